@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Measures the memory overhead per chapter of a book with a large number of chapters.
+
+Compares the current slotted Chapter class against the plain __dict__ based Chapter it
+replaced. Run from the repository root with::
+
+    python -m benchmarks.chapter_memory [chapter count]
+"""
+
+import sys
+import tracemalloc
+
+from publish.book import Book, Chapter
+
+DEFAULT_CHAPTER_COUNT = 100000
+
+
+class DictChapter:
+    """The Chapter class as it was before it used __slots__."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, src: str, publish: bool = True):
+        self.src = src
+        self.publish = publish
+
+
+def measure(chapter_class, srcs) -> int:
+    """Measures the memory allocated for a book holding one chapter per src.
+
+    The src strings themselves are allocated before the measurement starts, as they are
+    the same for both chapter classes.
+
+    Args:
+        chapter_class: The chapter class.
+        srcs: The chapter srcs.
+
+    Returns:
+        The allocated memory in bytes.
+    """
+    tracemalloc.start()
+    try:
+        book = Book('benchmark')
+        book.chapters.extend(chapter_class(src) for src in srcs)
+        allocated, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    del book
+    return allocated
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CHAPTER_COUNT
+    srcs = [f'chapters/chapter_{index:06}.md' for index in range(count)]
+
+    before = measure(DictChapter, srcs)
+    after = measure(Chapter, srcs)
+
+    print(f'{count} chapters')
+    print(f'before (__dict__): {before / 2**20:8.2f} MiB, {before / count:6.1f} bytes per chapter')
+    print(f'after (__slots__): {after / 2**20:8.2f} MiB, {after / count:6.1f} bytes per chapter')
+    print(f'saved:             {(before - after) / 2**20:8.2f} MiB '
+          f'({1 - after / before:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Measures the memory a build needs per stage of HtmlOutput.make and EbookConvertOutput.make
+for generated books of increasing size.
+
+Every measurement runs in a fresh process, once with tracemalloc to find the peak of each
+stage and once without it to sample the peak resident set size, as tracemalloc itself costs
+memory and time. The stages are interleaved chapter by chapter, so the peak of a stage is
+the most it allocated on top of what was in use when it started, for any one chapter.
+Chapters read ahead by the loader threads in the meantime count towards the stage they
+overlap with. The chapters are rendered separately, as only then do they stream through the
+stages.
+
+The report is written to pipeline_memory.json and the scaling curve, the memory needed per
+MiB of manuscript, is printed. Run from the repository root with::
+
+    python -m benchmarks.pipeline_memory [book size in MiB ...]
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from publish import isolation, output
+from publish.book import Book, Chapter
+from publish.output import EbookConvertOutput, HtmlOutput
+from publish.substitution import RegexSubstitution, SimpleSubstitution
+
+DEFAULT_SIZES = (1, 10, 100)
+CHAPTER_SIZE = 256 * 1024
+STAGES = ('substitute', 'render', 'template')
+OUTPUT_TYPES = {'html': HtmlOutput, 'epub': EbookConvertOutput}
+RSS_SAMPLE_INTERVAL = 0.01
+REPORT_PATH = 'pipeline_memory.json'
+CURVE_WIDTH = 50
+
+PARAGRAPH = ('The ++quick++ brown fox jumps over the *lazy* dog, as foxes do, and then reads '
+             'the [manual](#manual) once more. ' * 4).strip() + '\n\n'
+SECTION = (f'## Section\n\n{PARAGRAPH * 6}* a list item\n* another **list** item\n\n'
+           f'    some(code)\n    more(code)\n\n> A quote, {PARAGRAPH}')
+
+SUBSTITUTIONS = [SimpleSubstitution('fox', 'Fox'),
+                 SimpleSubstitution('manual', 'handbook'),
+                 RegexSubstitution(r'\+\+(?P<text>.*?)\+\+',
+                                   r'<span class="small-caps">\g<text></span>')]
+
+
+class StageMeter:
+    """Records the peak memory traced during each call of the wrapped stage functions.
+
+    The peak is reset by restarting tracemalloc before every call, as tracemalloc.reset_peak
+    needs Python 3.9. Restarting forgets the memory in use, which is kept in base instead.
+
+    Attributes:
+        peaks (Dict[str, int]): The peak per stage in bytes.
+        total (int): The peak of the whole measurement in bytes.
+        base (int): The memory in use when tracemalloc was last restarted in bytes.
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the :class:`StageMeter` class.
+        """
+        self.peaks: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.total = 0
+        self.base = 0
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        """Wraps a function, recording the memory it allocates on top of what is in use
+        when it is called.
+
+        Args:
+            stage: The name of the stage.
+            function: The function.
+
+        Returns:
+            The wrapped function.
+        """
+        def measured(*args, **kwargs):
+            self.restart()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _current, peak = tracemalloc.get_traced_memory()
+                self.total = max(self.total, self.base + peak)
+                self.peaks[stage] = max(self.peaks[stage], peak)
+
+        return measured
+
+    def restart(self):
+        """Restarts tracemalloc, resetting its peak."""
+        current, peak = tracemalloc.get_traced_memory()
+        self.total = max(self.total, self.base + peak)
+        self.base += current
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+class RssSampler(threading.Thread):
+    """Samples the resident set size of the current process in the background.
+
+    Attributes:
+        peak (int): The largest resident set size sampled in bytes.
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the :class:`RssSampler` class.
+        """
+        super().__init__(daemon=True)
+        self.peak = get_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, get_rss())
+
+    def stop(self) -> int:
+        """Stops sampling.
+
+        Returns:
+            The largest resident set size sampled in bytes.
+        """
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, get_rss())
+        return self.peak
+
+
+def get_rss() -> int:
+    """Gets the resident set size of the current process.
+
+    Returns:
+        The size in bytes, or the peak resident set size so far where /proc is missing.
+    """
+    try:
+        with open('/proc/self/statm', 'rt', encoding='ascii') as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return get_max_rss(resource.RUSAGE_SELF)
+
+
+def get_max_rss(who: int) -> int:
+    """Gets the peak resident set size reported by getrusage.
+
+    Args:
+        who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN.
+
+    Returns:
+        The size in bytes.
+    """
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss if platform.system() == 'Darwin' else max_rss * 1024
+
+
+def write_book(directory: str, size: float) -> int:
+    """Generates the chapters of a book of the given size.
+
+    Args:
+        directory: The directory the chapters are written to.
+        size: The size of the book in MiB.
+
+    Returns:
+        The size of the book in bytes.
+    """
+    chapter = ''.join('# Chapter\n\n' if index == 0 else SECTION
+                      for index in range(CHAPTER_SIZE // len(SECTION) + 1))
+    count = max(1, round(size * 2**20 / len(chapter)))
+
+    for index in range(count):
+        with open(os.path.join(directory, f'chapter_{index:05}.md'), 'wt',
+                  encoding='utf8') as file:
+            file.write(chapter)
+
+    return count * len(chapter.encode('utf8'))
+
+
+def measure(output_type: str, directory: str, traced: bool) -> Dict:
+    """Makes an output of the book in directory and measures its memory. Runs in a fresh
+    process.
+
+    Args:
+        output_type: The key of the output class in OUTPUT_TYPES, also the file type.
+        directory: The directory of the generated chapters.
+        traced: Whether to trace the stages with tracemalloc or sample the resident set
+            size.
+
+    Returns:
+        The measurement.
+    """
+    book = Book('Benchmark')
+    book.chapters.extend(Chapter(os.path.join(directory, name))
+                         for name in sorted(os.listdir(directory)) if name.endswith('.md'))
+    output_ = OUTPUT_TYPES[output_type](os.path.join(directory, f'book.{output_type}'),
+                                        render_chapters_separately=True)
+    meter = StageMeter()
+
+    if traced:
+        isolation.SubstitutionWorker.apply = meter.wrap(
+            'substitute', isolation.SubstitutionWorker.apply)
+        isolation.RenderWorker.render = meter.wrap('render', isolation.RenderWorker.render)
+        output.split_template = meter.wrap('template', output.split_template)
+        tracemalloc.start()
+        output_.make(book, SUBSTITUTIONS)
+        meter.restart()
+        tracemalloc.stop()
+        return {'stages': meter.peaks, 'traced_peak': meter.total}
+
+    sampler = RssSampler()
+    baseline = sampler.peak
+    sampler.start()
+
+    started = time.perf_counter()
+    output_.make(book, SUBSTITUTIONS)
+    elapsed = time.perf_counter() - started
+
+    # Without ebook-convert, the failed attempt to start it would count as a child.
+    has_child = output_type == 'epub' and shutil.which('ebook-convert')
+
+    return {'rss_peak': sampler.stop() - baseline,
+            'seconds': elapsed,
+            'child_rss_peak': get_max_rss(resource.RUSAGE_CHILDREN) if has_child else None}
+
+
+def run(output_type: str, directory: str, traced: bool) -> Dict:
+    """Runs a measurement in a fresh process, so neither earlier measurements nor the
+    generated book count towards its memory.
+
+    Args:
+        output_type: The key of the output class in OUTPUT_TYPES.
+        directory: The directory of the generated chapters.
+        traced: Whether to trace the stages with tracemalloc.
+
+    Returns:
+        The measurement.
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(measure, (output_type, directory, traced))
+
+
+def get_slope(points: List[Dict], key: str) -> Optional[float]:
+    """Gets the memory needed per additional MiB of manuscript between the smallest and the
+    largest book.
+
+    Args:
+        points: The measurements, ordered by the size of the book.
+        key: The key of the memory to compare.
+
+    Returns:
+        The slope in MiB per MiB, or None for less than two books.
+    """
+    if len(points) < 2 or points[-1]['manuscript'] == points[0]['manuscript']:
+        return None
+
+    first, last = points[0], points[-1]
+    return (last[key] - first[key]) / (last['manuscript'] - first['manuscript'])
+
+
+def print_curve(output_type: str, points: List[Dict], slope: Optional[float]):
+    """Prints the measurements of an output type as a table and a bar chart of the peak
+    resident set size.
+
+    Args:
+        output_type: The key of the output class in OUTPUT_TYPES.
+        points: The measurements, ordered by the size of the book.
+        slope: The peak resident set size needed per additional MiB of manuscript.
+    """
+    largest = max(point['rss_peak'] for point in points) or 1.0
+
+    print(f'{OUTPUT_TYPES[output_type].__name__}:')
+    print(f'{"book MiB":>9} {"seconds":>8} {"rss MiB":>8} {"traced":>8} '
+          + ' '.join(f'{stage:>10}' for stage in STAGES))
+
+    for point in points:
+        print(f'{point["manuscript"]:9.1f} {point["seconds"]:8.1f} {point["rss_peak"]:8.1f} '
+              f'{point["traced_peak"]:8.1f} '
+              + ' '.join(f'{point["stages"][stage]:10.1f}' for stage in STAGES))
+
+    for point in points:
+        curve = '#' * max(1, round(CURVE_WIDTH * point['rss_peak'] / largest))
+        print(f'{point["manuscript"]:9.1f} MiB | {curve} {point["rss_peak"]:.1f} MiB')
+
+    if slope is not None:
+        print(f'peak rss per additional MiB of manuscript: {slope:.3f} MiB')
+
+    if points[-1]['child_rss_peak']:
+        print(f'ebook-convert peak rss: {points[-1]["child_rss_peak"]:.1f} MiB')
+
+
+def main():
+    """Runs the benchmark, prints the results and writes the report."""
+    sizes = [float(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    report = {'python': platform.python_version(),
+              'ebook_convert': bool(shutil.which('ebook-convert')),
+              'outputs': {}}
+
+    for output_type in OUTPUT_TYPES:
+        points = []
+
+        for size in sorted(sizes):
+            with tempfile.TemporaryDirectory() as directory:
+                manuscript = write_book(directory, size)
+                traced = run(output_type, directory, traced=True)
+                sampled = run(output_type, directory, traced=False)
+
+            child_rss_peak = sampled['child_rss_peak']
+            points.append({
+                'manuscript': manuscript / 2**20,
+                'seconds': sampled['seconds'],
+                'rss_peak': sampled['rss_peak'] / 2**20,
+                'child_rss_peak': child_rss_peak / 2**20 if child_rss_peak else None,
+                'traced_peak': traced['traced_peak'] / 2**20,
+                'stages': {stage: peak / 2**20 for stage, peak in traced['stages'].items()}})
+
+        slope = get_slope(points, 'rss_peak')
+        report['outputs'][output_type] = {
+            'points': points,
+            'rss_per_manuscript_mib': slope,
+            'traced_per_manuscript_mib': get_slope(points, 'traced_peak')}
+        print_curve(output_type, points, slope)
+
+    with open(REPORT_PATH, 'wt', encoding='utf8') as file:
+        json.dump(report, file, indent=2)
+
+    print(f'The report was written to {REPORT_PATH}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Measures the time it takes to load a generated project file with a large number of
+chapters, substitutions and outputs.
+
+Compares the pure Python yaml parser, the C parser of ruamel.yaml.clib (if installed) and
+the project snapshot kept in the build cache. Run from the repository root with::
+
+    python -m benchmarks.project_load [chapter count]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import ruamel.yaml
+
+from publish import yaml as publish_yaml
+from publish.cache import BuildCache
+from publish.yaml import PROJECT_FILE, SNAPSHOT_NAME, load_project, load_project_file
+
+DEFAULT_CHAPTER_COUNT = 10000
+SUBSTITUTION_COUNT = 1000
+OUTPUT_COUNT = 10
+REPEAT = 5
+
+
+def get_project(chapter_count: int) -> str:
+    """Generates a project file.
+
+    Args:
+        chapter_count: The number of chapters.
+
+    Returns:
+        The yaml string.
+    """
+    lines = ['title: Benchmark', 'authors: Max Mustermann', 'language: en', 'chapters:']
+    lines.extend(f'  - src: chapters/chapter_{index:06}.md' for index in range(chapter_count))
+    lines.append('substitutions:')
+
+    for index in range(SUBSTITUTION_COUNT):
+        if index % 2:
+            lines.extend([f'  - old: term{index}', f'    new: Term {index}'])
+        else:
+            lines.extend([f'  - pattern: \\+\\+(?P<text>term{index}.*?)\\+\\+',
+                          '    replace_with: <span class="small-caps">\\g<text></span>'])
+
+    lines.extend(['stylesheet: style.css', 'ebookconvert_params:', '  - level1-toc=//h:h1',
+                  'outputs:'])
+    lines.extend(f'  - path: book_{index}.epub' for index in range(OUTPUT_COUNT))
+
+    return '\n'.join(lines) + '\n'
+
+
+def measure(function) -> float:
+    """Measures the best of REPEAT calls of a function.
+
+    Args:
+        function: The function.
+
+    Returns:
+        The fastest call in seconds.
+    """
+    timings = []
+
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CHAPTER_COUNT
+    yaml = get_project(count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        with open(PROJECT_FILE, 'wt', encoding='utf8') as file:
+            file.write(yaml)
+
+        cache = BuildCache()
+        default_yaml = publish_yaml.YAML
+
+        publish_yaml.YAML = ruamel.yaml.YAML(typ='safe', pure=True)
+        pure = measure(lambda: load_project(yaml))
+        publish_yaml.YAML = default_yaml
+        default = measure(lambda: load_project(yaml))
+
+        def load_without_snapshot():
+            os.remove(os.path.join(cache.directory, f'{SNAPSHOT_NAME}.json'))
+            load_project_file(cache=cache, snapshot=True)
+
+        load_project_file(cache=cache, snapshot=True)
+        cold = measure(load_without_snapshot)
+        warm = measure(lambda: load_project_file(cache=cache, snapshot=True))
+
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = f'default parser ({default_yaml.Parser.__name__}):'
+
+    print(f'{count} chapters, {SUBSTITUTION_COUNT} substitutions, {OUTPUT_COUNT} outputs, '
+          f'{len(yaml) / 2**20:.2f} MiB')
+    print(f'pure Python parser:        {pure * 1000:8.1f} ms')
+    print(f'{parser:26} {default * 1000:8.1f} ms')
+    print(f'saving the snapshot:       {cold * 1000:8.1f} ms')
+    print(f'reusing the snapshot:      {warm * 1000:8.1f} ms '
+          f'({pure / warm:.1f}x faster than pure Python)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the analysis of regular expressions for catastrophic backtracking,
+used to warn about risky regex substitutions. (see publish.substitution)
+"""
+
+import logging
+import re
+from typing import Callable, List, Optional, Pattern, Union
+
+# The analysis walks the parse tree of the regular expression parser of the standard
+# library, which is not a public api: it lives in sre_parse up to Python 3.10 and in
+# re._parser from Python 3.11 on, which re-exports the opcodes of the parse tree as well.
+# Everything the analysis needs from it is looked up here and nowhere else.
+try:
+    from re import _parser as _sre_parse  # Python >= 3.11
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre_parse  # pylint: disable=deprecated-module
+
+_parse = _sre_parse.parse
+_SubPattern = _sre_parse.SubPattern
+(ASSERT, ASSERT_NOT, BRANCH, CATEGORY, GROUPREF_EXISTS, IN, LITERAL, MAX_REPEAT, MIN_REPEAT,
+ NEGATE, NOT_LITERAL, RANGE, SUBPATTERN) = (
+     getattr(_sre_parse, name)
+     for name in ('ASSERT', 'ASSERT_NOT', 'BRANCH', 'CATEGORY', 'GROUPREF_EXISTS', 'IN',
+                  'LITERAL', 'MAX_REPEAT', 'MIN_REPEAT', 'NEGATE', 'NOT_LITERAL', 'RANGE',
+                  'SUBPATTERN'))
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+# re.Pattern only exists from Python 3.7 on.
+PATTERN_TYPE = type(re.compile(''))
+
+_REPEATS = (MAX_REPEAT, MIN_REPEAT)
+_CATEGORIES = {'CATEGORY_DIGIT': re.compile(r'\d'),
+               'CATEGORY_NOT_DIGIT': re.compile(r'\D'),
+               'CATEGORY_SPACE': re.compile(r'\s'),
+               'CATEGORY_NOT_SPACE': re.compile(r'\S'),
+               'CATEGORY_WORD': re.compile(r'\w'),
+               'CATEGORY_NOT_WORD': re.compile(r'\W')}
+_SAMPLE_CHARACTERS = [chr(code) for code in range(0x250)] + \
+    ['\u2003', '\u2014', '\u201c', '\u3000', '\u4e00', '\uff10']
+
+
+def get_backtracking_risks(pattern: Union[str, Pattern]) -> List[str]:
+    """Finds the parts of a regular expression that can make it backtrack catastrophically,
+    i.e. take time exponential in the length of the text when a match fails.
+
+    The analysis is a heuristic. It looks at every repetition whose content can be matched
+    in more than one way, so that the number of ways to split a text between the iterations
+    explodes:
+
+    * a nested quantifier like '(a+)+' or '(\\w+\\s?)*', unless the repeated content also
+      requires a character the nested quantifier can not match, like '(\\w+,)+'
+    * alternatives that can match the same text, like '(\\w|_x)+' or '(a|a)+'
+
+    Atomic groups and possessive quantifiers never backtrack and are ignored.
+
+    Args:
+        pattern: The pattern, as string or compiled.
+
+    Returns:
+        The descriptions of the risks found, or an empty list.
+    """
+    if isinstance(pattern, PATTERN_TYPE):
+        pattern = _parse(pattern.pattern, pattern.flags)
+    else:
+        pattern = _parse(pattern)
+
+    # The parser state of a parsed pattern is called pattern up to Python 3.7.
+    state = getattr(pattern, 'state', None) or pattern.pattern
+
+    risks = []
+    _find_backtracking_risks(pattern.data, state, risks)
+
+    return risks
+
+
+def _find_backtracking_risks(items: list, state, risks: List[str]):
+    """Finds the backtracking risks of every repetition inside the parsed items.
+
+    Args:
+        items: The items of a parsed pattern.
+        state: The parser state of the pattern.
+        risks: The list the risks found are added to.
+    """
+    for operator, argument in items:
+        if operator in _REPEATS:
+            minimum, maximum, body = argument
+            if maximum > 1 and minimum != maximum:
+                risk = _get_repeat_risk(_flatten(body), state)
+                if risk and risk not in risks:
+                    risks.append(risk)
+
+        for sub_items in _get_sub_items(operator, argument):
+            _find_backtracking_risks(sub_items, state, risks)
+
+
+def _get_repeat_risk(items: list, state) -> Optional[str]:
+    """Determines whether the content of a repetition can be matched in more than one way.
+
+    Args:
+        items: The flattened items repeated.
+        state: The parser state of the pattern.
+
+    Returns:
+        The description of the risk or None.
+    """
+    for index, (operator, argument) in enumerate(items):
+        if _is_variable((operator, argument)):
+            characters = _get_first_characters((operator, argument))
+            others = [item for other_index, item in enumerate(items)
+                      if other_index != index and _get_min_width(item, state) > 0]
+
+            if all(_overlap(characters, _get_first_characters(other)) for other in others):
+                return 'a repeated group contains a quantifier that can match the same text ' \
+                       'as the repetition around it'
+
+        if operator is BRANCH:
+            # The text following the alternatives is matched by the next item or, after
+            # the last item, by the next iteration.
+            following = _get_first_characters(items[(index + 1) % len(items)])
+            alternatives = argument[1]
+
+            for first_index, first in enumerate(alternatives):
+                for second in alternatives[first_index + 1:]:
+                    if _alternatives_overlap(first, second, following):
+                        return 'a repeated group contains alternatives that can match the ' \
+                               'same text'
+
+    return None
+
+
+def _alternatives_overlap(first: list,
+                          second: list,
+                          following: Optional[Callable[[str], bool]]) -> bool:
+    """Determines whether two alternatives can match the same text, i.e. whether the shorter
+    alternative can match the start of the longer one and the rest of the longer one can be
+    matched by what follows the alternatives.
+
+    Args:
+        first: The items of the first alternative.
+        second: The items of the second alternative.
+        following: The predicate for the characters following the alternatives.
+
+    Returns:
+        True if the alternatives can match the same text.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+
+    for first_item, second_item in zip(first, second):
+        if not _overlap(_get_first_characters(first_item),
+                        _get_first_characters(second_item)):
+            return False
+
+    if len(first) == len(second):
+        return True
+
+    return _overlap(_get_first_characters(second[len(first)]), following)
+
+
+def _get_sub_items(operator, argument) -> List[list]:
+    """Gets the nested item lists of a parsed item that can backtrack.
+
+    Args:
+        operator: The operator of the item.
+        argument: The argument of the item.
+
+    Returns:
+        The list of nested item lists.
+    """
+    if operator in _REPEATS:
+        return [argument[2]]
+    if operator is SUBPATTERN:
+        return [argument[-1]]
+    if operator is BRANCH:
+        return list(argument[1])
+    if operator in (ASSERT, ASSERT_NOT):
+        return [argument[1]]
+    if operator is GROUPREF_EXISTS:
+        return [items for items in argument[1:] if items]
+
+    return []
+
+
+def _flatten(items: list) -> list:
+    """Flattens the groups of parsed items into one sequence.
+
+    Args:
+        items: The parsed items.
+
+    Returns:
+        The flattened items.
+    """
+    flattened = []
+
+    for operator, argument in items:
+        if operator is SUBPATTERN:
+            flattened.extend(_flatten(argument[-1]))
+        else:
+            flattened.append((operator, argument))
+
+    return flattened
+
+
+def _is_variable(item) -> bool:
+    """Determines whether a parsed item is or contains a quantifier that can backtrack, i.e.
+    a quantifier with a minimum different from its maximum.
+
+    Args:
+        item: The parsed item.
+
+    Returns:
+        True if the item contains a quantifier that can backtrack.
+    """
+    operator, argument = item
+
+    if operator in _REPEATS and argument[0] != argument[1]:
+        return True
+
+    return any(_is_variable(sub_item)
+               for sub_items in _get_sub_items(operator, argument)
+               for sub_item in sub_items)
+
+
+def _get_first_characters(item) -> Optional[Callable[[str], bool]]:
+    """Gets a predicate for the characters a parsed item can start with.
+
+    Args:
+        item: The parsed item.
+
+    Returns:
+        The predicate or None if any character might be matched.
+    """
+    # pylint: disable=too-many-return-statements
+
+    operator, argument = item
+
+    if operator is LITERAL:
+        return lambda character: ord(character) == argument
+    if operator is NOT_LITERAL:
+        return lambda character: ord(character) != argument
+    if operator is IN:
+        return _get_set_predicate(argument)
+    if operator is SUBPATTERN or operator in _REPEATS:
+        sub_items = _get_sub_items(operator, argument)[0]
+        return _get_first_characters(sub_items[0]) if sub_items else None
+    if operator is BRANCH:
+        predicates = [_get_first_characters(items[0]) if items else None
+                      for items in argument[1]]
+        if any(predicate is None for predicate in predicates):
+            return None
+        return lambda character: any(predicate(character) for predicate in predicates)
+
+    return None
+
+
+def _get_set_predicate(items: list) -> Optional[Callable[[str], bool]]:
+    """Gets a predicate for the characters of a parsed character set.
+
+    Args:
+        items: The items of the character set.
+
+    Returns:
+        The predicate or None if the set can't be analyzed.
+    """
+    negate = False
+    predicates = []
+
+    for operator, argument in items:
+        if operator is NEGATE:
+            negate = True
+        elif operator is LITERAL:
+            predicates.append(lambda character, code=argument: ord(character) == code)
+        elif operator is RANGE:
+            predicates.append(lambda character, low=argument[0], high=argument[1]:
+                              low <= ord(character) <= high)
+        elif operator is CATEGORY and str(argument) in _CATEGORIES:
+            predicates.append(_CATEGORIES[str(argument)].match)
+        else:
+            return None
+
+    return lambda character: negate != any(predicate(character) for predicate in predicates)
+
+
+def _overlap(first: Optional[Callable[[str], bool]],
+             second: Optional[Callable[[str], bool]]) -> bool:
+    """Determines whether two character predicates can match the same character, sampling
+    the latin characters and a few others.
+
+    Args:
+        first: The first predicate, None for any character.
+        second: The second predicate, None for any character.
+
+    Returns:
+        True if a character matches both predicates.
+    """
+    if first is None or second is None:
+        return True
+
+    return any(first(character) and second(character) for character in _SAMPLE_CHARACTERS)
+
+
+def _get_min_width(item, state) -> int:
+    """Gets the minimum number of characters a parsed item matches.
+
+    Args:
+        item: The parsed item.
+        state: The parser state of the pattern.
+
+    Returns:
+        The minimum width.
+    """
+    return _SubPattern(state, [item]).getwidth()[0]
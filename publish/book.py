@@ -12,9 +12,14 @@ and its chapters required by publish.output to produce its output.
 """
 
 
+import copy
+import hashlib
 import logging
 from datetime import date
-from typing import List
+from typing import Any, Dict, List, Optional
+
+from publish.source import (READ_BUFFER_SIZE, ChapterSource, SourceResolver, SourceStat,
+                            borrow_resolver)
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.NullHandler())
@@ -78,6 +83,12 @@ class Book:
 
     # pylint: disable=too-few-public-methods,too-many-instance-attributes
 
+    # __dict__ keeps attributes set by callers working; a build has a single book, so the
+    # slots save little here anyway.
+    __slots__ = ('__chapters', '__sources', 'title', 'language', 'pubdate', 'author_sort',
+                 'authors', 'book_producer', 'comments', 'cover', 'isbn', 'publisher', 'rating',
+                 'series', 'series_index', 'tags', 'title_sort', '__dict__')
+
     def __init__(
             self,
             title: str,
@@ -85,6 +96,7 @@ class Book:
         """Initializes a new instance of the :class:`Book` class.
         """
         self.__chapters = []
+        self.__sources = {}
 
         # required attributes
         self.title = title
@@ -107,6 +119,30 @@ class Book:
         self.tags = kwargs.pop('tags', None)
         self.title_sort = kwargs.pop('title_sort', None)
 
+    def __deepcopy__(self, memo: Dict[int, Any]) -> 'Book':
+        """Copies the book with its chapters, e.g. for an output made in its own thread.
+
+        The copy shares the chapter sources with the book instead of copying them, as
+        sources may hold open archives, which can't be copied, and reading them is
+        thread-safe. Registering a source with the copy does not change the book.
+
+        Args:
+            memo: The objects copied so far.
+
+        Returns:
+            The copy.
+        """
+        book = Book(self.title)
+        memo[id(self)] = book
+        book.chapters.extend(copy.deepcopy(self.chapters, memo))
+        book.sources.update(self.sources)
+
+        for name in (*(name for name in self.__slots__ if not name.startswith('__')),
+                     *vars(self)):
+            setattr(book, name, copy.deepcopy(getattr(self, name), memo))
+
+        return book
+
     @property
     def chapters(self) -> List['Chapter']:
         """Gets the list of chapters.
@@ -116,11 +152,29 @@ class Book:
         """
         return self.__chapters
 
+    @property
+    def sources(self) -> Dict[str, ChapterSource]:
+        """Gets the named chapter sources, e.g. in-memory mappings, chapter srcs of the form
+        'name!member' are read from. (see publish.source)
+
+        Returns:
+            The dictionary of named chapter sources.
+        """
+        return self.__sources
+
 
 class Chapter:
     """The chapter class is used to define all metadata required for a chapter
     of a book.
 
+    Books can consist of tens of thousands of chapters, so chapters are kept small: they
+    use __slots__ instead of a __dict__, and everything read from the source file is only
+    read once it is needed.
+
+    The source file is usually a file on disk, but can also be a member of an archive, e.g.
+    'bundle.zip!chapters/01.md', or an entry of a source registered in Book.sources, e.g.
+    'manuscript!01.md'. (see publish.source)
+
     Args:
         src: The path to the source file.
         publish: Determines whether the chapter will be included
@@ -138,6 +192,8 @@ class Chapter:
 
     # pylint: disable=too-few-public-methods
 
+    __slots__ = ('src', 'publish', '_stat', '_content_hash', '_content')
+
     def __init__(self,
                  src: str,
                  publish: bool = True):
@@ -145,3 +201,130 @@ class Chapter:
         """
         self.src = src
         self.publish = publish
+        self._stat: Optional[SourceStat] = None
+        self._content_hash: Optional[str] = None
+        self._content: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        """Gets the size of the source file in bytes.
+
+        The size is read on first access and cached afterwards. (see invalidate)
+
+        Returns:
+            The size of the source file.
+        """
+        return self.stat().size
+
+    @property
+    def mtime(self) -> float:
+        """Gets the time of the last modification of the source file in seconds since the
+        epoch.
+
+        The modification time is read on first access and cached afterwards. (see invalidate)
+
+        Returns:
+            The modification time of the source file.
+        """
+        return self.stat().mtime
+
+    @property
+    def content_hash(self) -> str:
+        """Gets the sha256 hex digest of the source file.
+
+        The hash is computed on first access, without keeping the content in memory, and
+        cached afterwards. (see invalidate)
+
+        The hash can also be set, e.g. by an incremental build that knows the source file
+        is unchanged since it was last hashed. (see publish.incremental)
+
+        Returns:
+            The hash of the source file.
+        """
+        return self.get_content_hash()
+
+    @content_hash.setter
+    def content_hash(self, content_hash: str):
+        self._content_hash = content_hash
+
+    @property
+    def content(self) -> str:
+        """Gets the content of the source file.
+
+        The content is read on first access and kept until it is released.
+        (see release)
+
+        Returns:
+            The content of the source file.
+        """
+        return self.read()
+
+    def stat(self, resolver: Optional[SourceResolver] = None) -> SourceStat:
+        """Gets the cached size and modification time of the source file.
+
+        Args:
+            resolver: The source resolver of the current build. If None, archives are opened
+                just for this call.
+
+        Returns:
+            The size and modification time of the source file.
+        """
+        if self._stat is None:
+            with borrow_resolver(resolver) as resolver_:
+                self._stat = resolver_.stat(self.src)
+
+        return self._stat
+
+    def get_content_hash(self, resolver: Optional[SourceResolver] = None) -> str:
+        """Gets the cached sha256 hex digest of the source file.
+
+        Args:
+            resolver: The source resolver of the current build. If None, archives are opened
+                just for this call.
+
+        Returns:
+            The hash of the source file.
+        """
+        if self._content_hash is None:
+            hash_ = hashlib.sha256()
+            with borrow_resolver(resolver) as resolver_, resolver_.open(self.src) as file:
+                for block in iter(lambda: file.read(READ_BUFFER_SIZE), b''):
+                    hash_.update(block)
+            self._content_hash = hash_.hexdigest()
+
+        return self._content_hash
+
+    def read(self, resolver: Optional[SourceResolver] = None) -> str:
+        """Gets the utf-8 decoded content of the source file, reading it if it is not loaded.
+
+        Line breaks are normalised to '\\n', like reading the file in text mode would, so
+        substitutions match chapters written on Windows too.
+
+        Args:
+            resolver: The source resolver of the current build. If None, archives are opened
+                just for this call.
+
+        Returns:
+            The content of the source file.
+        """
+        if self._content is None:
+            with borrow_resolver(resolver) as resolver_:
+                self._content = resolver_.read(self.src).decode('utf-8') \
+                    .replace('\r\n', '\n').replace('\r', '\n')
+
+        return self._content
+
+    def release(self):
+        """Releases the content of the source file, e.g. once it has been rendered.
+
+        The content is read again on the next access.
+        """
+        self._content = None
+
+    def invalidate(self):
+        """Forgets everything read from the source file, e.g. after the file has been
+        modified.
+        """
+        self._stat = None
+        self._content_hash = None
+        self._content = None
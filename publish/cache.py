@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the build cache, a small persistent store for anything that can be
+reused from one build of a project to the next.
+"""
+
+import json
+import logging
+import os
+from tempfile import mkstemp
+from typing import Any, Optional, Union
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+DEFAULT_CACHE_DIRECTORY = '.publish-cache'
+
+
+class BuildCache:
+    """The BuildCache stores json documents by name and text and binary entries by namespace
+    and key inside a cache directory.
+
+    Every document and entry is written atomically, so an interrupted build never leaves a
+    half-written document behind. A missing or unreadable document is treated like an
+    empty cache: the cache only ever saves work, it is never required for a build.
+
+    Args:
+        directory: The cache directory. It is created on the first write.
+
+    Attributes:
+        directory (str): The cache directory.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY):
+        """Initializes a new instance of the :class:`BuildCache` class.
+        """
+        self.directory = directory
+
+    def load(self, name: str, default: Any = None) -> Any:
+        """Loads the json document with the given name.
+
+        Args:
+            name: The name of the document.
+            default: The value returned if the document does not exist or can't be read.
+
+        Returns:
+            The document or the default value.
+        """
+        try:
+            with open(self._get_path(name), 'rt', encoding='utf8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return default
+        except (OSError, ValueError) as error:
+            LOG.warning(f'Ignoring unreadable cache document {name}: {error}')
+            return default
+
+    def save(self, name: str, value: Any):
+        """Saves the value as json document with the given name, replacing any previous
+        document of the same name.
+
+        Args:
+            name: The name of the document.
+            value: The json serializable value.
+        """
+        _write_atomically(self._get_path(name), json.dumps(value))
+
+    def has_text(self, namespace: str, key: str) -> bool:
+        """Checks whether a text entry is stored under the key, without loading it.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'renders'.
+            key: The key of the entry, a hex digest.
+
+        Returns:
+            True if there is such an entry.
+        """
+        return os.path.isfile(self._get_entry_path(namespace, key))
+
+    def load_text(self, namespace: str, key: str) -> Optional[str]:
+        """Loads the text entry stored under the key, e.g. the rendered html of a chapter
+        stored under the hash of everything it was rendered from.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'renders'.
+            key: The key of the entry, a hex digest.
+
+        Returns:
+            The text or None if there is no such entry.
+        """
+        try:
+            with open(self._get_entry_path(namespace, key), 'rt', encoding='utf8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def save_text(self, namespace: str, key: str, text: str):
+        """Saves the text entry under the key, replacing any previous entry.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'renders'.
+            key: The key of the entry, a hex digest.
+            text: The text.
+        """
+        _write_atomically(self._get_entry_path(namespace, key), text)
+
+    def load_json(self, namespace: str, key: str) -> Any:
+        """Loads the json entry stored under the key, e.g. the headings of a chapter stored
+        under the render key of the chapter.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'headings'.
+            key: The key of the entry, a hex digest.
+
+        Returns:
+            The value or None if there is no such entry or it is not valid json.
+        """
+        text = self.load_text(namespace, key)
+
+        try:
+            return json.loads(text) if text is not None else None
+        except ValueError:
+            return None
+
+    def save_json(self, namespace: str, key: str, value: Any):
+        """Saves the value as json entry under the key, replacing any previous entry.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'headings'.
+            key: The key of the entry, a hex digest.
+            value: The value.
+        """
+        self.save_text(namespace, key, json.dumps(value))
+
+    def load_bytes(self, namespace: str, key: str) -> Optional[bytes]:
+        """Loads the binary entry stored under the key, e.g. an optimized image stored under
+        the hash of the original and the settings it was optimized with.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'images'.
+            key: The key of the entry, a hex digest.
+
+        Returns:
+            The bytes or None if there is no such entry.
+        """
+        try:
+            with open(self._get_entry_path(namespace, key), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def save_bytes(self, namespace: str, key: str, data: bytes):
+        """Saves the binary entry under the key, replacing any previous entry.
+
+        Args:
+            namespace: The namespace of the entry, e.g. 'images'.
+            key: The key of the entry, a hex digest.
+            data: The bytes.
+        """
+        _write_atomically(self._get_entry_path(namespace, key), data)
+
+    def _get_entry_path(self, namespace: str, key: str) -> str:
+        """Gets the path of a text or binary entry. Entries are spread over sub directories
+        named after the first two characters of their key to keep directories small.
+
+        Args:
+            namespace: The namespace of the entry.
+            key: The key of the entry.
+
+        Returns:
+            The path of the entry.
+        """
+        return os.path.join(self.directory, namespace, key[:2], key[2:])
+
+    def _get_path(self, name: str) -> str:
+        """Gets the path of the json document with the given name.
+
+        Args:
+            name: The name of the document.
+
+        Returns:
+            The path of the document.
+        """
+        return os.path.join(self.directory, f'{name}.json')
+
+
+def _write_atomically(path: str, data: Union[str, bytes]):
+    """Writes the data to a temporary file next to path and then moves it to path.
+
+    Args:
+        path: The path.
+        data: The text or bytes.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    descriptor, temp_path = mkstemp(dir=directory, suffix='.tmp')
+    try:
+        if isinstance(data, bytes):
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+        else:
+            with os.fdopen(descriptor, 'wt', encoding='utf8') as file:
+                file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
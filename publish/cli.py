@@ -10,29 +10,333 @@
 """CLI entry point for the publish command and the yaml project format.
 """
 
+import argparse
 import logging
+import os
+import sys
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
 
-from publish.yaml import load_project
+from publish.book import Book
+from publish.cache import BuildCache
+from publish.distributed import DEFAULT_WORKER_ADDRESS, parse_address, run_worker
+from publish.incremental import GitChangeDetector, IncrementalBuild
+from publish.output import HtmlOutput, EbookConvertOutput
+from publish.preflight import PreflightError, preflight
+from publish.profiling import SubstitutionProfiler
+from publish.scheduling import CostModel, make_outputs
+from publish.selection import parse_chapter_range
+from publish.substitution import Substitution
+from publish.yaml import PROJECT_FILE, load_project_file
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.NullHandler())
 
 
-def main():
+def main(argv: Optional[Sequence[str]] = None):
     """Main CLI entry point for anited. publish.
 
-    Looks for a file .publish.yml in the current working directory, calls load_yaml on
-    its content and then runs each output defined in the project file.
+    Looks for a file .publish.yml in the current working directory, loads it with
+    load_project_file, checks the inputs of every output (see publish.preflight) and then
+    runs each output defined in the project file.
+
+    `publish check` stops after the check. If the check finds any problems, all of them
+    are reported and the command exits with status 1 before any output is made.
+
+    `publish --stdout` writes the html output to standard out instead of its path.
+
+    Outputs are made several at once, slowest first, as far as previous builds showed it
+    pays off. (see publish.scheduling)
+
+    `publish worker` runs a render worker for the builds of other hosts instead (see
+    publish.distributed), `--render-workers` sends the chapters of a build to them.
+
+    Args:
+        argv: The command line arguments. Defaults to sys.argv[1:].
     """
+    parser = _get_argument_parser()
+    args = parser.parse_args(argv)
+
     logging.basicConfig(format='%(message)s', level=logging.INFO)
 
-    with open('.publish.yml', 'rt', encoding='utf8') as publish_yaml:
-        yaml = publish_yaml.read()
+    if args.command == 'worker':
+        _run_worker(parser, args)
+        return
+
+    _check_arguments(parser, args)
+    cache = None if args.no_cache else BuildCache()
+
+    try:
+        book, substitutions, outputs = load_project_file(PROJECT_FILE, cache=cache,
+                                                         snapshot=args.snapshot_project)
+    except PreflightError as error:
+        parser.exit(1, f'{error}\n')
+
+    outputs = _select_outputs(parser, args, outputs)
+    cost_model, profiler = _configure_outputs(parser, args, outputs, cache)
+
+    try:
+        preflight(book, substitutions, outputs)
+    except PreflightError as error:
+        parser.exit(1, f'{error}\n')
+
+    if args.command == 'check':
+        LOG.info('No problems found.')
+        return
+
+    _build(args, book, substitutions, outputs, cost_model)
+    cost_model.save()
+
+    if args.explain_schedule:
+        LOG.info(cost_model.format_report())
+
+    if profiler:
+        LOG.info(profiler.format_report())
+        profiler.save(args.profile_substitutions)
+
+
+def select_outputs(outputs: Iterable[Union[HtmlOutput, EbookConvertOutput]],
+                   paths: Optional[Iterable[str]] = None
+                   ) -> List[Union[HtmlOutput, EbookConvertOutput]]:
+    """Selects the outputs whose path matches one of the given paths.
 
-    book, substitutions, outputs = load_project(str(yaml))
+    Paths are compared after normalization, i.e. './book.epub' selects the output
+    'book.epub'. The order of the outputs as defined in the project is preserved.
 
+    Args:
+        outputs: The list of outputs.
+        paths: The output paths to select. If empty or None, all outputs are selected.
+
+    Returns:
+        The list of selected outputs.
+
+    Raises:
+        ValueError: If a path does not match any output.
+    """
+    outputs = list(outputs)
+
+    if not paths:
+        return outputs
+
+    wanted = {os.path.normpath(path) for path in paths}
+    available = {os.path.normpath(output.path) for output in outputs}
+
+    unknown = sorted(wanted - available)
+    if unknown:
+        raise ValueError(f'{", ".join(unknown)} do(es) not match any output. '
+                         f'Available outputs: {", ".join(sorted(available))}')
+
+    return [output for output in outputs if os.path.normpath(output.path) in wanted]
+
+
+def _run_worker(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """Runs a render worker for the builds of other hosts. (see publish.distributed)
+
+    Args:
+        parser: The argument parser, which reports an invalid address.
+        args: The parsed arguments.
+    """
+    try:
+        address = parse_address(args.listen)
+    except ValueError as error:
+        parser.error(str(error))
+
+    run_worker(address)
+
+
+def _check_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """Checks the arguments that can not be combined or are out of range.
+
+    Args:
+        parser: The argument parser, which reports the problem and exits.
+        args: The parsed arguments.
+    """
+    if args.incremental and args.no_cache:
+        parser.error('--incremental requires the build cache and can not be combined with '
+                     '--no-cache')
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    if args.incremental and args.stdout:
+        parser.error('--incremental can not be combined with --stdout')
+
+
+def _select_outputs(parser: argparse.ArgumentParser,
+                    args: argparse.Namespace,
+                    outputs: List[Union[HtmlOutput, EbookConvertOutput]]
+                    ) -> List[Union[HtmlOutput, EbookConvertOutput]]:
+    """Selects the outputs to make by --only and --stdout and turns them into previews of
+    the chapters selected by --chapters and --chapter-src.
+
+    Args:
+        parser: The argument parser, which reports invalid selections and exits.
+        args: The parsed arguments.
+        outputs: The outputs of the project.
+
+    Returns:
+        The outputs to make.
+    """
+    try:
+        outputs = select_outputs(outputs, args.only)
+        if args.chapters:
+            parse_chapter_range(args.chapters)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.stdout:
+        outputs = [output for output in outputs if not isinstance(output, EbookConvertOutput)]
+        if len(outputs) != 1:
+            parser.error(f'--stdout needs exactly one html output, found {len(outputs)}; '
+                         'select one with --only')
+
+    if args.chapters or args.chapter_src:
+        outputs = [output.preview(chapter_range=args.chapters,
+                                  chapter_src=args.chapter_src)
+                   for output in outputs]
+
+    return outputs
+
+
+def _configure_outputs(parser: argparse.ArgumentParser,
+                       args: argparse.Namespace,
+                       outputs: List[Union[HtmlOutput, EbookConvertOutput]],
+                       cache: Optional[BuildCache]
+                       ) -> Tuple[CostModel, Optional[SubstitutionProfiler]]:
+    """Sets the render workers, the substitution timeout, the cost model and the profiler
+    of the build on every output.
+
+    Args:
+        parser: The argument parser, which reports invalid render workers and exits.
+        args: The parsed arguments.
+        outputs: The outputs to make.
+        cache: The build cache, or None.
+
+    Returns:
+        A tuple consisting of the cost model and the profiler, if substitutions are
+        profiled.
+    """
+    if args.render_workers:
+        try:
+            render_workers = [address.strip() for address in args.render_workers.split(',')]
+            for address in render_workers:
+                parse_address(address)
+        except ValueError as error:
+            parser.error(str(error))
+
+        for output in outputs:
+            output.render_workers = render_workers
+
+    if args.substitution_timeout:
+        for output in outputs:
+            output.substitution_timeout = args.substitution_timeout
+
+    cost_model = CostModel(cache)
     for output in outputs:
-        output.make(book, substitutions)
+        output.cost_model = cost_model
+
+    profiler = None
+    if args.profile_substitutions:
+        profiler = SubstitutionProfiler()
+        for output in outputs:
+            output.profiler = profiler
+
+    return cost_model, profiler
+
+
+def _build(args: argparse.Namespace,
+           book: Book,
+           substitutions: List[Substitution],
+           outputs: List[Union[HtmlOutput, EbookConvertOutput]],
+           cost_model: CostModel):
+    """Makes the outputs, or writes the html output to standard out with --stdout.
+
+    Args:
+        args: The parsed arguments.
+        book: The book.
+        substitutions: The substitutions.
+        outputs: The outputs to make.
+        cost_model: The cost model the outputs are scheduled by, with the build cache
+            --incremental requires.
+    """
+    if args.stdout:
+        outputs[0].write_to(sys.stdout.buffer, book, substitutions)
+        sys.stdout.buffer.flush()
+        return
+
+    build = None
+    if args.incremental:
+        build = IncrementalBuild(cost_model.cache, GitChangeDetector())
+        outputs = build.prepare(book, substitutions, outputs)
+
+    make_outputs(book, substitutions, outputs, cost_model, jobs=args.jobs)
+
+    if build:
+        build.finish()
+
+
+def _get_argument_parser() -> argparse.ArgumentParser:
+    """Gets the argument parser of the publish command.
+
+    Returns:
+        The argument parser.
+    """
+    parser = argparse.ArgumentParser(
+        prog='publish',
+        description='Turns the markdown files described in .publish.yml into ebooks.')
+    parser.add_argument(
+        'command', nargs='?', choices=('build', 'check', 'worker'), default='build',
+        help='build the outputs (default), only check the project for problems or run a '
+             'render worker for the builds of other hosts')
+    parser.add_argument(
+        '--only', metavar='PATH', action='append',
+        help='only build the output with this path; can be given multiple times')
+    parser.add_argument(
+        '--chapters', metavar='RANGE',
+        help='only render the chapters at these 1-based positions, e.g. 12-14 or 1,3,5-7, '
+             'into a preview next to each output')
+    parser.add_argument(
+        '--chapter-src', metavar='GLOB',
+        help='only render the chapters whose src matches this glob pattern into a preview '
+             'next to each output')
+    parser.add_argument(
+        '--substitution-timeout', metavar='SECONDS', type=float,
+        help='stop the build if a single substitution takes longer than this on a chapter, '
+             'naming the substitution and the chapter')
+    parser.add_argument(
+        '--profile-substitutions', metavar='PATH',
+        help='report the time, matches and bytes changed of every substitution, flag the '
+             'substitutions that never match and save the profile as json file')
+    parser.add_argument(
+        '--stdout', action='store_true',
+        help='write the html output to standard out instead of its path, e.g. to pipe it '
+             'into another program; the log goes to standard error')
+    parser.add_argument(
+        '--render-workers', metavar='HOST:PORT,...',
+        help='send the chapters to these render workers, started with `publish worker`, '
+             'instead of rendering them here')
+    parser.add_argument(
+        '--jobs', metavar='N', type=int,
+        help='make up to N outputs at once, slowest first; by default the number is tuned '
+             'by the speedup measured in previous builds')
+    parser.add_argument(
+        '--explain-schedule', action='store_true',
+        help='report the predicted and the actual time the outputs, and the chapters sent '
+             'to render workers, took on their workers')
+    parser.add_argument(
+        '--listen', metavar='HOST:PORT', default=DEFAULT_WORKER_ADDRESS,
+        help=f'the address `publish worker` listens on, defaults to {DEFAULT_WORKER_ADDRESS}')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='neither read nor write the build cache in .publish-cache')
+    parser.add_argument(
+        '--snapshot-project', action='store_true',
+        help='keep the loaded project in .publish-cache and reuse it until .publish.yml or a '
+             'directory its chapter patterns expand in changes')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='skip outputs whose inputs are unchanged since the last build and reuse every '
+             'unchanged chapter, asking git which files changed where possible')
+    return parser
 
 
 if __name__ == '__main__':
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module expands glob patterns and directories into lists of chapter files.
+
+Directories are read with a single os.scandir call each and every listing is remembered
+together with the modification time of its directory. Adding, removing or renaming a file
+changes the modification time of the directory containing it, so a listing whose directory
+still has the same modification time can be reused without reading the directory again.
+"""
+
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Pattern
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+GLOB_CHARACTERS = '*?['
+DIRECTORY_PATTERN = '**/*.md'
+SCAN_CACHE_NAME = 'chapter-scan'
+
+# Listings shared by all scanners of this process, so repeated builds inside one
+# process (e.g. a watch mode) don't read unchanged directories again.
+_SHARED_LISTINGS: Dict[str, list] = {}
+
+
+class DirectoryScanner:
+    """The DirectoryScanner finds the files matching a glob pattern.
+
+    Supported are the wildcards `*` and `?`, character classes like `[0-9]` and `**` for
+    any number of nested directories. Like the shell, the wildcards don't match files or
+    directories whose name starts with a dot.
+
+    Args:
+        listings: Previously recorded directory listings, e.g. loaded from a build cache.
+            Defaults to the listings shared by all scanners of this process.
+
+    Attributes:
+        listings (Dict[str, list]): The directory listings known to this scanner, mapping
+            the path of each directory to its modification time, its file names and its
+            sub directory names.
+        visited (Dict[str, list]): The listings of all directories read or validated by
+            this scanner.
+    """
+
+    def __init__(self, listings: Optional[Dict[str, list]] = None):
+        """Initializes a new instance of the :class:`DirectoryScanner` class.
+        """
+        self.listings = _SHARED_LISTINGS if listings is None else listings
+        self.visited = {}
+
+    def find(self,
+             pattern: str,
+             exclude: Iterable[str] = ()) -> List[str]:
+        """Finds all files matching the pattern but none of the exclude patterns.
+
+        Exclude patterns without a slash are matched against the file name only, all
+        others against the whole path.
+
+        Args:
+            pattern: The glob pattern, e.g. 'chapters/**/*.md'.
+            exclude: The glob patterns of files to leave out, e.g. 'draft_*.md'.
+
+        Returns:
+            The paths of the matching files in natural sort order, e.g. '2.md' before
+            '10.md'.
+        """
+        pattern = _normalize(pattern)
+        root, max_depth = _split_pattern(pattern)
+
+        return match_paths(self._walk(root, max_depth), pattern, exclude)
+
+    def _walk(self, directory: str, max_depth: Optional[int]) -> Iterable[str]:
+        """Yields the paths of all files inside the directory and its sub directories.
+
+        Args:
+            directory: The directory, '' being the current working directory.
+            max_depth: The number of sub directory levels to descend into. None means
+                no limit.
+
+        Returns:
+            A generator yielding the file paths.
+        """
+        _mtime, file_names, directory_names = self._list(directory)
+        prefix = f'{directory}/' if directory else ''
+
+        for file_name in file_names:
+            yield prefix + file_name
+
+        if max_depth is not None:
+            if max_depth == 0:
+                return
+            max_depth -= 1
+
+        for directory_name in directory_names:
+            yield from self._walk(prefix + directory_name, max_depth)
+
+    def _list(self, directory: str) -> list:
+        """Lists the files and sub directories of the directory, reusing the recorded
+        listing if the directory has not been modified since.
+
+        Args:
+            directory: The directory.
+
+        Returns:
+            The listing as [modification time, file names, sub directory names].
+        """
+        if directory in self.visited:
+            return self.visited[directory]
+
+        try:
+            mtime = os.stat(directory or '.').st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            listing = [None, [], []]
+        else:
+            listing = self.listings.get(directory)
+            if not listing or listing[0] != mtime:
+                listing = [mtime, *_scan(directory)]
+
+        self.listings[directory] = listing
+        self.visited[directory] = listing
+        return listing
+
+
+def match_paths(paths: Iterable[str],
+                pattern: str,
+                exclude: Iterable[str] = ()) -> List[str]:
+    """Filters paths, e.g. the member names of an archive, by a glob pattern and exclude
+    patterns. (see DirectoryScanner.find)
+
+    Args:
+        paths: The paths, using / as separator.
+        pattern: The glob pattern.
+        exclude: The glob patterns of paths to leave out.
+
+    Returns:
+        The matching paths in natural sort order.
+    """
+    regex = compile_glob(_normalize(pattern))
+    excludes = [(compile_glob(_normalize(exclude_pattern)), '/' not in exclude_pattern)
+                for exclude_pattern in exclude]
+
+    matches = []
+    for path in paths:
+        if not regex.match(path):
+            continue
+
+        name = path.rsplit('/', 1)[-1]
+        if any(exclude_regex.match(name if by_name else path)
+               for exclude_regex, by_name in excludes):
+            continue
+
+        matches.append(path)
+
+    return sorted(matches, key=natural_sort_key)
+
+
+def is_pattern(src: str) -> bool:
+    """Determines whether a chapter src is a glob pattern.
+
+    Args:
+        src: The chapter src.
+
+    Returns:
+        True if the src contains any glob wildcard, otherwise False.
+    """
+    return any(character in src for character in GLOB_CHARACTERS)
+
+
+def compile_glob(pattern: str) -> Pattern:
+    """Compiles a glob pattern into a regular expression matching whole paths.
+
+    Args:
+        pattern: The glob pattern, using / as separator.
+
+    Returns:
+        The compiled regular expression.
+    """
+    segments = pattern.split('/')
+    regex = []
+
+    for index, segment in enumerate(segments):
+        is_last = index == len(segments) - 1
+
+        if segment == '**':
+            regex.append('.*' if is_last else '(?:[^/]+/)*')
+        else:
+            regex.append(_translate_segment(segment))
+            if not is_last:
+                regex.append('/')
+
+    return re.compile(''.join(regex) + r'\Z')
+
+
+def natural_sort_key(path: str) -> list:
+    """Gets a sort key that orders numbers inside of paths by their value, so that
+    'chapter_2.md' is sorted before 'chapter_10.md'.
+
+    Args:
+        path: The path.
+
+    Returns:
+        The sort key.
+    """
+    return [[(0, int(part)) if part.isdigit() else (1, part.lower())
+             for part in re.split(r'(\d+)', segment) if part]
+            for segment in path.split('/')]
+
+
+def _normalize(pattern: str) -> str:
+    """Normalizes a pattern to forward slashes without a leading './'.
+
+    Args:
+        pattern: The pattern or path.
+
+    Returns:
+        The normalized pattern.
+    """
+    pattern = pattern.replace(os.sep, '/')
+    while pattern.startswith('./'):
+        pattern = pattern[2:]
+    return pattern.rstrip('/')
+
+
+def _split_pattern(pattern: str):
+    """Splits a pattern into the directory containing all its matches and the number of
+    sub directory levels below it that have to be searched.
+
+    Args:
+        pattern: The normalized glob pattern.
+
+    Returns:
+        A tuple consisting of the directory and the depth, None if the depth is unlimited.
+    """
+    segments = pattern.split('/')
+    static = []
+
+    for segment in segments[:-1]:
+        if is_pattern(segment):
+            break
+        static.append(segment)
+
+    dynamic = segments[len(static):]
+    max_depth = None if '**' in dynamic else len(dynamic) - 1
+
+    return '/'.join(static), max_depth
+
+
+def _translate_segment(segment: str) -> str:
+    """Translates a single path segment of a glob pattern into a regular expression.
+
+    Args:
+        segment: The path segment.
+
+    Returns:
+        The regular expression.
+    """
+    regex = []
+    index = 0
+
+    while index < len(segment):
+        character = segment[index]
+        index += 1
+
+        if character == '*':
+            regex.append('[^/]*')
+        elif character == '?':
+            regex.append('[^/]')
+        elif character == '[' and ']' in segment[index + 1:]:
+            end = segment.index(']', index + 1)
+            class_ = segment[index:end].replace('\\', '\\\\')
+            if class_.startswith('!'):
+                class_ = '^' + class_[1:]
+            regex.append(f'[{class_}]')
+            index = end + 1
+        else:
+            regex.append(re.escape(character))
+
+    return ''.join(regex)
+
+
+def _scan(directory: str):
+    """Reads the directory with a single os.scandir call.
+
+    Files and directories starting with a dot are left out.
+
+    Args:
+        directory: The directory.
+
+    Returns:
+        A tuple consisting of the sorted file names and the sorted sub directory names.
+    """
+    file_names = []
+    directory_names = []
+
+    with os.scandir(directory or '.') as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+
+            if entry.is_dir():
+                directory_names.append(entry.name)
+            else:
+                file_names.append(entry.name)
+
+    return sorted(file_names), sorted(directory_names)
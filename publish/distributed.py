@@ -0,0 +1,645 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers distributed rendering: a build sends the chapters to `publish worker`
+processes on other hosts, which apply the substitutions, render the markdown and send the
+html back.
+
+The protocol is deliberately simple. Every message is a json object, utf-8 encoded and
+prefixed with its length as 4 byte big endian unsigned integer. A coordinator opens one
+connection per worker and starts it with a hello message holding the substitutions and
+limits of the output, which the worker answers with ready. Then it sends one job at a time,
+the markdown of a chapter, and the worker answers each with the html or the error::
+
+    -> {'type': 'hello', 'version': 2, 'substitutions': [...], 'render_timeout': ...}
+    <- {'type': 'ready'}
+    -> {'type': 'job', 'id': 7, 'src': 'chapter.md', 'text': '# Chapter ...'}
+    <- {'type': 'result', 'id': 7, 'html': '<h1>Chapter ...', 'fallback': False}
+
+Only json crosses the wire, so a worker never runs code sent by a coordinator. It does run
+the regular expressions of the substitutions though: only run workers on a trusted network.
+"""
+
+import itertools
+import json
+import logging
+import queue
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from publish.isolation import RENDER_FALLBACK_FAIL, RenderWorker, SubstitutionWorker
+from publish.substitution import RegexSubstitution, SimpleSubstitution, Substitution
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct('>I')
+DEFAULT_RETRIES = 2
+DEFAULT_CONNECT_TIMEOUT = 10.0
+JOBS_PER_WORKER = 2
+POLL_INTERVAL = 0.1
+DEFAULT_WORKER_ADDRESS = '127.0.0.1:8765'
+
+_JOB_IDS = itertools.count(1)
+
+
+class ProtocolError(Exception):
+    """A peer sent a message that does not follow the protocol."""
+
+
+class RemoteRenderError(Exception):
+    """A chapter could not be rendered by the render workers.
+
+    Args:
+        src: The src of the chapter.
+        message: The reason.
+
+    Attributes:
+        src (str): The src of the chapter.
+    """
+
+    def __init__(self, src: str, message: str):
+        """Initializes a new instance of the :class:`RemoteRenderError` class.
+        """
+        super().__init__(f'Rendering {src} failed: {message}')
+        self.src = src
+
+
+class RenderSettings(NamedTuple):
+    """How the render workers render the chapters of a coordinator and how the coordinator
+    deals with workers that die.
+
+    Attributes:
+        substitution_timeout: The time budget of each substitution per chapter, applied by
+            the worker. (see publish.isolation)
+        render_timeout: The time limit per chapter, applied by the worker.
+        render_memory_limit: The memory limit per chapter in MiB, applied by the worker.
+        render_fallback: 'fail' or 'pre'.
+        highlight: Determines whether the worker highlights fenced code blocks.
+            (see publish.highlighting)
+        retries: The number of times a job is sent again after its worker died.
+        connect_timeout: The time in seconds to wait for a worker to accept a connection.
+    """
+    substitution_timeout: Optional[float] = None
+    render_timeout: Optional[float] = None
+    render_memory_limit: Optional[float] = None
+    render_fallback: str = RENDER_FALLBACK_FAIL
+    highlight: bool = False
+    retries: int = DEFAULT_RETRIES
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+
+
+class RenderCoordinator:
+    """The RenderCoordinator sends chapters to render workers and collects their html.
+
+    One thread per worker keeps a connection open and takes the next job from a shared
+    queue whenever its worker is idle, so faster workers render more chapters. If a
+    connection breaks while a job is in flight, the job is put back into the queue for any
+    worker and the thread connects again. A worker that can not be reached is given up,
+    its thread ends. A job that was in flight on more than `retries` broken connections
+    fails, so a chapter that kills every worker it is sent to does not kill all of them.
+
+    Args:
+        addresses: The (host, port) of every worker.
+        substitutions: The list of substitutions, only SimpleSubstitution and
+            RegexSubstitution can be sent to workers.
+        settings: How the workers render the chapters.
+
+    Raises:
+        ValueError: If a substitution can not be sent to workers.
+
+    Examples:
+
+        .. code-block:: python
+
+            with RenderCoordinator([('build-1', 8765), ('build-2', 8765)],
+                                   substitutions) as coordinator:
+                for html, fallback, seconds in coordinator.render(texts_and_srcs):
+                    ...
+    """
+
+    def __init__(self,
+                 addresses: Iterable[Tuple[str, int]],
+                 substitutions: Iterable[Substitution],
+                 settings: RenderSettings = RenderSettings()):
+        """Initializes a new instance of the :class:`RenderCoordinator` class.
+        """
+        self.addresses = list(addresses)
+        self.settings = settings
+        self._hello = {'type': 'hello',
+                       'version': PROTOCOL_VERSION,
+                       'substitutions': [_dump_substitution(substitution)
+                                         for substitution in substitutions or []],
+                       'substitution_timeout': settings.substitution_timeout,
+                       'render_timeout': settings.render_timeout,
+                       'render_memory_limit': settings.render_memory_limit,
+                       'render_fallback': settings.render_fallback,
+                       'highlight': settings.highlight}
+        self._jobs: queue.Queue = queue.Queue()
+        # The thread of every worker still alive and its connection, if it is connected.
+        self._workers: Dict[threading.Thread, Optional[socket.socket]] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """Starts a connection thread for every worker."""
+        threads = [threading.Thread(target=self._run, args=(address,), daemon=True,
+                                    name=f'publish-coordinator-{address[0]}:{address[1]}')
+                   for address in self.addresses]
+
+        with self._lock:
+            self._workers.update((thread, None) for thread in threads)
+
+        for thread in threads:
+            thread.start()
+
+    def close(self):
+        """Closes the connections to the workers. Jobs not done yet fail."""
+        self._closed.set()
+
+        with self._lock:
+            threads = list(self._workers)
+
+            for connection in self._workers.values():
+                if connection:
+                    _shutdown(connection)
+
+        for thread in threads:
+            thread.join()
+
+        self._fail_queued('the coordinator was closed')
+
+    def submit(self, text: str, src: str = '') -> Future:
+        """Sends the markdown of a chapter to the next idle worker.
+
+        Args:
+            text: The markdown text of the chapter.
+            src: The src of the chapter.
+
+        Returns:
+            A future of a tuple consisting of the html, whether the chapter was rendered as
+            preformatted text because it exceeded a render limit and the seconds from
+            sending the chapter to receiving its html. The future fails with a
+            RemoteRenderError.
+        """
+        future: Future = Future()
+
+        job = _Job(src, text, future)
+
+        with self._lock:
+            if not self._workers:
+                job.fail('no render worker is left')
+                return future
+
+            self._jobs.put(job)
+
+        return future
+
+    def render(self, texts: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, bool, float]]:
+        """Renders chapters on the workers, yielding their html in the order of the
+        chapters.
+
+        A few chapters per worker are in flight at any time, so every worker stays busy
+        while the memory used is bounded by the chapters in flight rather than the book.
+
+        Args:
+            texts: The markdown text and the src of every chapter.
+
+        Returns:
+            A generator yielding the result (see submit) of every chapter.
+
+        Raises:
+            RemoteRenderError: If a chapter could not be rendered.
+        """
+        window = max(1, len(self.addresses) * JOBS_PER_WORKER)
+        futures: List[Future] = []
+
+        for text, src in texts:
+            futures.append(self.submit(text, src))
+
+            if len(futures) >= window:
+                yield futures.pop(0).result()
+
+        while futures:
+            yield futures.pop(0).result()
+
+    def _run(self, address: Tuple[str, int]):
+        """Runs in the thread of a worker: sends it jobs until the coordinator is closed or
+        the worker can not be reached any more.
+
+        Args:
+            address: The (host, port) of the worker.
+        """
+        name = f'{address[0]}:{address[1]}'
+        thread = threading.current_thread()
+
+        try:
+            while not self._closed.is_set():
+                try:
+                    connection = self._connect(address)
+                except (OSError, ProtocolError) as error:
+                    LOG.warning(f'Giving up render worker {name} ({error}).')
+                    return
+
+                with self._lock:
+                    self._workers[thread] = connection
+
+                try:
+                    self._send_jobs(connection, name)
+                finally:
+                    with self._lock:
+                        self._workers[thread] = None
+                    connection.close()
+        finally:
+            with self._lock:
+                del self._workers[thread]
+                alive = len(self._workers)
+
+            if not alive:
+                self._fail_queued('no render worker is left')
+
+    def _connect(self, address: Tuple[str, int]) -> socket.socket:
+        """Connects to a worker and says hello.
+
+        Args:
+            address: The (host, port) of the worker.
+
+        Returns:
+            The connection.
+
+        Raises:
+            OSError: If the worker can not be reached.
+            ProtocolError: If the worker refused the hello.
+        """
+        connection = socket.create_connection(address, timeout=self.settings.connect_timeout)
+
+        try:
+            connection.settimeout(None)
+            send_message(connection, self._hello)
+            reply = receive_message(connection)
+        except BaseException:
+            connection.close()
+            raise
+
+        if reply.get('type') != 'ready':
+            connection.close()
+            raise ProtocolError(reply.get('message', f'unexpected reply {reply.get("type")}'))
+
+        return connection
+
+    def _send_jobs(self, connection: socket.socket, name: str):
+        """Sends jobs over a connection until the coordinator is closed or the connection
+        breaks. The job in flight when it breaks is put back into the queue.
+
+        Args:
+            connection: The connection.
+            name: The name of the worker, for log messages.
+        """
+        while not self._closed.is_set():
+            try:
+                job = self._jobs.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            started = time.perf_counter()
+
+            try:
+                send_message(connection, {'type': 'job', 'id': job.id, 'src': job.src,
+                                          'text': job.text})
+                reply = receive_message(connection)
+
+                if reply.get('id') != job.id:
+                    raise ProtocolError(f'expected a reply to job {job.id}')
+            except (OSError, ProtocolError) as error:
+                job.attempts += 1
+
+                if self._closed.is_set():
+                    job.fail('the coordinator was closed')
+                elif job.attempts > self.settings.retries:
+                    job.fail(f'{job.attempts} render workers died while working on it')
+                else:
+                    LOG.warning(f'Render worker {name} died while working on {job.src} '
+                                f'({error}), sending it to another worker.')
+                    self._jobs.put(job)
+                return
+
+            if reply.get('type') == 'result':
+                job.future.set_result((reply['html'], bool(reply.get('fallback')),
+                                       time.perf_counter() - started))
+            else:
+                job.fail(reply.get('error', f'unexpected reply {reply.get("type")}'))
+
+    def _fail_queued(self, reason: str):
+        """Fails every job still queued.
+
+        Args:
+            reason: The reason.
+        """
+        while True:
+            try:
+                self._jobs.get_nowait().fail(reason)
+            except queue.Empty:
+                return
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """The WorkerServer renders the chapters sent by coordinators, one thread per
+    connection. (see `publish worker`)
+
+    Args:
+        address: The (host, port) to listen on. Port 0 picks a free port, see
+            server_address.
+
+    Examples:
+
+        .. code-block:: python
+
+            with WorkerServer(('0.0.0.0', 8765)) as server:
+                server.serve_forever()
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int]):
+        """Initializes a new instance of the :class:`WorkerServer` class.
+        """
+        super().__init__(address, _WorkerHandler)
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    """Handles the connection of a coordinator: renders its jobs until it disconnects."""
+
+    def handle(self):
+        try:
+            hello = receive_message(self.request)
+        except (OSError, ProtocolError):
+            return
+
+        try:
+            substitutions = _load_hello(hello)
+            worker = SubstitutionWorker(substitutions, timeout=hello['substitution_timeout'])
+            renderer = RenderWorker(timeout=hello['render_timeout'],
+                                    memory_limit=hello['render_memory_limit'],
+                                    fallback=hello['render_fallback'],
+                                    highlight=bool(hello['highlight']))
+        except (KeyError, TypeError, ValueError, re.error, ProtocolError) as error:
+            send_message(self.request, {'type': 'error', 'message': str(error)})
+            return
+
+        LOG.info(f'Rendering for {self.client_address[0]}:{self.client_address[1]} ...')
+        send_message(self.request, {'type': 'ready'})
+
+        with worker, renderer:
+            while True:
+                try:
+                    job = receive_message(self.request)
+                except (OSError, ProtocolError):
+                    return
+
+                send_message(self.request, _render_job(job, worker, renderer))
+
+
+def run_worker(address: Tuple[str, int]):
+    """Runs a worker until it is interrupted.
+
+    Args:
+        address: The (host, port) to listen on.
+    """
+    with WorkerServer(address) as server:
+        host, port = server.server_address[:2]
+        LOG.info(f'Render worker listening on {host}:{port} ...')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            LOG.info('... render worker stopped')
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Parses a worker address.
+
+    Args:
+        address: The address, e.g. 'build-1:8765' or '[::1]:8765'.
+
+    Returns:
+        A tuple consisting of the host and the port.
+
+    Raises:
+        ValueError: If the address is not of the form HOST:PORT.
+    """
+    host, separator, port = address.strip().rpartition(':')
+
+    if not separator or not host or not port.isdigit() or not 0 <= int(port) <= 65535:
+        raise ValueError(f'{address!r} is not a worker address of the form HOST:PORT.')
+
+    return host.strip('[]'), int(port)
+
+
+def send_message(connection: socket.socket, message: Dict):
+    """Sends a message.
+
+    Args:
+        connection: The connection.
+        message: The message, any json serializable dictionary.
+
+    Raises:
+        ProtocolError: If the message is too large.
+    """
+    payload = json.dumps(message).encode('utf-8')
+
+    if len(payload) > 2**32 - 1:
+        raise ProtocolError(f'The message of {len(payload)} bytes is too large.')
+
+    connection.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def receive_message(connection: socket.socket) -> Dict:
+    """Receives a message.
+
+    Args:
+        connection: The connection.
+
+    Returns:
+        The message.
+
+    Raises:
+        ProtocolError: If the peer closed the connection or sent something that is not a
+            message.
+    """
+    size, = HEADER.unpack(_receive_exactly(connection, HEADER.size))
+
+    try:
+        message = json.loads(_receive_exactly(connection, size).decode('utf-8'))
+    except ValueError as error:
+        raise ProtocolError(f'invalid message ({error})') from None
+
+    if not isinstance(message, dict):
+        raise ProtocolError('invalid message')
+
+    return message
+
+
+class _Job:
+    """A chapter to be rendered by a worker.
+
+    Args:
+        src: The src of the chapter.
+        text: The markdown text of the chapter.
+        future: The future of the result.
+    """
+
+    # A job is a record passed between the threads, fail keeps its two outcomes together.
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, src: str, text: str, future: Future):
+        """Initializes a new instance of the :class:`_Job` class.
+        """
+        self.id = next(_JOB_IDS)  # pylint: disable=invalid-name
+        self.src = src
+        self.text = text
+        self.future = future
+        self.attempts = 0
+
+    def fail(self, reason: str):
+        """Fails the job.
+
+        Args:
+            reason: The reason.
+        """
+        self.text = None
+        self.future.set_exception(RemoteRenderError(self.src, reason))
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    """Receives exactly size bytes.
+
+    Args:
+        connection: The connection.
+        size: The number of bytes.
+
+    Returns:
+        The bytes.
+
+    Raises:
+        ProtocolError: If the peer closed the connection before.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+
+    while received < size:
+        count = connection.recv_into(view[received:], size - received)
+        if not count:
+            raise ProtocolError('the connection was closed')
+        received += count
+
+    return bytes(buffer)
+
+
+def _shutdown(connection: socket.socket):
+    """Shuts a connection down, ending any receive waiting on it.
+
+    Args:
+        connection: The connection.
+    """
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _render_job(job: Dict, worker: SubstitutionWorker, renderer: RenderWorker) -> Dict:
+    """Applies the substitutions to the markdown of a job and renders it.
+
+    Args:
+        job: The job message.
+        worker: The substitution worker.
+        renderer: The render worker.
+
+    Returns:
+        The result message, or the error message if the chapter could not be rendered.
+    """
+    src = job.get('src', '')
+    fallbacks = len(renderer.fallback_srcs)
+
+    try:
+        html = renderer.render(worker.apply(job['text'], src), src)
+    except Exception as error:  # pylint: disable=broad-except
+        LOG.warning(f'Rendering {src} failed: {error}')
+        return {'type': 'error', 'id': job.get('id'), 'error': str(error)}
+
+    return {'type': 'result', 'id': job.get('id'), 'html': html,
+            'fallback': len(renderer.fallback_srcs) > fallbacks}
+
+
+def _dump_substitution(substitution: Substitution) -> Dict:
+    """Translates a substitution into a dictionary of the project format.
+
+    Args:
+        substitution: The substitution.
+
+    Returns:
+        The dictionary.
+
+    Raises:
+        ValueError: If the substitution is neither a SimpleSubstitution nor a
+            RegexSubstitution.
+    """
+    if type(substitution) is SimpleSubstitution:  # pylint: disable=unidiomatic-typecheck
+        return {'old': substitution.old, 'new': substitution.new}
+
+    if type(substitution) is RegexSubstitution:  # pylint: disable=unidiomatic-typecheck
+        pattern = substitution.regular_expression.pattern
+        if isinstance(pattern, str):
+            return {'pattern': pattern, 'replace_with': substitution.replace_with}
+
+    raise ValueError(f'{substitution!r} can not be sent to render workers, only simple and '
+                     'regex substitutions with str patterns can.')
+
+
+def _load_hello(hello: Dict) -> List[Substitution]:
+    """Checks the hello of a coordinator and loads its substitutions.
+
+    Args:
+        hello: The hello message.
+
+    Returns:
+        The list of substitutions.
+
+    Raises:
+        ProtocolError: If the message is not a hello of this protocol version.
+    """
+    if hello.get('type') != 'hello' or hello.get('version') != PROTOCOL_VERSION:
+        raise ProtocolError(f'expected a hello of protocol version {PROTOCOL_VERSION}')
+
+    substitutions = []
+
+    for substitution in hello['substitutions']:
+        if 'old' in substitution:
+            substitutions.append(SimpleSubstitution(substitution['old'], substitution['new']))
+        else:
+            substitutions.append(RegexSubstitution(substitution['pattern'],
+                                                   substitution['replace_with']))
+
+    return substitutions
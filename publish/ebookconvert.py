@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the command line of Kovid Goyals ebook-convert, which turns the html
+documents of EbookConvertOutput into ebooks. (see publish.output)
+
+The attributes of a book supported by ebook-convert are passed to it as metadata options.
+"""
+
+import asyncio
+import logging
+import subprocess  # nosec
+from textwrap import fill
+from typing import Generator, Iterable, Optional, Sequence
+
+from publish.book import Book
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+SUPPORTED_EBOOKCONVERT_ATTRIBUTES = (
+    'author_sort',
+    'authors',
+    'book_producer',
+    'comments',
+    'cover',
+    'isbn',
+    'language',
+    'pubdate',
+    'publisher',
+    'rating',
+    'series',
+    'series_index',
+    'tags',
+    'title'
+)
+
+
+def get_ebook_convert_params(book: Book,
+                             input_path: str,
+                             output_path: str,
+                             additional_params: Optional[Iterable[str]] = None
+                             ) -> Sequence[str]:
+    """Gets the call params for the ebookconvert commandline.
+
+    The book's attributes are translated into ebookconvert metadata commandline options
+    while any additional options present in EbookConvertOutput.ebookconvert_params are
+    appended to the call params as is.
+
+    Args:
+        book: The book object.
+        input_path: The path the html file that will be passed to ebookconvert.
+        output_path: The output path.
+    """
+    if not additional_params:
+        additional_params = []
+
+    call_params = [
+        'ebook-convert',
+        input_path,
+        output_path
+    ]
+    call_params.extend(yield_attributes_as_params(book))
+    call_params.extend(additional_params)
+    return call_params
+
+
+def call_ebook_convert(call_params: Sequence[str]) -> Optional[int]:
+    """Calls ebook-convert and waits for it to exit.
+
+    Args:
+        call_params: The call params. (see get_ebook_convert_params)
+
+    Returns:
+        The exit code of ebook-convert, or None if it could not be found.
+    """
+    LOG.info('Calling ebook-convert ...')
+
+    try:
+        return subprocess.call(call_params, shell=False)  # nosec
+    except FileNotFoundError:
+        _log_ebook_convert_not_found()
+        return None
+
+
+async def call_ebook_convert_async(call_params: Sequence[str]) -> Optional[int]:
+    """Calls ebook-convert as an asyncio subprocess and awaits its exit.
+
+    Cancelling the awaiting task kills ebook-convert. The cancellation completes once it
+    exited.
+
+    Args:
+        call_params: The call params. (see get_ebook_convert_params)
+
+    Returns:
+        The exit code of ebook-convert, or None if it could not be found.
+    """
+    LOG.info('Calling ebook-convert ...')
+
+    try:
+        process = await asyncio.create_subprocess_exec(*call_params)
+    except FileNotFoundError:
+        _log_ebook_convert_not_found()
+        return None
+
+    try:
+        return await process.wait()
+    except asyncio.CancelledError:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise
+
+
+def _log_ebook_convert_not_found():
+    """Logs that ebook-convert could not be found."""
+    LOG.error(
+        fill('Could not find ebook-convert. Please install calibre if you want to '
+             'use EbookconvertOutput and make sure ebook-convert is accessible '
+             'through the PATH variable.'))
+
+
+def yield_attributes_as_params(object_) -> Generator[str, None, None]:
+    """Takes an object or dictionary and returns a generator yielding all
+    attributes that can be processed by the ebookconvert command line as a
+    parameter array.
+
+    Args:
+        object_: An object or dictionary.
+
+    Returns:
+        A generator yielding all attributes of the object supported
+        by ebookconvert.
+    """
+    # This way the book can contain attributes not supported by ebookconvert
+    # (or any other specific output that follows this explicit pattern)
+    for attr_name in SUPPORTED_EBOOKCONVERT_ATTRIBUTES:
+        if hasattr(object_, attr_name):
+            attr = getattr(object_, attr_name)
+        else:
+            try:
+                attr = object_[attr_name]
+            except (TypeError, KeyError):
+                continue
+
+        if not attr:
+            continue
+
+        attr = str(attr)
+        if attr and not attr.isspace():
+            yield f'--{attr_name}={attr}'
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the heading index, from which the table of contents of a book is
+generated and references to headings are resolved.
+
+The headings and links of a chapter are extracted from its rendered html once and cached
+with it: the offsets of the heading tags and link targets in the html. When the document is
+written, the ids of the headings and the resolved link targets are inserted at those
+offsets, so an unchanged chapter is neither rendered nor parsed again.
+
+Ids are unique across the whole book. The first heading with a slug gets the slug itself,
+later ones get a number appended, e.g. 'introduction-1'. A reference '#introduction'
+resolves to the heading of the chapter it is written in, if that chapter has one, and to
+the first heading of the book with the slug otherwise. 'other.md#introduction' resolves to
+the heading of the chapter other.md, relative to the chapter the reference is written in.
+If the chapters are split into pages, a reference to a heading on another page points to
+that page.
+
+The table of contents comes before the chapters but needs the headings of all of them, so
+the chapter spool keeps the html of the chapters in a temporary file while their headings are
+collected, and the document is written from it afterwards.
+"""
+
+import hashlib
+import html
+import logging
+import posixpath
+import re
+import unicodedata
+from tempfile import TemporaryFile
+from typing import Dict, Iterator, List, Optional, Sequence, Set, TextIO, Tuple
+
+from publish.cache import BuildCache
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+HEADINGS_CACHE_NAMESPACE = 'headings'
+DEFAULT_TOC_DEPTH = 3
+
+HEADING_PATTERN = re.compile(r'<h([1-6])(\s[^>]*)?>(.*?)</h\1\s*>', re.IGNORECASE | re.DOTALL)
+ID_PATTERN = re.compile(r'\sid\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+LINK_PATTERN = re.compile(r'<a\s[^>]*?\bhref="([^"]*#[^"]*)"', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+class Heading:
+    """A heading of the book.
+
+    Args:
+        level: The level, 1 to 6.
+        text: The text, without markup.
+        slug: The slug of the text.
+        src: The src of the chapter.
+        position: The position of the chapter in the document.
+
+    Attributes:
+        level (int): The level, 1 to 6.
+        text (str): The text, without markup.
+        slug (str): The slug of the text.
+        src (str): The src of the chapter.
+        position (int): The position of the chapter in the document.
+        id (str): The id of the heading, unique across the book.
+    """
+
+    # A heading is a record, its slots keep the headings of a long book small.
+    # pylint: disable=too-few-public-methods
+
+    __slots__ = ('level', 'text', 'slug', 'src', 'position', 'id')
+
+    def __init__(self, level: int, text: str, slug: str, src: str, position: int = 0):
+        """Initializes a new instance of the :class:`Heading` class.
+        """
+        self.level = level
+        self.text = text
+        self.slug = slug
+        self.src = src
+        self.position = position
+        self.id = slug  # pylint: disable=invalid-name
+
+    def __repr__(self) -> str:
+        return f'Heading({self.level}, {self.text!r}, id={self.id!r}, src={self.src!r})'
+
+
+class HeadingIndex:
+    """The HeadingIndex collects the headings of every chapter of a document, assigns them
+    ids unique across the document and resolves the references between them.
+
+    Add the chapters in the order of the document first, then get the table of contents
+    and write the chapters.
+
+    Examples:
+
+        .. code-block:: python
+
+            index = HeadingIndex()
+            for chapter, html in chapters:
+                index.add_chapter(chapter.src, extract_headings(html))
+
+            toc = index.get_toc()
+            for position, (chapter, html) in enumerate(chapters):
+                index.write_chapter(file, position, html)
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the :class:`HeadingIndex` class.
+        """
+        self._chapters: List[Tuple[str, Dict, List[Heading]]] = []
+        self._reserved: Set[str] = set()
+        self._ids: Set[str] = set()
+        self._slugs: Dict[str, Dict[str, str]] = {}
+        self._first: Dict[str, str] = {}
+        self._positions: Dict[str, int] = {}
+        self._assigned = False
+
+    def add_chapter(self, src: str, extract: Dict):
+        """Adds the headings of the next chapter.
+
+        Args:
+            src: The src of the chapter.
+            extract: The headings and links of the chapter. (see extract_headings)
+        """
+        headings = []
+
+        for _offset, level, text, slug, has_id in extract['headings']:
+            heading = Heading(level, text, slug, src, len(self._chapters))
+            headings.append(heading)
+
+            if has_id:
+                self._reserved.add(slug)
+
+        self._chapters.append((src, extract, headings))
+        self._assigned = False
+
+    @property
+    def headings(self) -> List[Heading]:
+        """The headings of all chapters added, with their ids, in the order of the document.
+        """
+        self._assign_ids()
+        return [heading for _src, _extract, headings in self._chapters for heading in headings]
+
+    def get_chapter_headings(self, position: int) -> List[Heading]:
+        """Gets the headings of a chapter, with their ids.
+
+        Args:
+            position: The position of the chapter in the order it was added.
+
+        Returns:
+            The headings of the chapter in the order of the document.
+        """
+        self._assign_ids()
+        return self._chapters[position][2]
+
+    def get_toc(self, depth: int = DEFAULT_TOC_DEPTH) -> List[Heading]:
+        """Gets the headings for the table of contents.
+
+        Args:
+            depth: The deepest level listed.
+
+        Returns:
+            The headings up to the depth in the order of the document.
+        """
+        return [heading for heading in self.headings if heading.level <= depth]
+
+    def resolve(self, href: str, src: str) -> Optional[str]:
+        """Resolves a reference to a heading.
+
+        Args:
+            href: The link target, e.g. '#slug' or 'other.md#slug'.
+            src: The src of the chapter the reference is written in.
+
+        Returns:
+            The id of the heading, or None if the reference is not to a chapter of the
+            document or is already an id.
+        """
+        self._assign_ids()
+        path, _separator, fragment = href.partition('#')
+
+        if not path:
+            return self._resolve_fragment(fragment, src)
+
+        if ':' in path or path.startswith('/'):
+            return None
+
+        target = _normalize(posixpath.join(posixpath.dirname(_normalize(src)), path))
+        if target not in self._slugs:
+            return None
+
+        if fragment not in self._slugs[target]:
+            LOG.warning(f'{src}: {href} does not match any heading of {target}.')
+            return None
+
+        return self._slugs[target][fragment]
+
+    def write_chapter(self,
+                      file: TextIO,
+                      position: int,
+                      html_: str,
+                      pages: Optional[Sequence[str]] = None):
+        """Writes the html of a chapter with the ids of its headings and its references
+        resolved.
+
+        Args:
+            file: The text file.
+            position: The position of the chapter in the order it was added.
+            html_: The html of the chapter, as extracted.
+            pages: The url of the page of every chapter, if the chapters are split into
+                pages. References to headings on another page get the url of that page.
+        """
+        self._assign_ids()
+        edits = self._get_id_edits(position) + self._get_link_edits(position, pages)
+
+        written = 0
+        for start, end, text in sorted(edits):
+            file.write(html_[written:start])
+            file.write(text)
+            written = end
+
+        file.write(html_[written:])
+
+    def _resolve_fragment(self, fragment: str, src: str) -> Optional[str]:
+        """Resolves a reference to a heading without a path, e.g. '#slug'.
+
+        Args:
+            fragment: The slug or id of the heading.
+            src: The src of the chapter the reference is written in.
+
+        Returns:
+            The id of the heading of the chapter or, if it has none, of the first heading of
+            the document with the slug, or None if the reference is already an id.
+        """
+        ids = self._slugs.get(_normalize(src), {})
+
+        if fragment in ids:
+            return ids[fragment]
+
+        if fragment not in self._first and fragment not in self._ids:
+            LOG.warning(f'{src}: #{fragment} does not match any heading.')
+
+        return self._first.get(fragment)
+
+    def _get_id_edits(self, position: int) -> List[Tuple[int, int, str]]:
+        """Gets the ids to insert into the heading tags of a chapter that have none.
+
+        Args:
+            position: The position of the chapter in the order it was added.
+
+        Returns:
+            The start and end offset of every edit and the text inserted.
+        """
+        _src, extract, headings = self._chapters[position]
+
+        return [(offset, offset, f' id="{html.escape(heading.id)}"')
+                for (offset, _level, _text, _slug, has_id), heading
+                in zip(extract['headings'], headings) if not has_id]
+
+    def _get_link_edits(self,
+                        position: int,
+                        pages: Optional[Sequence[str]]) -> List[Tuple[int, int, str]]:
+        """Gets the resolved targets of the references to headings of a chapter.
+
+        Args:
+            position: The position of the chapter in the order it was added.
+            pages: The url of the page of every chapter, or None. (see write_chapter)
+
+        Returns:
+            The start and end offset of every edit and the text inserted.
+        """
+        src, extract, _headings = self._chapters[position]
+        edits = []
+
+        for start, end, href in extract['links']:
+            target = self.resolve(html.unescape(href), src)
+            if target is not None:
+                page = pages[self._positions[target]] if pages else ''
+                if pages and page == pages[position]:
+                    page = ''
+                edits.append((start, end, f'{html.escape(page)}#{html.escape(target)}'))
+
+        return edits
+
+    def _assign_ids(self):
+        """Assigns every heading its id, unless the ids were assigned since the last
+        chapter was added."""
+        if self._assigned:
+            return
+
+        self._ids = set(self._reserved)
+        self._slugs = {}
+        self._first = {}
+        self._positions = {}
+
+        for src, extract, headings in self._chapters:
+            slugs = self._slugs.setdefault(_normalize(src), {})
+
+            for heading, (_offset, _level, _text, _slug, has_id) in zip(headings,
+                                                                        extract['headings']):
+                if not has_id:
+                    heading.id = _get_unique_id(heading.slug, self._ids)
+                self._ids.add(heading.id)
+                self._positions.setdefault(heading.id, heading.position)
+                slugs.setdefault(heading.slug, heading.id)
+                self._first.setdefault(heading.slug, heading.id)
+
+        self._assigned = True
+
+
+class ChapterSpool:
+    """The ChapterSpool adds the headings of the chapters of a document to a heading index
+    and spools their html to a temporary file meanwhile, so the document can be written once
+    the headings of all chapters are known without holding all of its html in memory.
+
+    Args:
+        cache: The build cache the headings of the chapters are stored in and reused from,
+            or None. (see load_headings)
+
+    Attributes:
+        index (HeadingIndex): The heading index of the chapters added.
+        sizes (List[int]): The size of the html of every chapter in bytes.
+        hashes (List[str]): The sha256 hex digest of the html of every chapter.
+
+    Examples:
+
+        .. code-block:: python
+
+            with ChapterSpool() as spool:
+                for chapter, key, html in chapters:
+                    spool.add_chapter(chapter.src, key, html)
+
+                file.write(get_head(spool.index.get_toc()))
+                spool.write_chapters(file)
+    """
+
+    def __init__(self, cache: Optional[BuildCache] = None):
+        """Initializes a new instance of the :class:`ChapterSpool` class.
+        """
+        self.cache = cache
+        self.index = HeadingIndex()
+        self.sizes: List[int] = []
+        self.hashes: List[str] = []
+        self._file = TemporaryFile()  # pylint: disable=consider-using-with
+
+    def __enter__(self) -> 'ChapterSpool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_chapter(self, src: str, key: Optional[str], html_: str) -> Dict:
+        """Adds the next chapter.
+
+        Args:
+            src: The src of the chapter.
+            key: The render key of the chapter, or None if its html is not cached.
+            html_: The html of the chapter.
+
+        Returns:
+            The headings and links of the chapter. (see extract_headings)
+        """
+        extract = load_headings(html_, key, self.cache)
+        self.index.add_chapter(src, extract)
+
+        data = html_.encode('utf-8')
+        self._file.write(data)
+        self.sizes.append(len(data))
+        self.hashes.append(hashlib.sha256(data).hexdigest())
+        return extract
+
+    def read_chapters(self) -> Iterator[Tuple[int, str]]:
+        """Reads the html of the chapters back, one chapter at a time.
+
+        Returns:
+            A generator yielding the position and the html of every chapter as extracted, in
+            the order the chapters were added. (see HeadingIndex.write_chapter)
+        """
+        self._file.seek(0)
+
+        for position, size in enumerate(self.sizes):
+            yield position, self._file.read(size).decode('utf-8')
+
+    def write_chapters(self, file: TextIO):
+        """Writes the html of the chapters with the ids of their headings and their
+        references resolved.
+
+        Args:
+            file: The text file.
+        """
+        for position, html_ in self.read_chapters():
+            if position:
+                file.write('\n')
+            self.index.write_chapter(file, position, html_)
+
+    def close(self):
+        """Removes the temporary file."""
+        self._file.close()
+
+
+def load_headings(html_: str, key: Optional[str], cache: Optional[BuildCache] = None) -> Dict:
+    """Loads the headings and links of a chapter from the cache or extracts them from its
+    html.
+
+    Args:
+        html_: The html of the chapter.
+        key: The render key of the chapter, or None if its html is not cached.
+        cache: The build cache, or None.
+
+    Returns:
+        The headings and links. (see extract_headings)
+    """
+    headings = cache.load_json(HEADINGS_CACHE_NAMESPACE, key) if cache and key else None
+
+    if headings is not None:
+        return headings
+
+    headings = extract_headings(html_)
+
+    if cache and key:
+        cache.save_json(HEADINGS_CACHE_NAMESPACE, key, headings)
+
+    return headings
+
+
+def extract_headings(html_: str) -> Dict:
+    """Extracts the headings and the links to headings from the html of a chapter.
+
+    Args:
+        html_: The html.
+
+    Returns:
+        A json serializable dictionary with the keys 'headings' and 'links'. Each heading
+        is a list of the offset after its tag name, where an id is inserted, its level,
+        text, slug and whether it has an id already, which is its slug then. Each link is
+        a list of the start and end offset of its target and the target itself.
+    """
+    headings = []
+
+    for match in HEADING_PATTERN.finditer(html_):
+        text = html.unescape(TAG_PATTERN.sub('', match.group(3))).strip()
+        id_match = ID_PATTERN.search(match.group(2) or '')
+
+        if id_match:
+            headings.append([match.end(1), int(match.group(1)), text,
+                             html.unescape(id_match.group(1)), True])
+        else:
+            headings.append([match.end(1), int(match.group(1)), text, slugify(text), False])
+
+    links = [[match.start(1), match.end(1), match.group(1)]
+             for match in LINK_PATTERN.finditer(html_)]
+
+    return {'headings': headings, 'links': links}
+
+
+def slugify(text: str) -> str:
+    """Turns the text of a heading into a slug like the toc extension of markdown does.
+
+    Args:
+        text: The text.
+
+    Returns:
+        The slug, e.g. 'a-heading' for 'A Heading!', or 'section' if nothing is left.
+    """
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    text = re.sub(r'[^\w\s-]', '', text).strip().lower()
+    return re.sub(r'[-\s]+', '-', text) or 'section'
+
+
+def _get_unique_id(slug: str, ids: Set[str]) -> str:
+    """Gets the slug or, if it is taken, the slug with the lowest number appended that is not.
+
+    Args:
+        slug: The slug.
+        ids: The ids taken.
+
+    Returns:
+        The id.
+    """
+    id_ = slug
+    number = 0
+
+    while id_ in ids:
+        number += 1
+        id_ = f'{slug}-{number}'
+
+    return id_
+
+
+def _normalize(src: str) -> str:
+    """Normalizes the src of a chapter for comparisons.
+
+    Args:
+        src: The src.
+
+    Returns:
+        The normalized src.
+    """
+    return posixpath.normpath(src.replace('\\', '/'))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers syntax highlighting of fenced code blocks with Pygments.
+
+Highlighting is by far the most expensive part of rendering a chapter full of code, so the
+html of every block is cached by the hash of its language and code: in memory, shared by
+all chapters and outputs of a build, and in the build cache, shared by all builds. A block
+is only highlighted again once it changes, no matter how many chapters or outputs contain
+it. The html only holds css classes, so it does not depend on the style either; the css of
+the style is generated once and added to the css of the document.
+
+Pygments is optional. Without it, fenced code blocks are rendered as plain preformatted
+text.
+"""
+
+import functools
+import hashlib
+import html
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from markdown import Extension, Markdown
+from markdown.preprocessors import Preprocessor
+
+from publish.cache import BuildCache
+
+try:
+    import pygments
+    from pygments.formatters import HtmlFormatter  # pylint: disable=no-name-in-module
+    from pygments.lexers import TextLexer, get_lexer_by_name  # pylint: disable=no-name-in-module
+    from pygments.styles import get_all_styles
+    from pygments.util import ClassNotFound
+except ImportError:  # pragma: no cover
+    pygments = None
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+HIGHLIGHT_CACHE_NAMESPACE = 'highlights'
+HIGHLIGHT_CSS_CLASS = 'highlight'
+MEMORY_CACHE_SIZE = 4096
+
+FENCE_PATTERN = re.compile(r'''
+    ^(?P<fence>`{3,}|~{3,})[ ]*             # the opening fence
+    \{?\.?(?P<language>[\w#.+-]*)\}?[ ]*\n  # the language, e.g. python or {.python}
+    (?P<code>.*?)(?<=\n)
+    (?P=fence)[ ]*$                         # the closing fence
+    ''', re.MULTILINE | re.DOTALL | re.VERBOSE)
+
+_memory_cache: 'OrderedDict[str, str]' = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+
+class HighlightExtension(Extension):
+    """The HighlightExtension renders the fenced code blocks of markdown texts highlighted.
+
+    Args:
+        cache: The build cache highlighted blocks are stored in and reused from, or None to
+            share them in memory only.
+
+    Examples:
+
+        .. code-block:: python
+
+            renderer = markdown.Markdown(extensions=[HighlightExtension(BuildCache())])
+            html = renderer.convert(text)
+    """
+
+    def __init__(self, cache: Optional[BuildCache] = None):
+        """Initializes a new instance of the :class:`HighlightExtension` class.
+        """
+        super().__init__()
+        self.cache = cache
+
+    def extendMarkdown(self, md: Markdown):  # noqa: N802 pylint: disable=invalid-name
+        """Registers the preprocessor with the markdown instance.
+
+        Args:
+            md: The markdown instance.
+        """
+        # The same priority as the fenced_code extension of markdown.
+        md.preprocessors.register(_FencedCodePreprocessor(md, self.cache),
+                                  'publish_fenced_code', 25)
+
+
+class _FencedCodePreprocessor(Preprocessor):
+    """Replaces every fenced code block with its highlighted html, stashed so markdown
+    leaves it alone."""
+
+    def __init__(self, md: Markdown, cache: Optional[BuildCache]):
+        super().__init__(md)
+        self.cache = cache
+
+    def run(self, lines: List[str]) -> List[str]:
+        text = '\n'.join(lines)
+
+        def stash(match) -> str:
+            html_ = highlight_code(match.group('code'), match.group('language'), self.cache)
+            return self.md.htmlStash.store(html_)
+
+        return FENCE_PATTERN.sub(stash, text).split('\n')
+
+
+def highlight_code(code: str, language: str = '', cache: Optional[BuildCache] = None) -> str:
+    """Highlights a block of code, reusing the html of an identical block highlighted before.
+
+    Args:
+        code: The code.
+        language: The name of the language, e.g. 'python', or '' for plain text. Unknown
+            languages are highlighted as plain text.
+        cache: The build cache, or None to reuse blocks from memory only.
+
+    Returns:
+        The html of the block.
+    """
+    key = get_highlight_key(code, language)
+
+    with _memory_cache_lock:
+        html_ = _memory_cache.get(key)
+        if html_ is not None:
+            _memory_cache.move_to_end(key)
+            return html_
+
+    html_ = cache.load_text(HIGHLIGHT_CACHE_NAMESPACE, key) if cache else None
+
+    if html_ is None:
+        html_ = _highlight(code, language)
+        if cache:
+            cache.save_text(HIGHLIGHT_CACHE_NAMESPACE, key, html_)
+
+    with _memory_cache_lock:
+        _memory_cache[key] = html_
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+    return html_
+
+
+def get_highlight_key(code: str, language: str = '') -> str:
+    """Gets the key the html of a block of code is cached under.
+
+    Args:
+        code: The code.
+        language: The name of the language.
+
+    Returns:
+        The hash of the language, the code and the version of Pygments.
+    """
+    hash_ = hashlib.sha256()
+    for part in (get_highlight_fingerprint(), language.lower(), code):
+        hash_.update(part.encode('utf-8') + b'\0')
+    return hash_.hexdigest()
+
+
+def get_highlight_fingerprint() -> str:
+    """Gets what, besides the code, the html of highlighted blocks depends on.
+
+    Returns:
+        The version of Pygments, if it is installed.
+    """
+    return f'pygments {pygments.__version__}' if pygments else 'no pygments'
+
+
+@functools.lru_cache(maxsize=None)
+def get_highlight_css(style: str) -> str:
+    """Gets the css of a Pygments style for highlighted blocks. It is generated once per
+    style.
+
+    Args:
+        style: The name of the style, e.g. 'default' or 'monokai'.
+
+    Returns:
+        The css, or '' if Pygments is not installed.
+
+    Raises:
+        ValueError: If there is no style with the name.
+    """
+    if not pygments:
+        return ''
+
+    try:
+        formatter = HtmlFormatter(style=style, cssclass=HIGHLIGHT_CSS_CLASS)
+    except ClassNotFound:
+        raise ValueError(f'{style} is not a Pygments style, use one of '
+                         f'{", ".join(sorted(get_all_styles()))}.') from None
+
+    return formatter.get_style_defs(f'.{HIGHLIGHT_CSS_CLASS}')
+
+
+def _highlight(code: str, language: str) -> str:
+    """Highlights a block of code.
+
+    Args:
+        code: The code.
+        language: The name of the language, or ''.
+
+    Returns:
+        The html of the block.
+    """
+    if not pygments:
+        return f'<div class="{HIGHLIGHT_CSS_CLASS}"><pre><code>{html.escape(code)}</code></pre>' \
+               '</div>\n'
+
+    try:
+        lexer = get_lexer_by_name(language) if language else TextLexer()
+    except ClassNotFound:
+        LOG.debug(f'{language} is not a language Pygments knows, highlighting it as text.')
+        lexer = TextLexer()
+
+    return pygments.highlight(code, lexer, HtmlFormatter(cssclass=HIGHLIGHT_CSS_CLASS))
@@ -0,0 +1,866 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the image pipeline, which collects the images referenced by the
+chapters of a document into a directory next to it.
+
+Every image is stored once under a name derived from the hash of its content, however many
+chapters reference it under whatever path, and the references in the html are rewritten to
+it. Images can be downscaled to a maximum width and recompressed with Pillow, if it is
+installed, in a pool of processes while the document is written. Optimized images are kept
+in the build cache, so an image is only optimized again once it or the settings change, and
+an image already in the directory under its name is not even read again.
+
+Lazy images get the attributes that let a browser defer loading and decoding them and
+reserve their space before they arrive: the width and height are read from the headers of
+png, jpeg, gif and webp images, which are cached like the hashes of collected images.
+
+The document images rewrite the image tags of the chapters of a document as they stream by,
+with the lazy images, the image pipeline or both.
+"""
+
+import contextlib
+import hashlib
+import html
+import io
+import json
+import logging
+import os
+import posixpath
+import re
+import shutil
+import struct
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple,
+                    Union)
+from urllib.parse import unquote
+
+from publish.book import Chapter
+from publish.cache import BuildCache, _write_atomically
+from publish.source import CONTAINER_SEPARATOR
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+IMAGE_CACHE_NAMESPACE = 'images'
+IMAGE_SOURCES_NAMESPACE = 'image-sources'
+IMAGE_HASHES_DOCUMENT = 'image-hashes'
+IMAGE_HEADERS_DOCUMENT = 'image-headers'
+IMAGE_DIRECTORY_SUFFIX = '_images'
+OPTIMIZED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+QUALITY_FORMATS = ('JPEG', 'WEBP')
+BLOCK_SIZE = 2**20
+HEADER_SIZE = 32
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SIZE_MARKERS = set(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+EXIF_ORIENTATION_TAG = 0x0112
+
+IMAGE_PATTERN = re.compile(r'(<img\s[^>]*?\bsrc=")([^"]*)"', re.IGNORECASE)
+IMAGE_NAME_PATTERN = re.compile(r'^[0-9a-f]{16}(\.\w+)?$')
+IMAGE_TAG_PATTERN = re.compile(r'(<img\s[^>]*?)(\s*/?>)', re.IGNORECASE)
+SRC_ATTRIBUTE_PATTERN = re.compile(r'\ssrc="([^"]*)"', re.IGNORECASE)
+
+
+class ImageHeader(NamedTuple):
+    """What the header of an image tells about it: its format, as Pillow names it, its width
+    and height in pixels as stored, whether a png or webp image is animated and the exif
+    orientation of a jpeg image, 1 to 8.
+    """
+    format: str
+    width: int
+    height: int
+    animated: bool = False
+    orientation: int = 1
+
+
+class ImageSettings(NamedTuple):
+    """How the images of a document are optimized: the maximum width in pixels, wider
+    images are downscaled, the quality jpeg and webp images are recompressed with, 1 to 100,
+    both requiring Pillow, whether the image tags get the attributes of lazy images and the
+    number of processes images are optimized in, or None for one per cpu.
+    """
+    max_width: Optional[int] = None
+    quality: Optional[int] = None
+    lazy: bool = False
+    workers: Optional[int] = None
+
+
+class ImagePipeline:
+    """The ImagePipeline collects the images referenced by the html of the chapters of a
+    document and rewrites the references.
+
+    A reference is resolved relative to the directory of the chapter and then relative to the
+    project directory. References to urls, data uris and images that do not exist are left
+    alone, the latter are logged. Images no longer referenced are removed from the directory
+    when the pipeline is closed.
+
+    The pipeline is used by a single thread, the one writing the document.
+
+    Args:
+        directory: The directory the images are collected in.
+        document_directory: The directory of the document the references are relative to.
+        settings: How the images are optimized, lazy is left to LazyImages.
+        cache: The build cache optimized images are stored in and reused from, or None.
+
+    Examples:
+
+        .. code-block:: python
+
+            with ImagePipeline('book_images', '.', ImageSettings(max_width=1200)) as pipeline:
+                for chapter, html in chapters:
+                    html, changes = pipeline.rewrite(html, chapter.src)
+    """
+
+    # Besides its settings the pipeline holds the names, hashes and pending jobs of a build.
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self,
+                 directory: str,
+                 document_directory: str,
+                 settings: ImageSettings = ImageSettings(),
+                 cache: Optional[BuildCache] = None):
+        """Initializes a new instance of the :class:`ImagePipeline` class.
+        """
+        if (settings.max_width or settings.quality) and Image is None:
+            LOG.warning('Pillow is not installed, images are collected without being '
+                        'optimized.')
+            settings = settings._replace(max_width=None, quality=None)
+
+        self.directory = directory
+        self.document_directory = document_directory
+        self.settings = settings
+        self.cache = cache
+        self._names: Dict[str, str] = {}
+        self._hashes: Dict[str, list] = cache.load(IMAGE_HASHES_DOCUMENT, {}) if cache else {}
+        self._jobs: List[Tuple[str, str, Future]] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> 'ImagePipeline':
+        return self
+
+    @property
+    def sources(self) -> Set[str]:
+        """The paths of the images collected."""
+        return set(self._names)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    def rewrite(self, html_: str, src: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """Collects the images referenced by the html of a chapter and rewrites the
+        references.
+
+        Args:
+            html_: The html of the chapter.
+            src: The src of the chapter.
+
+        Returns:
+            A tuple consisting of the html and every reference rewritten with the reference
+            it was rewritten to.
+        """
+        changes = []
+
+        def replace(match) -> str:
+            reference = match.group(2)
+            target = self._collect(html.unescape(reference), src)
+
+            if target is None:
+                return match.group(0)
+
+            changes.append((reference, target))
+            return f'{match.group(1)}{html.escape(target)}"'
+
+        return IMAGE_PATTERN.sub(replace, html_), changes
+
+    def close(self):
+        """Waits for the images being optimized, writes them and removes the images no
+        longer referenced from the directory."""
+        try:
+            for key, target, future in self._jobs:
+                data = future.result()
+                _write_atomically(target, data)
+                if self.cache:
+                    self.cache.save_bytes(IMAGE_CACHE_NAMESPACE, key, data)
+        except BaseException:
+            self._abort()
+            raise
+
+        self._jobs = []
+        self._shutdown()
+
+        if self.cache:
+            self.cache.save(IMAGE_HASHES_DOCUMENT, self._hashes)
+
+        if os.path.isdir(self.directory):
+            written = set(self._names.values())
+
+            for name in os.listdir(self.directory):
+                if IMAGE_NAME_PATTERN.match(name) and name not in written:
+                    os.remove(os.path.join(self.directory, name))
+
+    def _collect(self, reference: str, src: str) -> Optional[str]:
+        """Collects the image a reference points to.
+
+        Args:
+            reference: The reference, e.g. 'images/cover.png'.
+            src: The src of the chapter.
+
+        Returns:
+            The reference to the collected image, or None if the reference is left alone.
+        """
+        if not _is_local_reference(reference):
+            return None
+
+        path = _resolve_reference(reference, src)
+
+        if path is None:
+            LOG.warning(f'{src}: image {reference} does not exist.')
+            return None
+
+        if path not in self._names:
+            self._names[path] = self._add(path)
+
+        target = os.path.relpath(os.path.join(self.directory, self._names[path]),
+                                 self.document_directory)
+        return posixpath.join(*target.split(os.sep))
+
+    def _add(self, path: str) -> str:
+        """Adds an image to the directory, unless it is there already.
+
+        Args:
+            path: The path of the image.
+
+        Returns:
+            The name of the image in the directory.
+        """
+        key = hashlib.sha256()
+        for part in (self._get_content_hash(path), self._get_settings()):
+            key.update(part.encode('utf-8') + b'\0')
+        key = key.hexdigest()
+
+        name = key[:16] + os.path.splitext(path)[1].lower()
+        target = os.path.join(self.directory, name)
+
+        if os.path.exists(target):
+            return name
+
+        data = self.cache.load_bytes(IMAGE_CACHE_NAMESPACE, key) if self.cache else None
+
+        if data is not None:
+            _write_atomically(target, data)
+        elif self.settings.max_width or self.settings.quality:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.settings.workers)
+            self._jobs.append((key, target, self._pool.submit(_optimize_image, path,
+                                                              self.settings.max_width,
+                                                              self.settings.quality)))
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f'{target}.tmp'
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, target)
+
+        return name
+
+    def _get_content_hash(self, path: str) -> str:
+        """Gets the hash of an image, reusing the hash of a previous build if the size and
+        modification time of the file are unchanged.
+
+        Args:
+            path: The path of the image.
+
+        Returns:
+            The sha256 hex digest of the image.
+        """
+        stat = os.stat(path)
+        known = self._hashes.get(path)
+
+        if known and known[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return known[2]
+
+        hash_ = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                hash_.update(block)
+
+        self._hashes[path] = [stat.st_mtime_ns, stat.st_size, hash_.hexdigest()]
+        return hash_.hexdigest()
+
+    def _get_settings(self) -> str:
+        """Gets the settings the collected images depend on.
+
+        Returns:
+            The settings.
+        """
+        if not (self.settings.max_width or self.settings.quality):
+            return 'original'
+
+        return f'width {self.settings.max_width}, quality {self.settings.quality}, exif kept, ' \
+               f'Pillow {Image.__version__}'
+
+    def _abort(self):
+        """Cancels the images not optimized yet."""
+        for _key, _target, future in self._jobs:
+            future.cancel()
+        self._jobs = []
+        self._shutdown()
+
+    def _shutdown(self):
+        """Shuts the pool down, if it was started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class LazyImages:
+    """The LazyImages add the attributes to the image tags of the html of the chapters of a
+    document that let a browser load and decode the images lazily, and the width and height
+    of the images, so the document does not reflow as they arrive.
+
+    The width and height are read from the header of each image, without decoding it, for
+    png, jpeg, gif and webp images. Headers are cached, in the build cache too, by the path,
+    size and modification time of the image. Tags that already have the attributes are left
+    alone, as are the width and height of images that do not exist or can't be read.
+
+    Args:
+        cache: The build cache headers are stored in and reused from, or None.
+        max_width: The maximum width images are downscaled to when they are collected, if
+            any. (see ImagePipeline)
+
+    Examples:
+
+        .. code-block:: python
+
+            with LazyImages() as images:
+                for chapter, html in chapters:
+                    html, changes = images.rewrite(html, chapter.src)
+    """
+
+    def __init__(self, cache: Optional[BuildCache] = None, max_width: Optional[int] = None):
+        """Initializes a new instance of the :class:`LazyImages` class.
+        """
+        self.cache = cache
+        self.max_width = max_width
+        self.sources: Set[str] = set()
+        self._headers: Dict[str, list] = \
+            cache.load(IMAGE_HEADERS_DOCUMENT, {}) if cache else {}
+        self._read: Set[str] = set()
+
+    def __enter__(self) -> 'LazyImages':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def rewrite(self, html_: str, src: str) -> Tuple[str, List[str]]:
+        """Adds the attributes to the image tags of the html of a chapter.
+
+        Args:
+            html_: The html of the chapter.
+            src: The src of the chapter.
+
+        Returns:
+            A tuple consisting of the html and the attributes added to every tag rewritten.
+        """
+        changes = []
+
+        def replace(match) -> str:
+            tag = match.group(1)
+            attributes = []
+
+            if not _has_attribute(tag, 'width') and not _has_attribute(tag, 'height'):
+                reference = SRC_ATTRIBUTE_PATTERN.search(tag)
+                size = self._get_size(html.unescape(reference.group(1)), src) \
+                    if reference else None
+                if size:
+                    attributes.append(f'width="{size[0]}" height="{size[1]}"')
+
+            if not _has_attribute(tag, 'loading'):
+                attributes.append('loading="lazy"')
+            if not _has_attribute(tag, 'decoding'):
+                attributes.append('decoding="async"')
+
+            if not attributes:
+                return match.group(0)
+
+            changes.append(' '.join(attributes))
+            return ' '.join([tag] + attributes) + match.group(2)
+
+        return IMAGE_TAG_PATTERN.sub(replace, html_), changes
+
+    def close(self):
+        """Saves the headers read to the build cache."""
+        if self.cache and self._read:
+            self.cache.save(IMAGE_HEADERS_DOCUMENT, self._headers)
+            self._read = set()
+
+    def _get_size(self, reference: str, src: str) -> Optional[Tuple[int, int]]:
+        """Gets the size an image is displayed in.
+
+        Args:
+            reference: The reference, e.g. 'images/cover.png'.
+            src: The src of the chapter.
+
+        Returns:
+            The width and height in pixels, or None if the image does not exist or its
+            header can't be read.
+        """
+        path = _resolve_reference(reference, src) if _is_local_reference(reference) else None
+
+        if path is None:
+            return None
+
+        self.sources.add(path)
+        header = self._get_header(path)
+        return get_display_size(header, self.max_width) if header else None
+
+    def _get_header(self, path: str) -> Optional[ImageHeader]:
+        """Gets the header of an image, reusing the header of a previous build if the size
+        and modification time of the file are unchanged.
+
+        Args:
+            path: The path of the image.
+
+        Returns:
+            The header, or None if it can't be read.
+        """
+        stat = os.stat(path)
+        known = self._headers.get(path)
+
+        if not (known and known[:2] == [stat.st_mtime_ns, stat.st_size]):
+            header = read_image_header(path)
+            known = [stat.st_mtime_ns, stat.st_size] + (list(header) if header else [])
+            self._headers[path] = known
+            self._read.add(path)
+
+        try:
+            return ImageHeader(*known[2:]) if len(known) > 2 else None
+        except TypeError:
+            return None
+
+
+class DocumentImages:
+    """The DocumentImages rewrite the image tags of the chapters of a document: they add
+    the attributes of lazy images, if lazy is set, and collect the images, if there is an
+    image directory. (see LazyImages and ImagePipeline)
+
+    Args:
+        directory: The directory the images are collected in, next to the document, or None.
+        cache: The build cache, or None.
+        settings: How the images are optimized and whether they are lazy.
+
+    Examples:
+
+        .. code-block:: python
+
+            with DocumentImages('book_images', settings=ImageSettings(lazy=True)) as images:
+                for chapter, key, html in images.rewrite_chapters(chapters):
+                    file.write(html)
+
+            images.save_sources('book.html')
+    """
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 cache: Optional[BuildCache] = None,
+                 settings: ImageSettings = ImageSettings()):
+        """Initializes a new instance of the :class:`DocumentImages` class.
+        """
+        self.cache = cache
+        self._stack = contextlib.ExitStack()
+        self.pipeline: Optional[ImagePipeline] = None
+        self.lazy_images: Optional[LazyImages] = None
+
+        if directory:
+            self.pipeline = self._stack.enter_context(ImagePipeline(
+                directory, os.path.dirname(os.path.abspath(directory)), settings, cache))
+
+        if settings.lazy:
+            self.lazy_images = self._stack.enter_context(LazyImages(
+                cache, max_width=self.pipeline.settings.max_width if self.pipeline else None))
+
+    def __enter__(self) -> 'DocumentImages':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stack.__exit__(exc_type, exc_value, traceback)
+
+    @property
+    def rewriters(self) -> List[Union[LazyImages, ImagePipeline]]:
+        """The lazy images and the image pipeline used, in the order they rewrite the tags.
+        The sizes are read from the images the references point to, so the attributes are
+        added before the references are rewritten.
+        """
+        return [rewriter for rewriter in (self.lazy_images, self.pipeline) if rewriter]
+
+    def rewrite_chapters(self,
+                         chapters: Iterable[Tuple[Chapter, Optional[str], str]]
+                         ) -> Iterator[Tuple[Chapter, Optional[str], str]]:
+        """Rewrites the image tags of every chapter.
+
+        The headings and tokens of a chapter are cached by its key, along with their offsets
+        in its html. Rewriting changes those offsets, so a chapter with rewritten tags gets a
+        key derived from its render key and the changes.
+
+        Args:
+            chapters: The chapters, their render keys and their html.
+
+        Returns:
+            A generator yielding each chapter, its key and its html with the image tags
+            rewritten.
+        """
+        rewriters = self.rewriters
+
+        for chapter, key, html_ in chapters:
+            for rewriter in rewriters:
+                html_, changes = rewriter.rewrite(html_, chapter.src)
+
+                if key and changes:
+                    hash_ = hashlib.sha256(key.encode('utf-8'))
+                    hash_.update(json.dumps(changes).encode('utf-8'))
+                    key = hash_.hexdigest()
+
+            yield chapter, key, html_
+
+    def save_sources(self, path: str):
+        """Records the images collected or read the sizes of for incremental builds, if
+        there is a cache. (see publish.incremental)
+
+        Args:
+            path: The output path.
+        """
+        rewriters = self.rewriters
+
+        if rewriters and self.cache:
+            save_image_sources(self.cache, path,
+                               set().union(*(rewriter.sources for rewriter in rewriters)))
+
+
+def read_image_header(path: str) -> Optional[ImageHeader]:
+    """Reads the header of a png, jpeg, gif or webp image, without decoding the image.
+
+    Args:
+        path: The path of the image.
+
+    Returns:
+        The header, or None if the file is not an image in one of these formats or can't be
+        read.
+    """
+    try:
+        with open(path, 'rb') as file:
+            head = file.read(HEADER_SIZE)
+
+            if head.startswith(PNG_SIGNATURE) and head[12:16] == b'IHDR':
+                return _read_png_header(file, head)
+            if head.startswith(b'\xff\xd8'):
+                return _read_jpeg_header(file)
+            if head.startswith((b'GIF87a', b'GIF89a')):
+                return ImageHeader('GIF', *struct.unpack('<HH', head[6:10]))
+            if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+                return _read_webp_header(head)
+    except (OSError, struct.error) as error:
+        LOG.debug(f'The header of {path} can\'t be read: {error}')
+
+    return None
+
+
+def get_display_size(header: ImageHeader, max_width: Optional[int] = None) -> Tuple[int, int]:
+    """Gets the size an image is displayed in by a browser.
+
+    Args:
+        header: The header of the image.
+        max_width: The maximum width the image is downscaled to when it is collected, if any.
+            (see _optimize_image)
+
+    Returns:
+        The width and height in pixels.
+    """
+    width, height = header.width, header.height
+
+    if max_width and width > max_width and header.format in OPTIMIZED_FORMATS and \
+            not header.animated:
+        width, height = max_width, max(1, round(height * max_width / width))
+
+    # Orientations 5 to 8 rotate the image by 90 degrees.
+    return (height, width) if header.orientation >= 5 else (width, height)
+
+
+def get_image_directory(path: str) -> str:
+    """Gets the directory the images of an html document are collected in.
+
+    Args:
+        path: The path of the html document, e.g. 'book.html'.
+
+    Returns:
+        The directory, e.g. 'book_images'.
+    """
+    return os.path.splitext(path)[0] + IMAGE_DIRECTORY_SUFFIX
+
+
+def save_image_sources(cache: BuildCache, path: str, sources: Iterable[str]):
+    """Records the images collected for an output, which an incremental build compares.
+    (see publish.incremental)
+
+    Args:
+        cache: The build cache.
+        path: The output path.
+        sources: The paths of the images.
+    """
+    cache.save_text(IMAGE_SOURCES_NAMESPACE, _get_path_key(path), json.dumps(sorted(sources)))
+
+
+def load_image_sources(cache: BuildCache, path: str) -> List[str]:
+    """Loads the images collected for an output by the last build.
+
+    Args:
+        cache: The build cache.
+        path: The output path.
+
+    Returns:
+        The paths of the images.
+    """
+    text = cache.load_text(IMAGE_SOURCES_NAMESPACE, _get_path_key(path))
+
+    try:
+        sources = json.loads(text) if text else []
+    except ValueError:
+        return []
+
+    return [source for source in sources if isinstance(source, str)] \
+        if isinstance(sources, list) else []
+
+
+def _is_local_reference(reference: str) -> bool:
+    """Checks whether a reference may point to an image in the project, rather than to a
+    url, a data uri, an absolute path or a fragment.
+
+    Args:
+        reference: The reference.
+
+    Returns:
+        True if it may, False otherwise.
+    """
+    return bool(reference) and not reference.startswith(('/', '#')) and \
+        ':' not in reference.split('/', 1)[0]
+
+
+def _resolve_reference(reference: str, src: str) -> Optional[str]:
+    """Finds the image a reference points to, relative to the directory of the chapter and
+    then relative to the project directory.
+
+    Args:
+        reference: The reference, e.g. 'images/cover%20art.png'.
+        src: The src of the chapter.
+
+    Returns:
+        The normalized path of the image, or None if it does not exist.
+    """
+    path = unquote(reference.split('?', 1)[0].split('#', 1)[0])
+    candidates = [path]
+
+    if CONTAINER_SEPARATOR not in src:
+        candidates.insert(0, os.path.join(os.path.dirname(src), path))
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return os.path.normpath(candidate)
+
+    return None
+
+
+def _has_attribute(tag: str, name: str) -> bool:
+    """Checks whether an html tag has an attribute.
+
+    Args:
+        tag: The tag, e.g. '<img src="cover.png"'.
+        name: The name of the attribute, e.g. 'width'.
+
+    Returns:
+        True if it has, False otherwise.
+    """
+    return re.search(rf'\s{name}\s*=', tag, re.IGNORECASE) is not None
+
+
+def _read_png_header(file: BinaryIO, head: bytes) -> ImageHeader:
+    """Reads the header of a png image, looking for an animation control chunk in the
+    chunks before the image data.
+
+    Args:
+        file: The image, positioned after the head.
+        head: The first bytes of the image.
+
+    Returns:
+        The header.
+    """
+    width, height = struct.unpack('>II', head[16:24])
+    file.seek(len(PNG_SIGNATURE))
+
+    while True:
+        length, chunk_type = struct.unpack('>I4s', file.read(8))
+        if chunk_type == b'acTL':
+            frames, = struct.unpack('>I', file.read(4))
+            return ImageHeader('PNG', width, height, animated=frames > 1)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return ImageHeader('PNG', width, height)
+        file.seek(length + 4, os.SEEK_CUR)
+
+
+def _read_jpeg_header(file: BinaryIO) -> Optional[ImageHeader]:
+    """Reads the header of a jpeg image from the segments before the start of frame
+    segment, which holds the size, including the orientation of an exif segment.
+
+    Args:
+        file: The image.
+
+    Returns:
+        The header, or None if the image ends before the start of frame segment.
+    """
+    file.seek(2)
+    orientation = 1
+
+    while True:
+        byte = file.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+
+        marker = file.read(1)
+        while marker == b'\xff':
+            marker = file.read(1)
+        if not marker or marker[0] in (0xd9, 0xda):
+            return None
+        if marker[0] == 0x01 or 0xd0 <= marker[0] <= 0xd8:
+            continue
+
+        length, = struct.unpack('>H', file.read(2))
+
+        if marker[0] in JPEG_SIZE_MARKERS:
+            height, width = struct.unpack('>xHH', file.read(5))
+            return ImageHeader('JPEG', width, height, orientation=orientation)
+
+        segment = file.read(length - 2)
+        if marker[0] == 0xe1 and segment.startswith(b'Exif\0\0'):
+            orientation = _read_exif_orientation(segment[6:])
+
+
+def _read_exif_orientation(tiff: bytes) -> int:
+    """Reads the orientation from the first image file directory of exif data.
+
+    Args:
+        tiff: The exif data, a tiff header followed by the directories.
+
+    Returns:
+        The orientation, 1 to 8, 1 if there is none.
+    """
+    byte_order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if byte_order is None:
+        return 1
+
+    offset, = struct.unpack(byte_order + 'I', tiff[4:8])
+    count, = struct.unpack(byte_order + 'H', tiff[offset:offset + 2])
+
+    for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+        tag, = struct.unpack(byte_order + 'H', tiff[entry:entry + 2])
+        if tag == EXIF_ORIENTATION_TAG:
+            orientation, = struct.unpack(byte_order + 'H', tiff[entry + 8:entry + 10])
+            return orientation if 1 <= orientation <= 8 else 1
+
+    return 1
+
+
+def _read_webp_header(head: bytes) -> Optional[ImageHeader]:
+    """Reads the header of a webp image from its first chunk.
+
+    Args:
+        head: The first bytes of the image.
+
+    Returns:
+        The header, or None for a chunk that is not lossy, lossless or extended.
+    """
+    chunk_type = head[12:16]
+
+    if chunk_type == b'VP8 ':
+        width, height = struct.unpack('<HH', head[26:30])
+        return ImageHeader('WEBP', width & 0x3fff, height & 0x3fff)
+
+    if chunk_type == b'VP8L':
+        bits, = struct.unpack('<I', head[21:25])
+        return ImageHeader('WEBP', (bits & 0x3fff) + 1, (bits >> 14 & 0x3fff) + 1)
+
+    if chunk_type == b'VP8X':
+        return ImageHeader('WEBP', int.from_bytes(head[24:27], 'little') + 1,
+                           int.from_bytes(head[27:30], 'little') + 1,
+                           animated=bool(head[20] & 0x02))
+
+    return None
+
+
+def _get_path_key(path: str) -> str:
+    """Gets the key of an output path in the build cache.
+
+    Args:
+        path: The output path.
+
+    Returns:
+        The key.
+    """
+    return hashlib.sha256(os.path.normpath(path).encode('utf-8')).hexdigest()
+
+
+def _optimize_image(path: str, max_width: Optional[int], quality: Optional[int]) -> bytes:
+    """Runs in a worker process: downscales and recompresses an image.
+
+    Animated images and formats other than jpeg, png and webp are kept as they are, as is an
+    image that only got bigger by recompressing it.
+
+    Args:
+        path: The path of the image.
+        max_width: The maximum width in pixels, or None.
+        quality: The quality jpeg and webp images are recompressed with, or None.
+
+    Returns:
+        The image.
+    """
+    with open(path, 'rb') as file:
+        original = file.read()
+
+    with Image.open(io.BytesIO(original)) as image:
+        image_format = image.format
+
+        if image_format not in OPTIMIZED_FORMATS or getattr(image, 'is_animated', False):
+            return original
+
+        # Pillow drops the exif data, e.g. the orientation of a photo, unless it is passed on.
+        exif = image.info.get('exif')
+        resized = bool(max_width and image.width > max_width)
+        if resized:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        options = {'optimize': True}
+        if exif:
+            options['exif'] = exif
+        if quality and image_format in QUALITY_FORMATS:
+            options['quality'] = quality
+
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **options)
+
+    data = buffer.getvalue()
+    return data if resized or len(data) < len(original) else original
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers incremental builds: outputs whose inputs are unchanged since the last
+successful build are skipped, and the outputs that are made reuse the rendered html of every
+unchanged chapter from the build cache.
+
+Whether an input changed is decided by its content hash. Hashing thousands of chapters on
+every build costs more than it should, so inside a clean git work tree the hashes recorded
+by the last build are reused for every file git reports as unchanged since the commit of
+that build.
+"""
+
+import hashlib
+import logging
+import os
+import subprocess  # nosec
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+import markdown
+
+from publish import __version__ as package_version
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.ebookconvert import yield_attributes_as_params
+from publish.images import load_image_sources
+from publish.loader import ChapterLoader
+from publish.output import HtmlOutput, EbookConvertOutput
+from publish.source import CONTAINER_SEPARATOR, ChapterSource, SourceResolver, is_archive
+from publish.substitution import Substitution, get_fingerprint
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+MANIFEST_NAME = 'build-manifest'
+
+# The settings of an output that change what it writes. Settings that only change how fast
+# it is made, like read_threads or render_workers, or that are objects shared by the build,
+# like the cache or the profiler, are left out, so they don't make an output stale.
+FINGERPRINT_SETTINGS = (
+    'path', 'stylesheet', 'css', 'force_publish', 'chapter_range', 'chapter_src',
+    'substitution_timeout', 'render_timeout', 'render_memory_limit', 'render_fallback', 'toc',
+    'toc_depth', 'highlight_style', 'collect_images', 'image_max_width', 'image_quality',
+    'lazy_images', 'stash_data_uris', 'stash_patterns', 'search_index', 'split_pages',
+    'split_page_size', 'render_chapters_separately', 'ebookconvert_params')
+
+
+class GitChangeDetector:
+    """The GitChangeDetector asks the local git command line which files differ from a
+    commit.
+
+    Args:
+        directory: The directory inside the git work tree, usually the project directory.
+    """
+
+    def __init__(self, directory: str = '.'):
+        """Initializes a new instance of the :class:`GitChangeDetector` class.
+        """
+        self.directory = directory
+
+    def get_clean_head(self) -> Optional[str]:
+        """Gets the commit currently checked out, if the work tree has no uncommitted changes
+        to tracked files.
+
+        Returns:
+            The commit hash, or None outside a git work tree, without git, or if the work
+            tree is dirty.
+        """
+        status = self._git('status', '--porcelain', '--untracked-files=no')
+
+        if status is None:
+            return None
+
+        if status:
+            LOG.info('The git work tree is dirty, falling back to content hashing ...')
+            return None
+
+        return self._git('rev-parse', '--verify', '--quiet', 'HEAD')
+
+    def get_unchanged_files(self,
+                            commit: Optional[str],
+                            head: Optional[str]) -> Optional[Set[str]]:
+        """Gets the files tracked by git that don't differ between the commit and the head.
+
+        The paths are relative to the directory of this detector. Files outside of the
+        directory are omitted. Untracked files are never reported as unchanged.
+
+        Args:
+            commit: The commit of the last successful build.
+            head: The commit currently checked out in a clean work tree, as returned by
+                get_clean_head.
+
+        Returns:
+            The set of unchanged files, or None if git can't tell: outside a git work tree,
+            without git, if either commit is unknown or the work tree is dirty.
+        """
+        if not commit or not head:
+            return None
+
+        changed = self._git('diff', '--name-only', '-z', '--relative', commit, head, '--')
+        tracked = self._git('ls-files', '-z')
+
+        if changed is None or tracked is None:
+            return None
+
+        changed = {os.path.normpath(path) for path in changed.split('\0') if path}
+        LOG.info(f'git reports {len(changed)} changed files since the last build.')
+
+        return {os.path.normpath(path) for path in tracked.split('\0') if path} - changed
+
+    def _git(self, *args: str) -> Optional[str]:
+        """Runs a git command.
+
+        Args:
+            *args: The arguments of the git command.
+
+        Returns:
+            The standard output of the command, stripped of a trailing newline, or None if
+            the command failed or git is not installed.
+        """
+        try:
+            completed = subprocess.run(['git', *args],  # nosec
+                                       cwd=self.directory,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       check=False)
+        except OSError:
+            return None
+
+        if completed.returncode != 0:
+            return None
+
+        return completed.stdout.decode('utf-8').rstrip('\n')
+
+
+class IncrementalBuild:
+    """The IncrementalBuild decides which outputs of a project have to be made and records
+    what they were made from once the build succeeded.
+
+    The manifest of the last successful build records the content hash of every chapter,
+    stylesheet and output, and the git commit the build was made from if the work tree was
+    clean at the time. The images collected for an output by the last build, or whose sizes
+    it read, (see publish.images) are compared as well.
+
+    Args:
+        cache: The build cache holding the manifest of the last build and the rendered
+            chapters.
+        detector: The change detector. Without one, or if it can't tell which files changed,
+            every input is hashed.
+
+    Examples:
+
+        .. code-block:: python
+
+            build = IncrementalBuild(BuildCache(), GitChangeDetector())
+
+            for output in build.prepare(book, substitutions, outputs):
+                output.make(book, substitutions)
+
+            build.finish()
+    """
+
+    def __init__(self,
+                 cache: BuildCache,
+                 detector: Optional[GitChangeDetector] = None):
+        """Initializes a new instance of the :class:`IncrementalBuild` class.
+        """
+        self.cache = cache
+        self.detector = detector
+        self._commit: Optional[str] = None
+        self._chapter_hashes: Dict[str, str] = {}
+        self._file_hashes: Dict[str, str] = {}
+        self._outputs: Dict[str, str] = {}
+        self._made: List[Tuple[Union[HtmlOutput, EbookConvertOutput], str]] = []
+
+    def prepare(self,
+                book: Book,
+                substitutions: Iterable[Substitution],
+                outputs: Iterable[Union[HtmlOutput, EbookConvertOutput]]
+                ) -> List[Union[HtmlOutput, EbookConvertOutput]]:
+        """Determines the outputs that have to be made and connects them to the build cache.
+
+        Args:
+            book: The book.
+            substitutions: The list of substitutions.
+            outputs: The list of outputs.
+
+        Returns:
+            The list of outputs whose inputs changed since the last successful build or
+            whose file is missing.
+        """
+        manifest = self.cache.load(MANIFEST_NAME, {})
+        unchanged = set()
+
+        if self.detector:
+            self._commit = self.detector.get_clean_head()
+            unchanged = self.detector.get_unchanged_files(manifest.get('commit'),
+                                                          self._commit) or set()
+
+        self._file_hashes = {path: hash_ for path, hash_ in manifest.get('files', {}).items()
+                             if path in unchanged}
+        known_chapter_hashes = manifest.get('chapters', {})
+
+        for chapter in book.chapters:
+            if _get_tracked_path(chapter.src, book.sources) in unchanged \
+                    and chapter.src in known_chapter_hashes:
+                chapter.content_hash = known_chapter_hashes[chapter.src]
+
+        with SourceResolver(book.sources) as resolver:
+            hashes = ChapterLoader(resolver).get_content_hashes(book.chapters)
+
+        self._chapter_hashes = {chapter.src: hash_
+                                for chapter, hash_ in zip(book.chapters, hashes)
+                                if _get_tracked_path(chapter.src, book.sources) is not None}
+        self._outputs = dict(manifest.get('outputs', {}))
+        self._made = []
+
+        for output in outputs:
+            output.cache = self.cache
+            fingerprint = self._get_fingerprint(output, book, substitutions)
+
+            if self._outputs.get(output.path) == self._add_images(fingerprint, output) and \
+                    os.path.exists(output.path):
+                LOG.info(f'{output.path} is up to date.')
+                continue
+
+            self._made.append((output, fingerprint))
+
+        return [output for output, _fingerprint in self._made]
+
+    def finish(self):
+        """Records the inputs of the outputs made, to be compared against by the next build.
+
+        Must only be called after all outputs returned by prepare were made successfully.
+        """
+        for output, fingerprint in self._made:
+            self._outputs[output.path] = self._add_images(fingerprint, output)
+
+        self.cache.save(MANIFEST_NAME, {'commit': self._commit,
+                                        'chapters': self._chapter_hashes,
+                                        'files': self._file_hashes,
+                                        'outputs': self._outputs})
+
+    def _get_file_hash(self, path: str) -> str:
+        """Gets the content hash of a file like a stylesheet, reusing the hash of the last
+        build if git reported the file as unchanged.
+
+        Args:
+            path: The path of the file.
+
+        Returns:
+            The sha256 hex digest of the file.
+        """
+        path = os.path.normpath(path)
+
+        if path not in self._file_hashes:
+            self._file_hashes[path] = Chapter(path).get_content_hash()
+
+        return self._file_hashes[path]
+
+    def _get_fingerprint(self,
+                         output: Union[HtmlOutput, EbookConvertOutput],
+                         book: Book,
+                         substitutions: Iterable[Substitution]) -> str:
+        """Gets the hash of everything the output is made from.
+
+        Args:
+            output: The output.
+            book: The book.
+            substitutions: The list of substitutions.
+
+        Returns:
+            The sha256 hex digest of the inputs of the output.
+        """
+        settings = [(name, repr(getattr(output, name, None))) for name in FINGERPRINT_SETTINGS]
+
+        parts = [type(output).__name__, package_version, markdown.__version__, repr(settings),
+                 book.title, book.language, repr(list(yield_attributes_as_params(book))),
+                 get_fingerprint(substitutions)]
+
+        if output.stylesheet:
+            parts.append(self._get_file_hash(output.stylesheet))
+
+        for chapter in output.get_chapters_to_be_published(book.chapters):
+            parts.extend((chapter.src, chapter.content_hash))
+
+        hash_ = hashlib.sha256()
+        for part in parts:
+            hash_.update(str(part).encode('utf-8') + b'\0')
+
+        return hash_.hexdigest()
+
+    def _add_images(self,
+                    fingerprint: str,
+                    output: Union[HtmlOutput, EbookConvertOutput]) -> str:
+        """Adds the images the output collected, or read the sizes of, when it was last made
+        to its fingerprint. (see publish.images) The images are only known once the output
+        was made, so this is done by prepare for the last build and by finish for the current
+        one.
+
+        Args:
+            fingerprint: The fingerprint of the output.
+            output: The output.
+
+        Returns:
+            The sha256 hex digest of the fingerprint and the images.
+        """
+        if not (output.collect_images or output.lazy_images):
+            return fingerprint
+
+        hash_ = hashlib.sha256(fingerprint.encode('utf-8'))
+        for path in load_image_sources(self.cache, output.path):
+            hash_.update(path.encode('utf-8') + b'\0')
+            if os.path.isfile(path):
+                hash_.update(self._get_file_hash(path).encode('utf-8'))
+            hash_.update(b'\0')
+
+        return hash_.hexdigest()
+
+
+def _get_tracked_path(src: str, sources: Mapping[str, ChapterSource]) -> Optional[str]:
+    """Gets the path of the file git tracks for a chapter src: the src itself or the archive
+    containing it. (see publish.source.SourceResolver.resolve)
+
+    Args:
+        src: The chapter src.
+        sources: The named sources of the book.
+
+    Returns:
+        The normalized path, or None for chapters not read from a file relative to the
+        project directory, e.g. from an in-memory source.
+    """
+    container, separator, _name = src.partition(CONTAINER_SEPARATOR)
+
+    if separator and container in sources:
+        return None
+
+    path = container if separator and is_archive(container) else src
+
+    return None if os.path.isabs(path) else os.path.normpath(path)
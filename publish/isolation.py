@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers workers that run the stages of a build which might never finish, e.g.
+a substitution whose pattern backtracks catastrophically or markdown rendering of a
+pathological chapter, in a separate process under a time budget.
+
+A regular expression can neither be interrupted by a signal nor by another thread while it
+is matching, so the only way to stop one is to kill the process running it.
+"""
+
+import html
+import logging
+import multiprocessing
+import os
+import time
+from abc import ABCMeta, abstractmethod
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import markdown
+
+from publish.cache import BuildCache
+from publish.highlighting import HighlightExtension
+from publish.substitution import Substitution, apply_substitutions
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+POLL_INTERVAL = 0.05
+RENDER_FALLBACK_FAIL = 'fail'
+RENDER_FALLBACK_PRE = 'pre'
+RENDER_FALLBACKS = (RENDER_FALLBACK_FAIL, RENDER_FALLBACK_PRE)
+MEMORY_ERROR_EXIT_CODE = 75
+
+
+class SubstitutionTimeoutError(Exception):
+    """A substitution exceeded its time budget.
+
+    Args:
+        substitution: The substitution.
+        src: The src of the chapter the substitution was applied to.
+        elapsed: The time spent applying the substitution in seconds.
+        timeout: The time budget in seconds.
+
+    Attributes:
+        substitution (Substitution): The substitution.
+        src (str): The src of the chapter the substitution was applied to.
+        elapsed (float): The time spent applying the substitution in seconds.
+        timeout (float): The time budget in seconds.
+    """
+
+    def __init__(self, substitution: Substitution, src: str, elapsed: float, timeout: float):
+        """Initializes a new instance of the :class:`SubstitutionTimeoutError` class.
+        """
+        super().__init__(f'{substitution!r} was stopped after {elapsed:.1f} seconds on {src}, '
+                         f'exceeding its time budget of {timeout} seconds.')
+        self.substitution = substitution
+        self.src = src
+        self.elapsed = elapsed
+        self.timeout = timeout
+
+
+class RenderLimitError(Exception):
+    """Rendering a chapter exceeded a limit.
+
+    Args:
+        src: The src of the chapter.
+        limit: The limit exceeded, 'time' or 'memory'.
+        value: The value of the limit in seconds or MiB.
+
+    Attributes:
+        src (str): The src of the chapter.
+        limit (str): The limit exceeded, 'time' or 'memory'.
+        value (float): The value of the limit in seconds or MiB.
+    """
+
+    def __init__(self, src: str, limit: str, value: float):
+        """Initializes a new instance of the :class:`RenderLimitError` class.
+        """
+        unit = 'seconds' if limit == 'time' else 'MiB'
+        super().__init__(f'Rendering {src} exceeded the {limit} limit of {value} {unit}.')
+        self.src = src
+        self.limit = limit
+        self.value = value
+
+
+class _Worker(metaclass=ABCMeta):
+    """The base class of the workers: starts the worker process, sends it requests while
+    watching it and kills it if needed.
+
+    The worker process is started with the default start method of the platform. Used as
+    a context manager, the worker is started on entering the context, so enter it before
+    starting any threads.
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the :class:`_Worker` class.
+        """
+        self._process = None
+        self._connection = None
+
+    def __enter__(self):
+        if self._is_isolated():
+            self._start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the worker process, if it is running."""
+        if self._process is None:
+            return
+
+        try:
+            self._connection.send(None)
+        except OSError:
+            pass
+
+        self._process.join(1)
+        self._kill()
+
+    @abstractmethod
+    def _is_isolated(self) -> bool:
+        """Determines whether requests are handled by a worker process.
+
+        Returns:
+            True if a worker process is needed.
+        """
+
+    @abstractmethod
+    def _get_target(self) -> Tuple[Callable, tuple]:
+        """Gets the function run by the worker process and its arguments, excluding the
+        connection passed first.
+
+        Returns:
+            A tuple consisting of the function and its arguments.
+        """
+
+    def _request(self, payload: Any, src: str, check: Callable[[], None]) -> Any:
+        """Sends a request to the worker process and waits for the result.
+
+        Args:
+            payload: The request.
+            src: The src of the chapter, for error messages.
+            check: Called while waiting, raising an error if the worker has to be stopped.
+
+        Returns:
+            The result.
+
+        Raises:
+            MemoryError: If the worker process ran out of memory.
+        """
+        self._start()
+
+        try:
+            self._connection.send(payload)
+
+            while not self._connection.poll(POLL_INTERVAL):
+                check()
+
+                if not self._process.is_alive() and not self._connection.poll():
+                    raise EOFError()
+
+            failed, result = self._connection.recv()
+        except (EOFError, OSError):
+            self._process.join(1)
+            exit_code = self._process.exitcode
+            self._kill()
+
+            if exit_code == MEMORY_ERROR_EXIT_CODE:
+                raise MemoryError() from None
+            raise RuntimeError(f'The {self._process_name} worker died while working on '
+                               f'{src}.') from None
+        except BaseException:
+            self._kill()
+            raise
+
+        if failed:
+            raise result
+
+        return result
+
+    @property
+    def _process_name(self) -> str:
+        """The name of the worker, e.g. 'render' for the RenderWorker."""
+        return type(self).__name__.replace('Worker', '').lower()
+
+    def _start(self):
+        """Starts the worker process, unless it is running."""
+        if self._process is not None:
+            return
+
+        target, args = self._get_target()
+        context = multiprocessing.get_context()
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(target=target,
+                                        args=(child_connection, *args),
+                                        name=f'publish-{self._process_name}',
+                                        daemon=True)
+        self._process.start()
+        child_connection.close()
+
+    def _kill(self):
+        """Kills the worker process. The next request starts a new one."""
+        if self._process is None:
+            return
+
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+        self._connection.close()
+        self._process = self._connection = None
+        self._on_killed()
+
+    def _on_killed(self):
+        """Called after the worker process was killed."""
+
+
+class SubstitutionWorker(_Worker):
+    """The SubstitutionWorker applies substitutions to chapters, each substitution under a
+    time budget.
+
+    With a time budget, the substitutions are applied in a worker process, which is reused
+    for every chapter. The worker reports which substitution it is applying and since when,
+    and is killed as soon as one substitution exceeds the budget. Without a time budget,
+    the substitutions are applied in the current process.
+
+    Args:
+        substitutions: The list of substitutions.
+        timeout: The time budget of each substitution per chapter in seconds, or None.
+
+    Examples:
+
+        .. code-block:: python
+
+            with SubstitutionWorker(substitutions, timeout=10) as worker:
+                markdown_ = worker.apply(markdown_, chapter.src)
+    """
+
+    def __init__(self,
+                 substitutions: Iterable[Substitution],
+                 timeout: Optional[float] = None):
+        """Initializes a new instance of the :class:`SubstitutionWorker` class.
+        """
+        super().__init__()
+        self.substitutions: List[Substitution] = list(substitutions or [])
+        self.timeout = timeout
+        self._progress = None
+
+    def apply(self, text: str, src: str = '') -> str:
+        """Applies the substitutions to the text.
+
+        Args:
+            text: The text, usually the content of a chapter.
+            src: The src of the chapter, for error messages.
+
+        Returns:
+            The changed text.
+
+        Raises:
+            SubstitutionTimeoutError: If a substitution exceeded the time budget.
+        """
+        if not self._is_isolated():
+            return apply_substitutions(text, self.substitutions)
+
+        def check():
+            started = self._progress[1]
+            elapsed = time.monotonic() - started
+
+            if started and elapsed > self.timeout:
+                substitution = self.substitutions[int(self._progress[0])]
+                raise SubstitutionTimeoutError(substitution, src, elapsed, self.timeout)
+
+        return self._request(text, src, check)
+
+    def _is_isolated(self) -> bool:
+        return bool(self.timeout and self.substitutions)
+
+    def _get_target(self) -> Tuple[Callable, tuple]:
+        self._progress = multiprocessing.get_context().Array('d', 2, lock=False)
+        return _run_substitution_worker, (self.substitutions, self._progress)
+
+    def _on_killed(self):
+        self._progress = None
+
+
+class RenderWorker(_Worker):
+    """The RenderWorker renders the markdown of chapters to html, each chapter under a time
+    and memory limit.
+
+    With a limit, chapters are rendered in a worker process, which is reused for every
+    chapter and killed as soon as a chapter exceeds the time limit. The memory limit is
+    enforced by the operating system (see resource.setrlimit), on top of the memory the
+    worker process started with. Without limits, chapters are rendered in the current
+    process.
+
+    A chapter exceeding a limit either fails the build with a RenderLimitError or, with
+    fallback 'pre', is logged and rendered as escaped preformatted text instead.
+
+    Args:
+        timeout: The time limit per chapter in seconds, or None.
+        memory_limit: The memory limit in MiB, or None. Only supported on Unix.
+        fallback: 'fail' or 'pre'.
+        highlight: Determines whether fenced code blocks are highlighted.
+            (see publish.highlighting)
+        cache: The build cache highlighted code blocks are reused from, or None.
+
+    Attributes:
+        fallback_srcs (List[str]): The srcs of the chapters rendered as preformatted text.
+
+    Examples:
+
+        .. code-block:: python
+
+            with RenderWorker(timeout=60, memory_limit=1024, fallback='pre') as worker:
+                html = worker.render(markdown_, chapter.src)
+    """
+
+    def __init__(self,
+                 timeout: Optional[float] = None,
+                 memory_limit: Optional[float] = None,
+                 fallback: str = RENDER_FALLBACK_FAIL,
+                 highlight: bool = False,
+                 cache: Optional[BuildCache] = None):
+        """Initializes a new instance of the :class:`RenderWorker` class.
+        """
+        super().__init__()
+
+        if fallback not in RENDER_FALLBACKS:
+            raise ValueError(f'{fallback} is not a render fallback, use one of '
+                             f'{", ".join(RENDER_FALLBACKS)}.')
+
+        if memory_limit and resource is None:
+            LOG.warning('Memory limits are not supported on this platform, ignoring '
+                        'the render memory limit.')
+            memory_limit = None
+
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.fallback = fallback
+        self.highlight = highlight
+        self.cache = cache
+        self.fallback_srcs: List[str] = []
+        self._renderer = _create_renderer(highlight, cache)
+
+    def render(self, text: str, src: str = '') -> str:
+        """Renders the markdown text to html.
+
+        Args:
+            text: The markdown text of the chapter.
+            src: The src of the chapter, for error messages.
+
+        Returns:
+            The html.
+
+        Raises:
+            RenderLimitError: If rendering exceeded a limit and fallback is 'fail'.
+        """
+        if not self._is_isolated():
+            return _convert(self._renderer, text)
+
+        started = time.monotonic()
+
+        def check():
+            if self.timeout and time.monotonic() - started > self.timeout:
+                raise RenderLimitError(src, 'time', self.timeout)
+
+        try:
+            try:
+                return self._request(text, src, check)
+            except MemoryError:
+                raise RenderLimitError(src, 'memory', self.memory_limit) from None
+        except RenderLimitError as error:
+            if self.fallback == RENDER_FALLBACK_FAIL:
+                raise
+
+            LOG.warning(f'{error} Rendering it as preformatted text instead.')
+            self.fallback_srcs.append(src)
+            return f'<pre>{html.escape(text)}</pre>'
+
+    def _is_isolated(self) -> bool:
+        return bool(self.timeout or self.memory_limit)
+
+    def _get_target(self) -> Tuple[Callable, tuple]:
+        return _run_render_worker, (self.memory_limit, self.highlight, self.cache)
+
+
+def _run_substitution_worker(connection, substitutions: List[Substitution], progress):
+    """Runs in the worker process: receives texts, applies the substitutions and sends the
+    results back, until it receives None.
+
+    Before each substitution, the index of the substitution and the time it was started
+    are written to progress. After the last substitution, the start time is reset to 0.
+
+    Args:
+        connection: The worker end of the pipe.
+        substitutions: The list of substitutions.
+        progress: The shared array holding the index and start time.
+    """
+    while True:
+        text = connection.recv()
+
+        if text is None:
+            return
+
+        try:
+            for index, substitution in enumerate(substitutions):
+                progress[0] = index
+                progress[1] = time.monotonic()
+                text = substitution.apply_to(text)
+        except Exception as error:  # pylint: disable=broad-except
+            progress[1] = 0
+            connection.send((True, error))
+            continue
+
+        progress[1] = 0
+        connection.send((False, text))
+
+
+def _run_render_worker(connection,
+                       memory_limit: Optional[float],
+                       highlight: bool,
+                       cache: Optional[BuildCache]):
+    """Runs in the worker process: receives markdown texts, renders them and sends the html
+    back, until it receives None.
+
+    Args:
+        connection: The worker end of the pipe.
+        memory_limit: The memory limit in MiB on top of the memory already in use, or None.
+        highlight: Determines whether fenced code blocks are highlighted.
+        cache: The build cache highlighted code blocks are reused from, or None.
+    """
+    if memory_limit:
+        limit = _get_virtual_memory_size() + int(memory_limit * 2**20)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    renderer = _create_renderer(highlight, cache)
+
+    try:
+        while True:
+            text = connection.recv()
+
+            if text is None:
+                return
+
+            try:
+                html_ = _convert(renderer, text)
+            except MemoryError:
+                raise
+            except Exception as error:  # pylint: disable=broad-except
+                connection.send((True, error))
+                continue
+
+            connection.send((False, html_))
+    except MemoryError:
+        # The memory limit was exceeded. Once out of memory, even sending the error back
+        # might fail, so the exit code tells the parent what happened.
+        os._exit(MEMORY_ERROR_EXIT_CODE)  # pylint: disable=protected-access
+
+
+def _create_renderer(highlight: bool, cache: Optional[BuildCache]) -> markdown.Markdown:
+    """Creates the markdown instance chapters are rendered with.
+
+    Args:
+        highlight: Determines whether fenced code blocks are highlighted.
+        cache: The build cache highlighted code blocks are reused from, or None.
+
+    Returns:
+        The markdown instance.
+    """
+    return markdown.Markdown(extensions=[HighlightExtension(cache)] if highlight else [])
+
+
+def _convert(renderer: markdown.Markdown, text: str) -> str:
+    """Renders the markdown text to html with a reused markdown instance.
+
+    A markdown instance keeps the lines and the element tree of the last text it converted
+    until the next conversion is done with them, which would hold a large chapter in memory
+    while the next one is rendered. Converting a single character afterwards drops them.
+
+    Args:
+        renderer: The markdown instance.
+        text: The markdown text.
+
+    Returns:
+        The html.
+    """
+    html_ = renderer.reset().convert(text)
+    renderer.reset().convert('.')
+    return html_
+
+
+def _get_virtual_memory_size() -> int:
+    """Gets the virtual memory size of the current process.
+
+    Returns:
+        The size in bytes, or 0 if it can't be determined.
+    """
+    try:
+        with open('/proc/self/statm', 'rt', encoding='ascii') as file:
+            return int(file.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the chapter loader, which reads chapters concurrently ahead of the
+stage consuming them.
+
+On high-latency filesystems like NFS most of the time spent reading a chapter is spent
+waiting for the server. Reading several chapters at once in a small thread pool hides that
+latency, and reading ahead of the substitution and rendering stages lets the reads overlap
+with their work.
+"""
+
+import logging
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from publish.book import Chapter
+from publish.source import SourceResolver
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+DEFAULT_READ_THREADS = 8
+DEFAULT_PREFETCH = 16
+DEFAULT_PREFETCH_BYTES = 64 * 1024 * 1024
+
+
+class ChapterLoader:
+    """The ChapterLoader reads chapters in a bounded thread pool while they are consumed.
+
+    At most `prefetch` chapters and, by the size of their source files, at most
+    `prefetch_bytes` are read ahead of the consumer, which bounds the memory held by chapters
+    that have been read but not yet rendered. The next chapter is always read, however large
+    it is.
+
+    Args:
+        resolver: The source resolver of the current build.
+        threads: The maximum number of concurrent reads.
+        prefetch: The maximum number of chapters read ahead of the consumer.
+        prefetch_bytes: The maximum number of bytes read ahead of the consumer, or None to
+            only limit the number of chapters.
+
+    Examples:
+
+        .. code-block:: python
+
+            for chapter, markdown_ in ChapterLoader(resolver).load(chapters):
+                render(markdown_)
+                chapter.release()
+    """
+
+    def __init__(self,
+                 resolver: Optional[SourceResolver] = None,
+                 threads: int = DEFAULT_READ_THREADS,
+                 prefetch: int = DEFAULT_PREFETCH,
+                 prefetch_bytes: Optional[int] = DEFAULT_PREFETCH_BYTES):
+        """Initializes a new instance of the :class:`ChapterLoader` class.
+        """
+        self.resolver = resolver
+        self.threads = max(1, threads)
+        self.prefetch = max(1, prefetch)
+        self.prefetch_bytes = prefetch_bytes
+
+    def load(self, chapters: Iterable[Chapter]) -> Iterator[Tuple[Chapter, str]]:
+        """Reads the chapters, yielding each chapter together with its content in the order
+        of the chapters.
+
+        The sizes of the chapters are stat-ed in the thread pool as well, ahead of their
+        reads, so on a high-latency filesystem the stats overlap like the reads do. A chapter
+        is only read ahead once its size and the sizes of the chapters read ahead of it are
+        known.
+
+        An error reading a chapter is raised when that chapter is reached.
+
+        Args:
+            chapters: The chapters.
+
+        Returns:
+            A generator yielding tuples consisting of the chapter and its content.
+        """
+        chapters = iter(chapters)
+        sized = deque()
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.threads,
+                                thread_name_prefix='publish-loader') as executor:
+            def read_ahead():
+                while True:
+                    while len(sized) < self.prefetch:
+                        chapter = next(chapters, None)
+                        if chapter is None:
+                            break
+                        sized.append((chapter, self._submit_stat(executor, chapter)))
+
+                    if not sized or len(pending) >= self.prefetch or \
+                            pending and not self._fits(sized[0][1], pending):
+                        return
+
+                    chapter, size = sized.popleft()
+                    pending.append((chapter, size, executor.submit(chapter.read, self.resolver)))
+
+            try:
+                read_ahead()
+
+                while pending:
+                    content = pending[0][2]
+
+                    # Reads ahead as soon as the sizes it waits for are known, not only once
+                    # the next chapter is read.
+                    unknown = self._get_unknown_sizes(sized, pending)
+                    while unknown and not content.done():
+                        wait([content, *unknown], return_when=FIRST_COMPLETED)
+                        read_ahead()
+                        unknown = self._get_unknown_sizes(sized, pending)
+
+                    chapter, _size, content = pending.popleft()
+                    content = content.result()
+
+                    read_ahead()
+
+                    yield chapter, content
+            finally:
+                for _chapter, size in sized:
+                    size.cancel()
+                for _chapter, size, content in pending:
+                    size.cancel()
+                    content.cancel()
+
+    def get_content_hashes(self, chapters: Iterable[Chapter]) -> List[str]:
+        """Gets the content hashes of the chapters, hashing concurrently the chapters whose
+        hash is not known yet.
+
+        Args:
+            chapters: The chapters.
+
+        Returns:
+            The list of content hashes in the order of the chapters.
+        """
+        with ThreadPoolExecutor(max_workers=self.threads,
+                                thread_name_prefix='publish-loader') as executor:
+            return list(executor.map(lambda chapter: chapter.get_content_hash(self.resolver),
+                                     chapters))
+
+    def _submit_stat(self, executor: ThreadPoolExecutor, chapter: Chapter) -> Future:
+        """Gets the size of a chapter's source file for the prefetch budget in the thread
+        pool.
+
+        Args:
+            executor: The thread pool.
+            chapter: The chapter.
+
+        Returns:
+            The future of the size in bytes, or of 0 if there is no byte budget or the
+            chapter can not be stat-ed, in which case reading it raises the error when it is
+            reached.
+        """
+        if self.prefetch_bytes is None:
+            size = Future()
+            size.set_result(0)
+            return size
+
+        return executor.submit(self._get_size, chapter)
+
+    def _fits(self, size: Future, pending: Iterable[Tuple[Chapter, Future, Future]]) -> bool:
+        """Determines whether a chapter can be read ahead within the prefetch budget.
+
+        Args:
+            size: The future of the size of the chapter.
+            pending: The chapters read ahead, the futures of their sizes and contents.
+
+        Returns:
+            True if the sizes are known and the chapter fits, otherwise False.
+        """
+        sizes = [size, *(pending_size for _chapter, pending_size, _content in pending)]
+
+        if not all(future.done() for future in sizes):
+            return False
+
+        return self.prefetch_bytes is None or \
+            sum(future.result() for future in sizes) <= self.prefetch_bytes
+
+    def _get_size(self, chapter: Chapter) -> int:
+        """Gets the size of a chapter's source file for the prefetch budget.
+
+        Args:
+            chapter: The chapter.
+
+        Returns:
+            The size in bytes, or 0 if the chapter can not be stat-ed, in which case reading
+            it raises the error when it is reached.
+        """
+        try:
+            return chapter.stat(self.resolver).size
+        except (OSError, ValueError, zipfile.BadZipFile, tarfile.TarError):
+            return 0
+
+    @staticmethod
+    def _get_unknown_sizes(sized: Sequence[Tuple[Chapter, Future]],
+                           pending: Iterable[Tuple[Chapter, Future, Future]]) -> List[Future]:
+        """Gets the futures of the sizes reading ahead waits for.
+
+        Args:
+            sized: The chapters not read yet and the futures of their sizes.
+            pending: The chapters read ahead, the futures of their sizes and contents.
+
+        Returns:
+            The futures of the sizes not known yet.
+        """
+        sizes = [size for _chapter, size, _content in pending]
+        if sized:
+            sizes.append(sized[0][1])
+
+        return [size for size in sizes if not size.done()]
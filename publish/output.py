@@ -10,43 +10,44 @@
 """This module offers the output classes used to transform book objects into html or epub files.
 """
 
+import asyncio
+import contextlib
+import copy
+import functools
+import io
 import logging
 import os
 import shutil
 import subprocess  # nosec
+import threading
 import uuid
+from concurrent.futures import Executor
 from tempfile import mkdtemp
-from textwrap import fill
-from typing import Iterable, Generator, Optional, Sequence
-from pkg_resources import resource_string
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO,
+                    Tuple, Union)
 
-import markdown
-from jinja2 import Template
-
-from publish import __version__ as package_version
 from publish.book import Book, Chapter
-from publish.substitution import Substitution, apply_substitutions
+from publish.pages import PageWriter
+from publish.loader import DEFAULT_PREFETCH_BYTES, DEFAULT_READ_THREADS, ChapterLoader
+from publish.source import SourceResolver
+from publish.cache import BuildCache
+from publish.ebookconvert import (call_ebook_convert, call_ebook_convert_async,
+                                  get_ebook_convert_params)
+from publish.headings import DEFAULT_TOC_DEPTH, ChapterSpool
+from publish.highlighting import get_highlight_css
+from publish.images import DocumentImages, ImageSettings, get_image_directory
+from publish.profiling import SubstitutionProfiler
+from publish.rendering import ChapterRenderer
+from publish.scheduling import CostModel
+from publish.selection import get_preview_path, select_chapters
+from publish.search import SearchIndex, get_search_index_path, load_tokens
+from publish.isolation import RENDER_FALLBACK_FAIL
+from publish.substitution import Substitution
+from publish.templating import split_template
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.NullHandler())
 
-SUPPORTED_EBOOKCONVERT_ATTRIBUTES = (
-    'author_sort',
-    'authors',
-    'book_producer',
-    'comments',
-    'cover',
-    'isbn',
-    'language',
-    'pubdate',
-    'publisher',
-    'rating',
-    'series',
-    'series_index',
-    'tags',
-    'title'
-)
-
 
 class HtmlOutput:
     """Turns a Book object and its chapters into an html document.
@@ -59,14 +60,149 @@ class HtmlOutput:
     Attributes:
         path (str): The output path.
         stylesheet (str): The path to the style sheet.
+        css (str): The css itself, used instead of reading the style sheet, e.g. read once
+            by a CompiledProject. (see publish.project)
+
+            Defaults to None.
         force_publish (bool): Determines wether to force publish all chapters.
 
             If set to true, all chapters of the book will be published
             no matter how the chapters are configured.
 
             Defaults to False.
+        chapter_range (str): Restricts the output to the chapters at the given
+            1-based positions, e.g. '12-14' or '1,3,5-7'. (see select_chapters)
+
+            Defaults to None.
+        chapter_src (str): Restricts the output to the chapters whose src matches
+            the given glob pattern. (see select_chapters)
+
+            Defaults to None.
+        read_threads (int): The maximum number of chapters read concurrently.
+
+            Defaults to 8.
+        prefetch_bytes (int): The maximum size of the chapters read ahead of rendering.
+            (see publish.loader)
+
+            Defaults to 64 MiB.
+        cache (BuildCache): The build cache the rendered html of each chapter is stored
+            in and reused from, as long as neither the chapter nor the substitutions change.
+
+            Defaults to None.
+        substitution_timeout (float): The time budget in seconds of each substitution per
+            chapter. If set, substitutions are applied in a worker process that is killed
+            when a substitution exceeds its budget, failing the output with a
+            SubstitutionTimeoutError. (see publish.isolation)
+
+            Defaults to None, i.e. no time budget.
+        render_timeout (float): The time limit in seconds for rendering a single chapter.
+            If set, chapters are rendered in a worker process. (see publish.isolation)
+
+            Defaults to None.
+        render_memory_limit (float): The memory limit in MiB for rendering a single
+            chapter. If set, chapters are rendered in a worker process. Only supported on
+            Unix.
+
+            Defaults to None.
+        render_fallback (str): What to do with a chapter exceeding a render limit: 'fail'
+            fails the output with a RenderLimitError naming the chapter and the limit,
+            'pre' renders the chapter as escaped preformatted text instead.
+
+            Defaults to 'fail'.
+        render_workers (List[str]): The addresses of `publish worker` processes, e.g.
+            ['build-1:8765', 'build-2:8765']. If set, the chapters are substituted and
+            rendered by these workers instead of the current process, with the time budget
+            and limits above. (see publish.distributed)
+
+            Defaults to None.
+        toc (bool): Determines whether the document starts with a table of contents. The
+            headings get ids unique across the document and references like '#slug' or
+            'other.md#slug' are resolved to them. (see publish.headings)
+
+            Defaults to False.
+        toc_depth (int): The deepest heading level listed in the table of contents.
+
+            Defaults to 3.
+        highlight_style (str): The Pygments style fenced code blocks are highlighted in,
+            e.g. 'default' or 'monokai'. If set, fenced code blocks are highlighted and
+            the css of the style is added to the stylesheet. The html of every block is
+            cached, in the build cache too, and shared by all chapters and outputs.
+            (see publish.highlighting)
+
+            Defaults to None, i.e. no highlighting.
+        collect_images (bool): Determines whether the images referenced by the chapters are
+            collected in a directory next to the output, e.g. book_images for book.html,
+            each image once under a name derived from its content, and the references
+            rewritten to them. Ebooks get the collected images from a temporary directory.
+            (see publish.images)
+
+            Defaults to False.
+        image_max_width (int): The maximum width in pixels of collected images, wider
+            images are downscaled. Requires Pillow.
+
+            Defaults to None.
+        image_quality (int): The quality collected jpeg and webp images are recompressed
+            with, 1 to 100. Requires Pillow.
+
+            Defaults to None.
+        lazy_images (bool): Determines whether the image tags get loading="lazy" and
+            decoding="async", and the width and height read from the headers of the images,
+            so browsers load the images as they are scrolled to without the document
+            reflowing. (see publish.images)
+
+            Defaults to False.
+        stash_data_uris (bool): Determines whether the payloads of base64 encoded data uris
+            are hidden from the substitutions and markdown behind short placeholders and put
+            back into the rendered html. (see publish.stash)
+
+            Defaults to True.
+        stash_patterns (List[str]): Regular expressions whose matches are hidden from the
+            substitutions and markdown like data uris, e.g. raw html blocks, and put back
+            into the rendered html as they are.
+
+            Defaults to None.
+        search_index (bool): Determines whether make writes a search index next to the
+            output, e.g. book.search.json for book.html, and the document gets a search
+            field using it. The headings get ids like with toc. (see publish.search)
+
+            Defaults to False.
+        split_pages (bool): Determines whether make writes the document split into pages:
+            an index page with the table of contents at the output path and the pages and
+            their shared css next to it, named after the hash of their content, e.g.
+            book.0123456789abcdef.html for book.html. Every page links to the next one and
+            lets the browser prefetch it. render and write_to still give the single
+            document. (see publish.pages)
+
+            Defaults to False.
+        split_page_size (int): The maximum size of a page in KiB. Consecutive chapters
+            share a page up to the size, a bigger chapter gets a page of its own.
+
+            Defaults to None, i.e. one page per chapter.
+        render_chapters_separately (bool): Determines whether every chapter is substituted
+            and rendered on its own. The chapters then stream through rendering one at a
+            time, so the memory of a build is bounded by the largest chapter rather than by
+            the size of the book, the html of every chapter is cached and reused on its own,
+            and the time budget, the render limits, the render workers and the cost model
+            apply per chapter. But the substitutions and markdown no longer see across chapters: a
+            reference link whose definition is in another chapter stays literal text and a
+            regular expression can not match across two chapters.
+
+            Defaults to False, i.e. the chapters are joined and substituted and rendered as a
+            whole, like a single chapter named after the output path.
+        cost_model (CostModel): Records the time every chapter took to render and, with
+            render workers, sends the chapters longest first. (see publish.scheduling)
+
+            Defaults to None.
+        profiler (SubstitutionProfiler): Profiles the substitutions applied to every
+            chapter. (see publish.profiling) Chapters are never reused from the cache
+            while profiling, and substitutions are applied in the current process, without
+            a time budget.
+
+            Defaults to None.
     """
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(self,
                  path: str,
                  **kwargs):
@@ -74,13 +210,42 @@ class HtmlOutput:
         """
         self.path = path
         self.stylesheet = kwargs.pop('stylesheet', None)
+        self.css: Optional[str] = kwargs.pop('css', None)
         self.force_publish = kwargs.pop('force_publish', False)
+        self.chapter_range = kwargs.pop('chapter_range', None)
+        self.chapter_src = kwargs.pop('chapter_src', None)
+        self.read_threads = kwargs.pop('read_threads', DEFAULT_READ_THREADS)
+        self.prefetch_bytes = kwargs.pop('prefetch_bytes', DEFAULT_PREFETCH_BYTES)
+        self.cache: Optional[BuildCache] = kwargs.pop('cache', None)
+        self.substitution_timeout = kwargs.pop('substitution_timeout', None)
+        self.render_timeout = kwargs.pop('render_timeout', None)
+        self.render_memory_limit = kwargs.pop('render_memory_limit', None)
+        self.render_fallback = kwargs.pop('render_fallback', RENDER_FALLBACK_FAIL)
+        self.render_workers: Optional[List[str]] = kwargs.pop('render_workers', None)
+        self.toc = kwargs.pop('toc', False)
+        self.toc_depth = kwargs.pop('toc_depth', DEFAULT_TOC_DEPTH)
+        self.highlight_style: Optional[str] = kwargs.pop('highlight_style', None)
+        self.collect_images = kwargs.pop('collect_images', False)
+        self.image_max_width: Optional[int] = kwargs.pop('image_max_width', None)
+        self.image_quality: Optional[int] = kwargs.pop('image_quality', None)
+        self.lazy_images = kwargs.pop('lazy_images', False)
+        self.stash_data_uris = kwargs.pop('stash_data_uris', True)
+        self.stash_patterns: Optional[List[str]] = kwargs.pop('stash_patterns', None)
+        self.search_index = kwargs.pop('search_index', False)
+        self.split_pages = kwargs.pop('split_pages', False)
+        self.split_page_size: Optional[int] = kwargs.pop('split_page_size', None)
+        self.render_chapters_separately = kwargs.pop('render_chapters_separately', False)
+        self.cost_model: Optional[CostModel] = kwargs.pop('cost_model', None)
+        self.profiler: Optional[SubstitutionProfiler] = kwargs.pop('profiler', None)
 
     def make(self,
              book: Book,
              substitutions: Optional[Iterable[Substitution]] = None):
         """Makes the Output for the provided book and substitutions.
 
+        The document is written chapter by chapter to a temporary file next to the output
+        path, which replaces the output once the document is complete.
+
         Args:
             book: The book.
             substitutions: The substitutions.
@@ -90,10 +255,82 @@ class HtmlOutput:
         if not substitutions:
             substitutions = []
 
-        html_document = self._get_html_document(book, substitutions)
+        if self.split_pages:
+            self._write_html_pages(book, substitutions,
+                                   search_path=self._get_search_index_path())
+        else:
+            self._write_html_file(self.path, book, substitutions,
+                                  search_path=self._get_search_index_path())
+
+        LOG.info('... HtmlOutput finished')
+
+    def render(self,
+               book: Book,
+               substitutions: Optional[Iterable[Substitution]] = None) -> bytes:
+        """Makes the Output like make, but returns it instead of writing it to the output
+        path, e.g. to serve it without a round trip through the filesystem.
+
+        Args:
+            book: The book.
+            substitutions: The substitutions.
+
+        Returns:
+            The utf-8 encoded html document.
+        """
+        target = io.BytesIO()
+        self.write_to(target, book, substitutions)
+        return target.getvalue()
+
+    def write_to(self,
+                 target: Union[BinaryIO, TextIO],
+                 book: Book,
+                 substitutions: Optional[Iterable[Substitution]] = None):
+        """Makes the Output like make, but writes it chapter by chapter to a file-like
+        object instead of the output path.
+
+        Args:
+            target: The file-like object, e.g. sys.stdout.buffer or a response stream.
+                Text files get the document as str, any other object with a write method
+                gets it utf-8 encoded.
+            book: The book.
+            substitutions: The substitutions.
+        """
+        LOG.info('Making HtmlOutput ...')
+
+        if not isinstance(target, io.TextIOBase):
+            target = _Utf8Writer(target)
 
-        with open(self.path, 'w') as file:
-            file.write(html_document)
+        self._write_html_document(book, substitutions or [], target)
+
+        LOG.info('... HtmlOutput finished')
+
+    async def make_async(self,
+                         book: Book,
+                         substitutions: Optional[Iterable[Substitution]] = None,
+                         executor: Optional[Executor] = None):
+        """Makes the Output like make without blocking the event loop: the document is
+        rendered in an executor.
+
+        Cancelling the task stops rendering at the next chapter and removes the partially
+        written file. The cancellation completes once rendering has stopped.
+
+        Args:
+            book: The book.
+            substitutions: The substitutions.
+            executor: The executor to render in, or None for the default executor of the
+                event loop.
+        """
+        LOG.info('Making HtmlOutput ...')
+
+        if self.split_pages:
+            write_html_pages = functools.partial(self._write_html_pages,
+                                                 search_path=self._get_search_index_path())
+            await _run_in_executor(executor, write_html_pages, book, substitutions or [])
+        else:
+            write_html_file = functools.partial(self._write_html_file,
+                                                search_path=self._get_search_index_path())
+            await _run_in_executor(executor, write_html_file, self.path, book,
+                                   substitutions or [])
 
         LOG.info('... HtmlOutput finished')
 
@@ -106,20 +343,54 @@ class HtmlOutput:
         If the outputs `force_publish` override is set to true, all chapters
         will be published regardless of their individual `publish` attributes.
 
+        If the output has a `chapter_range` or `chapter_src` selection, only the
+        selected chapters are published, again regardless of their individual `publish`
+        attributes: a chapter that was explicitly asked for is always rendered.
+
         Returns:
             The list of chapters to be published.
         """
+        if self.chapter_range or self.chapter_src:
+            return select_chapters(chapters,
+                                   chapter_range=self.chapter_range,
+                                   chapter_src=self.chapter_src)
+
         if self.force_publish:
             return chapters
 
         return list(filter(lambda c: c.publish is True, chapters))
 
+    def preview(self,
+                chapter_range: Optional[str] = None,
+                chapter_src: Optional[str] = None) -> 'HtmlOutput':
+        """Gets a copy of this output that only renders the selected chapters.
+
+        The copy writes to a path derived from this output's path (see get_preview_path),
+        so a preview never overwrites the full build.
+
+        Args:
+            chapter_range: The 1-based chapter positions, e.g. '12-14'.
+            chapter_src: A glob pattern matched against the chapters' src.
+
+        Returns:
+            The preview output.
+        """
+        preview = copy.copy(self)
+        preview.path = get_preview_path(self.path)
+        preview.chapter_range = chapter_range
+        preview.chapter_src = chapter_src
+        return preview
+
     def _get_css(self) -> str:
         """Gets the css from the css file specified in stylesheet as a string.
 
         Returns:
-            The css from the css file specified in stylesheet as a string.
+            The css from the css file specified in stylesheet as a string, or the css
+            attribute if it is set.
         """
+        if self.css is not None:
+            return self.css
+
         if not self.stylesheet:
             return ''
 
@@ -131,6 +402,60 @@ class HtmlOutput:
 
         return css if css else ''
 
+    def _get_document_css(self) -> str:
+        """Gets the css of the document: the css of the stylesheet followed by the css of
+        the highlight style, if code blocks are highlighted.
+
+        Returns:
+            The css.
+        """
+        css = self._get_css()
+
+        if not self.highlight_style:
+            return css
+
+        return '\n'.join(part for part in (css, get_highlight_css(self.highlight_style))
+                         if part)
+
+    def _get_search_index_path(self) -> Optional[str]:
+        """Gets the path the search index is written to.
+
+        Returns:
+            The path next to the output path, or None if no search index is written.
+        """
+        return get_search_index_path(self.path) if self.search_index else None
+
+    def _write_html_file(self,
+                         path: str,
+                         book: Book,
+                         substitutions: Iterable[Substitution],
+                         cancelled: Optional[threading.Event] = None,
+                         search_path: Optional[str] = None):
+        """Writes the html document to a temporary file next to the path, which replaces
+        the file at the path once the document is complete.
+
+        Args:
+            path: The path.
+            book: The book.
+            substitutions: The list of substitutions.
+            cancelled: Stops writing at the next chapter once set. (see make_async)
+            search_path: The path the search index is written to, if any.
+        """
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+        image_directory = get_image_directory(path) if self.collect_images else None
+
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                self._write_html_document(book, substitutions, file, cancelled=cancelled,
+                                          search_path=search_path,
+                                          image_directory=image_directory)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
     def _get_html_document(self,
                            book: Book,
                            substitutions: Iterable[Substitution]
@@ -138,6 +463,9 @@ class HtmlOutput:
         """Takes a book, renders it to html, applying the list of substitutions in the process
         and returns the finished html document as a string.
 
+        Outputs write the document to a file instead, without ever holding all of it in
+        memory. (see _write_html_document)
+
         Args:
             book: The book.
             substitutions: The list of substitutions.
@@ -145,23 +473,182 @@ class HtmlOutput:
         Returns:
             The html document as a string.
         """
-        html_content = self._get_html_content(book.chapters, substitutions)
-        html_document = _apply_template(html_content=html_content,
-                                        title=book.title,
-                                        css=self._get_css(),
-                                        language=book.language)
+        file = io.StringIO()
+        self._write_html_document(book, substitutions, file)
+        return file.getvalue()
+
+    def _write_html_document(self,
+                             book: Book,
+                             substitutions: Iterable[Substitution],
+                             file: TextIO,
+                             cancelled: Optional[threading.Event] = None,
+                             **kwargs):
+        """Takes a book, renders it to html, applying the list of substitutions in the process
+        and writes the finished html document to the file.
+
+        The html of each chapter is written as soon as it is rendered and the template is
+        written around it. With render_chapters_separately the document flows through
+        substitution, rendering and templating one chapter at a time, so memory is bounded by
+        the largest chapter rather than by the size of the book. Otherwise the markdown and
+        html of the whole book are held while it is rendered as a whole.
+
+        Args:
+            book: The book.
+            substitutions: The list of substitutions.
+            file: The text file the document is written to.
+            cancelled: Stops rendering at the next chapter once set.
+            **kwargs: search_path (str), the path the search index is written to, and
+                image_directory (str), the directory the images referenced by the chapters
+                are collected in, next to the file, if any. (see publish.images)
+
+        Raises:
+            CancelledError: If cancelled was set.
+        """
+        context = {'title': book.title, 'css': self._get_document_css(), 'language': book.language}
+        search_path = kwargs.get('search_path')
+
+        with contextlib.ExitStack() as stack:
+            resolver = stack.enter_context(SourceResolver(book.sources))
+            images = stack.enter_context(self._get_document_images(kwargs.get('image_directory')))
+            chapters = images.rewrite_chapters(self._yield_rendered_chapters(
+                book.chapters, substitutions, resolver, cancelled))
+
+            if self.toc or search_path:
+                self._write_indexed_html_document(context, chapters, file, search_path)
+            else:
+                head, tail = split_template(**context)
+                file.write(head)
+                _write_chapters(file, chapters)
+                file.write(tail)
+
+        images.save_sources(self.path)
+
+    def _write_html_pages(self,
+                          book: Book,
+                          substitutions: Iterable[Substitution],
+                          cancelled: Optional[threading.Event] = None,
+                          search_path: Optional[str] = None):
+        """Takes a book, renders it to html, applying the list of substitutions in the process
+        and writes it split into pages. (see publish.pages)
+
+        The names of the pages are derived from the html of their chapters and every page
+        links to the pages of the headings it references, so the html of all chapters is
+        spooled while their headings are collected, like for a table of contents, and the
+        pages are written afterwards.
+
+        Args:
+            book: The book.
+            substitutions: The list of substitutions.
+            cancelled: Stops rendering at the next chapter once set. (see make_async)
+            search_path: The path the search index is written to, if any.
+
+        Raises:
+            CancelledError: If cancelled was set.
+        """
+        context = {'title': book.title, 'css': self._get_document_css(), 'language': book.language,
+                   'search_index': os.path.basename(search_path) if search_path else None}
+
+        with contextlib.ExitStack() as stack:
+            resolver = stack.enter_context(SourceResolver(book.sources))
+            images = stack.enter_context(self._get_document_images(
+                get_image_directory(self.path) if self.collect_images else None))
+            spool = stack.enter_context(ChapterSpool(self.cache))
+            search_index = self._spool_chapters(spool, images.rewrite_chapters(
+                self._yield_rendered_chapters(book.chapters, substitutions, resolver, cancelled)),
+                                                search_path)
+
+            pages = stack.enter_context(PageWriter(self.path))
+            chapter_pages = pages.write_document(
+                spool, context, self.split_page_size * 1024 if self.split_page_size else None,
+                self.toc_depth)
+
+            if search_index:
+                search_index.save(search_path, book.title, spool.index, chapter_pages)
+
+        images.save_sources(self.path)
+
+    def _get_document_images(self, directory: Optional[str] = None) -> DocumentImages:
+        """Gets the images of the document, which add the attributes of lazy images to the
+        image tags of the chapters, if lazy_images is set, and collect the images, if there
+        is a directory.
+
+        Args:
+            directory: The directory the images are collected in, next to the document, if
+                any.
+
+        Returns:
+            The images of the document.
+        """
+        return DocumentImages(directory, self.cache,
+                              ImageSettings(max_width=self.image_max_width,
+                                            quality=self.image_quality, lazy=self.lazy_images))
+
+    def _write_indexed_html_document(self,
+                                     context: Dict[str, Any],
+                                     chapters: Iterable[Tuple[Chapter, Optional[str], str]],
+                                     file: TextIO,
+                                     search_path: Optional[str] = None):
+        """Writes the html document with a table of contents, if toc is set, and the
+        references to headings resolved. (see publish.headings)
+
+        The table of contents comes before the chapters but needs the headings of all of
+        them, so the html of the chapters is spooled while their headings are collected, and
+        copied into the document chapter by chapter afterwards.
+
+        Args:
+            context: The title, css and language of the document.
+            chapters: The chapters, their render keys and their html.
+            file: The text file the document is written to.
+            search_path: The path the search index is written to, if any.
+        """
+        with ChapterSpool(self.cache) as spool:
+            search_index = self._spool_chapters(spool, chapters, search_path)
+
+            if search_index:
+                search_index.save(search_path, context['title'], spool.index)
+
+            head, tail = split_template(
+                **context, toc=spool.index.get_toc(self.toc_depth) if self.toc else None,
+                search_index=os.path.basename(search_path) if search_path else None)
+            file.write(head)
+            spool.write_chapters(file)
+
+        file.write(tail)
+
+    def _spool_chapters(self,
+                        spool: ChapterSpool,
+                        chapters: Iterable[Tuple[Chapter, Optional[str], str]],
+                        search_path: Optional[str] = None) -> Optional[SearchIndex]:
+        """Spools the html of the chapters and collects their headings and, if a search index
+        is written, their tokens. The headings and tokens of every chapter are cached like
+        its html. (see publish.search)
+
+        Args:
+            spool: The spool.
+            chapters: The chapters, their render keys and their html.
+            search_path: The path the search index is written to, if any.
+
+        Returns:
+            The search index, or None if no search index is written.
+        """
+        search_index = SearchIndex() if search_path else None
+
+        for chapter, key, html in chapters:
+            extract = spool.add_chapter(chapter.src, key, html)
 
-        return html_document
+            if search_index:
+                search_index.add_chapter(load_tokens(html, extract, key, self.cache))
+
+        return search_index
 
     def _get_html_content(self,
                           chapters: Iterable[Chapter],
-                          substitutions: Iterable[Substitution]) -> str:
+                          substitutions: Iterable[Substitution],
+                          resolver: Optional[SourceResolver] = None) -> str:
         """Gets the content of the provided list of chapters as as an html string.
 
         The list of substitutions is applied to the markdown content before it is rendered to
-        html.
-
-        The order of the chapters is preserved.
+        html. (see _yield_rendered_chapters)
 
         The resulting html string does not include a head or body, only the chapters markdown
         turned into html.
@@ -169,20 +656,42 @@ class HtmlOutput:
         Args:
             chapters: The list of chapters.
             substitutions: The list of substitutions.
+            resolver: The source resolver of the current build.
 
         Returns:
             The content of the provided list of chapters as an html string.
         """
-        markdown_ = self._get_markdown_content(chapters)
-        markdown_ = apply_substitutions(
-            markdown_,
-            substitutions)
+        return '\n'.join(html for _chapter, _key, html
+                         in self._yield_rendered_chapters(chapters, substitutions, resolver))
+
+    def _yield_rendered_chapters(self,
+                                 chapters: Iterable[Chapter],
+                                 substitutions: Iterable[Substitution],
+                                 resolver: Optional[SourceResolver] = None,
+                                 cancelled: Optional[threading.Event] = None
+                                 ) -> Iterator[Tuple[Chapter, Optional[str], str]]:
+        """Renders the provided list of chapters to html, yielding each chapter with its
+        html one at a time in the order of the chapters. (see publish.rendering)
 
-        LOG.info('Rendering markdown to html ...')
-        return markdown.markdown(markdown_)
+        Args:
+            chapters: The list of chapters.
+            substitutions: The list of substitutions.
+            resolver: The source resolver of the current build.
+            cancelled: Stops rendering at the next chapter once set.
+
+        Returns:
+            A generator yielding a tuple consisting of each chapter, the key its html is
+            cached under, or None if it is not cached, and its html.
+
+        Raises:
+            CancelledError: If cancelled was set.
+        """
+        return ChapterRenderer(self, substitutions, resolver).render(
+            self._get_chapters_to_render(chapters), cancelled)
 
     def _get_markdown_content(self,
-                              chapters: Iterable[Chapter]) -> str:
+                              chapters: Iterable[Chapter],
+                              resolver: Optional[SourceResolver] = None) -> str:
         """Gets the markdown content of the provided list of chapters concatenated into a single
         string.
 
@@ -190,6 +699,7 @@ class HtmlOutput:
 
         Args:
             chapters: The list of chapters.
+            resolver: The source resolver of the current build.
 
         Returns:
             The markdown content of the list of chapters concatenated into a single string.
@@ -197,21 +707,39 @@ class HtmlOutput:
         markdown_ = []
         md_paragraph_sep = '\n\n'
 
+        chapters_to_publish = self._get_chapters_to_render(chapters)
+
+        LOG.info('Collecting chapters ...')
+        loader = ChapterLoader(resolver, threads=self.read_threads)
+        for chapter, content in loader.load(chapters_to_publish):
+            markdown_.append(content)
+            chapter.release()
+
+        return md_paragraph_sep.join(markdown_)
+
+    def _get_chapters_to_render(self,
+                                chapters: Iterable[Chapter]) -> List[Chapter]:
+        """Gets the list of chapters to be published, making sure there is at least one.
+
+        Args:
+            chapters: The list of chapters.
+
+        Returns:
+            The list of chapters to be published.
+
+        Raises:
+            NoChaptersFoundError: If there are no chapters or none of them are to be published.
+        """
         if not chapters:
             raise NoChaptersFoundError('Your book contains no chapters.')
 
-        chapters_to_publish = self.get_chapters_to_be_published(chapters)
+        chapters_to_publish = list(self.get_chapters_to_be_published(chapters))
 
         if not chapters_to_publish:
             raise NoChaptersFoundError('None of your chapters are set to be'
                                        'published.')
 
-        LOG.info('Collecting chapters ...')
-        for chapter in chapters_to_publish:
-            with open(chapter.src, 'r') as file:
-                markdown_.append(file.read())
-
-        return md_paragraph_sep.join(markdown_)
+        return chapters_to_publish
 
 
 class EbookConvertOutput(HtmlOutput):
@@ -236,6 +764,8 @@ class EbookConvertOutput(HtmlOutput):
             no matter how the chapters are configured.
 
             Defaults to False.
+
+        All other attributes are the same as those of :class:`HtmlOutput`.
     """
 
     def __init__(self,
@@ -273,125 +803,196 @@ class EbookConvertOutput(HtmlOutput):
         # -> ebook-convert fails with 'Permission denied'.
 
         try:
-            temp_path = os.path.join(
-                temp_directory, str(uuid.uuid4()) + '.html')
+            if self._convert(book, substitutions, temp_directory, self.path) is None:
+                return
+            LOG.info('... EbookConvertOutput finished')
+        finally:
+            shutil.rmtree(temp_directory)
 
-            html_document = self._get_html_document(book, substitutions)
+    def write_to(self,
+                 target: BinaryIO,
+                 book: Book,
+                 substitutions: Optional[Iterable[Substitution]] = None):
+        """Makes an ebook like make, but streams it to a binary file-like object instead of
+        the output path. ebook-convert still needs files to work with, so the ebook is made
+        in a temporary directory, which is removed afterwards.
 
-            with open(temp_path, 'w') as file:
-                file.write(html_document)
+        The type of the ebook is taken from the file type of the output path.
 
-            call_params = _get_ebook_convert_params(book,
-                                                    input_path=temp_path,
-                                                    output_path=self.path,
-                                                    additional_params=self.ebookconvert_params)
+        Args:
+            target: The binary file-like object, e.g. a response stream.
+            book: The book.
+            substitutions: The list of substitutions.
 
-            LOG.info('Calling ebook-convert ...')
+        Raises:
+            TypeError: If the target is a text file.
+            FileNotFoundError: If ebook-convert could not be found.
+            subprocess.CalledProcessError: If ebook-convert failed.
+        """
+        LOG.info('Making EbookConvertOutput ...')
+        if not book:
+            raise AttributeError("book must not be None")
+
+        if isinstance(target, io.TextIOBase):
+            raise TypeError('EbookConvertOutput can only write to binary files.')
+
+        temp_directory = mkdtemp()
 
-            try:
-                subprocess.call(call_params, shell=False)  # nosec
-            except FileNotFoundError:
-                LOG.error(
-                    fill('Could not find ebook-convert. Please install calibre if you want to '
-                         'use EbookconvertOutput and make sure ebook-convert is accessible '
-                         'through the PATH variable.'))
+        try:
+            output_path = os.path.join(temp_directory, str(uuid.uuid4()) +
+                                       os.path.splitext(self.path)[1])
+            returncode = self._convert(book, substitutions or [], temp_directory, output_path)
+
+            if returncode is None:
+                raise FileNotFoundError('Could not find ebook-convert.')
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, 'ebook-convert')
+
+            with open(output_path, 'rb') as file:
+                shutil.copyfileobj(file, target)
+            LOG.info('... EbookConvertOutput finished')
+        finally:
+            shutil.rmtree(temp_directory)
+
+    async def make_async(self,
+                         book: Book,
+                         substitutions: Optional[Iterable[Substitution]] = None,
+                         executor: Optional[Executor] = None):
+        """Makes an ebook like make without blocking the event loop: the html document is
+        rendered in an executor and ebook-convert runs as an asyncio subprocess.
+
+        Cancelling the task stops rendering at the next chapter or kills ebook-convert,
+        and removes the temporary directory. The cancellation completes once both are done.
+
+        Args:
+            book: The book.
+            substitutions: The list of substitutions.
+            executor: The executor to render in, or None for the default executor of the
+                event loop.
+        """
+        LOG.info('Making EbookConvertOutput ...')
+        if not book:
+            raise AttributeError("book must not be None")
+
+        temp_directory = mkdtemp()
+
+        try:
+            temp_path = os.path.join(
+                temp_directory, str(uuid.uuid4()) + '.html')
+
+            await _run_in_executor(executor, self._write_html_file, temp_path, book,
+                                   substitutions or [])
+
+            call_params = get_ebook_convert_params(book,
+                                                   input_path=temp_path,
+                                                   output_path=self.path,
+                                                   additional_params=self.ebookconvert_params)
+
+            if await call_ebook_convert_async(call_params) is None:
                 return
+
             LOG.info('... EbookConvertOutput finished')
         finally:
             shutil.rmtree(temp_directory)
 
+    def _convert(self,
+                 book: Book,
+                 substitutions: Iterable[Substitution],
+                 temp_directory: str,
+                 output_path: str) -> Optional[int]:
+        """Writes the html document to the temporary directory and calls ebook-convert to
+        turn it into the ebook at the output path.
 
-def _get_ebook_convert_params(book: Book,
-                              input_path: str,
-                              output_path: str,
-                              additional_params: Optional[Iterable[str]] = None
-                              ) -> Sequence[str]:
-    """Gets the call params for the ebookconvert commandline.
+        Args:
+            book: The book.
+            substitutions: The list of substitutions.
+            temp_directory: The temporary directory.
+            output_path: The path of the ebook.
+
+        Returns:
+            The exit code of ebook-convert, or None if it could not be found.
+        """
+        temp_path = os.path.join(
+            temp_directory, str(uuid.uuid4()) + '.html')
+        image_directory = get_image_directory(temp_path) if self.collect_images else None
+
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            self._write_html_document(book, substitutions, file,
+                                      image_directory=image_directory)
+
+        call_params = get_ebook_convert_params(book,
+                                               input_path=temp_path,
+                                               output_path=output_path,
+                                               additional_params=self.ebookconvert_params)
 
-    The book's attributes are translated into ebookconvert metadata commandline options
-    while any additional options present in EbookConvertOutput.ebookconvert_params are
-    appended to the call params as is.
+        return call_ebook_convert(call_params)
+
+
+class _Utf8Writer:
+    """Writes text utf-8 encoded to a binary file-like object.
 
     Args:
-        book: The book object.
-        input_path: The path the html file that will be passed to ebookconvert.
-        output_path: The output path.
+        target: The binary file-like object.
     """
-    if not additional_params:
-        additional_params = []
-
-    call_params = [
-        'ebook-convert',
-        input_path,
-        output_path
-    ]
-    call_params.extend(_yield_attributes_as_params(book))
-    call_params.extend(additional_params)
-    return call_params
-
-
-def _apply_template(html_content: str,
-                    title: str,
-                    css: str,
-                    language: str) -> str:
-    """Renders the html content, title, css and document language into the jinja2 formatted
-    template and returns the resulting html document.
 
-    Args:
-        html_content: The html content gets inserted into the {{ content }} of the template.
-        title: The title gets inserted into the {{ title }} of the template.
-        css: The css gets inserted into the {{ css }} of the template.
-        language: The language gets inserted into the {{ language }} of the template.
+    # pylint: disable=too-few-public-methods
 
-    Returns:
-        The html document.
+    def __init__(self, target: BinaryIO):
+        """Initializes a new instance of the :class:`_Utf8Writer` class.
+        """
+        self.target = target
+
+    def write(self, text: str):
+        """Writes the text.
+
+        Args:
+            text: The text.
+        """
+        self.target.write(text.encode('utf-8'))
+
+
+def _write_chapters(file: TextIO, chapters: Iterable[Tuple[Chapter, Optional[str], str]]):
+    """Writes the html of the chapters to the file, separated by line breaks.
+
+    Args:
+        file: The text file.
+        chapters: The chapters, their render keys and their html.
     """
-    template = resource_string(__name__, 'template.jinja') \
-        .decode('utf-8') \
-        .replace('\r\n', '\n')
-    # resource_string opens the file as bytes, which means that we
-    # have to decode to utf-8. The replace is necessary because
-    # resource_string, instead of open, does not automatically
-    # strip \r\n down to \n on windows systems. Leaving \r\n as is
-    # would produce double line breaks when writing the resulting string
-    # back to disc, thus we have to do the replacement ourselves, too.
-
-    return Template(template).render(content=html_content,
-                                     title=title,
-                                     css=css,
-                                     language=language,
-                                     package_version=package_version)
-
-
-def _yield_attributes_as_params(object_) -> Generator[str, None, None]:
-    """Takes an object or dictionary and returns a generator yielding all
-    attributes that can be processed by the ebookconvert command line as a
-    parameter array.
+    for index, (_chapter, _key, html) in enumerate(chapters):
+        if index:
+            file.write('\n')
+        file.write(html)
+
+
+async def _run_in_executor(executor: Optional[Executor],
+                           function: Callable[..., Any],
+                           *args: Any) -> Any:
+    """Runs a blocking function in an executor and awaits its result.
+
+    The function is passed a threading.Event as its `cancelled` keyword argument. If the
+    awaiting task is cancelled, the event is set and the function is awaited until it
+    stopped, so it never outlives the task and can clean up after itself.
 
     Args:
-        object_: An object or dictionary.
+        executor: The executor, or None for the default executor of the event loop.
+        function: The function.
+        *args: The arguments of the function.
 
     Returns:
-        A generator yielding all attributes of the object supported
-        by ebookconvert.
+        The result of the function.
     """
-    # This way the book can contain attributes not supported by ebookconvert
-    # (or any other specific output that follows this explicit pattern)
-    for attr_name in SUPPORTED_EBOOKCONVERT_ATTRIBUTES:
-        if hasattr(object_, attr_name):
-            attr = getattr(object_, attr_name)
-        else:
-            try:
-                attr = object_[attr_name]
-            except (TypeError, KeyError):
-                continue
-
-        if not attr:
-            continue
-
-        attr = str(attr)
-        if attr and not attr.isspace():
-            yield '--{0}={1}'.format(attr_name, attr)
+    cancelled = threading.Event()
+    future = asyncio.get_event_loop().run_in_executor(
+        executor, functools.partial(function, *args, cancelled=cancelled))
+
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancelled.set()
+        await asyncio.wait([future])
+        if not future.cancelled():
+            future.exception()
+        raise
 
 
 class NoChaptersFoundError(Exception):
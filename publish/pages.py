@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the page writer, which writes an html document split into pages: an
+index page at the output path, one page per chapter or per group of chapters next to it and
+the css they share.
+
+Pages are named after the hash of their chapters and the css after the hash of its content,
+e.g. book.0123456789abcdef.html for book.html, so a page keeps its name as long as its
+chapters are unchanged. The html of a page also holds the names of the pages it links to,
+the previous and next page and the pages of headings it references, so it changes, under the
+same name, when one of those pages is renamed. A file is only written if its content
+changed, so after an incremental build the pages of changed chapters, the pages linking to
+them and the index page are new. Pages are not immutable, so a server or CDN should
+revalidate them rather than cache them for good. Pages no longer part of the document are
+kept for one more build, so pages and indexes still cached from the last build keep working,
+and removed by the build after that.
+"""
+
+import hashlib
+import html
+import io
+import itertools
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from publish.cache import _write_atomically
+from publish.headings import DEFAULT_TOC_DEPTH, ChapterSpool, HeadingIndex
+from publish.templating import split_template
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+PAGE_HASH_LENGTH = 16
+
+
+class PageWriter:
+    """The PageWriter names and writes the pages of a document split into pages and removes
+    the pages of earlier builds that are no longer part of it when it is closed. The pages of
+    the last build are kept, so it lists the pages it wrote in a hidden file next to them,
+    e.g. .book.pages.
+
+    Args:
+        path: The output path, where the index page is written.
+
+    Examples:
+
+        .. code-block:: python
+
+            with PageWriter('book.html') as pages:
+                name = pages.get_name([chapter_hash])
+                pages.write(name, page_html)
+                pages.write(pages.index_name, index_html)
+
+            with PageWriter('book.html') as pages:
+                pages.write_document(spool, {'title': title, 'css': css, 'language': 'en'})
+    """
+
+    def __init__(self, path: str):
+        """Initializes a new instance of the :class:`PageWriter` class.
+        """
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.index_name = os.path.basename(path)
+        self.stem = os.path.splitext(self.index_name)[0]
+        self.written: Set[str] = set()
+        self._names: Set[str] = set()
+        self._list_path = os.path.join(self.directory, f'.{self.stem}.pages')
+        self._pattern = re.compile(rf'^{re.escape(self.stem)}\.[0-9a-f]{{{PAGE_HASH_LENGTH}}}'
+                                   r'\.(html|css)$')
+
+    def __enter__(self) -> 'PageWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def get_name(self, hashes: Iterable[str], extension: str = '.html') -> str:
+        """Gets the name of a page or of the css, unique across the document.
+
+        Args:
+            hashes: The hashes of the content, e.g. of every chapter of a page.
+            extension: The extension, '.html' or '.css'.
+
+        Returns:
+            The name, e.g. 'book.0123456789abcdef.html'.
+        """
+        hash_ = hashlib.sha256()
+        for part in hashes:
+            hash_.update(part.encode('utf-8') + b'\0')
+
+        name = f'{self.stem}.{hash_.hexdigest()[:PAGE_HASH_LENGTH]}{extension}'
+
+        # Pages with the same content, e.g. two empty chapters, still need their own names.
+        while name in self._names:
+            hash_.update(b'\0')
+            name = f'{self.stem}.{hash_.hexdigest()[:PAGE_HASH_LENGTH]}{extension}'
+
+        self._names.add(name)
+        return name
+
+    def write(self, name: str, text: str) -> bool:
+        """Writes a page, unless the file has that content already.
+
+        Args:
+            name: The name of the page.
+            text: The html or css.
+
+        Returns:
+            True if the file was written, False if it was unchanged.
+        """
+        path = os.path.join(self.directory, name)
+        data = text.encode('utf-8')
+        self.written.add(name)
+
+        if os.path.isfile(path) and os.path.getsize(path) == len(data):
+            with open(path, 'rb') as file:
+                if file.read() == data:
+                    return False
+
+        _write_atomically(path, data)
+        return True
+
+    def write_document(self,
+                       spool: ChapterSpool,
+                       context: Dict[str, Any],
+                       max_size: Optional[int] = None,
+                       toc_depth: int = DEFAULT_TOC_DEPTH) -> List[str]:
+        """Writes a document split into pages: the css, the pages and the index page with
+        the table of contents.
+
+        The names of the pages are derived from the html of their chapters and every page
+        links to the pages of the headings it references, so the html and the headings of
+        all chapters are spooled first. Each page is built in memory, which is bounded by
+        the page size or the largest chapter.
+
+        Args:
+            spool: The spool of the chapters of the document.
+            context: The parts of the template every page shares: the title, css and
+                language and the url of the search index, if any. (see publish.templating)
+            max_size: The maximum size of a page in bytes, or None for one page per
+                chapter. (see group_pages)
+            toc_depth: The deepest heading level listed in the table of contents.
+
+        Returns:
+            The name of the page of every chapter.
+        """
+        context = dict(context, stylesheet=self.write_stylesheet(context['css']))
+        groups = group_pages(spool.sizes, max_size)
+        names = [self.get_name(spool.hashes[position] for position in group)
+                 for group in groups]
+        chapter_pages = [name for name, group in zip(names, groups) for _position in group]
+        chapters = spool.read_chapters()
+
+        for number, group in enumerate(groups):
+            self.write(names[number], _get_page(
+                spool.index, group, itertools.islice(chapters, len(group)),
+                _get_page_context(context, names, number, self.index_name), chapter_pages))
+
+        head, tail = split_template(**context, toc=spool.index.get_toc(toc_depth),
+                                    prefetch=names[0] if names else None,
+                                    chapter_pages=chapter_pages)
+        self.write(self.index_name, head + tail)
+
+        LOG.info(f'Wrote {len(names)} page(s) of {self.index_name}')
+        return chapter_pages
+
+    def write_stylesheet(self, css: str) -> Optional[str]:
+        """Writes the css the pages share, named after its hash.
+
+        Args:
+            css: The css.
+
+        Returns:
+            The name of the css, or None if there is no css.
+        """
+        if not css:
+            return None
+
+        name = self.get_name([css], '.css')
+        self.write(name, css)
+        return name
+
+    def close(self):
+        """Removes the pages and css of earlier builds that are neither part of the document
+        nor of the last build, and lists the pages written for the next build.
+        """
+        kept = self._read_list()
+        removed = 0
+
+        for name in os.listdir(self.directory):
+            if self._pattern.match(name) and name not in self.written and name not in kept:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+
+        if removed:
+            LOG.info(f'Removed {removed} page(s) no longer part of {self.index_name}')
+
+        names = sorted(name for name in self.written if self._pattern.match(name))
+        _write_atomically(self._list_path, ''.join(f'{name}\n' for name in names).encode('utf-8'))
+
+    def _read_list(self) -> Set[str]:
+        """Reads the names of the pages written by the last build.
+
+        Returns:
+            The names, or an empty set if the pages were never written before.
+        """
+        try:
+            with open(self._list_path, 'r', encoding='utf-8') as file:
+                return {line.strip() for line in file if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+
+def group_pages(sizes: Sequence[int], max_size: Optional[int] = None) -> List[List[int]]:
+    """Groups the chapters of a document into pages.
+
+    Args:
+        sizes: The size of the html of every chapter in bytes.
+        max_size: The maximum size of a page in bytes, or None for one page per chapter.
+            Consecutive chapters share a page as long as it stays within the size; a
+            chapter bigger than the size gets a page of its own.
+
+    Returns:
+        The positions of the chapters of every page.
+    """
+    pages: List[List[int]] = []
+    size = 0
+
+    for position, chapter_size in enumerate(sizes):
+        if pages and max_size and size + chapter_size <= max_size:
+            pages[-1].append(position)
+            size += chapter_size
+        else:
+            pages.append([position])
+            size = chapter_size
+
+    return pages
+
+
+def _get_page_context(context: Dict[str, Any],
+                      names: Sequence[str],
+                      number: int,
+                      index_name: str) -> Dict[str, Any]:
+    """Gets the parts of the template of a page: the shared parts and the links to the
+    previous page, the index page and the next page, which the browser prefetches.
+
+    Args:
+        context: The parts of the template every page shares.
+        names: The names of all pages.
+        number: The number of the page, starting at 0.
+        index_name: The name of the index page.
+
+    Returns:
+        The parts of the template.
+    """
+    following = names[number + 1] if number + 1 < len(names) else None
+    navigation = [('prev', names[number - 1], 'Previous')] if number else []
+    navigation.append(('index', index_name, 'Contents'))
+
+    if following:
+        navigation.append(('next', following, 'Next'))
+
+    return dict(context, prefetch=following, navigation=navigation)
+
+
+def _get_page(index: HeadingIndex,
+              group: Sequence[int],
+              chapters: Iterator[Tuple[int, str]],
+              context: Dict[str, Any],
+              chapter_pages: Sequence[str]) -> str:
+    """Gets the html of a page, titled after its first heading.
+
+    Args:
+        index: The heading index of the document.
+        group: The positions of the chapters of the page.
+        chapters: The position and the html of every chapter of the page.
+            (see ChapterSpool.read_chapters)
+        context: The parts of the template of the page.
+        chapter_pages: The name of the page of every chapter.
+
+    Returns:
+        The html.
+    """
+    headings = [heading for position in group for heading in index.get_chapter_headings(position)]
+    title = f'{html.escape(headings[0].text)} - {context["title"]}' \
+        if headings else context['title']
+    head, tail = split_template(**dict(context, title=title))
+    page = io.StringIO()
+    page.write(head)
+
+    for count, (position, html_) in enumerate(chapters):
+        if count:
+            page.write('\n')
+        index.write_chapter(page, position, html_, pages=chapter_pages)
+
+    page.write(tail)
+    return page.getvalue()
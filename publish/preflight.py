@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the preflight check, which finds the problems of a project before any
+output is made.
+
+A missing chapter or a missing ebook-convert would otherwise only be found in the middle of
+a build, possibly after other outputs took minutes to make. The preflight check looks at the
+inputs of every output up front and reports all problems found at once.
+"""
+
+import logging
+import os
+import re
+import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Union
+
+from jinja2 import Template, TemplateError
+
+from publish.book import Book, Chapter
+from publish.distributed import parse_address
+from publish.highlighting import get_highlight_css
+from publish.isolation import RENDER_FALLBACKS
+from publish.loader import DEFAULT_READ_THREADS
+from publish.output import HtmlOutput, EbookConvertOutput, NoChaptersFoundError
+from publish.source import SourceResolver
+from publish.substitution import RegexSubstitution, Substitution
+from publish.templating import load_template
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+EBOOK_CONVERT = 'ebook-convert'
+
+
+class PreflightError(Exception):
+    """The project has problems that would make the build fail.
+
+    Args:
+        problems: The descriptions of all problems found.
+
+    Attributes:
+        problems (List[str]): The descriptions of all problems found.
+    """
+
+    def __init__(self, problems: List[str]):
+        """Initializes a new instance of the :class:`PreflightError` class.
+        """
+        super().__init__('\n'.join([f'Found {len(problems)} problem(s):', *problems]))
+        self.problems = problems
+
+
+def check_project(book: Book,
+                  substitutions: Iterable[Substitution],
+                  outputs: Iterable[Union[HtmlOutput, EbookConvertOutput]],
+                  threads: int = DEFAULT_READ_THREADS) -> List[str]:
+    """Checks the inputs of every output without making any of them.
+
+    The following problems are found:
+
+    * outputs without any chapter to publish or with an invalid chapter selection
+    * chapters that can not be read, checked by stat-ing all of them concurrently
+    * regex substitutions whose replacement refers to a group the pattern does not have
+    * stylesheets that can not be read and a template that can not be loaded
+    * ebook-convert missing from PATH while there are ebook outputs
+    * output paths that can not be written, invalid render fallbacks and invalid render
+      worker addresses
+
+    Args:
+        book: The book.
+        substitutions: The list of substitutions.
+        outputs: The list of outputs.
+        threads: The maximum number of chapters stat-ed concurrently.
+
+    Returns:
+        The descriptions of all problems found, or an empty list.
+    """
+    outputs = list(outputs)
+    problems = []
+    chapters: Dict[int, Chapter] = {}
+
+    for output in outputs:
+        try:
+            for chapter in output._get_chapters_to_render(  # pylint: disable=protected-access
+                    book.chapters):
+                chapters[id(chapter)] = chapter
+        except (NoChaptersFoundError, ValueError) as error:
+            problems.append(f'{output.path}: {error}')
+
+    problems.extend(_check_chapters(book, list(chapters.values()), threads))
+    problems.extend(_check_substitutions(substitutions))
+    problems.extend(_check_files(outputs))
+
+    return problems
+
+
+def preflight(book: Book,
+              substitutions: Iterable[Substitution],
+              outputs: Iterable[Union[HtmlOutput, EbookConvertOutput]]):
+    """Checks the inputs of every output like check_project and raises all problems found.
+
+    Call this before making the outputs of a project from Python.
+
+    Args:
+        book: The book.
+        substitutions: The list of substitutions.
+        outputs: The list of outputs.
+
+    Raises:
+        PreflightError: If any problem was found.
+    """
+    LOG.info('Checking the project ...')
+    problems = check_project(book, substitutions, outputs)
+
+    if problems:
+        raise PreflightError(problems)
+
+
+def _check_chapters(book: Book,
+                    chapters: List[Chapter],
+                    threads: int) -> List[str]:
+    """Checks that every chapter can be read by stat-ing all of them concurrently.
+
+    Args:
+        book: The book, for its sources.
+        chapters: The chapters to check.
+        threads: The maximum number of concurrent stats.
+
+    Returns:
+        The list of problems.
+    """
+    def stat(chapter: Chapter) -> str:
+        try:
+            chapter.stat(resolver)
+        except (OSError, ValueError, zipfile.BadZipFile, tarfile.TarError) as error:
+            return f'{chapter.src}: can not read chapter ({error})'
+        return ''
+
+    with SourceResolver(book.sources) as resolver, \
+            ThreadPoolExecutor(max_workers=max(1, threads),
+                               thread_name_prefix='publish-preflight') as executor:
+        return [problem for problem in executor.map(stat, chapters) if problem]
+
+
+def _check_substitutions(substitutions: Iterable[Substitution]) -> List[str]:
+    """Checks that the replacement of every regex substitution is valid for its pattern.
+
+    The patterns themselves were compiled when the substitutions were created, but an
+    invalid group reference in a replacement is only found when it is applied.
+
+    Args:
+        substitutions: The list of substitutions.
+
+    Returns:
+        The list of problems.
+    """
+    problems = []
+
+    for substitution in substitutions:
+        if isinstance(substitution, RegexSubstitution):
+            try:
+                substitution.regular_expression.sub(substitution.replace_with, '')
+            except (re.error, IndexError) as error:
+                problems.append(f'{substitution!r}: invalid replacement ({error})')
+
+    return problems
+
+
+def _check_files(outputs: List[Union[HtmlOutput, EbookConvertOutput]]) -> List[str]:
+    """Checks the stylesheets, the template, ebook-convert, the output settings and the output
+    paths.
+
+    Args:
+        outputs: The list of outputs.
+
+    Returns:
+        The list of problems.
+    """
+    problems = _check_stylesheets(outputs)
+    problems.extend(_check_template())
+    problems.extend(_check_ebook_convert(outputs))
+
+    for output in outputs:
+        problems.extend(_check_settings(output))
+        problems.extend(_check_output_path(output))
+
+    return problems
+
+
+def _check_stylesheets(outputs: List[Union[HtmlOutput, EbookConvertOutput]]) -> List[str]:
+    """Checks that the stylesheet of every output can be read.
+
+    Args:
+        outputs: The list of outputs.
+
+    Returns:
+        The list of problems.
+    """
+    return [f'{stylesheet}: stylesheet does not exist or can not be read'
+            for stylesheet in sorted({output.stylesheet for output in outputs
+                                      if output.stylesheet})
+            if not os.path.isfile(stylesheet) or not os.access(stylesheet, os.R_OK)]
+
+
+def _check_template() -> List[str]:
+    """Checks that the html template can be loaded.
+
+    Returns:
+        The list of problems.
+    """
+    try:
+        Template(load_template())
+    except (OSError, TemplateError) as error:
+        return [f'The html template can not be loaded ({error})']
+
+    return []
+
+
+def _check_ebook_convert(outputs: List[Union[HtmlOutput, EbookConvertOutput]]) -> List[str]:
+    """Checks that ebook-convert is on the PATH if there are ebook outputs.
+
+    Args:
+        outputs: The list of outputs.
+
+    Returns:
+        The list of problems.
+    """
+    ebook_outputs = [output.path for output in outputs
+                     if isinstance(output, EbookConvertOutput)]
+
+    if ebook_outputs and not shutil.which(EBOOK_CONVERT):
+        return [f'{", ".join(ebook_outputs)}: {EBOOK_CONVERT} not found, please install '
+                f'calibre and make sure {EBOOK_CONVERT} is on the PATH']
+
+    return []
+
+
+def _check_settings(output: Union[HtmlOutput, EbookConvertOutput]) -> List[str]:
+    """Checks the render fallback, the highlight style, the split page size, the stash
+    patterns and the render worker addresses of an output.
+
+    Args:
+        output: The output.
+
+    Returns:
+        The list of problems.
+    """
+    problems = []
+
+    if output.render_fallback not in RENDER_FALLBACKS:
+        problems.append(f'{output.path}: render_fallback must be one of '
+                        f'{", ".join(RENDER_FALLBACKS)}')
+
+    if output.highlight_style:
+        try:
+            get_highlight_css(output.highlight_style)
+        except ValueError as error:
+            problems.append(f'{output.path}: {error}')
+
+    if output.split_page_size is not None and \
+            (not isinstance(output.split_page_size, int) or output.split_page_size < 1):
+        problems.append(f'{output.path}: split_page_size must be a positive number of KiB')
+
+    for pattern in output.stash_patterns or []:
+        try:
+            re.compile(pattern)
+        except re.error as error:
+            problems.append(f'{output.path}: stash pattern {pattern!r} is invalid ({error})')
+
+    for address in output.render_workers or []:
+        try:
+            parse_address(address)
+        except ValueError as error:
+            problems.append(f'{output.path}: {error}')
+
+    return problems
+
+
+def _check_output_path(output: Union[HtmlOutput, EbookConvertOutput]) -> List[str]:
+    """Checks that the path of an output can be written.
+
+    Args:
+        output: The output.
+
+    Returns:
+        The list of problems.
+    """
+    directory = os.path.dirname(os.path.abspath(output.path))
+
+    if os.path.isdir(output.path):
+        return [f'{output.path}: output path is a directory']
+
+    if not os.path.isdir(directory):
+        return [f'{output.path}: output directory {directory} does not exist']
+
+    if not os.access(directory, os.W_OK) or \
+            (os.path.exists(output.path) and not os.access(output.path, os.W_OK)):
+        return [f'{output.path}: output path is not writable']
+
+    return []
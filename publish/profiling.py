@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the substitution profiler, which records the time spent, the number
+of matches and the bytes changed of every substitution for every chapter.
+
+Projects accumulate substitutions over the years. The profile shows which of them are
+expensive and which never match anything and can be removed.
+"""
+
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from publish.substitution import RegexSubstitution, SimpleSubstitution, Substitution
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+REPORT_RULE_WIDTH = 60
+
+
+class SubstitutionProfiler:
+    """The SubstitutionProfiler applies substitutions like apply_substitutions while
+    recording, per substitution and chapter, the time spent, the number of matches and the
+    number of bytes changed.
+
+    The bytes changed are the utf-8 encoded size of the text matched by a
+    SimpleSubstitution or RegexSubstitution. Other substitution classes are counted as one
+    match, changing the whole text, for every chapter they change. Counting matches costs
+    time of its own, which is not included in the time recorded.
+
+    A chapter profiled twice, e.g. by two outputs, only counts once: the last profile of
+    each chapter is kept.
+
+    Examples:
+
+        .. code-block:: python
+
+            profiler = SubstitutionProfiler()
+            HtmlOutput(path='example.html', profiler=profiler).make(book, substitutions)
+
+            print(profiler.format_report())
+            profiler.save('substitution-profile.json')
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the :class:`SubstitutionProfiler` class.
+        """
+        self.substitutions: List[Substitution] = []
+        self._chapters: Dict[str, List[Tuple[float, int, int]]] = {}
+
+    def apply(self, text: str, substitutions: Iterable[Substitution], src: str = '') -> str:
+        """Applies the substitutions to the text of a chapter and records their profile.
+
+        Args:
+            text: The text of the chapter.
+            substitutions: The list of substitutions, the same for every chapter.
+            src: The src of the chapter.
+
+        Returns:
+            The changed text.
+        """
+        self.substitutions = list(substitutions or [])
+        profile = []
+
+        for substitution in self.substitutions:
+            start = time.perf_counter()
+            changed = substitution.apply_to(text)
+            elapsed = time.perf_counter() - start
+
+            matches, bytes_changed = _count_matches(substitution, text, changed)
+            profile.append((elapsed, matches, bytes_changed))
+            text = changed
+
+        self._chapters[src] = profile
+        return text
+
+    def get_profile(self) -> List[Dict]:
+        """Gets the profile of every substitution, sorted by the time spent, most expensive
+        first.
+
+        Returns:
+            One dictionary per substitution with the keys 'index', 'rule', 'time',
+            'matches', 'bytes_changed', 'dead' and 'chapters'. 'dead' is True for
+            substitutions that never matched in any chapter, 'chapters' maps the src of
+            each chapter to its own 'time', 'matches' and 'bytes_changed'.
+        """
+        rules = []
+
+        for index, substitution in enumerate(self.substitutions):
+            chapters = {src: {'time': profile[index][0],
+                              'matches': profile[index][1],
+                              'bytes_changed': profile[index][2]}
+                        for src, profile in self._chapters.items()}
+            matches = sum(chapter['matches'] for chapter in chapters.values())
+
+            rules.append({'index': index,
+                          'rule': repr(substitution),
+                          'time': sum(chapter['time'] for chapter in chapters.values()),
+                          'matches': matches,
+                          'bytes_changed': sum(chapter['bytes_changed']
+                                               for chapter in chapters.values()),
+                          'dead': matches == 0,
+                          'chapters': chapters})
+
+        return sorted(rules, key=lambda rule: rule['time'], reverse=True)
+
+    def get_dead_rules(self) -> List[Substitution]:
+        """Gets the substitutions that never matched in any chapter profiled.
+
+        Returns:
+            The list of substitutions in their original order.
+        """
+        dead = {rule['index'] for rule in self.get_profile() if rule['dead']}
+        return [substitution for index, substitution in enumerate(self.substitutions)
+                if index in dead]
+
+    def format_report(self, limit: Optional[int] = None) -> str:
+        """Formats the profile as a table sorted by the time spent, followed by the list of
+        substitutions that never matched.
+
+        Args:
+            limit: The maximum number of substitutions in the table, or None for all.
+
+        Returns:
+            The report.
+        """
+        rules = self.get_profile()
+        total = sum(rule['time'] for rule in rules) or 1.0
+        lines = [f'Substitution profile of {len(self._chapters)} chapters:',
+                 f'{"time ms":>10} {"share":>6} {"matches":>9} {"bytes":>11}  rule']
+
+        for rule in rules[:limit]:
+            lines.append(f'{rule["time"] * 1000:10.1f} {rule["time"] / total:6.1%} '
+                         f'{rule["matches"]:9} {rule["bytes_changed"]:11}  '
+                         f'{_shorten(rule["rule"])}')
+
+        dead = [rule for rule in rules if rule['dead']]
+        if dead:
+            lines.append(f'{len(dead)} substitution(s) never matched and can be removed:')
+            lines.extend(f'  #{rule["index"] + 1} {_shorten(rule["rule"])}'
+                         for rule in sorted(dead, key=lambda rule: rule['index']))
+
+        return '\n'.join(lines)
+
+    def save(self, path: str):
+        """Saves the profile as json file.
+
+        Args:
+            path: The path of the json file.
+        """
+        with open(path, 'wt', encoding='utf8') as file:
+            json.dump({'chapters': len(self._chapters), 'rules': self.get_profile()},
+                      file, indent=2)
+
+        LOG.info(f'Saved the substitution profile to {path}.')
+
+
+def _count_matches(substitution: Substitution, before: str, after: str) -> Tuple[int, int]:
+    """Counts the matches of a substitution and the bytes they changed.
+
+    Args:
+        substitution: The substitution.
+        before: The text before the substitution was applied.
+        after: The text after the substitution was applied.
+
+    Returns:
+        A tuple consisting of the number of matches and the number of bytes changed.
+    """
+    if isinstance(substitution, SimpleSubstitution):
+        if not substitution.old:
+            return 0, 0
+        matches = before.count(substitution.old)
+        return matches, matches * len(substitution.old.encode('utf-8'))
+
+    if isinstance(substitution, RegexSubstitution):
+        matches = 0
+        bytes_changed = 0
+        for match in substitution.regular_expression.finditer(before):
+            matches += 1
+            bytes_changed += len(match.group(0).encode('utf-8'))
+        return matches, bytes_changed
+
+    if before == after:
+        return 0, 0
+
+    return 1, len(before.encode('utf-8'))
+
+
+def _shorten(text: str, width: int = REPORT_RULE_WIDTH) -> str:
+    """Shortens a text to the width, marking the cut with an ellipsis.
+
+    Args:
+        text: The text.
+        width: The maximum width.
+
+    Returns:
+        The shortened text.
+    """
+    return text if len(text) <= width else f'{text[:width - 3]}...'
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the compiled project, an immutable project that can be shared by many
+threads building its outputs at the same time, e.g. in a web service.
+
+Books, chapters and outputs are mutable and collect state while an output is made: chapters
+cache their content and hash, outputs may carry a profiler. A compiled project holds none of
+them. It keeps the book metadata, the chapter srcs, the precompiled substitutions and the
+css of every stylesheet, and hands out fresh objects to every build.
+"""
+
+import copy
+import logging
+import os
+from types import MappingProxyType
+from typing import Any, BinaryIO, Iterable, List, Optional, TextIO, Tuple, Union
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.output import HtmlOutput, EbookConvertOutput
+from publish.substitution import Substitution
+from publish.templating import get_template
+from publish.yaml import load_project
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+BOOK_ATTRIBUTES = tuple(name for name in Book.__slots__ if not name.startswith('__'))
+
+
+class CompiledProject:
+    """The CompiledProject is an immutable project whose outputs can be made by many threads
+    at once.
+
+    Every build gets its own book, chapters and outputs (see get_book and get_outputs), so
+    no state is shared between builds except the immutable parts of the project itself.
+
+    Args:
+        book: The book.
+        substitutions: The list of substitutions.
+        outputs: The list of outputs.
+
+    Attributes:
+        metadata (Mapping[str, Any]): The attributes of the book, e.g. 'title' or 'authors'.
+        chapters (Tuple[Tuple[str, bool], ...]): The src and publish flag of every chapter.
+        sources (Mapping[str, ChapterSource]): The named chapter sources of the book.
+        substitutions (Tuple[Substitution, ...]): The precompiled substitutions.
+        stylesheets (Mapping[str, str]): The css of every stylesheet, read when the project
+            was compiled.
+        template (Template): The compiled html template.
+
+    Examples:
+
+        .. code-block:: python
+
+            project = CompiledProject(*load_project_file())
+
+            # in any number of threads at once
+            html = project.render('example.html')
+    """
+
+    __slots__ = ('metadata', 'chapters', 'sources', 'substitutions', 'stylesheets', 'template',
+                 '_outputs')
+
+    def __init__(self,
+                 book: Book,
+                 substitutions: Iterable[Substitution],
+                 outputs: Iterable[Union[HtmlOutput, EbookConvertOutput]]):
+        """Initializes a new instance of the :class:`CompiledProject` class.
+        """
+        # pylint: disable=protected-access
+        outputs = [copy.deepcopy(output) for output in outputs]
+        stylesheets = {}
+
+        for output in outputs:
+            if output.stylesheet and output.css is None:
+                if output.stylesheet not in stylesheets:
+                    stylesheets[output.stylesheet] = output._get_css()
+                output.css = stylesheets[output.stylesheet]
+
+        self.metadata = MappingProxyType({name: getattr(book, name)
+                                          for name in BOOK_ATTRIBUTES})
+        self.chapters = tuple((chapter.src, chapter.publish) for chapter in book.chapters)
+        self.sources = MappingProxyType(dict(book.sources))
+        self.substitutions = tuple(substitutions)
+        self.stylesheets = MappingProxyType(stylesheets)
+        self.template = get_template()
+        self._outputs = tuple(outputs)
+
+    def __setattr__(self, name: str, value: Any):
+        # Every attribute is set once, by __init__, and never again.
+        if hasattr(self, name):
+            raise AttributeError(f'{type(self).__name__} is immutable')
+
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    @property
+    def paths(self) -> Tuple[str, ...]:
+        """Gets the paths of the outputs.
+
+        Returns:
+            The output paths in the order of the project.
+        """
+        return tuple(output.path for output in self._outputs)
+
+    def get_book(self) -> Book:
+        """Gets a new book with new chapters for a single build.
+
+        Returns:
+            The book.
+        """
+        book = Book(**self.metadata)
+        book.chapters.extend(Chapter(src, publish=publish) for src, publish in self.chapters)
+        book.sources.update(self.sources)
+        return book
+
+    def get_outputs(self, cache: Optional[BuildCache] = None
+                    ) -> List[Union[HtmlOutput, EbookConvertOutput]]:
+        """Gets new outputs for a single build.
+
+        Args:
+            cache: The build cache the outputs use, if any.
+
+        Returns:
+            The list of outputs in the order of the project.
+        """
+        outputs = [copy.deepcopy(output) for output in self._outputs]
+
+        if cache:
+            for output in outputs:
+                output.cache = cache
+
+        return outputs
+
+    def get_output(self, path: str) -> Union[HtmlOutput, EbookConvertOutput]:
+        """Gets a new output for a single build by its path.
+
+        Args:
+            path: The output path. Paths are compared after normalization.
+
+        Returns:
+            The output.
+
+        Raises:
+            ValueError: If the path does not match any output.
+        """
+        for output in self._outputs:
+            if os.path.normpath(output.path) == os.path.normpath(path):
+                return copy.deepcopy(output)
+
+        raise ValueError(f'{path} does not match any output. '
+                         f'Available outputs: {", ".join(self.paths)}')
+
+    def make(self, paths: Optional[Iterable[str]] = None):
+        """Makes the outputs with the given paths, or all outputs.
+
+        Args:
+            paths: The output paths, or None for all outputs.
+        """
+        outputs = self.get_outputs() if paths is None else \
+            [self.get_output(path) for path in paths]
+
+        for output in outputs:
+            output.make(self.get_book(), self.substitutions)
+
+    def render(self, path: str) -> bytes:
+        """Makes the output with the given path and returns it. (see HtmlOutput.render)
+
+        Args:
+            path: The output path.
+
+        Returns:
+            The html document or ebook.
+        """
+        return self.get_output(path).render(self.get_book(), self.substitutions)
+
+    def write_to(self, path: str, target: Union[BinaryIO, TextIO]):
+        """Makes the output with the given path and writes it to a file-like object.
+        (see HtmlOutput.write_to)
+
+        Args:
+            path: The output path.
+            target: The file-like object.
+        """
+        self.get_output(path).write_to(target, self.get_book(), self.substitutions)
+
+
+def compile_project(yaml: str) -> CompiledProject:
+    """Loads a yaml string like load_project and compiles it into a CompiledProject.
+
+    Args:
+        yaml: The yaml string.
+
+    Returns:
+        The compiled project.
+    """
+    return CompiledProject(*load_project(yaml))
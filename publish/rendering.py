@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the chapter renderer, which substitutes and renders the chapters of a
+document to html with the settings of an output. (see publish.output)
+
+The markdown of the chapters is joined and rendered as a whole, so reference links, raw html
+and substitutions work across chapters, or, with render_chapters_separately, every chapter
+is rendered on its own and the chapters stream through rendering one at a time. Either way
+the html is cached in the build cache and rendered with the time budget and limits of the
+output, in the current process, in worker processes (see publish.isolation) or on render
+workers (see publish.distributed), and yielded chapter by chapter.
+"""
+
+import contextlib
+import functools
+import hashlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import CancelledError
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Sequence, Tuple)
+
+import markdown
+
+from publish import __version__ as package_version
+from publish.book import Chapter
+from publish.distributed import RenderCoordinator, RenderSettings, parse_address
+from publish.highlighting import get_highlight_fingerprint
+from publish.isolation import RenderWorker, SubstitutionWorker
+from publish.loader import ChapterLoader
+from publish.scheduling import get_lpt_order, predict_makespan
+from publish.source import SourceResolver
+from publish.stash import OpaqueStash
+from publish.substitution import Substitution, get_fingerprint
+
+if TYPE_CHECKING:  # pragma: no cover
+    from publish.output import HtmlOutput  # pylint: disable=cyclic-import
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+RENDER_CACHE_NAMESPACE = 'renders'
+
+# Separates the chapters of a book rendered as a whole, so its html can be split into chapters
+# again. A private use character, like the placeholders of the stash, is left alone by markdown
+# and by any sensible substitution.
+CHAPTER_BREAK = '\ue002'
+CHAPTER_BREAK_PATTERN = re.compile(f'\n*(?:<p>)?{CHAPTER_BREAK}(?:</p>)?\n*')
+
+
+class ChapterRenderer:
+    """The ChapterRenderer substitutes and renders the chapters of a document to html with
+    the settings of an output, e.g. its cache, its time budget and its render workers.
+
+    Args:
+        output: The output.
+        substitutions: The list of substitutions.
+        resolver: The source resolver of the current build.
+
+    Examples:
+
+        .. code-block:: python
+
+            with SourceResolver(book.sources) as resolver:
+                renderer = ChapterRenderer(output, substitutions, resolver)
+                for chapter, key, html in renderer.render(chapters):
+                    file.write(html)
+    """
+
+    def __init__(self,
+                 output: 'HtmlOutput',
+                 substitutions: Iterable[Substitution],
+                 resolver: Optional[SourceResolver] = None):
+        """Initializes a new instance of the :class:`ChapterRenderer` class.
+        """
+        self.output = output
+        self.substitutions = substitutions
+        self.resolver = resolver
+        self.stash = self._get_stash()
+
+    def render(self,
+               chapters: Sequence[Chapter],
+               cancelled: Optional[threading.Event] = None
+               ) -> Iterator[Tuple[Chapter, Optional[str], str]]:
+        """Renders the chapters to html, yielding each chapter with its html one at a time
+        in the order of the chapters.
+
+        The list of substitutions is applied to the markdown content before it is rendered to
+        html, either of each chapter on its own, if render_chapters_separately is set, or of
+        the whole book.
+
+        Args:
+            chapters: The chapters to be published.
+            cancelled: Stops rendering at the next chapter once set.
+
+        Returns:
+            A generator yielding a tuple consisting of each chapter, the key its html is
+            cached under, or None if it is not cached, and its html.
+
+        Raises:
+            CancelledError: If cancelled was set.
+        """
+        if self.output.render_chapters_separately:
+            return self._render_chapters(chapters, cancelled)
+
+        return self._render_book(chapters, cancelled)
+
+    def get_render_keys(self, chapters: Sequence[Chapter]) -> List[Optional[str]]:
+        """Gets the keys the rendered html of the chapters is cached under.
+
+        A key is the hash of everything the html of a chapter is rendered from: the content
+        of the chapter, the substitutions, the versions of publish and markdown, the
+        settings of the stash and the version of Pygments if code blocks are highlighted.
+
+        Args:
+            chapters: The list of chapters.
+
+        Returns:
+            The list of keys in the order of the chapters, or a list of None if the output
+            has no cache.
+        """
+        if not self.output.cache:
+            return [None] * len(chapters)
+
+        base = hashlib.sha256()
+        for part in (package_version, markdown.__version__, get_fingerprint(self.substitutions)):
+            base.update(part.encode('utf-8') + b'\0')
+
+        if self.output.highlight_style:
+            base.update(get_highlight_fingerprint().encode('utf-8') + b'\0')
+
+        if self.stash:
+            base.update(self.stash.get_fingerprint().encode('utf-8') + b'\0')
+
+        loader = ChapterLoader(self.resolver, threads=self.output.read_threads)
+        keys = []
+
+        for content_hash in loader.get_content_hashes(chapters):
+            key = base.copy()
+            key.update(content_hash.encode('utf-8'))
+            keys.append(key.hexdigest())
+
+        return keys
+
+    def _render_book(self,
+                     chapters: Sequence[Chapter],
+                     cancelled: Optional[threading.Event] = None
+                     ) -> Iterator[Tuple[Chapter, Optional[str], str]]:
+        """Renders the chapters to html as a whole, like a single chapter, yielding each
+        chapter with its html.
+
+        The markdown of the chapters is joined by blank lines, so reference links, raw html
+        and substitutions work across chapters. If the html is split into chapters again
+        later on, for a table of contents, a search index or pages, a chapter break is put
+        between the chapters and the html is split at the breaks. Should the substitutions
+        or markdown swallow a break, the whole html is yielded with the first chapter.
+
+        The html of the book is cached as a whole, as long as neither a chapter nor the
+        substitutions change.
+
+        Args:
+            chapters: The chapters to be published.
+            cancelled: Stops rendering once set.
+
+        Returns:
+            A generator yielding a tuple consisting of each chapter, the key its html is
+            cached under, or None if it is not cached, and its html.
+
+        Raises:
+            CancelledError: If cancelled was set.
+        """
+        output = self.output
+        separator = f'\n\n{CHAPTER_BREAK}\n\n' \
+            if output.toc or output.search_index or output.split_pages else '\n\n'
+        key = self._get_book_key(chapters, separator)
+        html = output.cache.load_text(RENDER_CACHE_NAMESPACE, key) if key else None
+
+        if html is None:
+            LOG.info(f'Rendering {len(chapters)} chapters to html as a whole ...')
+            text = separator.join(text for text, _src
+                                  in _release_chapters(self._get_loader().load(chapters)))
+            _check_cancelled(cancelled)
+
+            with contextlib.ExitStack() as stack:
+                html, fallback = self._get_render(stack)[0](text, output.path)
+            del text
+
+            if fallback:
+                key = None
+            elif key:
+                output.cache.save_text(RENDER_CACHE_NAMESPACE, key, html)
+
+        parts = _split_chapters(html, len(chapters), separator, output.path)
+
+        for position, (chapter, part) in enumerate(zip(chapters, parts)):
+            _check_cancelled(cancelled)
+
+            part_key = key
+            if key and len(parts) > 1:
+                part_key = hashlib.sha256(f'{key}\0{position}'.encode('utf-8')).hexdigest()
+
+            yield chapter, part_key, part
+
+    def _get_book_key(self, chapters: Sequence[Chapter], separator: str) -> Optional[str]:
+        """Gets the key the html of the book rendered as a whole is cached under.
+
+        Args:
+            chapters: The chapters to be published.
+            separator: The separator the markdown of the chapters is joined with.
+
+        Returns:
+            The key, or None if the html is not cached.
+        """
+        if not self.output.cache or self.output.profiler:
+            return None
+
+        hash_ = hashlib.sha256(separator.encode('utf-8'))
+        for chapter_key in self.get_render_keys(chapters):
+            hash_.update(b'\0' + chapter_key.encode('utf-8'))
+
+        return hash_.hexdigest()
+
+    def _render_chapters(self,
+                         chapters: Sequence[Chapter],
+                         cancelled: Optional[threading.Event] = None
+                         ) -> Iterator[Tuple[Chapter, Optional[str], str]]:
+        """Renders the chapters to html one chapter at a time, yielding each chapter with
+        its html in the order of the chapters.
+
+        The list of substitutions is applied to the markdown content of each chapter before
+        it is rendered to html.
+
+        The chapters are read concurrently ahead of rendering (see publish.loader) and each
+        chapter is substituted and rendered on its own, so reading overlaps with the
+        substitution and rendering of the chapters before it. If the output has a cache,
+        chapters rendered by a previous build are loaded from the cache when they are reached,
+        without reading them again.
+
+        Args:
+            chapters: The chapters to be published.
+            cancelled: Stops rendering at the next chapter once set.
+
+        Returns:
+            A generator yielding a tuple consisting of each chapter, the key its html is
+            cached under, or None if it is not cached, and its html.
+
+        Raises:
+            CancelledError: If cancelled was set.
+        """
+        output = self.output
+        keys = self.get_render_keys(chapters)
+        missing = [position for position, key in enumerate(keys)
+                   if not (output.cache and not output.profiler
+                           and output.cache.has_text(RENDER_CACHE_NAMESPACE, key))]
+
+        LOG.info(f'Rendering {len(missing)} of {len(chapters)} chapters to html ...')
+
+        with contextlib.ExitStack() as stack:
+            render, coordinator = self._get_render(stack)
+            missing_chapters = [chapters[position] for position in missing]
+            rendered = self._render_remotely(coordinator, missing_chapters, cancelled) \
+                if coordinator else self._render_locally(render, missing_chapters, cancelled)
+            done = 0
+
+            for position, (html, fallback) in zip(missing, rendered):
+                yield from self._load_chapters(chapters[done:position], keys[done:position],
+                                               render, cancelled)
+                yield self._store(chapters[position], keys[position], html, fallback)
+                done = position + 1
+
+            yield from self._load_chapters(chapters[done:], keys[done:], render, cancelled)
+
+    def _render_locally(self,
+                        render: Callable[[str, str], Tuple[str, bool]],
+                        chapters: Sequence[Chapter],
+                        cancelled: Optional[threading.Event] = None
+                        ) -> Iterator[Tuple[str, bool]]:
+        """Renders chapters in the current process or in worker processes, yielding the
+        html of each chapter and whether it was rendered as preformatted text in the order
+        of the chapters. With a cost model, the time every chapter took is recorded.
+
+        Args:
+            render: Renders a single markdown text. (see _get_render)
+            chapters: The chapters.
+            cancelled: Stops rendering at the next chapter once set.
+
+        Returns:
+            A generator yielding the html and the fallback flag of each chapter.
+        """
+        cost_model = None if self.output.profiler else self.output.cost_model
+
+        for chapter, text in self._get_loader().load(chapters):
+            _check_cancelled(cancelled)
+            started = time.perf_counter()
+            html, fallback = render(text, chapter.src)
+            del text
+            chapter.release()
+
+            if cost_model:
+                cost_model.record_render(chapter.src, time.perf_counter() - started)
+
+            yield html, fallback
+
+    def _render_remotely(self,
+                         coordinator: RenderCoordinator,
+                         chapters: Sequence[Chapter],
+                         cancelled: Optional[threading.Event] = None
+                         ) -> Iterator[Tuple[str, bool]]:
+        """Renders chapters on the render workers, yielding the html of each chapter and
+        whether it was rendered as preformatted text in the order of the chapters.
+
+        With a cost model, the chapters are read and sent longest first (see
+        publish.scheduling), so no worker is left alone with a giant chapter at the end.
+        The html of chapters done before their turn is kept until they are reached. The
+        opaque spans of the chapters are stashed before they are sent, so they never cross
+        the network.
+
+        Args:
+            coordinator: The coordinator.
+            chapters: The chapters.
+            cancelled: Stops rendering at the next chapter once set.
+
+        Returns:
+            A generator yielding the html and the fallback flag of each chapter.
+        """
+        cost_model = self.output.cost_model
+        costs = [cost_model.get_render_time(chapter.src) if cost_model else None
+                 for chapter in chapters]
+        order = get_lpt_order(costs) if cost_model else list(range(len(chapters)))
+        stashed: Dict[int, List[str]] = {}
+
+        def stash_chapters(texts: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+            for index, (text, src) in zip(order, texts):
+                text, stashed[index] = _stash(self.stash, text)
+                yield text, src
+
+        rendered = coordinator.render(stash_chapters(_release_chapters(
+            self._get_loader().load([chapters[index] for index in order]))))
+        started = time.perf_counter()
+
+        for index, (html, fallback, seconds) in enumerate(_reorder(order, rendered)):
+            _check_cancelled(cancelled)
+            html = _restore(self.stash, html, stashed.pop(index), fallback)
+
+            if cost_model:
+                cost_model.record_render(chapters[index].src, seconds)
+
+                if index == len(chapters) - 1:
+                    cost_model.explain(f'chapters of {self.output.path}',
+                                       len(coordinator.addresses),
+                                       predict_makespan(costs, len(coordinator.addresses)),
+                                       time.perf_counter() - started)
+
+            yield html, fallback
+
+    def _load_chapters(self,
+                       chapters: Sequence[Chapter],
+                       keys: Sequence[str],
+                       render: Callable[[str, str], Tuple[str, bool]],
+                       cancelled: Optional[threading.Event] = None
+                       ) -> Iterator[Tuple[Chapter, Optional[str], str]]:
+        """Loads the html of chapters from the cache, yielding each chapter with its html.
+
+        Args:
+            chapters: The chapters.
+            keys: The keys their html is cached under.
+            render: Renders a single markdown text, for a chapter whose cache entry vanished
+                since it was found. (see _get_render)
+            cancelled: Stops loading at the next chapter once set.
+
+        Returns:
+            A generator yielding a tuple consisting of each chapter, the key its html is
+            cached under, or None if it is not cached, and its html.
+        """
+        for chapter, key in zip(chapters, keys):
+            _check_cancelled(cancelled)
+            html = self.output.cache.load_text(RENDER_CACHE_NAMESPACE, key)
+
+            if html is None:
+                # The entry vanished since it was found, render it after all.
+                html, fallback = render(chapter.read(self.resolver), chapter.src)
+                chapter.release()
+                yield self._store(chapter, key, html, fallback)
+            else:
+                yield chapter, key, html
+
+    def _store(self,
+               chapter: Chapter,
+               key: Optional[str],
+               html: str,
+               fallback: bool) -> Tuple[Chapter, Optional[str], str]:
+        """Stores the html of a chapter in the cache, unless it is the markdown rendered as
+        preformatted text.
+
+        Args:
+            chapter: The chapter.
+            key: The key its html is cached under.
+            html: The html.
+            fallback: Whether the html is the markdown rendered as preformatted text.
+
+        Returns:
+            A tuple consisting of the chapter, the key its html is cached under, or None if
+            it is not cached, and its html.
+        """
+        if fallback:
+            return chapter, None, html
+
+        if self.output.cache:
+            self.output.cache.save_text(RENDER_CACHE_NAMESPACE, key, html)
+
+        return chapter, key, html
+
+    def _get_render(self,
+                    stack: contextlib.ExitStack
+                    ) -> Tuple[Callable[[str, str], Tuple[str, bool]],
+                               Optional[RenderCoordinator]]:
+        """Gets the function substituting and rendering a single markdown text with the time
+        budget and limits of the output, on the render workers if there are any.
+
+        Args:
+            stack: The stack the workers or the render coordinator are closed by.
+
+        Returns:
+            A tuple consisting of the function and the render coordinator, or None if the
+            text is rendered locally. The function takes the markdown and the src it is
+            reported under and returns a tuple consisting of the html and whether it is the
+            markdown rendered as preformatted text.
+        """
+        output = self.output
+
+        if output.render_workers and not output.profiler:
+            coordinator = stack.enter_context(self._get_render_coordinator())
+            return functools.partial(self._submit, coordinator), coordinator
+
+        worker = None if output.profiler else stack.enter_context(SubstitutionWorker(
+            self.substitutions, timeout=output.substitution_timeout))
+        renderer = stack.enter_context(self._get_render_worker())
+
+        def render_text(text: str, src: str) -> Tuple[str, bool]:
+            text, spans = _stash(self.stash, text)
+            text = output.profiler.apply(text, self.substitutions, src) if worker is None \
+                else worker.apply(text, src)
+            html = renderer.render(text, src)
+            fallback = src in renderer.fallback_srcs
+            return _restore(self.stash, html, spans, fallback), fallback
+
+        return render_text, None
+
+    def _submit(self, coordinator: RenderCoordinator, text: str, src: str) -> Tuple[str, bool]:
+        """Substitutes and renders a single markdown text on the render workers.
+
+        Args:
+            coordinator: The coordinator.
+            text: The markdown.
+            src: The src the text is reported under.
+
+        Returns:
+            A tuple consisting of the html and whether it is the markdown rendered as
+            preformatted text.
+        """
+        text, spans = _stash(self.stash, text)
+        html, fallback, _seconds = coordinator.submit(text, src).result()
+        return _restore(self.stash, html, spans, fallback), fallback
+
+    def _get_loader(self) -> ChapterLoader:
+        """Gets the loader reading the chapters ahead of rendering.
+
+        Returns:
+            The loader.
+        """
+        return ChapterLoader(self.resolver, threads=self.output.read_threads,
+                             prefetch_bytes=self.output.prefetch_bytes)
+
+    def _get_render_worker(self) -> RenderWorker:
+        """Gets the worker rendering markdown to html with the limits of the output.
+
+        Returns:
+            The worker.
+        """
+        return RenderWorker(timeout=self.output.render_timeout,
+                            memory_limit=self.output.render_memory_limit,
+                            fallback=self.output.render_fallback,
+                            highlight=bool(self.output.highlight_style),
+                            cache=self.output.cache)
+
+    def _get_render_coordinator(self) -> RenderCoordinator:
+        """Gets the coordinator sending the chapters to the render workers.
+
+        Returns:
+            The coordinator, not started yet.
+        """
+        output = self.output
+        return RenderCoordinator([parse_address(address) for address in output.render_workers],
+                                 self.substitutions,
+                                 RenderSettings(substitution_timeout=output.substitution_timeout,
+                                                render_timeout=output.render_timeout,
+                                                render_memory_limit=output.render_memory_limit,
+                                                render_fallback=output.render_fallback,
+                                                highlight=bool(output.highlight_style)))
+
+    def _get_stash(self) -> Optional[OpaqueStash]:
+        """Gets the stash hiding the opaque spans of the chapters from the substitutions and
+        markdown.
+
+        Returns:
+            The stash, or None if nothing is stashed.
+        """
+        if not self.output.stash_data_uris and not self.output.stash_patterns:
+            return None
+
+        return OpaqueStash(data_uris=self.output.stash_data_uris,
+                           patterns=self.output.stash_patterns)
+
+
+def _check_cancelled(cancelled: Optional[threading.Event]):
+    """Stops rendering if it was cancelled.
+
+    Args:
+        cancelled: The event set to cancel rendering, or None.
+
+    Raises:
+        CancelledError: If cancelled was set.
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise CancelledError()
+
+
+def _split_chapters(html: str, count: int, separator: str, path: str) -> List[str]:
+    """Splits the html of a book rendered as a whole into chapters at the chapter breaks.
+
+    Args:
+        html: The html.
+        count: The number of chapters.
+        separator: The separator the markdown of the chapters was joined with.
+        path: The output path, for the warning if the chapter breaks did not survive.
+
+    Returns:
+        The html of every chapter, or the whole html only if the html has no chapter breaks
+        or not one less than the chapters.
+    """
+    parts = CHAPTER_BREAK_PATTERN.split(html) if CHAPTER_BREAK in separator else [html]
+
+    if len(parts) != count:
+        if len(parts) > 1 or count > 1 and CHAPTER_BREAK in separator:
+            LOG.warning(f'The chapter breaks of {path} did not survive rendering, '
+                        f'the whole html is kept with the first chapter.')
+        parts = [html]
+
+    return parts
+
+
+def _reorder(order: Sequence[int], results: Iterable[Any]) -> Iterator[Any]:
+    """Puts results arriving in some order of their indices back into the order 0, 1, 2 ...,
+    keeping the results that arrive before their turn until it comes.
+
+    Args:
+        order: The index of every result in the order the results arrive.
+        results: The results.
+
+    Returns:
+        A generator yielding the results in the order of their indices.
+    """
+    pending = {}
+    index = 0
+
+    for arrived, result in zip(order, results):
+        pending[arrived] = result
+
+        while index in pending:
+            yield pending.pop(index)
+            index += 1
+
+
+def _stash(stash: Optional[OpaqueStash], text: str) -> Tuple[str, List[str]]:
+    """Stashes the opaque spans of the markdown of a chapter.
+
+    Args:
+        stash: The stash, or None.
+        text: The markdown.
+
+    Returns:
+        The markdown with placeholders and the spans stashed.
+    """
+    return stash.stash(text) if stash else (text, [])
+
+
+def _restore(stash: Optional[OpaqueStash], html: str, spans: List[str], fallback: bool) -> str:
+    """Puts the stashed spans of a chapter back into its html.
+
+    Args:
+        stash: The stash, or None.
+        html: The html.
+        spans: The spans stashed.
+        fallback: Whether the html is the markdown rendered as preformatted text.
+
+    Returns:
+        The html with the spans.
+    """
+    return stash.restore(html, spans, escape=fallback) if stash else html
+
+
+def _release_chapters(loaded: Iterable[Tuple[Chapter, str]]) -> Iterator[Tuple[str, str]]:
+    """Releases the content of every chapter loaded, passing on its text.
+
+    Args:
+        loaded: The chapters and their texts. (see ChapterLoader.load)
+
+    Returns:
+        A generator yielding the text and the src of each chapter.
+    """
+    for chapter, text in loaded:
+        chapter.release()
+        yield text, chapter.src
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the cost model, which records how long chapters and outputs took to
+make, and schedules later builds with it.
+
+Work spread over a pool in the order of the project leaves the pool idle at the end while
+the one giant chapter or the one slow ebook conversion that came last finishes alone.
+Starting the longest work first (longest processing time first, LPT) keeps every worker
+busy until close to the end. The durations of previous builds are kept in the build cache,
+as is the speedup measured for every number of workers tried, from which the number of
+outputs made at once is chosen.
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from heapq import heapify, heapreplace
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from publish.book import Book
+from publish.cache import BuildCache
+from publish.substitution import Substitution
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+COSTS_DOCUMENT = 'costs'
+SMOOTHING = 0.5
+GOOD_ENOUGH_SPEEDUP = 0.9
+EFFICIENT_SPEEDUP = 0.75
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+class CostModel:
+    """The CostModel records the durations of chapters and outputs and the speedup of every
+    number of workers, and predicts them for the next build.
+
+    Every duration recorded is smoothed with the one recorded before, so a single slow build
+    does not turn the schedule upside down. The model is loaded from the build cache when it
+    is created and written back by save. It is safe to use from several threads.
+
+    Args:
+        cache: The build cache, or None to keep the model in memory only.
+
+    Examples:
+
+        .. code-block:: python
+
+            cost_model = CostModel(BuildCache())
+            make_outputs(book, substitutions, outputs, cost_model)
+            cost_model.save()
+
+            print(cost_model.format_report())
+    """
+
+    def __init__(self, cache: Optional[BuildCache] = None):
+        """Initializes a new instance of the :class:`CostModel` class.
+        """
+        self.cache = cache
+        document = cache.load(COSTS_DOCUMENT, {}) if cache else {}
+        document = document if isinstance(document, dict) else {}
+
+        self._renders: Dict[str, float] = _load_durations(document.get('renders'))
+        self._outputs: Dict[str, float] = _load_durations(document.get('outputs'))
+        self._speedups: Dict[int, float] = {
+            int(workers): speedup
+            for workers, speedup in _load_durations(document.get('speedups')).items()
+            if workers.isdigit()}
+        self._schedules: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def get_render_time(self, src: str) -> Optional[float]:
+        """Gets the time rendering a chapter took in previous builds.
+
+        Args:
+            src: The src of the chapter.
+
+        Returns:
+            The time in seconds, or None if the chapter was never rendered.
+        """
+        return self._renders.get(src)
+
+    def record_render(self, src: str, seconds: float):
+        """Records the time rendering a chapter took, including its substitutions.
+
+        Args:
+            src: The src of the chapter.
+            seconds: The time in seconds.
+        """
+        with self._lock:
+            self._renders[src] = _smooth(self._renders.get(src), seconds)
+
+    def get_output_time(self, path: str) -> Optional[float]:
+        """Gets the time making an output took in previous builds.
+
+        Args:
+            path: The output path.
+
+        Returns:
+            The time in seconds, or None if the output was never made.
+        """
+        return self._outputs.get(os.path.normpath(path))
+
+    def record_output(self, path: str, seconds: float):
+        """Records the time making an output took.
+
+        Args:
+            path: The output path.
+            seconds: The time in seconds.
+        """
+        path = os.path.normpath(path)
+
+        with self._lock:
+            self._outputs[path] = _smooth(self._outputs.get(path), seconds)
+
+    def record_speedup(self, workers: int, speedup: float):
+        """Records the speedup measured with a number of workers, the time the work would
+        have taken on a single worker divided by the time it took.
+
+        Args:
+            workers: The number of workers.
+            speedup: The speedup.
+        """
+        with self._lock:
+            self._speedups[workers] = _smooth(self._speedups.get(workers), speedup)
+
+    def get_workers(self, max_workers: int) -> int:
+        """Gets the number of workers to use, tuned by the speedups measured so far.
+
+        Without measurements, one worker per cpu is used. Otherwise the smallest number of
+        workers reaching nearly the best speedup measured is used, as more workers would
+        only cost memory. If that is the largest number tried and each worker was still
+        efficient, twice as many workers are tried next.
+
+        Args:
+            max_workers: The maximum number of workers, e.g. the number of tasks.
+
+        Returns:
+            The number of workers.
+        """
+        measured = {workers: speedup for workers, speedup in self._speedups.items()
+                    if 0 < workers <= max_workers}
+
+        if max_workers <= 1:
+            return 1
+
+        if not measured:
+            return min(max_workers, DEFAULT_WORKERS)
+
+        best = max(measured.values())
+        workers = min(workers for workers, speedup in measured.items()
+                      if speedup >= best * GOOD_ENOUGH_SPEEDUP)
+        largest = max(measured)
+
+        if workers == largest and largest < max_workers and \
+                measured[largest] / largest >= EFFICIENT_SPEEDUP:
+            workers = min(max_workers, largest * 2)
+
+        return workers
+
+    def explain(self,
+                name: str,
+                workers: int,
+                predicted: Optional[float],
+                actual: float,
+                tasks: Iterable[Tuple[str, Optional[float], float]] = ()):
+        """Adds a schedule to the report of format_report.
+
+        Args:
+            name: What was scheduled, e.g. 'outputs'.
+            workers: The number of workers.
+            predicted: The predicted makespan in seconds, or None if nothing was known.
+            actual: The actual makespan in seconds.
+            tasks: The name, predicted and actual duration of every task worth listing.
+        """
+        with self._lock:
+            self._schedules.append({'name': name, 'workers': workers, 'predicted': predicted,
+                                    'actual': actual, 'tasks': list(tasks)})
+
+    def format_report(self) -> str:
+        """Formats the predicted and actual makespan of every schedule explained.
+
+        Returns:
+            The report.
+        """
+        lines = []
+
+        for schedule in self._schedules:
+            lines.append(f'Schedule of {schedule["name"]} on {schedule["workers"]} '
+                         f'worker(s): predicted makespan {_format_seconds(schedule["predicted"])}'
+                         f', actual {_format_seconds(schedule["actual"])}')
+
+            if schedule['tasks']:
+                lines.append(f'{"predicted":>12} {"actual":>10}  task')
+                lines.extend(f'{_format_seconds(predicted):>12} {_format_seconds(actual):>10}'
+                             f'  {name}' for name, predicted, actual in schedule['tasks'])
+
+        return '\n'.join(lines) or 'Nothing was scheduled.'
+
+    def save(self):
+        """Saves the model to the build cache, if there is one."""
+        if not self.cache:
+            return
+
+        with self._lock:
+            self.cache.save(COSTS_DOCUMENT, {
+                'renders': self._renders,
+                'outputs': self._outputs,
+                'speedups': {str(workers): speedup
+                             for workers, speedup in self._speedups.items()}})
+
+
+def get_lpt_order(costs: Sequence[Optional[float]]) -> List[int]:
+    """Gets the order in which to start tasks, longest first.
+
+    Tasks of unknown cost are assumed to take the mean of the known costs. Tasks of the
+    same cost keep their order.
+
+    Args:
+        costs: The predicted cost of every task, or None if unknown.
+
+    Returns:
+        The indices of the tasks in the order to start them.
+    """
+    costs = _fill_unknown(costs)
+    return sorted(range(len(costs)), key=lambda index: -costs[index])
+
+
+def predict_makespan(costs: Sequence[Optional[float]], workers: int) -> Optional[float]:
+    """Predicts the time tasks take on a pool of workers when started longest first, each
+    task going to the next idle worker.
+
+    Args:
+        costs: The predicted cost of every task, or None if unknown.
+        workers: The number of workers.
+
+    Returns:
+        The makespan in seconds, or None if no cost is known.
+    """
+    if not any(cost is not None for cost in costs):
+        return None
+
+    costs = _fill_unknown(costs)
+    finished = [0.0] * max(1, min(workers, len(costs)))
+    heapify(finished)
+
+    for index in get_lpt_order(costs):
+        heapreplace(finished, finished[0] + costs[index])
+
+    return max(finished)
+
+
+def make_outputs(book: Book,
+                 substitutions: Iterable[Substitution],
+                 outputs: Iterable[Any],
+                 cost_model: Optional[CostModel] = None,
+                 jobs: Optional[int] = None):
+    """Makes several outputs at once, the slowest outputs of previous builds first.
+
+    Every output is made from its own copy of the book. The time each output took and the
+    speedup over making them one after the other are recorded in the cost model.
+
+    Args:
+        book: The book.
+        substitutions: The list of substitutions.
+        outputs: The list of outputs.
+        cost_model: The cost model, or None for a model without history.
+        jobs: The number of outputs made at once, or None to let the cost model choose.
+    """
+    outputs = list(outputs)
+    substitutions = list(substitutions or [])
+    cost_model = cost_model or CostModel()
+
+    if not outputs:
+        return
+
+    jobs = max(1, min(jobs or cost_model.get_workers(len(outputs)), len(outputs)))
+    costs = [cost_model.get_output_time(output.path) for output in outputs]
+    durations = [0.0] * len(outputs)
+
+    def make(index: int):
+        started = time.perf_counter()
+        outputs[index].make(book if jobs == 1 else copy.deepcopy(book), substitutions)
+        durations[index] = time.perf_counter() - started
+        cost_model.record_output(outputs[index].path, durations[index])
+
+    started = time.perf_counter()
+
+    if jobs == 1:
+        for index in range(len(outputs)):
+            make(index)
+    else:
+        LOG.info(f'Making {len(outputs)} outputs, {jobs} at once ...')
+        with ThreadPoolExecutor(max_workers=jobs,
+                                thread_name_prefix='publish-output') as executor:
+            for future in [executor.submit(make, index) for index in get_lpt_order(costs)]:
+                future.result()
+
+    makespan = time.perf_counter() - started
+
+    if len(outputs) > 1 and makespan > 0:
+        cost_model.record_speedup(jobs, sum(durations) / makespan)
+
+    cost_model.explain('outputs', jobs, predict_makespan(costs, jobs), makespan,
+                       [(output.path, cost, duration)
+                        for output, cost, duration in zip(outputs, costs, durations)])
+
+
+def _load_durations(value: Any) -> Dict[str, float]:
+    """Loads a mapping of durations from the cache document, skipping anything else.
+
+    Args:
+        value: The value from the cache document.
+
+    Returns:
+        The durations.
+    """
+    if not isinstance(value, dict):
+        return {}
+
+    return {key: float(seconds) for key, seconds in value.items()
+            if isinstance(seconds, (int, float)) and seconds >= 0}
+
+
+def _smooth(previous: Optional[float], current: float) -> float:
+    """Smoothes a measurement with the previous one.
+
+    Args:
+        previous: The previous value, or None.
+        current: The measurement.
+
+    Returns:
+        The smoothed value.
+    """
+    if previous is None:
+        return current
+
+    return previous + SMOOTHING * (current - previous)
+
+
+def _fill_unknown(costs: Sequence[Optional[float]]) -> List[float]:
+    """Replaces unknown costs with the mean of the known ones.
+
+    Args:
+        costs: The costs, or None if unknown.
+
+    Returns:
+        The costs.
+    """
+    known = [cost for cost in costs if cost is not None]
+    mean = sum(known) / len(known) if known else 0.0
+    return [mean if cost is None else cost for cost in costs]
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    """Formats a duration for the report.
+
+    Args:
+        seconds: The duration, or None if unknown.
+
+    Returns:
+        The formatted duration.
+    """
+    return 'unknown' if seconds is None else f'{seconds:.2f} s'
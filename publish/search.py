@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the search index, which lets readers of an html document search it in
+the browser instead of scanning megabytes of html with the find function of the browser.
+
+The document is divided into sections at its headings. (see publish.headings) The words of
+every chapter are collected per section once and cached with its html, so only chapters
+that changed are tokenized again. The index itself is written next to the html document as
+json, e.g. book.search.json for book.html:
+
+    {"version": 1,
+     "sections": [["", "Book title"], ["introduction", "Introduction"], ...],
+     "tokens": [[0, "apple", [1, 3]], [4, "ication", [2]], ...]}
+
+Section 0 is the start of the document, every other section starts at a heading and is
+linked to by its id. The tokens are sorted and prefix compressed: each entry holds the
+length of the prefix it shares with the token before it, the rest of the token and the
+sections the token occurs in, each as the difference to the section before it. If the
+document is split into pages, every section holds the url of its page as well, e.g.
+["introduction", "Introduction", "book.0123456789abcdef.html"].
+"""
+
+import html
+import json
+import logging
+import os
+import re
+import uuid
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Set
+
+from publish.cache import BuildCache
+from publish.headings import HeadingIndex, TAG_PATTERN
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+SEARCH_CACHE_NAMESPACE = 'search'
+SEARCH_INDEX_VERSION = 1
+SEARCH_INDEX_SUFFIX = '.search.json'
+MIN_TOKEN_LENGTH = 2
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+HIDDEN_PATTERN = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+
+class SearchIndex:
+    """The SearchIndex collects the tokens of every chapter of a document and builds the
+    search index from them, with the sections of the document taken from its heading index.
+
+    Add the chapters in the order of the document, the same order as in the heading index.
+
+    Examples:
+
+        .. code-block:: python
+
+            headings, search = HeadingIndex(), SearchIndex()
+            for chapter, html in chapters:
+                extract = extract_headings(html)
+                headings.add_chapter(chapter.src, extract)
+                search.add_chapter(tokenize_chapter(html, extract))
+
+            search.save(get_search_index_path('book.html'), book.title, headings)
+    """
+
+    def __init__(self):
+        """Initializes a new instance of the :class:`SearchIndex` class.
+        """
+        self._chapters: List[Dict[str, List[int]]] = []
+
+    def add_chapter(self, tokens: Dict[str, List[int]]):
+        """Adds the tokens of the next chapter.
+
+        Args:
+            tokens: The tokens of the chapter. (see tokenize_chapter)
+        """
+        self._chapters.append(tokens)
+
+    def build(self,
+              title: str,
+              headings: HeadingIndex,
+              pages: Optional[Sequence[str]] = None) -> Dict:
+        """Builds the search index.
+
+        Args:
+            title: The title of the document, the title of section 0.
+            headings: The heading index of the document.
+            pages: The url of the page of every chapter, if the document is split into
+                pages. Section 0 is on the first page.
+
+        Returns:
+            The json serializable search index.
+        """
+        if pages:
+            sections = [['', title, pages[0]]] + [[heading.id, heading.text,
+                                                   pages[heading.position]]
+                                                  for heading in headings.headings]
+        else:
+            sections = [['', title]] + [[heading.id, heading.text]
+                                        for heading in headings.headings]
+        postings: Dict[str, Set[int]] = {}
+        current = 0
+
+        for position, tokens in enumerate(self._chapters):
+            first = current + 1
+            count = len(headings.get_chapter_headings(position))
+
+            for token, local_sections in tokens.items():
+                postings.setdefault(token, set()).update(
+                    first + local - 1 if local else current for local in local_sections)
+
+            current += count
+
+        return {'version': SEARCH_INDEX_VERSION,
+                'sections': sections,
+                'tokens': _compress(postings)}
+
+    def save(self,
+             path: str,
+             title: str,
+             headings: HeadingIndex,
+             pages: Optional[Sequence[str]] = None):
+        """Builds the search index and writes it to a temporary file next to the path,
+        which replaces the file at the path once it is complete.
+
+        Args:
+            path: The path.
+            title: The title of the document.
+            headings: The heading index of the document.
+            pages: The url of the page of every chapter, if the document is split into
+                pages.
+        """
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.build(title, headings, pages), file, ensure_ascii=False,
+                          separators=(',', ':'))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        LOG.info(f'Wrote search index {path}')
+
+
+def tokenize_chapter(html_: str, extract: Dict) -> Dict[str, List[int]]:
+    """Collects the words of a chapter per section.
+
+    Section 0 is the text before the first heading of the chapter, which belongs to the
+    section of the heading before the chapter. Section n is the text from the n-th heading
+    of the chapter on.
+
+    Args:
+        html_: The html of the chapter.
+        extract: The headings of the chapter. (see publish.headings.extract_headings)
+
+    Returns:
+        A json serializable dictionary of every token, lower case, and the sorted sections
+        of the chapter it occurs in.
+    """
+    # the offsets point behind '<h1', the section starts at the tag
+    starts = [offset - 3 for offset, _level, _text, _slug, _has_id in extract['headings']]
+    bounds = [0] + starts + [len(html_)]
+    tokens: Dict[str, List[int]] = {}
+
+    for section in range(len(bounds) - 1):
+        text = HIDDEN_PATTERN.sub(' ', html_[bounds[section]:bounds[section + 1]])
+        text = html.unescape(TAG_PATTERN.sub(' ', text)).lower()
+
+        for token in set(TOKEN_PATTERN.findall(text)):
+            if len(token) >= MIN_TOKEN_LENGTH:
+                tokens.setdefault(token, []).append(section)
+
+    return tokens
+
+
+def load_tokens(html_: str,
+                extract: Dict,
+                key: Optional[str],
+                cache: Optional[BuildCache] = None) -> Dict[str, List[int]]:
+    """Loads the tokens of a chapter from the cache or collects them from its html.
+
+    Args:
+        html_: The html of the chapter.
+        extract: The headings of the chapter. (see publish.headings.extract_headings)
+        key: The render key of the chapter, or None if its html is not cached.
+        cache: The build cache, or None.
+
+    Returns:
+        The tokens. (see tokenize_chapter)
+    """
+    tokens = cache.load_json(SEARCH_CACHE_NAMESPACE, key) if cache and key else None
+
+    if tokens is not None:
+        return tokens
+
+    tokens = tokenize_chapter(html_, extract)
+
+    if cache and key:
+        cache.save_json(SEARCH_CACHE_NAMESPACE, key, tokens)
+
+    return tokens
+
+
+def get_search_index_path(path: str) -> str:
+    """Gets the path of the search index of an html document.
+
+    Args:
+        path: The path of the html document, e.g. 'book.html'.
+
+    Returns:
+        The path of the search index, e.g. 'book.search.json'.
+    """
+    return os.path.splitext(path)[0] + SEARCH_INDEX_SUFFIX
+
+
+def search(index: Dict, query: str) -> List[int]:
+    """Searches the search index like the search of the html document does: every word of
+    the query must be the start of a token of the section.
+
+    Args:
+        index: The search index. (see SearchIndex.build)
+        query: The query.
+
+    Returns:
+        The sections found, in the order of the document.
+    """
+    postings = _decompress(index['tokens'])
+    tokens = sorted(postings)
+    found = None
+
+    for term in TOKEN_PATTERN.findall(query.lower()):
+        sections: Set[int] = set()
+
+        for token in tokens[bisect_left(tokens, term):]:
+            if not token.startswith(term):
+                break
+            sections.update(postings[token])
+
+        found = sections if found is None else found & sections
+
+    return sorted(found or ())
+
+
+def _compress(postings: Dict[str, Set[int]]) -> List[list]:
+    """Compresses the postings of every token.
+
+    Args:
+        postings: The sections of every token.
+
+    Returns:
+        The sorted, prefix compressed tokens with their gap encoded sections.
+    """
+    entries = []
+    previous = ''
+
+    for token in sorted(postings):
+        shared = 0
+        while shared < min(len(token), len(previous)) and token[shared] == previous[shared]:
+            shared += 1
+
+        gaps = []
+        last = 0
+        for section in sorted(postings[token]):
+            gaps.append(section - last)
+            last = section
+
+        entries.append([shared, token[shared:], gaps])
+        previous = token
+
+    return entries
+
+
+def _decompress(entries: List[list]) -> Dict[str, List[int]]:
+    """Decompresses the tokens of a search index.
+
+    Args:
+        entries: The compressed tokens. (see _compress)
+
+    Returns:
+        The sections of every token.
+    """
+    postings = {}
+    token = ''
+
+    for shared, suffix, gaps in entries:
+        token = token[:shared] + suffix
+        sections = []
+        section = 0
+        for gap in gaps:
+            section += gap
+            sections.append(section)
+        postings[token] = sections
+
+    return postings
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the chapter selection of partial preview builds, which render only the
+chapters at some positions or matching a glob pattern to a path next to the full build.
+(see HtmlOutput.preview)
+"""
+
+import fnmatch
+import os
+from typing import Iterable, List, Optional, Set
+
+from publish.book import Chapter
+
+
+def parse_chapter_range(chapter_range: str) -> Set[int]:
+    """Parses a chapter range into the set of 1-based chapter positions it covers.
+
+    A chapter range is a comma separated list of single positions and closed
+    intervals, e.g. '12-14' or '1,3,5-7'.
+
+    Args:
+        chapter_range: The chapter range.
+
+    Returns:
+        The set of chapter positions.
+
+    Raises:
+        ValueError: If the chapter range is malformed.
+    """
+    positions = set()
+
+    for part in chapter_range.split(','):
+        part = part.strip()
+        start, _, end = part.partition('-')
+
+        try:
+            start = int(start)
+            end = int(end) if end else start
+        except ValueError:
+            raise ValueError(f'{chapter_range!r} is not a valid chapter range.') from None
+
+        if start < 1 or end < start:
+            raise ValueError(f'{chapter_range!r} is not a valid chapter range.')
+
+        positions.update(range(start, end + 1))
+
+    return positions
+
+
+def select_chapters(chapters: Iterable[Chapter],
+                    chapter_range: Optional[str] = None,
+                    chapter_src: Optional[str] = None) -> List[Chapter]:
+    """Selects chapters by their 1-based position and/or by a glob pattern matched
+    against their src.
+
+    If both a chapter range and a glob pattern are provided, a chapter has to match
+    both to be selected. The order of the chapters is preserved.
+
+    Args:
+        chapters: The list of chapters.
+        chapter_range: The chapter range, e.g. '12-14'. (see parse_chapter_range)
+        chapter_src: The glob pattern, e.g. 'chapters/part_2/*.md'.
+
+    Returns:
+        The list of selected chapters.
+    """
+    positions = parse_chapter_range(chapter_range) if chapter_range else None
+
+    selected = []
+    for position, chapter in enumerate(chapters, start=1):
+        if positions is not None and position not in positions:
+            continue
+
+        if chapter_src and not fnmatch.fnmatchcase(
+                chapter.src.replace(os.sep, '/'), chapter_src.replace(os.sep, '/')):
+            continue
+
+        selected.append(chapter)
+
+    return selected
+
+
+def get_preview_path(path: str) -> str:
+    """Derives the path of a partial preview build from the path of the full build by
+    inserting '.preview' in front of the file type, e.g. 'book.epub' becomes
+    'book.preview.epub'.
+
+    Args:
+        path: The output path of the full build.
+
+    Returns:
+        The output path of the preview build.
+    """
+    root, extension = os.path.splitext(path)
+    return f'{root}.preview{extension}'
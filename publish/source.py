@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module defines the sources chapters are read from: plain files, members of zip or tar
+archives and in-memory mappings.
+
+A chapter src of the form 'container!member' points into a container, e.g.
+'bundle.zip!chapters/01.md' or 'manuscript!01.md', where 'manuscript' is the name of a
+source registered in Book.sources. Any other src is a path on the filesystem.
+"""
+
+import io
+import logging
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+CONTAINER_SEPARATOR = '!'
+READ_BUFFER_SIZE = 1024 * 1024
+ZIP_EXTENSIONS = ('.zip',)
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+class SourceStat(NamedTuple):
+    """The size in bytes and the modification time in seconds since the epoch of a chapter
+    source.
+    """
+    size: int
+    mtime: float
+
+
+class ChapterSource(metaclass=ABCMeta):
+    """The ChapterSource class acts as an abstract interface for the places chapters can be
+    read from.
+
+    Every name passed to a source is relative to the source, e.g. the name of an archive
+    member. A name that does not exist raises a FileNotFoundError.
+    """
+
+    @abstractmethod
+    def open(self, name: str) -> BinaryIO:
+        """Opens the named chapter for reading in binary mode.
+
+        Args:
+            name: The name of the chapter inside this source.
+
+        Returns:
+            The binary file object.
+        """
+
+    @abstractmethod
+    def stat(self, name: str) -> SourceStat:
+        """Gets the size and modification time of the named chapter.
+
+        Args:
+            name: The name of the chapter inside this source.
+
+        Returns:
+            The size and modification time.
+        """
+
+    def read(self, name: str) -> bytes:
+        """Reads the named chapter.
+
+        Args:
+            name: The name of the chapter inside this source.
+
+        Returns:
+            The content of the chapter.
+        """
+        with self.open(name) as file:
+            return file.read()
+
+    def names(self) -> List[str]:
+        """Gets the names of all chapters inside this source, e.g. to expand glob patterns.
+
+        Sources that can not list their contents, e.g. the filesystem, which is scanned by
+        :class:`publish.discovery.DirectoryScanner` instead, return an empty list.
+
+        Returns:
+            The list of names.
+        """
+        return []
+
+    def close(self):
+        """Releases any resources held by this source."""
+
+
+class FileSource(ChapterSource):
+    """The FileSource reads chapters from the filesystem."""
+
+    def open(self, name: str) -> BinaryIO:
+        return open(name, 'rb', buffering=READ_BUFFER_SIZE)
+
+    def stat(self, name: str) -> SourceStat:
+        stat = os.stat(name)
+        return SourceStat(stat.st_size, stat.st_mtime)
+
+
+class ZipSource(ChapterSource):
+    """The ZipSource reads chapters directly from the members of a zip archive.
+
+    The archive is opened once and kept open until the source is closed.
+
+    Args:
+        path: The path to the zip archive.
+    """
+
+    def __init__(self, path: str):
+        """Initializes a new instance of the :class:`ZipSource` class.
+        """
+        self.path = path
+        self._zip_file = zipfile.ZipFile(path)  # pylint: disable=consider-using-with
+
+    def open(self, name: str) -> BinaryIO:
+        return self._zip_file.open(self._get_info(name))
+
+    def stat(self, name: str) -> SourceStat:
+        info = self._get_info(name)
+        return SourceStat(info.file_size, time.mktime(info.date_time + (0, 0, -1)))
+
+    def names(self) -> List[str]:
+        return [info.filename for info in self._zip_file.infolist() if not info.is_dir()]
+
+    def close(self):
+        self._zip_file.close()
+
+    def _get_info(self, name: str) -> zipfile.ZipInfo:
+        try:
+            return self._zip_file.getinfo(name)
+        except KeyError:
+            raise FileNotFoundError(f'{name} not found in {self.path}') from None
+
+
+class TarSource(ChapterSource):
+    """The TarSource reads chapters directly from the members of a tar archive, compressed or
+    not.
+
+    The archive is opened and its index read once and kept until the source is closed.
+    Uncompressed archives offer the fastest random access; compressed archives have to be
+    decompressed up to each member read.
+
+    Args:
+        path: The path to the tar archive.
+    """
+
+    def __init__(self, path: str):
+        """Initializes a new instance of the :class:`TarSource` class.
+        """
+        self.path = path
+        self._tar_file = tarfile.open(path)  # pylint: disable=consider-using-with
+        self._members = {member.name: member
+                         for member in self._tar_file.getmembers() if member.isfile()}
+        self._lock = threading.Lock()
+        # TarFile shares a single file position between all members, so reads must not
+        # interleave.
+
+    def open(self, name: str) -> BinaryIO:
+        with self._lock:
+            return io.BytesIO(self._tar_file.extractfile(self._get_member(name)).read())
+
+    def stat(self, name: str) -> SourceStat:
+        member = self._get_member(name)
+        return SourceStat(member.size, float(member.mtime))
+
+    def names(self) -> List[str]:
+        return list(self._members)
+
+    def close(self):
+        self._tar_file.close()
+
+    def _get_member(self, name: str) -> tarfile.TarInfo:
+        try:
+            return self._members[name]
+        except KeyError:
+            raise FileNotFoundError(f'{name} not found in {self.path}') from None
+
+
+class MappingSource(ChapterSource):
+    """The MappingSource reads chapters from a mapping of names to contents, e.g. to build
+    a book from text that never touches the disk.
+
+    Args:
+        mapping: The mapping of chapter names to their str or utf-8 encoded bytes contents.
+        mtime: The modification time reported for all chapters. Defaults to the time the
+            source was created.
+
+    Examples:
+
+        .. code-block:: python
+
+            book = Book('Example')
+            book.sources['memory'] = MappingSource({'01.md': '# Hello World!'})
+            book.chapters.append(Chapter(src='memory!01.md'))
+    """
+
+    def __init__(self,
+                 mapping: Mapping[str, Union[str, bytes]],
+                 mtime: Optional[float] = None):
+        """Initializes a new instance of the :class:`MappingSource` class.
+        """
+        self.mapping = mapping
+        self.mtime = time.time() if mtime is None else mtime
+
+    def open(self, name: str) -> BinaryIO:
+        return io.BytesIO(self._get_bytes(name))
+
+    def stat(self, name: str) -> SourceStat:
+        return SourceStat(len(self._get_bytes(name)), self.mtime)
+
+    def names(self) -> List[str]:
+        return list(self.mapping)
+
+    def _get_bytes(self, name: str) -> bytes:
+        try:
+            content = self.mapping[name]
+        except KeyError:
+            raise FileNotFoundError(f'{name} not found in mapping') from None
+
+        return content.encode('utf-8') if isinstance(content, str) else content
+
+
+class SourceResolver:
+    """The SourceResolver resolves chapter srcs to the source they are read from.
+
+    Archives are opened on first use and then kept open, so each archive is opened only once
+    no matter how many chapters it contains. Use the resolver as a context manager to close
+    them again at the end of a build. Registered sources are owned by the caller and not
+    closed.
+
+    Args:
+        sources: The named sources, e.g. Book.sources.
+    """
+
+    def __init__(self, sources: Optional[Mapping[str, ChapterSource]] = None):
+        """Initializes a new instance of the :class:`SourceResolver` class.
+        """
+        self.sources = dict(sources or {})
+        self._file_source = FileSource()
+        self._archives: Dict[str, ChapterSource] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'SourceResolver':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def resolve(self, src: str) -> Tuple[ChapterSource, str]:
+        """Resolves a chapter src to its source and the name inside that source.
+
+        Args:
+            src: The chapter src, e.g. 'chapters/01.md' or 'bundle.zip!chapters/01.md'.
+
+        Returns:
+            A tuple consisting of the source and the name.
+        """
+        container, separator, name = src.partition(CONTAINER_SEPARATOR)
+
+        if separator:
+            if container in self.sources:
+                return self.sources[container], name
+            if is_archive(container):
+                return self._get_archive(container), name
+
+        return self._file_source, src
+
+    def open(self, src: str) -> BinaryIO:
+        """Opens the chapter src for reading in binary mode."""
+        source, name = self.resolve(src)
+        return source.open(name)
+
+    def read(self, src: str) -> bytes:
+        """Reads the content of the chapter src."""
+        source, name = self.resolve(src)
+        return source.read(name)
+
+    def stat(self, src: str) -> SourceStat:
+        """Gets the size and modification time of the chapter src."""
+        source, name = self.resolve(src)
+        return source.stat(name)
+
+    def close(self):
+        """Closes all archives opened by this resolver."""
+        with self._lock:
+            archives, self._archives = self._archives, {}
+
+        for archive in archives.values():
+            archive.close()
+
+    def _get_archive(self, path: str) -> ChapterSource:
+        """Gets the source for the archive at path, opening it on first use.
+
+        Args:
+            path: The path to the archive.
+
+        Returns:
+            The archive source.
+        """
+        with self._lock:
+            if path not in self._archives:
+                LOG.info(f'Opening {path} ...')
+                self._archives[path] = open_archive(path)
+
+            return self._archives[path]
+
+
+@contextmanager
+def borrow_resolver(resolver: Optional[SourceResolver] = None) -> Iterator[SourceResolver]:
+    """Yields the given resolver or, if there is none, a new resolver that is closed again
+    afterwards.
+
+    Args:
+        resolver: The resolver of the current build, if any.
+
+    Returns:
+        A context manager yielding a resolver.
+    """
+    if resolver is not None:
+        yield resolver
+        return
+
+    with SourceResolver() as temporary_resolver:
+        yield temporary_resolver
+
+
+def is_archive(path: str) -> bool:
+    """Determines whether the path names a supported archive by its file type.
+
+    Args:
+        path: The path.
+
+    Returns:
+        True if the path ends in a zip or tar file type, otherwise False.
+    """
+    return path.lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS)
+
+
+def open_archive(path: str) -> ChapterSource:
+    """Opens the archive at path as a chapter source.
+
+    Args:
+        path: The path to the zip or tar archive.
+
+    Returns:
+        The archive source.
+
+    Raises:
+        ValueError: If the file type is not a supported archive type.
+    """
+    if path.lower().endswith(ZIP_EXTENSIONS):
+        return ZipSource(path)
+    if path.lower().endswith(TAR_EXTENSIONS):
+        return TarSource(path)
+
+    raise ValueError(f'{path} is not a supported archive.')
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the stash, which hides spans of a chapter that are neither prose nor
+markdown from substitution and rendering.
+
+An inline image like `![x](data:image/png;base64,...)` can be megabytes on a single line,
+which every substitution and markdown itself crawl through character by character. The
+stash replaces the payload of such data uris, and the matches of any other pattern given,
+e.g. raw html blocks, with a short placeholder before the substitutions are applied, and
+puts the spans back into the rendered html.
+"""
+
+import html
+import logging
+import re
+from typing import Iterable, List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+DATA_URI_MIN_LENGTH = 256
+
+DATA_URI_PATTERN = re.compile(r'(;base64,)([A-Za-z0-9+/]{%d,}={0,2})' % DATA_URI_MIN_LENGTH)
+
+# Placeholders are made of characters of the private use area of unicode, which are neither
+# letters, digits nor markdown syntax: the index of the span, digit by digit, between a
+# start and an end character.
+PLACEHOLDER_START = '\ue000'
+PLACEHOLDER_END = '\ue001'
+PLACEHOLDER_ZERO = 0xe010
+PLACEHOLDER_PATTERN = re.compile(
+    f'<p>{PLACEHOLDER_START}([\ue010-\ue019]+){PLACEHOLDER_END}</p>|'
+    f'{PLACEHOLDER_START}([\ue010-\ue019]+){PLACEHOLDER_END}')
+
+
+class OpaqueStash:
+    """The OpaqueStash replaces opaque spans of a text with placeholders and puts them back
+    into the html the text was rendered to.
+
+    A placeholder is a few characters of the private use area of unicode, which markdown
+    leaves alone and substitutions of prose do not match. A placeholder making up a
+    paragraph of its own, e.g. the one of a raw html block, is restored without the
+    paragraph.
+
+    Args:
+        data_uris: Determines whether the payloads of base64 encoded data uris of at least
+            256 characters are stashed.
+        patterns: The regular expressions whose matches are stashed, e.g.
+            r'(?ms)^<div class="raw">.*?^</div>$'.
+
+    Examples:
+
+        .. code-block:: python
+
+            stash = OpaqueStash()
+            text, spans = stash.stash(text)
+            html = stash.restore(markdown.markdown(text), spans)
+    """
+
+    def __init__(self, data_uris: bool = True, patterns: Optional[Iterable[str]] = None):
+        """Initializes a new instance of the :class:`OpaqueStash` class.
+        """
+        self.data_uris = data_uris
+        self.patterns = [re.compile(pattern) for pattern in patterns or []]
+
+    def stash(self, text: str) -> Tuple[str, List[str]]:
+        """Replaces the opaque spans of a text with placeholders.
+
+        Args:
+            text: The text, e.g. the markdown of a chapter.
+
+        Returns:
+            A tuple consisting of the text with placeholders and the spans replaced.
+        """
+        spans: List[str] = []
+
+        def replace(span: str) -> str:
+            spans.append(span)
+            digits = ''.join(chr(PLACEHOLDER_ZERO + int(digit)) for digit in str(len(spans) - 1))
+            return f'{PLACEHOLDER_START}{digits}{PLACEHOLDER_END}'
+
+        for pattern in self.patterns:
+            text = pattern.sub(lambda match: replace(match.group(0)), text)
+
+        if self.data_uris:
+            text = DATA_URI_PATTERN.sub(lambda match: match.group(1) + replace(match.group(2)),
+                                        text)
+
+        return text, spans
+
+    def restore(self, html_: str, spans: List[str], escape: bool = False) -> str:
+        """Puts the spans back in place of their placeholders.
+
+        Args:
+            html_: The html rendered from the text with placeholders.
+            spans: The spans replaced. (see stash)
+            escape: Determines whether the spans are escaped, e.g. for html rendered as
+                preformatted text.
+
+        Returns:
+            The html with the spans.
+        """
+        if not spans:
+            return html_
+
+        restored = set()
+
+        def replace(match) -> str:
+            index = int(''.join(str(ord(digit) - PLACEHOLDER_ZERO)
+                                for digit in match.group(1) or match.group(2)))
+            restored.add(index)
+            span = spans[index] if index < len(spans) else match.group(0)
+            return html.escape(span) if escape else span
+
+        html_ = PLACEHOLDER_PATTERN.sub(replace, html_)
+
+        if len(restored) < len(spans):
+            LOG.warning(f'{len(spans) - len(restored)} stashed span(s) could not be put back, '
+                        f'a substitution changed their placeholder.')
+
+        return html_
+
+    def get_fingerprint(self) -> str:
+        """Gets what the html of a chapter depends on besides its text and substitutions.
+
+        Returns:
+            The settings of the stash.
+        """
+        return repr((self.data_uris, [pattern.pattern for pattern in self.patterns]))
@@ -14,11 +14,14 @@ rendered to html or epub.
 
 # pylint: disable=too-few-public-methods,anomalous-backslash-in-string
 
+import hashlib
 import logging.config
 import re
 from abc import ABCMeta, abstractmethod
 from typing import Iterable, Union
 
+from publish.backtracking import get_backtracking_risks
+
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.NullHandler())
 
@@ -96,6 +99,9 @@ class SimpleSubstitution(Substitution):
         """
         return text.replace(self.old, self.new)
 
+    def __repr__(self) -> str:
+        return f'SimpleSubstitution(old={self.old!r}, new={self.new!r})'
+
 
 class RegexSubstitution(Substitution):
     """The RegexSubstitution allows you to use regular expressions to make
@@ -136,6 +142,8 @@ class RegexSubstitution(Substitution):
 
             <span class="hello">World!</span>
 
+        Patterns that are prone to catastrophic backtracking, e.g. '(a+)+', are logged as
+        a warning when the substitution is created. (see get_backtracking_risks)
     """
 
     def __init__(self, pattern: Union[bytes, str],
@@ -143,6 +151,9 @@ class RegexSubstitution(Substitution):
         self.regular_expression = re.compile(pattern)
         self.replace_with = replace_with
 
+        for risk in get_backtracking_risks(self.regular_expression):
+            LOG.warning(f'{pattern!r} may take exponential time to match: {risk}')
+
     def apply_to(self, text: str):
         """Applies the substitution to the text, returning the changed text.
 
@@ -154,6 +165,11 @@ class RegexSubstitution(Substitution):
         """
         return self.regular_expression.sub(self.replace_with, text)
 
+    def __repr__(self) -> str:
+        return (f'RegexSubstitution(pattern={self.regular_expression.pattern!r}, '
+                f'flags={self.regular_expression.flags!r}, '
+                f'replace_with={self.replace_with!r})')
+
 
 def apply_substitutions(
         text: str,
@@ -170,12 +186,35 @@ def apply_substitutions(
     text = str(text)
 
     if substitutions:
-        LOG.info('Applying substitutions ...')
+        LOG.debug('Applying substitutions ...')
 
     substitution_count = len(list(substitutions))
 
     for index, substitution in enumerate(substitutions):
         text = substitution.apply_to(text)
-        LOG.info(f'{index + 1} of {substitution_count} applied')
+        LOG.debug(f'{index + 1} of {substitution_count} applied')
 
     return text
+
+
+def get_fingerprint(substitutions: Iterable[Substitution]) -> str:
+    """Gets a hash identifying the list of substitutions, e.g. to tell whether a chapter
+    rendered with a previous list of substitutions can be reused.
+
+    The fingerprint is built from the repr of each substitution, so substitution classes
+    without a repr of their own (which defaults to the object id) never match a previous
+    fingerprint.
+
+    Args:
+        substitutions: The list of substitutions.
+
+    Returns:
+        The sha256 hex digest of the list of substitutions.
+    """
+    hash_ = hashlib.sha256()
+
+    for substitution in substitutions or []:
+        hash_.update(repr(substitution).encode('utf-8'))
+        hash_.update(b'\0')
+
+    return hash_.hexdigest()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""This module offers the html template the documents of the outputs are rendered into.
+
+The template is compiled once and shared by all outputs. A document is written chapter by
+chapter, so the template is rendered without its content and split where the content goes,
+and the chapters are written between the two parts. (see split_template)
+"""
+
+import functools
+import logging
+from typing import Tuple
+from pkg_resources import resource_string
+
+from jinja2 import Template
+
+from publish import __version__ as package_version
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+CONTENT_PLACEHOLDER = '\0publish-content\0'
+
+
+def apply_template(html_content: str,
+                   title: str,
+                   css: str,
+                   language: str,
+                   **kwargs) -> str:
+    """Renders the html content, title, css and document language into the jinja2 formatted
+    template and returns the resulting html document.
+
+    Args:
+        html_content: The html content gets inserted into the {{ content }} of the template.
+        title: The title gets inserted into the {{ title }} of the template.
+        css: The css gets inserted into the {{ css }} of the template.
+        language: The language gets inserted into the {{ language }} of the template.
+        **kwargs: The optional parts of the template:
+
+            toc (List[Heading]): The headings listed in the table of contents, if any.
+            search_index (str): The url of the search index the search field uses, if any.
+            stylesheet (str): The url of the stylesheet linked instead of inserting the css,
+                if any.
+            prefetch (str): The url of the page the browser fetches ahead, if any.
+            navigation (List[Tuple[str, str, str]]): The relation, url and label of every
+                link to another page, e.g. ('next', 'book.0123456789abcdef.html', 'Next'),
+                if the document is split into pages.
+            chapter_pages (List[str]): The url of the page of every chapter the table of
+                contents links to, if the document is split into pages.
+
+    Returns:
+        The html document.
+    """
+    return get_template().render(content=html_content,
+                                 title=title,
+                                 css=css,
+                                 language=language,
+                                 toc=kwargs.pop('toc', None) or [],
+                                 search_index=kwargs.pop('search_index', None),
+                                 stylesheet=kwargs.pop('stylesheet', None),
+                                 prefetch=kwargs.pop('prefetch', None),
+                                 navigation=kwargs.pop('navigation', None),
+                                 chapter_pages=kwargs.pop('chapter_pages', None),
+                                 package_version=package_version)
+
+
+def split_template(title: str,
+                   css: str,
+                   language: str,
+                   **kwargs) -> Tuple[str, str]:
+    """Renders the title, css and document language into the jinja2 formatted template and
+    splits the resulting html document where the html content goes.
+
+    Writing the html content between the two parts gives the same document as
+    apply_template, without the html content ever being part of a single string.
+
+    Args:
+        title: The title gets inserted into the {{ title }} of the template.
+        css: The css gets inserted into the {{ css }} of the template.
+        language: The language gets inserted into the {{ language }} of the template.
+        **kwargs: The optional parts of the template. (see apply_template)
+
+    Returns:
+        A tuple consisting of the html before and after the {{ content }} of the template.
+    """
+    head, _placeholder, tail = apply_template(CONTENT_PLACEHOLDER, title, css, language,
+                                              **kwargs).partition(CONTENT_PLACEHOLDER)
+    return head, tail
+
+
+@functools.lru_cache(maxsize=None)
+def get_template() -> Template:
+    """Gets the compiled html template. It is compiled once and shared by all outputs, which
+    is safe as rendering a jinja2 template does not change it.
+
+    Returns:
+        The compiled template.
+    """
+    return Template(load_template())
+
+
+def load_template() -> str:
+    """Loads the jinja2 formatted html template shipped with the package.
+
+    Returns:
+        The template.
+    """
+    return resource_string(__name__, 'template.jinja') \
+        .decode('utf-8') \
+        .replace('\r\n', '\n')
+    # resource_string opens the file as bytes, which means that we
+    # have to decode to utf-8. The replace is necessary because
+    # resource_string, instead of open, does not automatically
+    # strip \r\n down to \n on windows systems. Leaving \r\n as is
+    # would produce double line breaks when writing the resulting string
+    # back to disc, thus we have to do the replacement ourselves, too.
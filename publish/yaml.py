@@ -9,19 +9,35 @@
 
 """Load anited. publish projects from yaml strings.
 """
+import hashlib
 import logging
-from typing import Dict, Tuple, Iterable, Union, List
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Tuple, Iterable, Optional, Union, List
 
 import ruamel.yaml
 
+from publish import __version__ as package_version
 from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.discovery import (DIRECTORY_PATTERN, SCAN_CACHE_NAME, DirectoryScanner,
+                               is_pattern, match_paths)
 from publish.output import HtmlOutput, EbookConvertOutput
+from publish.preflight import PreflightError
+from publish.source import CONTAINER_SEPARATOR, is_archive, open_archive
 from publish.substitution import Substitution, SimpleSubstitution, RegexSubstitution
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.NullHandler())
 
-YAML = ruamel.yaml.YAML(typ='safe', pure=True)
+# Uses the C parser of ruamel.yaml.clib if it is installed and falls back to the pure
+# Python parser otherwise.
+YAML = ruamel.yaml.YAML(typ='safe', pure=False)
+
+PROJECT_FILE = '.publish.yml'
+SNAPSHOT_NAME = 'project-snapshot'
+DATE_KEY = '$date'
 
 
 def load_yaml(yaml: str) -> Dict:
@@ -36,9 +52,11 @@ def load_yaml(yaml: str) -> Dict:
     return YAML.load(yaml)
 
 
-def load_project(yaml: str) -> Tuple[Book,
-                                     Iterable[Substitution],
-                                     Iterable[Union[HtmlOutput, EbookConvertOutput]]]:
+def load_project(yaml: str,
+                 cache: Optional[BuildCache] = None
+                 ) -> Tuple[Book,
+                            Iterable[Substitution],
+                            Iterable[Union[HtmlOutput, EbookConvertOutput]]]:
     """Loads a yaml string using the anited. publish project structure and returns the
     components of the project as a tuple: the book, the substitutions and the outputs.
 
@@ -50,20 +68,179 @@ def load_project(yaml: str) -> Tuple[Book,
 
     Args:
         yaml: The yaml string.
+        cache: The build cache used to remember the directory listings read while expanding
+            chapter patterns across builds. (see publish.discovery)
 
     Returns:
         A tuple consisting of the book, the list of substitutions and the list of outputs.
     """
+    dict_, _dependencies = _expand_project(yaml, cache)
+
+    return _load_expanded_project(dict_)
+
+
+def load_project_file(path: str = PROJECT_FILE,
+                      cache: Optional[BuildCache] = None,
+                      snapshot: bool = False
+                      ) -> Tuple[Book,
+                                 Iterable[Substitution],
+                                 Iterable[Union[HtmlOutput, EbookConvertOutput]]]:
+    """Loads the project file at path like load_project.
+
+    With a build cache and snapshot set, the project is kept as a json snapshot in the cache,
+    with its chapter patterns expanded, and the next call builds the project from the
+    snapshot, without parsing the yaml or expanding chapter patterns, as long as neither the
+    project file nor any directory or archive its chapter patterns were expanded in has
+    changed. The snapshot only holds what the project file sets, so defaults like the
+    pubdate of the book are set anew by every call.
+
+    Args:
+        path: The path to the project file.
+        cache: The build cache used to remember directory listings and holding the snapshot.
+        snapshot: Determines whether the project is kept as a snapshot and reused.
+
+    Returns:
+        A tuple consisting of the book, the list of substitutions and the list of outputs.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    if cache is None or not snapshot:
+        return load_project(data.decode('utf8'), cache)
+
+    key = hashlib.sha256(package_version.encode('utf8') + b'\0' + data).hexdigest()
+    saved = cache.load(SNAPSHOT_NAME)
+
+    if isinstance(saved, dict) and saved.get('key') == key and all(
+            _get_mtime(dependency) == mtime
+            for dependency, mtime in saved['dependencies'].items()):
+        LOG.info(f'Reusing the loaded project {path} ...')
+        return _load_expanded_project(_decode_dates(saved['project']))
+
+    dict_, dependencies = _expand_project(data.decode('utf8'), cache)
+
+    try:
+        cache.save(SNAPSHOT_NAME, {'key': key,
+                                   'dependencies': dependencies,
+                                   'project': _encode_dates(dict_)})
+    except (TypeError, ValueError) as error:
+        LOG.info(f'Not keeping a snapshot of {path}: {error}')
+
+    return _load_expanded_project(dict_)
+
+
+def _expand_project(yaml: str,
+                    cache: Optional[BuildCache] = None
+                    ) -> Tuple[Dict, Dict[str, Optional[int]]]:
+    """Loads a yaml string into a dictionary with the chapter patterns expanded into one
+    chapter sub-dictionary per chapter.
+
+    Args:
+        yaml: The yaml string.
+        cache: The build cache used to remember directory listings.
+
+    Returns:
+        A tuple consisting of the dictionary and a dictionary mapping the path of every
+        directory and archive read to its modification time in nanoseconds, or None if it
+        did not exist.
+    """
     dict_ = load_yaml(yaml)
 
+    scanner = DirectoryScanner(cache.load(SCAN_CACHE_NAME, {}) if cache else None)
+    chapters = [{'src': chapter.src, 'publish': chapter.publish}
+                for chapter in _load_chapters(dict_, scanner)]
+
+    if cache and scanner.visited:
+        cache.save(SCAN_CACHE_NAME, scanner.visited)
+
+    dependencies = {directory or '.': listing[0]
+                    for directory, listing in scanner.visited.items()}
+
+    for chapter in dict_.get('chapters') or []:
+        src = chapter.get('src', '')
+        if _is_archive_pattern(src):
+            archive_path = src.partition(CONTAINER_SEPARATOR)[0]
+            dependencies[archive_path] = _get_mtime(archive_path)
+
+    return dict(dict_, chapters=chapters), dependencies
+
+
+def _load_expanded_project(dict_: Dict
+                           ) -> Tuple[Book,
+                                      Iterable[Substitution],
+                                      Iterable[Union[HtmlOutput, EbookConvertOutput]]]:
+    """Translates a dictionary whose chapter patterns are expanded into the book, the
+    substitutions and the outputs.
+
+    Args:
+        dict_: The dictionary. (see _expand_project)
+
+    Returns:
+        A tuple consisting of the book, the list of substitutions and the list of outputs.
+    """
     book = _load_book(dict_)
-    book.chapters.extend(_load_chapters(dict_))
+    book.chapters.extend(Chapter(**chapter) for chapter in dict_['chapters'])
     substitutions = _load_substitutions(dict_)
     outputs = _load_outputs(dict_)
 
     return book, substitutions, outputs
 
 
+def _encode_dates(value: Any) -> Any:
+    """Replaces the dates yaml loads, e.g. of a pubdate, with json objects.
+
+    Times are left as they are, so a project setting one is not kept as a snapshot.
+
+    Args:
+        value: The value loaded from yaml.
+
+    Returns:
+        The value with json objects instead of dates. (see _decode_dates)
+    """
+    if isinstance(value, dict):
+        return {key: _encode_dates(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode_dates(item) for item in value]
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return {DATE_KEY: value.isoformat()}
+
+    return value
+
+
+def _decode_dates(value: Any) -> Any:
+    """Turns the json objects of dates back into dates.
+
+    Args:
+        value: The value encoded by _encode_dates.
+
+    Returns:
+        The value as loaded from yaml.
+    """
+    if isinstance(value, list):
+        return [_decode_dates(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if list(value) == [DATE_KEY]:
+        return datetime.strptime(value[DATE_KEY], '%Y-%m-%d').date()
+
+    return {key: _decode_dates(item) for key, item in value.items()}
+
+
+def _get_mtime(path: str) -> Optional[int]:
+    """Gets the modification time of a file or directory.
+
+    Args:
+        path: The path.
+
+    Returns:
+        The modification time in nanoseconds or None if the path does not exist.
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
 def _load_book(dict_: Dict) -> Book:
     """Translates a dictionary into a book object. Dictionary keys and values are mapped to
     corresponding book properties of the same name.
@@ -81,21 +258,33 @@ def _load_book(dict_: Dict) -> Book:
     return book
 
 
-def _load_chapters(dict_: Dict) -> Iterable[Chapter]:
+def _load_chapters(dict_: Dict,
+                   scanner: Optional[DirectoryScanner] = None) -> Iterable[Chapter]:
     """Translates a dictionary into a list of chapter objects.
 
     The dictionary is assumed to have the following structure::
 
         {
             'chapters': [{ 'src': 'some_file.md' },
+                         { 'src': 'chapters/**/*.md', 'exclude': ['draft_*.md'] },
+                         { 'src': 'appendix/' },
                          { 'src': '...' }]
         }
 
+    A src containing glob wildcards is expanded into one chapter per matching file, in natural
+    sort order. A src naming a directory is expanded like the pattern 'directory/**/*.md'.
+    Patterns and directories inside zip or tar archives, e.g. 'bundle.zip!chapters/*.md', are
+    expanded against the member names of the archive. The optional 'exclude' key holds one or
+    more glob patterns of files to leave out. All other keys of the sub-dictionary, e.g.
+    'publish', are applied to every expanded chapter. Files already added as chapters by an
+    earlier entry are not added a second time by a pattern.
+
     If the key 'chapters' is not present in the dictionary or if there are no chapter
     sub-dictionaries, an empty list is returned instead.
 
     Args:
         dict_: The dictionary.
+        scanner: The scanner used to expand patterns. (see publish.discovery)
 
     Returns:
         The list of chapter objects or an empty list either if not chapter sub-dictionaries are
@@ -105,11 +294,114 @@ def _load_chapters(dict_: Dict) -> Iterable[Chapter]:
 
     if 'chapters' in dict_ and dict_['chapters']:
         for chapter in dict_['chapters']:
-            chapters.append(Chapter(**chapter))
+            src = chapter.get('src', '')
+
+            if _is_archive_pattern(src):
+                chapters.extend(_expand_archive_chapters(chapter, chapters))
+            elif is_pattern(src) or os.path.isdir(src):
+                chapters.extend(_expand_chapters(chapter, chapters, scanner))
+            else:
+                chapters.append(Chapter(**chapter))
 
     return chapters
 
 
+def _expand_chapters(chapter: Dict,
+                     chapters: Iterable[Chapter],
+                     scanner: Optional[DirectoryScanner] = None) -> Iterable[Chapter]:
+    """Expands a chapter sub-dictionary whose src is a glob pattern or a directory into a list
+    of chapter objects.
+
+    Args:
+        chapter: The chapter sub-dictionary.
+        chapters: The chapters loaded so far.
+        scanner: The scanner used to expand the pattern.
+
+    Returns:
+        The list of chapter objects, one per matching file not already in chapters.
+    """
+    chapter = dict(chapter)
+    src = chapter.pop('src')
+    exclude = chapter.pop('exclude', [])
+
+    if isinstance(exclude, str):
+        exclude = [exclude]
+
+    if not is_pattern(src):
+        src = f'{src.rstrip("/")}/{DIRECTORY_PATTERN}'
+
+    known = {os.path.normpath(known_chapter.src) for known_chapter in chapters}
+    paths = (scanner or DirectoryScanner()).find(src, exclude)
+
+    if not paths:
+        LOG.warning(f'{src} does not match any chapter files.')
+
+    return [Chapter(src=path, **chapter)
+            for path in paths
+            if os.path.normpath(path) not in known]
+
+
+def _expand_archive_chapters(chapter: Dict,
+                             chapters: Iterable[Chapter]) -> Iterable[Chapter]:
+    """Expands a chapter sub-dictionary whose src is a glob pattern or a directory inside an
+    archive into a list of chapter objects.
+
+    Args:
+        chapter: The chapter sub-dictionary.
+        chapters: The chapters loaded so far.
+
+    Returns:
+        The list of chapter objects, one per matching member not already in chapters.
+
+    Raises:
+        PreflightError: If the archive does not list any members to match the pattern against.
+    """
+    chapter = dict(chapter)
+    archive_path, _, pattern = chapter.pop('src').partition(CONTAINER_SEPARATOR)
+    exclude = chapter.pop('exclude', [])
+
+    if isinstance(exclude, str):
+        exclude = [exclude]
+
+    if not is_pattern(pattern):
+        pattern = f'{pattern.rstrip("/")}/{DIRECTORY_PATTERN}'.lstrip('/')
+
+    archive = open_archive(archive_path)
+    try:
+        members = archive.names()
+    finally:
+        archive.close()
+
+    if not members:
+        raise PreflightError([f'{archive_path} does not list any members to expand {pattern} '
+                              f'against.'])
+
+    names = match_paths(members, pattern, exclude)
+
+    if not names:
+        LOG.warning(f'{pattern} does not match any chapter files in {archive_path}.')
+
+    known = {known_chapter.src for known_chapter in chapters}
+    srcs = (f'{archive_path}{CONTAINER_SEPARATOR}{name}' for name in names)
+
+    return [Chapter(src=src, **chapter) for src in srcs if src not in known]
+
+
+def _is_archive_pattern(src: str) -> bool:
+    """Determines whether a chapter src is a glob pattern or a directory inside an archive.
+
+    Args:
+        src: The chapter src.
+
+    Returns:
+        True if the src points to a pattern or directory inside a zip or tar archive.
+    """
+    archive_path, separator, member = src.partition(CONTAINER_SEPARATOR)
+
+    return bool(separator) and is_archive(archive_path) and \
+        (is_pattern(member) or not member or member.endswith('/'))
+
+
 def _load_substitutions(dict_: Dict) -> Iterable[Substitution]:
     """Translates a dictionary into a list of substitution objects.
 
@@ -139,8 +431,11 @@ def _load_substitutions(dict_: Dict) -> Iterable[Substitution]:
     Raises:
         TypeError: If the key names of a substitution dictionary don't match any Substitution
             class implementation.
+        PreflightError: If any pattern is not a valid regular expression. All invalid
+            patterns are reported at once.
     """
     substitutions = []
+    problems = []
 
     if 'substitutions' in dict_ and dict_['substitutions']:
         for substitution in dict_['substitutions']:
@@ -149,13 +444,19 @@ def _load_substitutions(dict_: Dict) -> Iterable[Substitution]:
                     SimpleSubstitution(old=substitution['old'],
                                        new=substitution['new']))
             elif 'pattern' in substitution and 'replace_with' in substitution:
-                substitutions.append(
-                    RegexSubstitution(pattern=substitution['pattern'],
-                                      replace_with=substitution['replace_with']))
+                try:
+                    substitutions.append(
+                        RegexSubstitution(pattern=substitution['pattern'],
+                                          replace_with=substitution['replace_with']))
+                except re.error as error:
+                    problems.append(f'{substitution["pattern"]!r}: invalid pattern ({error})')
             else:
                 raise TypeError(
                     f'{list(substitution.keys())} do not match any substitution type.')
 
+    if problems:
+        raise PreflightError(problems)
+
     return substitutions
 
 
@@ -179,7 +480,8 @@ def _load_outputs(dict_: Dict) -> Iterable[Union[HtmlOutput, EbookConvertOutput]
     any other file type excluding '.html' will produce an EbookConvertOutput.
 
     Note that a local stylesheet *replaces* the global stylesheet, but local ebookconvert_params
-    are *added* to the global ebookconvert_params if present.
+    are *added* to the global ebookconvert_params if present. The dictionary itself is left
+    unchanged.
 
     Args:
         dict_: The dictionary.
@@ -199,6 +501,7 @@ def _load_outputs(dict_: Dict) -> Iterable[Union[HtmlOutput, EbookConvertOutput]
         global_ec_params = _load_ebookconvert_params(dict_)
 
     for output in dict_['outputs']:
+        output = dict(output)
         path = output['path']
         file_type = path.split('.')[-1]
 
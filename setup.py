@@ -76,7 +76,9 @@ setup(
     install_requires=REQUIREMENTS,
     tests_require=DEV_REQUIREMENTS,
     extras_require={
-        'dev': DEV_REQUIREMENTS
+        'dev': DEV_REQUIREMENTS,
+        'highlight': ['Pygments'],
+        'images': ['Pillow'],
     },
     license="MIT",
     zip_safe=False,
@@ -10,6 +10,8 @@
 """Common test functions.
 """
 
+import asyncio
+
 from publish.book import Book
 
 
@@ -30,3 +32,34 @@ def get_test_book():
                 series_index='series_index',
                 tags='tags',
                 title_sort='title_sort')
+
+
+def get_attributes(object_):
+    """Gets the attributes of an object as a dictionary, whether the object stores them
+    in __slots__, in a __dict__ or in both."""
+    attributes = dict(vars(object_)) if hasattr(object_, '__dict__') else {}
+
+    for class_ in type(object_).__mro__:
+        for name in getattr(class_, '__slots__', ()):
+            if name.startswith('__') and name.endswith('__'):
+                continue
+            if name.startswith('__'):
+                name = f'_{class_.__name__.lstrip("_")}{name}'
+            if hasattr(object_, name):
+                attributes[name] = getattr(object_, name)
+
+    return attributes
+
+
+def run_async(coroutine):
+    """Runs a coroutine in a new event loop, like asyncio.run, which needs Python 3.7.
+
+    The loop is set as the event loop of the thread while it runs, so up to Python 3.7 the
+    child watcher of subprocesses is attached to it."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.backtracking` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,too-few-public-methods
+
+import re
+from unittest.mock import patch
+
+import pytest
+
+from publish import backtracking
+from publish.backtracking import get_backtracking_risks
+
+
+@pytest.mark.parametrize('pattern', [r'(a+)+$', r'(\w+\s?)*$', r'(\d+|x)+', r'(\w+.)+',
+                                     r'(a|aa)+', r'(a|a)+', r'(\w|_x)+', r'(?:a|b|ab)+'])
+def test_get_backtracking_risks_finds_risky_patterns(pattern):
+    assert len(get_backtracking_risks(pattern)) == 1
+
+
+@pytest.mark.parametrize('pattern', [r'\+\+(?P<text>.*?)\+\+', r'(?:ab+)+', r'(?:\w+,)+',
+                                     r'(?:\s*,\s*\w+)+', r'(a|b)+', r'(ab?)+',
+                                     r'"(?:[^"\\]|\\.)*"', r'(?:Mr|Mrs)\.'])
+def test_get_backtracking_risks_accepts_safe_patterns(pattern):
+    assert get_backtracking_risks(pattern) == []
+
+
+def test_get_backtracking_risks_of_compiled_pattern():
+    assert len(get_backtracking_risks(re.compile(r'(a+)+$', re.IGNORECASE))) == 1
+
+
+class OldParsedPattern:
+    """A parsed pattern like on Python 3.6 and 3.7, whose parser state is called pattern."""
+
+    def __init__(self, parsed):
+        self.data = parsed.data
+        self.pattern = getattr(parsed, 'state', None) or parsed.pattern
+
+
+@pytest.mark.parametrize('pattern, count', [(r'(a+)+$', 1), (r'(?:ab+)+', 0)])
+def test_get_backtracking_risks_with_parser_state_of_python_37(pattern, count):
+    parse = backtracking._parse  # pylint: disable=protected-access
+
+    with patch('publish.backtracking._parse', lambda *args: OldParsedPattern(parse(*args))):
+        assert len(get_backtracking_risks(pattern)) == count
@@ -14,8 +14,12 @@
 
 from datetime import date
 
+import copy
+import hashlib
+
 import pytest
 from publish.book import Book, Chapter
+from publish.source import MappingSource, SourceResolver
 from tests import get_test_book
 
 
@@ -65,6 +69,35 @@ class TestBook:
             # noinspection PyPropertyAccess
             book.chapters = []
 
+    def test_sources_is_get_only(self):
+        book = Book('title')
+        with pytest.raises(AttributeError):
+            # noinspection PyPropertyAccess
+            book.sources = {}
+
+    def test_extra_attributes_can_be_set(self):
+        book = Book('title')
+        book.custom_attribute = 'custom'
+
+        assert book.custom_attribute == 'custom'  # pylint: disable=no-member
+
+    def test_deepcopy_shares_sources(self):
+        book = get_test_book()
+        book.custom_attribute = ['custom']
+        source = MappingSource({'1.md': '# One'})
+        book.sources['memory'] = source
+        book.chapters.append(Chapter('memory!1.md'))
+
+        actual = copy.deepcopy(book)
+        actual.sources['other'] = MappingSource({})
+
+        assert actual.title == book.title and actual.authors == book.authors
+        assert actual.custom_attribute == ['custom']
+        assert actual.custom_attribute is not book.custom_attribute  # pylint: disable=no-member
+        assert actual.chapters[0] is not book.chapters[0]
+        assert actual.sources['memory'] is source
+        assert 'other' not in book.sources
+
     def test_chapters_is_iterable(self):
         book = Book('title')
         iter(book.chapters)
@@ -183,3 +216,61 @@ class TestChapter:
         with pytest.raises(TypeError):
             # noinspection PyArgumentList
             Chapter()  # pylint: disable=no-value-for-parameter
+
+    def test_has_no_dict(self):
+        with pytest.raises(AttributeError):
+            Chapter('source').unknown_attribute = 'unknown'  # pylint: disable=assigning-non-slot
+
+    def test_lazy_attributes(self, tmp_path):
+        path = tmp_path / 'chapter.md'
+        path.write_bytes('# Chäpter'.encode('utf-8'))
+        chapter = Chapter(str(path))
+
+        assert chapter.size == 10
+        assert chapter.mtime == path.stat().st_mtime
+        assert chapter.content_hash == hashlib.sha256('# Chäpter'.encode('utf-8')).hexdigest()
+        assert chapter.content == '# Chäpter'
+
+    def test_lazy_attributes_are_cached_until_invalidated(self, tmp_path):
+        path = tmp_path / 'chapter.md'
+        path.write_text('old', encoding='utf-8')
+        chapter = Chapter(str(path))
+        old_hash = chapter.content_hash
+        assert chapter.content == 'old'
+        assert chapter.size == 3
+
+        path.write_text('new content', encoding='utf-8')
+
+        assert chapter.content == 'old'
+        assert chapter.content_hash == old_hash
+        assert chapter.size == 3
+
+        chapter.invalidate()
+
+        assert chapter.content == 'new content'
+        assert chapter.content_hash != old_hash
+        assert chapter.size == 11
+
+    def test_release(self, tmp_path):
+        path = tmp_path / 'chapter.md'
+        path.write_text('old', encoding='utf-8')
+        chapter = Chapter(str(path))
+        assert chapter.content == 'old'
+
+        path.write_text('new', encoding='utf-8')
+        chapter.release()
+
+        assert chapter.content == 'new'
+
+    def test_read_normalises_line_breaks(self, tmp_path):
+        path = tmp_path / 'chapter.md'
+        path.write_bytes(b'Title\r\n=====\r\n\r\nWindows\rold mac\n')
+
+        assert Chapter(str(path)).read() == 'Title\n=====\n\nWindows\nold mac\n'
+
+    def test_read_from_named_source(self):
+        resolver = SourceResolver({'memory': MappingSource({'01.md': 'memory content'})})
+        chapter = Chapter('memory!01.md')
+
+        assert chapter.read(resolver) == 'memory content'
+        assert chapter.stat(resolver).size == 14
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.cache` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import os
+
+from publish.cache import BuildCache
+
+
+def test_save_and_load(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    cache.save('document', {'a': [1, 2]})
+
+    assert cache.load('document') == {'a': [1, 2]}
+    assert os.listdir(str(tmp_path / 'cache')) == ['document.json']
+
+
+def test_load_missing_document_returns_default(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+
+    assert cache.load('document') is None
+    assert cache.load('document', {}) == {}
+
+
+def test_load_unreadable_document_returns_default(tmp_path):
+    (tmp_path / 'document.json').write_text('{', encoding='utf8')
+
+    assert BuildCache(str(tmp_path)).load('document', []) == []
+
+
+def test_save_and_load_text(tmp_path):
+    cache = BuildCache(str(tmp_path))
+    cache.save_text('renders', 'abcdef', '<p>text</p>')
+
+    assert cache.load_text('renders', 'abcdef') == '<p>text</p>'
+    assert (tmp_path / 'renders' / 'ab' / 'cdef').exists()
+    assert cache.load_text('renders', 'abcdeg') is None
+
+
+def test_save_and_load_json(tmp_path):
+    cache = BuildCache(str(tmp_path))
+    cache.save_json('headings', 'abcdef', {'headings': [[1, 'One', 'one']]})
+    cache.save_text('headings', 'abcdeg', '{')
+
+    assert cache.load_json('headings', 'abcdef') == {'headings': [[1, 'One', 'one']]}
+    assert cache.load_json('headings', 'abcdeg') is None
+    assert cache.load_json('headings', 'abcdeh') is None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.cli` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,protected-access
+# pylint: disable=unused-argument,redefined-outer-name
+
+import logging
+import re
+from unittest.mock import patch
+
+import pytest
+
+from publish.cli import main, select_outputs
+from publish.output import HtmlOutput, EbookConvertOutput
+
+TEST_PROJECT = """
+title: My book
+
+chapters:
+  - src: first_chapter.md
+  - src: second_chapter.md
+
+outputs:
+  - path: example.html
+  - path: example.epub
+"""
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    (tmp_path / '.publish.yml').write_text(TEST_PROJECT, encoding='utf8')
+    (tmp_path / 'first_chapter.md').write_text('# One', encoding='utf8')
+    (tmp_path / 'second_chapter.md').write_text('# Two', encoding='utf8')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('publish.preflight.shutil.which', lambda name: f'/usr/bin/{name}')
+    return tmp_path
+
+
+def test_select_outputs():
+    outputs = [HtmlOutput('example.html'), EbookConvertOutput('example.epub')]
+
+    assert select_outputs(outputs, ['./example.epub']) == [outputs[1]]
+    assert select_outputs(outputs, None) == outputs
+
+
+def test_select_outputs_unknown_path_raises_error():
+    with pytest.raises(ValueError, match='missing.epub'):
+        select_outputs([HtmlOutput('example.html')], ['missing.epub'])
+
+
+def test_main_only(project_dir):
+    with patch.object(HtmlOutput, 'make') as mock_html_make, \
+            patch.object(EbookConvertOutput, 'make') as mock_ebook_make:
+        main(['--only', 'example.epub'])
+
+    mock_html_make.assert_not_called()
+    mock_ebook_make.assert_called_once()
+
+
+def test_main_chapters_builds_previews(project_dir):
+    made = []
+
+    def make(self, book, substitutions):  # pylint: disable=unused-argument
+        made.append(self)
+
+    with patch.object(HtmlOutput, 'make', make):
+        main(['--only', 'example.html', '--chapters', '2'])
+
+    assert [output.path for output in made] == ['example.preview.html']
+    assert made[0].chapter_range == '2'
+
+
+def test_main_invalid_chapter_range_exits(project_dir):
+    with pytest.raises(SystemExit):
+        main(['--chapters', 'x'])
+
+
+def test_main_check_does_not_make_outputs(project_dir, caplog):
+    caplog.set_level(logging.INFO)
+
+    with patch.object(HtmlOutput, 'make') as mock_html_make, \
+            patch.object(EbookConvertOutput, 'make') as mock_ebook_make:
+        main(['check'])
+
+    mock_html_make.assert_not_called()
+    mock_ebook_make.assert_not_called()
+    assert 'No problems found.' in caplog.text
+
+
+def test_main_reports_all_problems_before_making_outputs(project_dir, capsys):
+    (project_dir / 'second_chapter.md').unlink()
+    (project_dir / '.publish.yml').write_text(TEST_PROJECT + 'stylesheet: missing.css\n',
+                                              encoding='utf8')
+
+    with patch.object(HtmlOutput, 'make') as mock_html_make, \
+            pytest.raises(SystemExit) as exit_info:
+        main(['--no-cache'])
+
+    error = capsys.readouterr().err
+    mock_html_make.assert_not_called()
+    assert exit_info.value.code == 1
+    assert 'Found 2 problem(s)' in error
+    assert 'second_chapter.md' in error
+    assert 'missing.css' in error
+
+
+def test_main_stdout_writes_html_output(project_dir, capsysbinary):
+    main(['--stdout'])
+
+    stdout = capsysbinary.readouterr().out.decode('utf-8')
+    assert '<h1>One</h1>\n<h1>Two</h1>' in stdout
+    assert not (project_dir / 'example.html').exists()
+    assert not (project_dir / 'example.epub').exists()
+
+
+def test_main_stdout_needs_exactly_one_html_output(project_dir):
+    (project_dir / '.publish.yml').write_text(TEST_PROJECT + '  - path: other.html\n',
+                                              encoding='utf8')
+
+    with pytest.raises(SystemExit):
+        main(['--stdout'])
+
+    with patch.object(HtmlOutput, 'write_to', autospec=True) as mock_write_to:
+        main(['--stdout', '--only', 'other.html'])
+
+    assert mock_write_to.call_args[0][0].path == 'other.html'
+
+
+def test_main_worker_runs_worker_without_project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    with patch('publish.cli.run_worker') as mock_run_worker:
+        main(['worker', '--listen', '0.0.0.0:9000'])
+
+    mock_run_worker.assert_called_once_with(('0.0.0.0', 9000))
+
+
+def test_main_render_workers_are_set_on_outputs(project_dir):
+    made = []
+
+    def make(self, book, substitutions):  # pylint: disable=unused-argument
+        made.append(self)
+
+    with patch.object(HtmlOutput, 'make', make):
+        main(['--only', 'example.html', '--render-workers', 'build-1:8765, build-2:8765'])
+
+    assert made[0].render_workers == ['build-1:8765', 'build-2:8765']
+
+    with pytest.raises(SystemExit):
+        main(['--render-workers', 'build-1'])
+
+
+def test_main_explain_schedule_reports_makespan(project_dir, caplog):
+    caplog.set_level(logging.INFO)
+
+    with patch.object(EbookConvertOutput, 'make'):
+        main(['--explain-schedule', '--jobs', '2'])
+        main(['--explain-schedule', '--jobs', '2'])
+
+    assert 'Schedule of outputs on 2 worker(s): predicted makespan unknown' in caplog.text
+    assert re.search(r'predicted makespan \d+\.\d\d s', caplog.text)
+    assert 'example.epub' in caplog.text
+    assert (project_dir / '.publish-cache' / 'costs.json').exists()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.discovery` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,protected-access
+# pylint: disable=redefined-outer-name
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from publish.discovery import DirectoryScanner, compile_glob, is_pattern, natural_sort_key
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    for path in ('chapters/1.md', 'chapters/2.md', 'chapters/10.md', 'chapters/notes.txt',
+                 'chapters/part_2/11.md', 'chapters/part_2/draft_12.md',
+                 'chapters/.hidden/13.md', 'intro.md'):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path, encoding='utf8')
+
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_is_pattern():
+    assert is_pattern('chapters/*.md')
+    assert is_pattern('chapter_?.md')
+    assert is_pattern('chapter_[0-9].md')
+    assert not is_pattern('chapters/1.md')
+
+
+@pytest.mark.parametrize('pattern,path,expected', [
+    ('*.md', 'a.md', True),
+    ('*.md', 'dir/a.md', False),
+    ('dir/**/*.md', 'dir/a.md', True),
+    ('dir/**/*.md', 'dir/sub/sub/a.md', True),
+    ('dir/**', 'dir/sub/a.txt', True),
+    ('chapter_?.md', 'chapter_1.md', True),
+    ('chapter_?.md', 'chapter_10.md', False),
+    ('chapter_[!0].md', 'chapter_0.md', False),
+    ('a+b.md', 'a+b.md', True),
+])
+def test_compile_glob(pattern, path, expected):
+    assert bool(compile_glob(pattern).match(path)) is expected
+
+
+def test_natural_sort_key():
+    paths = ['10.md', 'b/1.md', '2.md', 'a/10.md', 'a/9.md', 'Chapter_3.md', 'chapter_20.md']
+
+    assert sorted(paths, key=natural_sort_key) == \
+        ['2.md', '10.md', 'a/9.md', 'a/10.md', 'b/1.md', 'Chapter_3.md', 'chapter_20.md']
+
+
+@pytest.mark.usefixtures('tree')
+def test_find():
+    scanner = DirectoryScanner({})
+
+    assert scanner.find('chapters/*.md') == ['chapters/1.md', 'chapters/2.md', 'chapters/10.md']
+    assert scanner.find('./chapters/**/*.md') == ['chapters/1.md', 'chapters/2.md',
+                                                  'chapters/10.md', 'chapters/part_2/11.md',
+                                                  'chapters/part_2/draft_12.md']
+    assert scanner.find('*.md') == ['intro.md']
+
+
+@pytest.mark.usefixtures('tree')
+def test_find_exclude():
+    scanner = DirectoryScanner({})
+
+    assert scanner.find('chapters/**/*.md', exclude=['draft_*.md', 'chapters/1*.md']) == \
+        ['chapters/2.md', 'chapters/part_2/11.md']
+
+
+@pytest.mark.usefixtures('tree')
+def test_find_missing_directory_returns_empty_list():
+    assert DirectoryScanner({}).find('missing/*.md') == []
+
+
+@pytest.mark.usefixtures('tree')
+def test_find_reuses_listings_of_unmodified_directories():
+    listings = {}
+    DirectoryScanner(listings).find('chapters/**/*.md')
+
+    with patch('os.scandir') as mock_scandir:
+        DirectoryScanner(listings).find('chapters/**/*.md')
+
+    mock_scandir.assert_not_called()
+
+
+def test_find_rescans_modified_directories_only(tree):
+    listings = {}
+    DirectoryScanner(listings).find('chapters/**/*.md')
+
+    (tree / 'chapters/part_2/14.md').write_text('new', encoding='utf8')
+    stat = os.stat(tree / 'chapters/part_2')
+    os.utime(tree / 'chapters/part_2', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    scanned = []
+    original_scandir = os.scandir
+
+    def scandir(path):
+        scanned.append(path)
+        return original_scandir(path)
+
+    with patch('os.scandir', scandir):
+        actual = DirectoryScanner(listings).find('chapters/**/*.md')
+
+    assert scanned == ['chapters/part_2']
+    assert 'chapters/part_2/14.md' in actual
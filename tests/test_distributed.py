@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.distributed` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,redefined-outer-name
+# pylint: disable=too-few-public-methods
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import markdown
+import pytest
+
+from publish.book import Book, Chapter
+from publish.distributed import (ProtocolError, RemoteRenderError, RenderCoordinator,
+                                 RenderSettings, WorkerServer, parse_address, receive_message,
+                                 send_message)
+from publish.output import HtmlOutput
+from publish.scheduling import CostModel
+from publish.substitution import RegexSubstitution, SimpleSubstitution, Substitution
+
+SUBSTITUTIONS = [SimpleSubstitution('fox', 'Fox'),
+                 RegexSubstitution(r'\+\+(?P<text>.*?)\+\+', r'<b>\g<text></b>')]
+
+
+class UpperSubstitution(Substitution):
+
+    def apply_to(self, text: str) -> str:
+        return text.upper()
+
+
+@pytest.fixture
+def start_worker():
+    servers = []
+
+    def start():
+        server = WorkerServer(('127.0.0.1', 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[:2]
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def start_dying_worker():
+    """Starts a worker that accepts a single connection, takes a single job and dies."""
+    listeners = []
+
+    def start():
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        listeners.append(listener)
+
+        def serve():
+            connection, _address = listener.accept()
+            listener.close()
+            with connection:
+                try:
+                    receive_message(connection)
+                    send_message(connection, {'type': 'ready'})
+                    receive_message(connection)
+                except (OSError, ProtocolError):
+                    pass
+
+        threading.Thread(target=serve, daemon=True).start()
+        return listener.getsockname()[:2]
+
+    yield start
+
+    for listener in listeners:
+        listener.close()
+
+
+@pytest.fixture
+def start_recording_worker():
+    """Starts a worker that accepts a single connection and renders its jobs, recording the
+    src of every job in the order they are received."""
+    listeners = []
+
+    def start(received):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        listeners.append(listener)
+
+        def serve():
+            connection, _address = listener.accept()
+            listener.close()
+            with connection:
+                try:
+                    receive_message(connection)
+                    send_message(connection, {'type': 'ready'})
+                    while True:
+                        job = receive_message(connection)
+                        received.append(os.path.basename(job['src']))
+                        send_message(connection, {'type': 'result', 'id': job['id'],
+                                                  'html': markdown.markdown(job['text'])})
+                except (OSError, ProtocolError):
+                    pass
+
+        threading.Thread(target=serve, daemon=True).start()
+        return listener.getsockname()[:2]
+
+    yield start
+
+    for listener in listeners:
+        listener.close()
+
+
+def test_render_yields_html_in_chapter_order(start_worker):
+    addresses = [start_worker() for _ in range(3)]
+    texts = [(f'# Chapter {index}\n\nThe ++fox++.', f'{index}.md') for index in range(20)]
+
+    with RenderCoordinator(addresses, SUBSTITUTIONS) as coordinator:
+        rendered = [(html, fallback) for html, fallback, _seconds in coordinator.render(texts)]
+
+    assert rendered == [(f'<h1>Chapter {index}</h1>\n<p>The <b>Fox</b>.</p>', False)
+                        for index in range(20)]
+
+
+def test_worker_highlights_code_blocks(start_worker):
+    with RenderCoordinator([start_worker()], [], RenderSettings(highlight=True)) as coordinator:
+        html, _fallback, _seconds = coordinator.submit('```python\nx = 1\n```', '1.md').result()
+
+    assert '<span class="mi">1</span>' in html
+
+
+def test_job_of_dying_worker_is_sent_to_another_worker(start_worker, start_dying_worker):
+    addresses = [start_dying_worker(), start_worker()]
+    texts = [(f'# {index}', f'{index}.md') for index in range(5)]
+
+    with RenderCoordinator(addresses, []) as coordinator:
+        rendered = [result[0] for result in coordinator.render(texts)]
+
+    assert rendered == [f'<h1>{index}</h1>' for index in range(5)]
+
+
+def test_job_fails_after_retries(start_dying_worker):
+    addresses = [start_dying_worker() for _ in range(3)]
+
+    with RenderCoordinator(addresses, [], RenderSettings(retries=1)) as coordinator:
+        with pytest.raises(RemoteRenderError, match='1.md'):
+            coordinator.submit('# 1', '1.md').result(timeout=10)
+
+
+def test_jobs_fail_without_workers():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    address = listener.getsockname()[:2]
+    listener.close()
+
+    with RenderCoordinator([address], [], RenderSettings(connect_timeout=1)) as coordinator:
+        with pytest.raises(RemoteRenderError, match='no render worker is left'):
+            list(coordinator.render([('# 1', '1.md'), ('# 2', '2.md')]))
+
+
+def test_error_of_chapter_is_not_retried(start_worker, monkeypatch):
+    convert = markdown.Markdown.convert
+
+    def failing_convert(self, text):
+        if text == 'boom':
+            raise ValueError('boom')
+        return convert(self, text)
+
+    monkeypatch.setattr('markdown.Markdown.convert', failing_convert)
+
+    with RenderCoordinator([start_worker()], []) as coordinator:
+        with pytest.raises(RemoteRenderError, match='1.md failed: boom'):
+            coordinator.submit('boom', '1.md').result(timeout=10)
+
+        assert coordinator.submit('# b', '2.md').result(timeout=10)[:2] == ('<h1>b</h1>', False)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='patches are only inherited by forked workers')
+def test_worker_applies_render_fallback(start_worker, monkeypatch):
+    monkeypatch.setattr('markdown.Markdown.convert', lambda self, text: time.sleep(10))
+
+    settings = RenderSettings(render_timeout=0.2, render_fallback='pre')
+
+    with RenderCoordinator([start_worker()], [], settings) as coordinator:
+        assert coordinator.submit('# <a>', '1.md').result(timeout=10)[:2] == \
+            ('<pre># &lt;a&gt;</pre>', True)
+
+
+def test_custom_substitution_can_not_be_sent():
+    with pytest.raises(ValueError, match='can not be sent'):
+        RenderCoordinator([('127.0.0.1', 8765)], [UpperSubstitution()])
+
+
+def test_output_with_render_workers(tmp_path, start_worker):
+    book = Book('title')
+    for index in range(4):
+        (tmp_path / f'{index}.md').write_text(f'# The fox {index}', encoding='utf8')
+        book.chapters.append(Chapter(str(tmp_path / f'{index}.md')))
+
+    addresses = [start_worker(), start_worker()]
+    output = HtmlOutput(str(tmp_path / 'book.html'),
+                        render_workers=[f'{host}:{port}' for host, port in addresses])
+    local = HtmlOutput(str(tmp_path / 'local.html'))
+
+    assert output.render(book, SUBSTITUTIONS) == local.render(book, SUBSTITUTIONS)
+    assert b'<h1>The Fox 3</h1>' in output.render(book, SUBSTITUTIONS)
+
+
+def test_output_sends_longest_chapters_first(tmp_path, start_recording_worker):
+    book = Book('title')
+    cost_model = CostModel()
+    for index, seconds in enumerate([1.0, 3.0, None, 2.0]):
+        (tmp_path / f'{index}.md').write_text(f'# {index}', encoding='utf8')
+        book.chapters.append(Chapter(str(tmp_path / f'{index}.md')))
+        if seconds:
+            cost_model.record_render(str(tmp_path / f'{index}.md'), seconds)
+
+    sent = []
+    host, port = start_recording_worker(sent)
+    output = HtmlOutput(str(tmp_path / 'book.html'), render_workers=[f'{host}:{port}'],
+                        cost_model=cost_model, render_chapters_separately=True)
+
+    assert b'<h1>0</h1>\n<h1>1</h1>\n<h1>2</h1>\n<h1>3</h1>' in output.render(book, [])
+    assert sent == ['1.md', '2.md', '3.md', '0.md']
+    assert 'Schedule of chapters of ' in cost_model.format_report()
+    assert cost_model.get_render_time(str(tmp_path / '2.md')) is not None
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('localhost:8765', ('localhost', 8765)),
+    (' 10.0.0.1:1 ', ('10.0.0.1', 1)),
+    ('[::1]:8765', ('::1', 8765))])
+def test_parse_address(address, expected):
+    assert parse_address(address) == expected
+
+
+@pytest.mark.parametrize('address', ['localhost', ':8765', 'localhost:port', 'host:70000'])
+def test_parse_address_raises_error(address):
+    with pytest.raises(ValueError, match='HOST:PORT'):
+        parse_address(address)
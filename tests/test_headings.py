@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.headings` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import io
+from unittest.mock import patch
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.headings import HeadingIndex, extract_headings, slugify
+from publish.output import HtmlOutput
+
+
+def get_index(*chapters):
+    index = HeadingIndex()
+    for src, html in chapters:
+        index.add_chapter(src, extract_headings(html))
+    return index
+
+
+def write(index, position, html):
+    file = io.StringIO()
+    index.write_chapter(file, position, html)
+    return file.getvalue()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('A Heading!', 'a-heading'),
+    ('Über  uns -- mehr', 'uber-uns-mehr'),
+    ('***', 'section')])
+def test_slugify(text, expected):
+    assert slugify(text) == expected
+
+
+def test_extract_headings():
+    html = ('<h1>The <em>First</em> &amp; Last</h1>\n<p><a href="#the-first-last">x</a> '
+            '<a href="https://example.com">y</a></p>\n<h2 id="own">Own</h2>')
+
+    extract = extract_headings(html)
+
+    assert extract['headings'] == [[3, 1, 'The First & Last', 'the-first-last', False],
+                                   [html.index('<h2') + 3, 2, 'Own', 'own', True]]
+    assert extract['links'] == [[html.index('#the'), html.index('">x'), '#the-first-last']]
+
+
+def test_ids_are_unique_across_chapters():
+    index = get_index(('1.md', '<h1>Intro</h1><h2>Intro</h2>'),
+                      ('2.md', '<h1>Intro</h1>'),
+                      ('3.md', '<h1 id="intro-2">Explicit</h1>'))
+
+    assert [heading.id for heading in index.headings] == \
+        ['intro', 'intro-1', 'intro-3', 'intro-2']
+    assert write(index, 1, '<h1>Intro</h1>') == '<h1 id="intro-3">Intro</h1>'
+
+
+def test_references_are_resolved():
+    index = get_index(
+        ('chapters/1.md', '<h1>Intro</h1><a href="#intro">a</a><a href="#details">b</a>'),
+        ('chapters/2.md', '<h1>Intro</h1><h2>Details</h2>'
+                          '<a href="#intro">c</a><a href="1.md#intro">d</a>'
+                          '<a href="../chapters/1.md#missing">e</a><a href="other.html#x">f</a>'))
+
+    assert write(index, 0, '<h1>Intro</h1><a href="#intro">a</a><a href="#details">b</a>') == \
+        '<h1 id="intro">Intro</h1><a href="#intro">a</a><a href="#details">b</a>'
+    assert write(index, 1, '<h1>Intro</h1><h2>Details</h2>'
+                           '<a href="#intro">c</a><a href="1.md#intro">d</a>'
+                           '<a href="../chapters/1.md#missing">e</a>'
+                           '<a href="other.html#x">f</a>') == \
+        ('<h1 id="intro-1">Intro</h1><h2 id="details">Details</h2>'
+         '<a href="#intro-1">c</a><a href="#intro">d</a>'
+         '<a href="../chapters/1.md#missing">e</a><a href="other.html#x">f</a>')
+
+
+def test_unresolved_reference_is_logged(caplog):
+    index = get_index(('1.md', '<a href="#nowhere">a</a>'))
+
+    assert write(index, 0, '<a href="#nowhere">a</a>') == '<a href="#nowhere">a</a>'
+    assert '1.md: #nowhere does not match any heading.' in caplog.text
+
+
+def test_get_toc():
+    index = get_index(('1.md', '<h1>One</h1><h4>Deep</h4>'), ('2.md', '<h2>Two</h2>'))
+
+    assert [(heading.level, heading.text, heading.src) for heading in index.get_toc(3)] == \
+        [(1, 'One', '1.md'), (2, 'Two', '2.md')]
+
+
+def test_output_with_toc(tmp_path):
+    book = Book('title')
+    (tmp_path / '1.md').write_text('# Setup\n\nSee [usage](2.md#usage).', encoding='utf8')
+    (tmp_path / '2.md').write_text('# Usage\n\n## Setup <b>&</b>', encoding='utf8')
+    book.chapters.extend([Chapter(str(tmp_path / '1.md')), Chapter(str(tmp_path / '2.md'))])
+    output = HtmlOutput(str(tmp_path / 'book.html'), toc=True)
+
+    html = output.render(book).decode('utf-8')
+
+    assert ('<nav class="toc">\n<ul>\n'
+            '<li class="toc-level-1"><a href="#setup">Setup</a></li>\n'
+            '<li class="toc-level-1"><a href="#usage">Usage</a></li>\n'
+            '<li class="toc-level-2"><a href="#setup-1">Setup &amp;</a></li>\n'
+            '</ul>\n</nav>') in html
+    assert '<h1 id="setup">Setup</h1>\n<p>See <a href="#usage">usage</a>.</p>\n' \
+           '<h1 id="usage">Usage</h1>' in html
+
+
+def test_output_reuses_cached_headings(tmp_path):
+    book = Book('title')
+    (tmp_path / '1.md').write_text('# One', encoding='utf8')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+    output = HtmlOutput(str(tmp_path / 'book.html'), toc=True,
+                        cache=BuildCache(str(tmp_path / 'cache')))
+    first = output.render(book)
+
+    with patch('publish.headings.extract_headings') as mock_extract_headings:
+        assert output.render(book) == first
+
+    mock_extract_headings.assert_not_called()
+    assert b'<h1 id="one">One</h1>' in first
+
+
+def test_output_without_toc_is_unchanged(tmp_path):
+    book = Book('title')
+    (tmp_path / '1.md').write_text('# One', encoding='utf8')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+
+    html = HtmlOutput(str(tmp_path / 'book.html')).render(book).decode('utf-8')
+
+    assert '<body>\n<h1>One</h1>\n</body>' in html
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.highlighting` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,redefined-outer-name
+
+from unittest.mock import patch
+
+import markdown
+import pytest
+
+from publish import highlighting
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.highlighting import HighlightExtension, get_highlight_css, highlight_code
+from publish.isolation import RenderWorker
+from publish.output import HtmlOutput
+
+CODE_CHAPTER = 'Intro\n\n```python\nx = 1\n```\n\n~~~{.nosuchlanguage}\n<b>\n~~~\n'
+
+
+@pytest.fixture(autouse=True)
+def clear_memory_cache():
+    highlighting._memory_cache.clear()  # pylint: disable=protected-access
+    yield
+    highlighting._memory_cache.clear()  # pylint: disable=protected-access
+
+
+def test_fenced_code_blocks_are_highlighted():
+    html = markdown.Markdown(extensions=[HighlightExtension()]).convert(CODE_CHAPTER)
+
+    assert html.startswith('<p>Intro</p>\n<div class="highlight"><pre><span></span>'
+                           '<span class="n">x</span> <span class="o">=</span> '
+                           '<span class="mi">1</span>\n</pre></div>')
+    assert '<div class="highlight"><pre><span></span>&lt;b&gt;\n</pre></div>' in html
+
+
+def test_highlighted_blocks_are_reused_from_memory():
+    with patch('publish.highlighting._highlight', return_value='<div>x</div>') as mock_highlight:
+        assert highlight_code('x = 1\n', 'python') == '<div>x</div>'
+        assert highlight_code('x = 1\n', 'python') == '<div>x</div>'
+        highlight_code('x = 1\n', 'ruby')
+
+    assert mock_highlight.call_count == 2
+
+
+def test_highlighted_blocks_are_reused_from_cache(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    html = highlight_code('x = 1\n', 'python', cache)
+    highlighting._memory_cache.clear()  # pylint: disable=protected-access
+
+    with patch('publish.highlighting._highlight') as mock_highlight:
+        assert highlight_code('x = 1\n', 'python', cache) == html
+
+    mock_highlight.assert_not_called()
+
+
+def test_get_highlight_css():
+    assert '.highlight .k' in get_highlight_css('monokai')
+
+    with pytest.raises(ValueError, match='nope is not a Pygments style'):
+        get_highlight_css('nope')
+
+
+def test_isolated_render_worker_highlights():
+    with RenderWorker(timeout=60, highlight=True) as worker:
+        assert '<span class="mi">1</span>' in worker.render(CODE_CHAPTER, 'code.md')
+
+
+def test_output_with_highlight_style(tmp_path):
+    (tmp_path / 'style.css').write_text('p { color: red; }', encoding='utf8')
+    (tmp_path / '1.md').write_text(CODE_CHAPTER, encoding='utf8')
+    book = Book('title')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+    output = HtmlOutput(str(tmp_path / 'book.html'), stylesheet=str(tmp_path / 'style.css'),
+                        highlight_style='monokai')
+
+    html = output.render(book).decode('utf-8')
+
+    assert '<style type="text/css">\np { color: red; }\n' in html
+    assert get_highlight_css('monokai') + '\n</style>' in html
+    assert '<span class="mi">1</span>' in html
+
+
+def test_output_without_highlight_style_is_unchanged(tmp_path):
+    (tmp_path / '1.md').write_text(CODE_CHAPTER, encoding='utf8')
+    book = Book('title')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+
+    html = HtmlOutput(str(tmp_path / 'book.html')).render(book).decode('utf-8')
+
+    assert 'class="highlight"' not in html
+    assert '<p><code>python' in html
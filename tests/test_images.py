@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.images` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,redefined-outer-name
+
+import io
+from unittest.mock import patch
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.images import (ImageHeader, ImagePipeline, ImageSettings, LazyImages,
+                            get_display_size, get_image_directory, read_image_header)
+from publish.incremental import IncrementalBuild
+from publish.output import HtmlOutput
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / 'part').mkdir()
+    (tmp_path / 'part' / 'images').mkdir()
+    (tmp_path / 'part' / 'images' / 'a.png').write_bytes(b'image a')
+    (tmp_path / 'copy of a.png').write_bytes(b'image a')
+    (tmp_path / 'b.gif').write_bytes(b'image b')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_png(path, width, height):
+    image_module = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    image_module.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    path.write_bytes(buffer.getvalue())
+
+
+def get_size(path):
+    image_module = pytest.importorskip('PIL.Image')
+    with image_module.open(str(path)) as image:
+        return image.size
+
+
+def test_images_are_collected_once(project, caplog):
+    html = ('<img alt="a" src="images/a.png"><img src="copy%20of%20a.png">'
+            '<img src="b.gif"><img src="https://example.com/c.png">'
+            '<img src="data:image/png;base64,AAAA"><img src="missing.png">')
+
+    with ImagePipeline('out/book_images', 'out') as pipeline:
+        rewritten, changes = pipeline.rewrite(html, 'part/1.md')
+
+    collected = sorted(path.name for path in (project / 'out' / 'book_images').iterdir())
+    assert len(collected) == 2
+    name_a = changes[0][1]
+    assert changes == [('images/a.png', name_a), ('copy%20of%20a.png', name_a),
+                       ('b.gif', changes[2][1])]
+    assert name_a.startswith('book_images/') and name_a.endswith('.png')
+    assert rewritten == (f'<img alt="a" src="{name_a}"><img src="{name_a}">'
+                         f'<img src="{changes[2][1]}"><img src="https://example.com/c.png">'
+                         '<img src="data:image/png;base64,AAAA"><img src="missing.png">')
+    assert (project / 'out' / name_a).read_bytes() == b'image a'
+    assert pipeline.sources == {'part/images/a.png', 'copy of a.png', 'b.gif'}
+    assert 'part/1.md: image missing.png does not exist.' in caplog.text
+
+
+def test_images_no_longer_referenced_are_removed(project):
+    with ImagePipeline('book_images', '.') as pipeline:
+        pipeline.rewrite('<img src="b.gif">', '1.md')
+    (project / 'book_images' / 'notes.txt').write_text('mine', encoding='utf-8')
+
+    with ImagePipeline('book_images', '.') as pipeline:
+        _html, changes = pipeline.rewrite('<img src="copy of a.png">', '1.md')
+
+    assert sorted(path.name for path in (project / 'book_images').iterdir()) == \
+        sorted([changes[0][1].split('/')[1], 'notes.txt'])
+
+
+def test_images_are_optimized_and_cached(project):
+    make_png(project / 'wide.png', 400, 200)
+    cache = BuildCache(str(project / 'cache'))
+
+    with ImagePipeline('first', '.', ImageSettings(max_width=100, workers=1), cache) as pipeline:
+        _html, changes = pipeline.rewrite('<img src="wide.png">', '1.md')
+
+    assert get_size(project / changes[0][1]) == (100, 50)
+
+    with patch('publish.images.ProcessPoolExecutor') as mock_pool:
+        with ImagePipeline('second', '.', ImageSettings(max_width=100), cache) as pipeline:
+            _html, changes = pipeline.rewrite('<img src="wide.png">', '1.md')
+
+    mock_pool.assert_not_called()
+    assert get_size(project / changes[0][1]) == (100, 50)
+
+
+def test_narrow_images_are_kept(project):
+    make_png(project / 'narrow.png', 50, 20)
+
+    with ImagePipeline('book_images', '.', ImageSettings(max_width=100, workers=1)) as pipeline:
+        _html, changes = pipeline.rewrite('<img src="narrow.png">', '1.md')
+
+    assert get_size(project / changes[0][1]) == (50, 20)
+
+
+def test_get_image_directory():
+    assert get_image_directory('out/book.html') == 'out/book_images'
+
+
+def test_output_collects_images(project):
+    (project / 'part' / '1.md').write_text('![A](images/a.png)', encoding='utf-8')
+    book = Book('title')
+    book.chapters.append(Chapter('part/1.md'))
+
+    HtmlOutput('book.html', collect_images=True).make(book)
+
+    html = (project / 'book.html').read_text(encoding='utf-8')
+    assert '<img alt="A" src="book_images/' in html
+    assert len(list((project / 'book_images').iterdir())) == 1
+
+
+def test_incremental_build_compares_collected_images(project):
+    (project / '1.md').write_text('![B](b.gif)', encoding='utf-8')
+
+    def build():
+        book = Book('title')
+        book.chapters.append(Chapter('1.md'))
+        incremental_build = IncrementalBuild(BuildCache())
+        made = incremental_build.prepare(book, [], [HtmlOutput('book.html',
+                                                               collect_images=True)])
+        for output in made:
+            output.make(book)
+        incremental_build.finish()
+        return made
+
+    assert len(build()) == 1
+    assert build() == []
+    (project / 'b.gif').write_bytes(b'image b, changed')
+    assert len(build()) == 1
+
+
+def make_image(path, image_format, width, height, **options):
+    image_module = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    image_module.new('RGB', (width, height), (200, 30, 30)).save(buffer, image_format, **options)
+    path.write_bytes(buffer.getvalue())
+
+
+@pytest.mark.parametrize('image_format,options', [
+    ('PNG', {}), ('JPEG', {}), ('JPEG', {'progressive': True}), ('GIF', {}),
+    ('WEBP', {}), ('WEBP', {'lossless': True})])
+def test_read_image_header(tmp_path, image_format, options):
+    make_image(tmp_path / 'image', image_format, 321, 123, **options)
+
+    header = read_image_header(str(tmp_path / 'image'))
+
+    assert header == ImageHeader(image_format, 321, 123)
+
+
+def test_read_image_header_of_rotated_jpeg(tmp_path):
+    image_module = pytest.importorskip('PIL.Image')
+    exif = image_module.Exif()
+    exif[0x0112] = 6
+    make_image(tmp_path / 'photo.jpg', 'JPEG', 40, 30, exif=exif.tobytes())
+
+    header = read_image_header(str(tmp_path / 'photo.jpg'))
+
+    assert header == ImageHeader('JPEG', 40, 30, orientation=6)
+    assert get_display_size(header) == (30, 40)
+    assert get_display_size(header, max_width=20) == (15, 20)
+
+
+def test_read_image_header_of_other_files(tmp_path):
+    (tmp_path / 'text.png').write_bytes(b'not an image')
+    (tmp_path / 'truncated.png').write_bytes(b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR')
+
+    assert read_image_header(str(tmp_path / 'text.png')) is None
+    assert read_image_header(str(tmp_path / 'truncated.png')) is None
+    assert read_image_header(str(tmp_path / 'missing.png')) is None
+
+
+def test_lazy_images_get_attributes(project):
+    make_image(project / 'part' / 'wide.png', 'PNG', 400, 200)
+    html = ('<p><img alt="W" src="wide.png" /><img src="b.gif">'
+            '<img src="https://example.com/c.png"><img src="wide.png" loading="eager" '
+            'decoding="sync" width="40" height="20"></p>')
+
+    with LazyImages(max_width=100) as images:
+        rewritten, changes = images.rewrite(html, 'part/1.md')
+
+    assert rewritten == (
+        '<p><img alt="W" src="wide.png" width="100" height="50" loading="lazy" '
+        'decoding="async" /><img src="b.gif" loading="lazy" decoding="async">'
+        '<img src="https://example.com/c.png" loading="lazy" decoding="async">'
+        '<img src="wide.png" loading="eager" decoding="sync" width="40" height="20"></p>')
+    assert len(changes) == 3
+    assert images.sources == {'part/wide.png', 'b.gif'}
+
+
+def test_lazy_images_headers_are_cached(project):
+    make_image(project / 'wide.png', 'PNG', 400, 200)
+    cache = BuildCache(str(project / 'cache'))
+
+    with LazyImages(cache) as images:
+        images.rewrite('<img src="wide.png">', '1.md')
+
+    with patch('publish.images.read_image_header') as mock_read:
+        with LazyImages(cache) as images:
+            html, _changes = images.rewrite('<img src="wide.png">', '1.md')
+
+    mock_read.assert_not_called()
+    assert 'width="400" height="200"' in html
+
+
+def test_output_adds_lazy_image_attributes(project):
+    make_image(project / 'wide.png', 'PNG', 400, 200)
+    (project / '1.md').write_text('![W](wide.png)', encoding='utf-8')
+    book = Book('title')
+    book.chapters.append(Chapter('1.md'))
+
+    HtmlOutput('book.html', lazy_images=True, collect_images=True, image_max_width=100).make(book)
+
+    html = (project / 'book.html').read_text(encoding='utf-8')
+    assert 'src="book_images/' in html
+    assert 'width="100" height="50" loading="lazy" decoding="async"' in html
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.incremental` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,protected-access
+# pylint: disable=redefined-outer-name
+
+import shutil
+import subprocess  # nosec
+from unittest.mock import ANY, patch
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.incremental import GitChangeDetector, IncrementalBuild
+from publish.output import HtmlOutput
+from publish.profiling import SubstitutionProfiler
+from publish.scheduling import CostModel
+from publish.source import FileSource
+from publish.substitution import SimpleSubstitution
+
+requires_git = pytest.mark.skipif(shutil.which('git') is None, reason='requires git')
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / '1.md').write_text('# One', encoding='utf-8')
+    (tmp_path / '2.md').write_text('# Two', encoding='utf-8')
+    (tmp_path / 'style.css').write_text('p {}', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def get_project():
+    book = Book('title', pubdate='2020-01-01')
+    book.chapters.extend([Chapter('1.md'), Chapter('2.md')])
+    outputs = [HtmlOutput('book.html', stylesheet='style.css', render_chapters_separately=True)]
+    return book, [SimpleSubstitution('One', 'Uno')], outputs
+
+
+def build(detector=None, **settings):
+    incremental_build = IncrementalBuild(BuildCache(), detector)
+    book, substitutions, outputs = get_project()
+    for output in outputs:
+        output.cost_model = CostModel()
+        for name, value in settings.items():
+            setattr(output, name, value)
+    made = incremental_build.prepare(book, substitutions, outputs)
+
+    for output in made:
+        output.make(book, substitutions)
+
+    incremental_build.finish()
+    return made
+
+
+def git(*args):
+    subprocess.run(['git', *args], check=True, stdout=subprocess.PIPE)  # nosec
+
+
+@pytest.mark.usefixtures('project')
+def test_unchanged_project_is_skipped():
+    assert len(build()) == 1
+    assert build() == []
+
+
+@pytest.mark.parametrize('path', ['2.md', 'style.css'])
+def test_changed_input_is_made_again(project, path):
+    build()
+    (project / path).write_text('changed', encoding='utf-8')
+
+    assert len(build()) == 1
+
+
+@pytest.mark.usefixtures('project')
+def test_changed_setting_is_made_again():
+    build()
+
+    assert len(build(toc=True)) == 1
+    assert len(build(render_chapters_separately=False)) == 1
+
+
+@pytest.mark.usefixtures('project')
+def test_settings_not_changing_the_output_are_ignored():
+    build()
+
+    assert build(profiler=SubstitutionProfiler(), read_threads=1) == []
+
+
+def test_missing_output_is_made_again(project):
+    build()
+    (project / 'book.html').unlink()
+
+    assert len(build()) == 1
+
+
+def test_unchanged_chapters_are_not_rendered_again(project):
+    build()
+    (project / '2.md').write_text('# Zwei', encoding='utf-8')
+
+    with patch('publish.isolation._convert', return_value='<h1>Zwei</h1>') as mock_convert:
+        build()
+
+    mock_convert.assert_called_once_with(ANY, '# Zwei')
+    assert '<h1>Uno</h1>\n<h1>Zwei</h1>' in (project / 'book.html').read_text(encoding='utf-8')
+
+
+@requires_git
+def test_git_unchanged_files_are_not_read(project):
+    git('init', '-q')
+    git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q',
+        '--allow-empty', '-m', 'init')
+    (project / '.gitignore').write_text('.publish-cache\nbook.html\n', encoding='utf-8')
+    git('add', '.')
+    git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'a')
+    build(GitChangeDetector())
+
+    with patch.object(FileSource, 'open', side_effect=AssertionError('read')):
+        assert build(GitChangeDetector()) == []
+
+
+@requires_git
+def test_git_dirty_work_tree_falls_back_to_hashing(project):
+    git('init', '-q')
+    git('add', '.')
+    git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'a')
+    build(GitChangeDetector())
+    (project / '1.md').write_text('# Changed', encoding='utf-8')
+
+    assert GitChangeDetector().get_clean_head() is None
+    assert len(build(GitChangeDetector())) == 1
+
+
+def test_git_change_detector_outside_work_tree(tmp_path):
+    detector = GitChangeDetector(str(tmp_path))
+
+    assert detector.get_clean_head() is None
+    assert detector.get_unchanged_files('abc', None) is None
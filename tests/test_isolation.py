@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.isolation` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import multiprocessing
+import re
+import time
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.isolation import (RenderLimitError, RenderWorker, SubstitutionTimeoutError,
+                               SubstitutionWorker, _Worker, resource)
+from publish.output import HtmlOutput
+from publish.substitution import RegexSubstitution, SimpleSubstitution
+
+CATASTROPHIC = RegexSubstitution(r'(a+)+$', '')
+CATASTROPHIC_TEXT = 'a' * 40 + 'b'
+
+
+def test_worker_is_abstract():
+    with pytest.raises(TypeError):
+        _Worker()  # pylint: disable=abstract-class-instantiated
+
+
+def test_apply_without_timeout_runs_in_process():
+    with SubstitutionWorker([SimpleSubstitution('a', 'b')]) as worker:
+        assert worker.apply('aa') == 'bb'
+        assert worker._process is None  # pylint: disable=protected-access
+
+
+def test_apply_in_worker():
+    substitutions = [SimpleSubstitution('a', 'b'), RegexSubstitution('b+', 'c')]
+
+    with SubstitutionWorker(substitutions, timeout=5) as worker:
+        assert worker.apply('aab') == 'c'
+        assert worker.apply('xa') == 'xc'
+
+
+def test_apply_exceeding_timeout_raises_error():
+    substitutions = [SimpleSubstitution('x', 'y'), CATASTROPHIC]
+
+    with SubstitutionWorker(substitutions, timeout=0.2) as worker:
+        with pytest.raises(SubstitutionTimeoutError) as error_info:
+            worker.apply(CATASTROPHIC_TEXT, 'chapters/1.md')
+
+        assert worker.apply('x') == 'y'
+
+    error = error_info.value
+    assert error.substitution is substitutions[1]
+    assert error.src == 'chapters/1.md'
+    assert error.elapsed >= 0.2
+    assert "'(a+)+$'" in str(error) and 'chapters/1.md' in str(error)
+
+
+def test_apply_raises_error_of_substitution():
+    with SubstitutionWorker([RegexSubstitution('(a)', r'\2')], timeout=5) as worker:
+        with pytest.raises(re.error):
+            worker.apply('a')
+
+
+def test_output_with_substitution_timeout(tmp_path):
+    (tmp_path / '1.md').write_text(CATASTROPHIC_TEXT, encoding='utf8')
+    book = Book('title')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+    output = HtmlOutput(str(tmp_path / 'book.html'), substitution_timeout=0.2,
+                        render_chapters_separately=True)
+
+    with pytest.raises(SubstitutionTimeoutError, match='1.md'):
+        output.make(book, [CATASTROPHIC])
+
+
+requires_fork = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                                   reason='patches are only inherited by forked workers')
+requires_resource = pytest.mark.skipif(resource is None, reason='requires resource')
+
+
+def test_render_without_limits_runs_in_process():
+    with RenderWorker() as worker:
+        assert worker.render('# Title') == '<h1>Title</h1>'
+        assert worker._process is None  # pylint: disable=protected-access
+
+
+def test_render_in_worker():
+    with RenderWorker(timeout=5) as worker:
+        assert worker.render('# Title') == '<h1>Title</h1>'
+        assert worker.render('*text*') == '<p><em>text</em></p>'
+
+
+@requires_fork
+def test_render_exceeding_time_limit_raises_error(monkeypatch):
+    monkeypatch.setattr('markdown.Markdown.convert', lambda self, text: time.sleep(10))
+
+    with RenderWorker(timeout=0.2) as worker:
+        with pytest.raises(RenderLimitError) as error_info:
+            worker.render('# Title', 'chapters/1.md')
+
+    assert error_info.value.src == 'chapters/1.md'
+    assert error_info.value.limit == 'time'
+    assert str(error_info.value) == \
+        'Rendering chapters/1.md exceeded the time limit of 0.2 seconds.'
+
+
+@requires_resource
+def test_render_exceeding_memory_limit_falls_back_to_pre():
+    text = '<b>' + 'a' * 2**25
+
+    with RenderWorker(memory_limit=2, fallback='pre') as worker:
+        assert worker.render(text, 'chapters/1.md') == f'<pre>&lt;b&gt;{text[3:]}</pre>'
+        assert worker.render('# Title') == '<h1>Title</h1>'
+
+    assert worker.fallback_srcs == ['chapters/1.md']
+
+
+@requires_resource
+def test_render_exceeding_memory_limit_raises_error():
+    with RenderWorker(memory_limit=2) as worker:
+        with pytest.raises(RenderLimitError, match='memory limit of 2 MiB'):
+            worker.render('a' * 2**25, 'chapters/1.md')
+
+
+def test_render_worker_rejects_unknown_fallback():
+    with pytest.raises(ValueError):
+        RenderWorker(fallback='ignore')
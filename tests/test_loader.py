@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.loader` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import threading
+import time
+
+import pytest
+
+from publish.book import Chapter
+from publish.loader import ChapterLoader
+from publish.source import ChapterSource, SourceResolver, SourceStat
+
+
+class SlowSource(ChapterSource):
+    """Simulates a high-latency filesystem."""
+
+    def __init__(self, latency=0.0, stat_latency=0.0):
+        self.latency = latency
+        self.stat_latency = stat_latency
+        self.stat_threads = set()
+        self.started = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def open(self, name):
+        raise NotImplementedError()
+
+    def read(self, name):
+        with self.lock:
+            self.started.append(name)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.latency)
+        with self.lock:
+            self.active -= 1
+        if name == 'missing':
+            raise FileNotFoundError(name)
+        return name.encode('utf-8')
+
+    def stat(self, name):
+        self.stat_threads.add(threading.current_thread().name)
+        time.sleep(self.stat_latency)
+        return SourceStat(len(name), 0.0)
+
+
+def get_chapters(names):
+    return [Chapter(f'slow!{name}') for name in names]
+
+
+def test_load_preserves_order():
+    resolver = SourceResolver({'slow': SlowSource()})
+    names = [str(index) for index in range(50)]
+
+    actual = [content for _chapter, content in ChapterLoader(resolver).load(get_chapters(names))]
+
+    assert actual == names
+
+
+def test_load_reads_concurrently():
+    source = SlowSource(latency=0.05)
+    resolver = SourceResolver({'slow': source})
+
+    list(ChapterLoader(resolver, threads=4).load(get_chapters(str(i) for i in range(8))))
+
+    assert source.max_active == 4
+
+
+def test_load_bounds_prefetch():
+    source = SlowSource()
+    resolver = SourceResolver({'slow': source})
+    loaded = ChapterLoader(resolver, prefetch=3).load(get_chapters(str(i) for i in range(10)))
+
+    next(loaded)
+    time.sleep(0.05)
+
+    assert len(source.started) <= 4
+    loaded.close()
+
+
+def test_load_bounds_prefetch_bytes():
+    source = SlowSource()
+    resolver = SourceResolver({'slow': source})
+    names = ['a' * 10, 'b' * 10, 'c' * 10, 'd' * 30, 'e']
+    loaded = ChapterLoader(resolver, prefetch_bytes=25).load(get_chapters(names))
+
+    assert next(loaded)[1] == names[0]
+    time.sleep(0.05)
+    assert source.started == names[:3]
+
+    assert [content for _chapter, content in loaded] == names[1:]
+
+
+def test_load_stats_concurrently_in_the_pool():
+    source = SlowSource(stat_latency=0.05)
+    resolver = SourceResolver({'slow': source})
+    names = [str(index) for index in range(16)]
+    started = time.perf_counter()
+
+    actual = [content for _chapter, content in ChapterLoader(resolver).load(get_chapters(names))]
+
+    assert actual == names
+    assert time.perf_counter() - started < 0.05 * len(names) / 2
+    assert all(name.startswith('publish-loader') for name in source.stat_threads)
+
+
+def test_load_raises_error_of_chapter_when_reached():
+    resolver = SourceResolver({'slow': SlowSource()})
+    loaded = ChapterLoader(resolver).load(get_chapters(['1', 'missing', '3']))
+
+    assert next(loaded)[1] == '1'
+    with pytest.raises(FileNotFoundError):
+        next(loaded)
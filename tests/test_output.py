@@ -11,27 +11,35 @@
 """
 
 # pylint: disable=missing-docstring,no-self-use,invalid-name,protected-access
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-few-public-methods,redefined-outer-name
 
 from typing import Iterable
-from unittest.mock import patch, mock_open
+from unittest.mock import ANY, Mock, patch, mock_open
 
+import asyncio
+import io
 import os
+import tempfile
+import time
+import zipfile
 
 import pytest
 
 from publish import __version__ as package_version
 from publish.book import Book, Chapter
+from publish.isolation import RenderWorker
 # noinspection PyProtectedMember
-from publish.output import (SUPPORTED_EBOOKCONVERT_ATTRIBUTES,
-                            _apply_template,
-                            _yield_attributes_as_params,
-                            _get_ebook_convert_params,
-                            HtmlOutput,
+from publish.ebookconvert import (SUPPORTED_EBOOKCONVERT_ATTRIBUTES,
+                                  get_ebook_convert_params,
+                                  yield_attributes_as_params)
+from publish.output import (HtmlOutput,
                             NoChaptersFoundError,
                             EbookConvertOutput)
-from publish.substitution import Substitution, SimpleSubstitution
-from tests import get_test_book
+from publish.selection import get_preview_path, parse_chapter_range, select_chapters
+from publish.source import MappingSource
+from publish.substitution import Substitution, SimpleSubstitution, RegexSubstitution
+from publish.templating import apply_template
+from tests import get_test_book, run_async
 
 
 def test_supported_ebookconvert_attrs():
@@ -134,6 +142,29 @@ class TestHtmlOutput:
 
         assert actual == expected
 
+    def test_get_chapters_to_be_published_chapter_range_ignores_publish(self):
+        output = HtmlOutputStub('a', chapter_range='2-3')
+        chapters = [Chapter('1'),
+                    Chapter('2', publish=False),
+                    Chapter('3')]
+
+        expected = [chapters[1],
+                    chapters[2]]
+        actual = output.get_chapters_to_be_published(chapters)
+
+        assert actual == expected
+
+    def test_preview(self):
+        output = HtmlOutputStub('book.html', stylesheet='b')
+        preview = output.preview(chapter_range='1', chapter_src='*.md')
+
+        assert preview.path == 'book.preview.html'
+        assert preview.stylesheet == 'b'
+        assert preview.chapter_range == '1'
+        assert preview.chapter_src == '*.md'
+        assert output.path == 'book.html'
+        assert output.chapter_range is None
+
     def test_get_css(self):
         with patch('builtins.open', mock_open(read_data='css')) as mock_file:
             output = HtmlOutput('some.path', stylesheet='some.css')
@@ -152,37 +183,181 @@ class TestHtmlOutput:
 
         assert actual == expected
 
-    def test_make(self):
-        output = HtmlOutput('some.path')
+    def test_make(self, tmp_path):
+        output = HtmlOutput(str(tmp_path / 'book.html'))
         book = Book('title')
         substitution = SimpleSubstitution(old='a', new='b')
         substitutions = [substitution]
 
-        with patch('builtins.open', mock_open(read_data='css'), create=True) as mock_file, \
-                patch.object(output, '_get_html_document') as mock_get_html_document:
-            mock_get_html_document.return_value = 'document'
+        with patch.object(output, '_write_html_document') as mock_write_html_document:
+            mock_write_html_document.side_effect = \
+                lambda *args, **kwargs: args[2].write('document')
             output.make(book, substitutions)
 
-        mock_get_html_document.assert_called_once_with(book, substitutions)
-        mock_file.assert_called_once_with('some.path', 'w')
-        mock_file_handle = mock_file()
-        mock_file_handle.write.assert_called_once_with('document')
+        mock_write_html_document.assert_called_once_with(book, substitutions, ANY, cancelled=None,
+                                                         search_path=None,
+                                                         image_directory=None)
+        assert (tmp_path / 'book.html').read_text() == 'document'
+        assert os.listdir(str(tmp_path)) == ['book.html']
 
-    def test_make_without_substitutions(self):
-        output = HtmlOutput('some.path')
+    def test_make_without_substitutions(self, tmp_path):
+        output = HtmlOutput(str(tmp_path / 'book.html'))
         book = Book('title')
 
-        with patch('builtins.open', mock_open(read_data='css'), create=True) as mock_file, \
-                patch.object(output, '_get_html_document') as mock_get_html_document:
-            mock_get_html_document.return_value = 'document'
+        with patch.object(output, '_write_html_document') as mock_write_html_document:
             output.make(book)
 
-        mock_file.assert_called_once_with('some.path', 'w')
-        mock_file_handle = mock_file()
-        mock_file_handle.write.assert_called_once_with('document')
+        mock_write_html_document.assert_called_once_with(book, [], ANY, cancelled=None,
+                                                         search_path=None,
+                                                         image_directory=None)
+
+    def test_make_keeps_previous_output_on_error(self, tmp_path):
+        (tmp_path / 'book.html').write_text('previous')
+        output = HtmlOutput(str(tmp_path / 'book.html'))
+
+        with patch.object(output, '_write_html_document') as mock_write_html_document:
+            mock_write_html_document.side_effect = NoChaptersFoundError()
+            with pytest.raises(NoChaptersFoundError):
+                output.make(Book('title'))
+
+        assert (tmp_path / 'book.html').read_text() == 'previous'
+        assert os.listdir(str(tmp_path)) == ['book.html']
+
+    def test_render(self, tmp_path):
+        book = Book('title')
+        book.chapters.extend([Chapter('tests/resources/1.md'), Chapter('tests/resources/2.md')])
+        output = HtmlOutput(str(tmp_path / 'book.html'))
+
+        actual = output.render(book)
+
+        assert actual == output._get_html_document(book, []).encode('utf-8')
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_write_to(self):
+        book = Book('title')
+        book.chapters.append(Chapter('tests/resources/1.md'))
+        output = HtmlOutput('')
+        text_target = io.StringIO()
+        binary_target = Mock(spec=['write'])
+
+        output.write_to(text_target, book)
+        output.write_to(binary_target, book)
+
+        assert '<h1>This is the first file</h1>' in text_target.getvalue()
+        assert b''.join(call[0][0] for call in binary_target.write.call_args_list) == \
+            text_target.getvalue().encode('utf-8')
+
+    def test_make_async(self, tmp_path):
+        book = Book('title')
+        book.chapters.extend([Chapter('tests/resources/1.md'), Chapter('tests/resources/2.md')])
+        output = HtmlOutput(str(tmp_path / 'book.html'))
+
+        run_async(output.make_async(book, [SimpleSubstitution('text', 'content')]))
+
+        assert (tmp_path / 'book.html').read_text() == output._get_html_document(
+            book, [SimpleSubstitution('text', 'content')])
+
+    def test_make_async_cancellation_stops_rendering(self, tmp_path):
+        book = Book('title')
+        book.chapters.extend(Chapter('tests/resources/1.md') for _ in range(50))
+        output = HtmlOutput(str(tmp_path / 'book.html'), render_chapters_separately=True)
+        rendered = []
+
+        def render(_worker, text, src=''):
+            rendered.append(src)
+            time.sleep(0.02)
+            return text
+
+        async def make_and_cancel():
+            task = asyncio.ensure_future(output.make_async(book))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return len(rendered)
+
+        with patch.object(RenderWorker, 'render', render):
+            rendered_until_cancelled = run_async(make_and_cancel())
+            time.sleep(0.1)
+
+        assert rendered_until_cancelled == len(rendered) < 50
+        assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.fixture
+def fake_ebook_convert(tmp_path, monkeypatch):
+    """Puts an ebook-convert on the PATH that copies the html and sleeps for $SLEEP seconds,
+    and records the temporary directories made."""
+    bin_directory = tmp_path / 'bin'
+    bin_directory.mkdir()
+    script = bin_directory / 'ebook-convert'
+    script.write_text('#!/bin/sh\ncp "$1" "$2"\necho $$ > "$2.pid"\nexec sleep "${SLEEP:-0}"\n')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_directory}{os.pathsep}{os.environ["PATH"]}')
+
+    temp_directories = []
+
+    def mkdtemp():
+        temp_directories.append(tempfile.mkdtemp())
+        return temp_directories[-1]
+
+    monkeypatch.setattr('publish.output.mkdtemp', mkdtemp)
+    return temp_directories
 
 
 class TestEbookConvertOutput:
+    @pytest.mark.skipif(os.name == 'nt', reason='the fake ebook-convert is a shell script')
+    def test_make_async(self, tmp_path, fake_ebook_convert):
+        book = Book('title')
+        book.chapters.append(Chapter('tests/resources/1.md'))
+        output = EbookConvertOutput(str(tmp_path / 'book.epub'))
+
+        run_async(output.make_async(book))
+
+        assert '<h1>This is the first file</h1>' in (tmp_path / 'book.epub').read_text()
+        assert not os.path.exists(fake_ebook_convert[0])
+
+    @pytest.mark.skipif(os.name == 'nt', reason='the fake ebook-convert is a shell script')
+    def test_render(self, tmp_path, fake_ebook_convert):
+        book = Book('title')
+        book.chapters.append(Chapter('tests/resources/1.md'))
+        output = EbookConvertOutput(str(tmp_path / 'book.epub'))
+
+        actual = output.render(book)
+
+        assert b'<h1>This is the first file</h1>' in actual
+        assert not (tmp_path / 'book.epub').exists()
+        assert not os.path.exists(fake_ebook_convert[0])
+
+    def test_write_to_text_file_raises_error(self):
+        with pytest.raises(TypeError):
+            EbookConvertOutput('book.epub').write_to(io.StringIO(), get_test_book())
+
+    @pytest.mark.skipif(os.name == 'nt', reason='the fake ebook-convert is a shell script')
+    def test_make_async_cancellation_kills_ebook_convert(self, tmp_path, fake_ebook_convert,
+                                                         monkeypatch):
+        monkeypatch.setenv('SLEEP', '30')
+        book = Book('title')
+        book.chapters.append(Chapter('tests/resources/1.md'))
+        output = EbookConvertOutput(str(tmp_path / 'book.epub'))
+
+        async def make_and_cancel():
+            task = asyncio.ensure_future(output.make_async(book))
+            while not (tmp_path / 'book.epub.pid').exists():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        started = time.monotonic()
+        run_async(make_and_cancel())
+        pid = int((tmp_path / 'book.epub.pid').read_text())
+
+        assert time.monotonic() - started < 10
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+        assert not os.path.exists(fake_ebook_convert[0])
+
     def test_constructor(self):
         output = EbookConvertOutputStub('a',
                                         stylesheet='b',
@@ -219,7 +394,7 @@ def test_get_html_document():
     assert actual == expected
 
 
-def test_apply_template():
+def testapply_template():
     title = 'Foo'
     html_content = '<p>Bar</p>'
     css = 'p { font-style: italic }'
@@ -232,7 +407,7 @@ def test_apply_template():
         language=language,
         package_version=package_version)
 
-    actual = _apply_template(
+    actual = apply_template(
         html_content=html_content,
         title=title,
         css=css,
@@ -247,7 +422,7 @@ def test_yield_attributes_as_params_from_dict():
 
     expected = [f'--{attribute}={attribute}'
                 for attribute in SUPPORTED_EBOOKCONVERT_ATTRIBUTES]
-    actual = list(_yield_attributes_as_params(attributes))
+    actual = list(yield_attributes_as_params(attributes))
 
     assert actual == expected
 
@@ -259,7 +434,7 @@ def test_yield_attributes_as_params_from_dict_omits_unsupported():
 
     expected = [f'--{attribute}={attribute}'
                 for attribute in SUPPORTED_EBOOKCONVERT_ATTRIBUTES]
-    actual = list(_yield_attributes_as_params(attributes))
+    actual = list(yield_attributes_as_params(attributes))
 
     assert actual == expected
 
@@ -269,7 +444,7 @@ def test_yield_attributes_as_params_from_object():
 
     expected = [f'--{attribute}={attribute}'
                 for attribute in SUPPORTED_EBOOKCONVERT_ATTRIBUTES]
-    actual = list(_yield_attributes_as_params(object_))
+    actual = list(yield_attributes_as_params(object_))
 
     assert actual == expected
 
@@ -280,7 +455,7 @@ def test_yield_attributes_as_params_from_object_omits_unsupported():
 
     expected = [f'--{attribute}={attribute}'
                 for attribute in SUPPORTED_EBOOKCONVERT_ATTRIBUTES]
-    actual = list(_yield_attributes_as_params(object_))
+    actual = list(yield_attributes_as_params(object_))
 
     assert actual == expected
 
@@ -291,7 +466,7 @@ def test_yield_attributes_as_params_from_dict_missing_supported_attribute_omits_
 
     expected = [f'--{attribute}={attribute}'
                 for attribute in SUPPORTED_EBOOKCONVERT_ATTRIBUTES[:-1]]
-    actual = list(_yield_attributes_as_params(attributes))
+    actual = list(yield_attributes_as_params(attributes))
 
     assert actual == expected
 
@@ -303,11 +478,20 @@ def test_yield_attributes_as_params_value_none_omits_attribute():
 
     expected = [f'--{attribute}={attribute}'
                 for attribute in SUPPORTED_EBOOKCONVERT_ATTRIBUTES[:-1]]
-    actual = list(_yield_attributes_as_params(attributes))
+    actual = list(yield_attributes_as_params(attributes))
 
     assert actual == expected
 
 
+def test_multiline_substitution_matches_crlf_chapter(tmp_path):
+    (tmp_path / '1.md').write_bytes(b'Title\r\n\r\nText\r\n')
+    substitution = RegexSubstitution(r'(?m)^Title$', '# Title')
+
+    actual = HtmlOutput('')._get_html_content([Chapter(str(tmp_path / '1.md'))], [substitution])
+
+    assert actual == '<h1>Title</h1>\n<p>Text</p>'
+
+
 def test_get_html_content():
     output = HtmlOutput('')
     actual = output._get_html_content([Chapter('tests/resources/1.md'),
@@ -322,6 +506,113 @@ def test_get_html_content():
     assert actual == expected
 
 
+def get_reference_book():
+    book = Book('title')
+    book.sources['memory'] = MappingSource({'1.md': '# One\n\nRead [the docs][docs].',
+                                            '2.md': '# Two\n\n[docs]: http://example.com'})
+    book.chapters.extend([Chapter('memory!1.md'), Chapter('memory!2.md')])
+    return book
+
+
+@pytest.mark.parametrize('settings', [{}, {'toc': True}])
+def test_reference_links_are_resolved_across_chapters(settings):
+    book = get_reference_book()
+
+    html = HtmlOutput('', **settings).render(book).decode('utf-8')
+
+    assert 'Read <a href="http://example.com">the docs</a>.' in html
+
+
+def test_chapters_rendered_separately_keep_reference_links_to_other_chapters():
+    book = get_reference_book()
+
+    html = HtmlOutput('', render_chapters_separately=True).render(book).decode('utf-8')
+
+    assert 'Read [the docs][docs].' in html
+
+
+def test_regex_substitutions_match_across_chapters():
+    book = Book('title')
+    book.chapters.extend([Chapter('tests/resources/1.md'), Chapter('tests/resources/2.md')])
+    substitution = RegexSubstitution(r'text\.\s+# This', 'text. This')
+
+    html = HtmlOutput('').render(book, [substitution]).decode('utf-8')
+
+    assert '<p>With some text. This is the second file</p>' in html
+
+
+def test_book_rendered_as_a_whole_is_split_into_chapters_again(tmp_path):
+    book = get_reference_book()
+    output = HtmlOutput(str(tmp_path / 'book.html'), split_pages=True)
+
+    output.make(book)
+
+    pages = sorted(name for name in os.listdir(str(tmp_path)) if name.endswith('.html'))
+    assert len(pages) == 3
+    assert any('<h1 id="two">Two</h1>' in (tmp_path / name).read_text(encoding='utf-8')
+               and 'One</h1>' not in (tmp_path / name).read_text(encoding='utf-8')
+               for name in pages)
+
+
+def test_write_html_document_streams_the_templated_document():
+    book = Book('title', language='de')
+    book.chapters.extend([Chapter('tests/resources/1.md'), Chapter('tests/resources/2.md')])
+    output = HtmlOutput('')
+    file = io.StringIO()
+
+    output._write_html_document(book, [], file)
+
+    assert file.getvalue() == apply_template(
+        html_content=output._get_html_content(book.chapters, []),
+        title='title',
+        css='',
+        language='de')
+
+
+def test_make_holds_only_the_chapters_read_ahead(tmp_path, monkeypatch):
+    paragraph = 'Some *emphasized* words and a [link](#anchor).\n\n'
+    sizes = [8 * 1024] * 6 + [32 * 1024] + [8 * 1024] * 6
+    book = Book('title')
+    for index, size in enumerate(sizes):
+        path = tmp_path / f'{index}.md'
+        path.write_text(paragraph * (size // len(paragraph)), encoding='utf-8')
+        book.chapters.append(Chapter(str(path)))
+    output = HtmlOutput(str(tmp_path / 'book.html'), prefetch_bytes=16 * 1024,
+                        render_chapters_separately=True)
+
+    held, peak = {}, []
+    read, release = Chapter.read, Chapter.release
+
+    def tracked_read(chapter, resolver=None):
+        content = read(chapter, resolver)
+        held[chapter.src] = len(content)
+        peak.append(sum(held.values()))
+        return content
+
+    def tracked_release(chapter):
+        held.pop(chapter.src, None)
+        release(chapter)
+
+    rendered = []
+    render = RenderWorker.render
+
+    def tracked_render(worker, text, src):
+        rendered.append(len(text))
+        return render(worker, text, src)
+
+    monkeypatch.setattr(Chapter, 'read', tracked_read)
+    monkeypatch.setattr(Chapter, 'release', tracked_release)
+    monkeypatch.setattr(RenderWorker, 'render', tracked_render)
+    output.make(book)
+
+    # The chapter being rendered and the chapters read ahead within the prefetch budget, of
+    # which there is always at least the next one.
+    assert max(peak) <= max(sizes) + max(16 * 1024, max(sizes))
+    assert max(peak) < sum(sizes) / 2
+    assert not held
+    assert len(rendered) == len(sizes) and max(rendered) <= max(sizes)
+
+
 def test_get_markdown_content_no_chapters_raises_error():
     output = HtmlOutput('')
     with pytest.raises(NoChaptersFoundError):
@@ -358,6 +649,20 @@ def test_get_markdown_content_joins_multiple_markdown_files():
     assert actual == expected
 
 
+def test_get_html_document_reads_archives_and_named_sources(tmp_path):
+    zip_path = str(tmp_path / 'bundle.zip')
+    with zipfile.ZipFile(zip_path, 'w') as zip_file:
+        zip_file.writestr('01.md', '# Zipped')
+
+    book = Book('title')
+    book.sources['memory'] = MappingSource({'02.md': '# In memory'})
+    book.chapters.extend([Chapter(f'{zip_path}!01.md'), Chapter('memory!02.md')])
+
+    actual = HtmlOutput('')._get_html_document(book, [])
+
+    assert '<h1>Zipped</h1>\n<h1>In memory</h1>' in actual
+
+
 def test_get_markdown_content_omits_chapters_not_set_to_publish():
     output = HtmlOutput('')
     actual = output._get_markdown_content([Chapter('tests/resources/1.md'),
@@ -376,12 +681,45 @@ def test_get_markdown_content_omits_chapters_not_set_to_publish():
     assert actual == expected
 
 
+@pytest.mark.parametrize('chapter_range,expected', [
+    ('3', {3}),
+    ('12-14', {12, 13, 14}),
+    ('1, 3,5-7', {1, 3, 5, 6, 7}),
+])
+def test_parse_chapter_range(chapter_range, expected):
+    assert parse_chapter_range(chapter_range) == expected
+
+
+@pytest.mark.parametrize('chapter_range', ['', 'a', '0', '3-1', '1-2-3', '1,,2'])
+def test_parse_chapter_range_invalid_range_raises_error(chapter_range):
+    with pytest.raises(ValueError):
+        parse_chapter_range(chapter_range)
+
+
+def test_select_chapters():
+    chapters = [Chapter('part1/a.md'),
+                Chapter('part1/b.md'),
+                Chapter('part2/c.md'),
+                Chapter('part2/d.md')]
+
+    assert select_chapters(chapters, chapter_range='2-3') == chapters[1:3]
+    assert select_chapters(chapters, chapter_src='part2/*') == chapters[2:]
+    assert select_chapters(chapters, chapter_range='2-3', chapter_src='part2/*') == [chapters[2]]
+    assert select_chapters(chapters) == chapters
+
+
+def test_get_preview_path():
+    assert get_preview_path('book.epub') == 'book.preview.epub'
+    assert get_preview_path(os.path.join('out', 'book.html')) == \
+        os.path.join('out', 'book.preview.html')
+
+
 def test_get_ebook_convert_params_no_additional_params():
     book = get_test_book()
     input_path = 'input_path'
     output_path = 'output_path'
 
-    actual = _get_ebook_convert_params(book, input_path, output_path)
+    actual = get_ebook_convert_params(book, input_path, output_path)
 
     expected = ['ebook-convert', input_path, output_path]
     expected.extend([f'--{attribute}={attribute}'
@@ -396,7 +734,7 @@ def test_get_ebook_convert_params_additional_params():
     output_path = 'output_path'
     additional_params = ['--param1=value1', '--param2=value2']
 
-    actual = _get_ebook_convert_params(book, input_path, output_path, additional_params)
+    actual = get_ebook_convert_params(book, input_path, output_path, additional_params)
 
     expected = ['ebook-convert', input_path, output_path]
     expected.extend([f'--{attribute}={attribute}'
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.pages` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,redefined-outer-name
+
+import json
+import re
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.output import HtmlOutput
+from publish.pages import PageWriter, group_pages
+from tests import run_async
+
+PAGE_NAME_PATTERN = re.compile(r'^book\.[0-9a-f]{16}\.html$')
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / '1.md').write_text('# One\n\nSee [two](2.md#two).', encoding='utf-8')
+    (tmp_path / '2.md').write_text('# Two\n\nBack to [one](#one).', encoding='utf-8')
+    (tmp_path / '3.md').write_text('# Three\n\nThe end.', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_book():
+    book = Book('Title')
+    book.chapters.extend([Chapter('1.md'), Chapter('2.md'), Chapter('3.md')])
+    return book
+
+
+def get_pages(project):
+    return sorted(path.name for path in project.iterdir() if PAGE_NAME_PATTERN.match(path.name))
+
+
+def get_toc_pages(project):
+    index = (project / 'book.html').read_text(encoding='utf-8')
+    return re.findall(r'<li class="toc-level-1"><a href="([^"#]*)#', index)
+
+
+def test_group_pages():
+    assert group_pages([10, 20, 30]) == [[0], [1], [2]]
+    assert group_pages([10, 20, 30, 5], max_size=30) == [[0, 1], [2], [3]]
+    assert group_pages([50, 10], max_size=30) == [[0], [1]]
+    assert group_pages([]) == []
+
+
+def test_page_writer(tmp_path):
+    (tmp_path / 'book.0123456789abcdef.html').write_text('stale', encoding='utf-8')
+    (tmp_path / 'notes.html').write_text('mine', encoding='utf-8')
+
+    with PageWriter(str(tmp_path / 'book.html')) as pages:
+        first = pages.get_name(['a', 'b'])
+        second = pages.get_name(['a', 'b'])
+        assert pages.write(first, 'one')
+        assert pages.write(second, 'two')
+
+    assert first != second and PAGE_NAME_PATTERN.match(first)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([
+        '.book.pages', first, second, 'notes.html'])
+
+    with PageWriter(str(tmp_path / 'book.html')) as pages:
+        assert pages.get_name(['a', 'b']) == first
+        assert not pages.write(first, 'one')
+
+    # The second page was part of the last build, so it is kept for this one.
+    assert (tmp_path / second).exists()
+
+    with PageWriter(str(tmp_path / 'book.html')) as pages:
+        assert pages.write(pages.get_name(['c']), 'changed')
+
+    assert not (tmp_path / second).exists() and (tmp_path / first).exists()
+    assert (tmp_path / 'notes.html').exists()
+
+
+def test_output_writes_pages(project):
+    HtmlOutput('book.html', split_pages=True, css='p { color: red }', search_index=True
+               ).make(make_book())
+
+    first, second, third = get_toc_pages(project)
+    assert sorted([first, second, third]) == get_pages(project)
+    index = (project / 'book.html').read_text(encoding='utf-8')
+    assert f'<li class="toc-level-1"><a href="{first}#one">One</a></li>' in index
+    assert f'<link rel="prefetch" href="{first}">' in index
+
+    css = [path for path in project.iterdir() if path.suffix == '.css']
+    assert len(css) == 1 and css[0].read_text(encoding='utf-8') == 'p { color: red }'
+
+    html = (project / first).read_text(encoding='utf-8')
+    assert '<title>One - Title</title>' in html
+    assert f'<link rel="stylesheet" href="{css[0].name}">' in html
+    assert f'<link rel="prefetch" href="{second}">' in html
+    assert f'<a href="{second}#two">two</a>' in html
+    assert f'<a rel="index" href="book.html">Contents</a> <a rel="next" href="{second}">' \
+        in html
+    assert 'p { color: red }' not in html
+    assert f'<a href="{first}#one">one</a>' in (project / second).read_text(encoding='utf-8')
+    assert 'rel="prefetch"' not in (project / third).read_text(encoding='utf-8')
+
+    search_index = json.loads((project / 'book.search.json').read_text(encoding='utf-8'))
+    assert search_index['sections'][2] == ['two', 'Two', second]
+
+
+def test_output_pages_keep_their_names(project):
+    output = HtmlOutput('book.html', split_pages=True)
+    output.make(make_book())
+    first, second, third = get_toc_pages(project)
+    written = (project / first).stat().st_mtime_ns
+
+    (project / '3.md').write_text('# Three\n\nThe real end.', encoding='utf-8')
+    output.make(make_book())
+    pages = get_toc_pages(project)
+
+    assert pages[:2] == [first, second] and pages[2] != third
+    # The old third page is kept for a build, for pages still cached from the last build.
+    assert get_pages(project) == sorted([*pages, third])
+    # The first page links to the second, whose name is unchanged, so it is not written.
+    assert (project / first).stat().st_mtime_ns == written
+    assert pages[2] in (project / second).read_text(encoding='utf-8')
+
+    output.make(make_book())
+
+    assert get_pages(project) == sorted(pages)
+
+
+def test_output_groups_chapters_into_pages(project):
+    (project / '3.md').write_text('# Three\n\n' + 'Long. ' * 400, encoding='utf-8')
+
+    HtmlOutput('book.html', split_pages=True, split_page_size=1).make(make_book())
+
+    pages = get_toc_pages(project)
+    assert pages[0] == pages[1] != pages[2]
+    html = (project / pages[0]).read_text(encoding='utf-8')
+    assert '<a href="#two">two</a>' in html and '<a href="#one">one</a>' in html
+
+
+def test_make_async_writes_pages(project):
+    run_async(HtmlOutput('book.html', split_pages=True).make_async(make_book()))
+
+    assert len(get_pages(project)) == 3
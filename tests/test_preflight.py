@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.preflight` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,redefined-outer-name
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.output import HtmlOutput, EbookConvertOutput
+from publish.preflight import PreflightError, check_project, preflight
+from publish.substitution import RegexSubstitution, SimpleSubstitution
+from publish.yaml import load_project
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    (tmp_path / '1.md').write_text('# One', encoding='utf8')
+    (tmp_path / 'style.css').write_text('p {}', encoding='utf8')
+    monkeypatch.chdir(tmp_path)
+
+    book = Book('title')
+    book.chapters.append(Chapter('1.md'))
+    return book
+
+
+def test_check_project_without_problems(book, monkeypatch):
+    monkeypatch.setattr('publish.preflight.shutil.which', lambda name: f'/usr/bin/{name}')
+    outputs = [HtmlOutput('book.html', stylesheet='style.css'), EbookConvertOutput('book.epub')]
+
+    assert check_project(book, [SimpleSubstitution('a', 'b')], outputs) == []
+
+
+def test_check_project_reports_all_problems(book, monkeypatch):
+    monkeypatch.setattr('publish.preflight.shutil.which', lambda name: None)
+    book.chapters.extend([Chapter('missing.md'), Chapter('bundle.zip!2.md')])
+    substitutions = [RegexSubstitution('(a)', r'\2'), RegexSubstitution('(?P<a>a)', r'\g<a>')]
+    outputs = [HtmlOutput('book.html', stylesheet='missing.css'),
+               HtmlOutput('missing/book.html'),
+               HtmlOutput('.'),
+               HtmlOutput('selection.html', chapter_range='5'),
+               EbookConvertOutput('book.epub')]
+
+    problems = check_project(book, substitutions, outputs)
+
+    assert len(problems) == 8
+    assert problems[0].startswith('selection.html: ')
+    assert problems[1].startswith('missing.md: can not read chapter')
+    assert problems[2].startswith('bundle.zip!2.md: can not read chapter')
+    assert 'invalid replacement' in problems[3]
+    assert problems[4].startswith('missing.css: ')
+    assert problems[5].startswith('book.epub: ebook-convert not found')
+    assert 'does not exist' in problems[6]
+    assert problems[7] == '.: output path is a directory'
+
+
+def test_check_project_reports_invalid_render_workers(book):
+    outputs = [HtmlOutput('book.html', render_workers=['build-1:8765', 'build-2'])]
+
+    assert check_project(book, [], outputs) == \
+        ["book.html: 'build-2' is not a worker address of the form HOST:PORT."]
+
+
+def test_check_project_reports_unknown_highlight_style(book):
+    outputs = [HtmlOutput('book.html', highlight_style='no-such-style')]
+
+    problems = check_project(book, [], outputs)
+
+    assert len(problems) == 1
+    assert problems[0].startswith('book.html: no-such-style is not a Pygments style, use one of')
+
+
+def test_check_project_reports_invalid_stash_pattern(book):
+    outputs = [HtmlOutput('book.html', stash_patterns=['(?ms)^<div>.*?</div>', '(open'])]
+
+    assert check_project(book, [], outputs) == \
+        ["book.html: stash pattern '(open' is invalid "
+         "(missing ), unterminated subpattern at position 0)"]
+
+
+def test_check_project_reports_invalid_split_page_size(book):
+    outputs = [HtmlOutput('book.html', split_pages=True, split_page_size=0)]
+
+    assert check_project(book, [], outputs) == \
+        ['book.html: split_page_size must be a positive number of KiB']
+
+
+def test_preflight_raises_all_problems(book):
+    book.chapters.append(Chapter('missing.md'))
+
+    with pytest.raises(PreflightError) as error_info:
+        preflight(book, [], [HtmlOutput('book.html', stylesheet='missing.css')])
+
+    assert len(error_info.value.problems) == 2
+    assert str(error_info.value).startswith('Found 2 problem(s):\n')
+
+
+def test_load_project_reports_all_invalid_patterns():
+    yaml = r"""
+title: My book
+substitutions:
+  - pattern: (
+    replace_with: a
+  - pattern: a
+    replace_with: b
+  - pattern: '['
+    replace_with: c
+"""
+
+    with pytest.raises(PreflightError) as error_info:
+        load_project(yaml)
+
+    assert len(error_info.value.problems) == 2
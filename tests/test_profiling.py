@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.profiling` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import json
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.output import HtmlOutput
+from publish.profiling import SubstitutionProfiler
+from publish.substitution import RegexSubstitution, SimpleSubstitution, Substitution
+
+
+class UpperSubstitution(Substitution):
+    def apply_to(self, text: str) -> str:
+        return text.upper()
+
+
+SUBSTITUTIONS = [SimpleSubstitution('ä', 'ae'),
+                 RegexSubstitution(r'\+\+(.*?)\+\+', r'<b>\1</b>'),
+                 SimpleSubstitution('never', 'matched'),
+                 UpperSubstitution()]
+
+
+def test_apply_records_profile_per_chapter():
+    profiler = SubstitutionProfiler()
+
+    assert profiler.apply('ä ++ä++', SUBSTITUTIONS, '1.md') == 'AE <B>AE</B>'
+    profiler.apply('++a++ ++b++', SUBSTITUTIONS, '2.md')
+    profiler.apply('ä', SUBSTITUTIONS, '1.md')
+
+    rules = sorted(profiler.get_profile(), key=lambda rule: rule['index'])
+
+    assert [rule['matches'] for rule in rules] == [1, 2, 0, 2]
+    assert [rule['bytes_changed'] for rule in rules] == [2, 10, 0, 2 + 17]
+    assert [rule['dead'] for rule in rules] == [False, False, True, False]
+    assert rules[1]['chapters']['2.md']['matches'] == 2
+    assert all(rule['time'] >= 0 for rule in rules)
+    assert profiler.get_dead_rules() == [SUBSTITUTIONS[2]]
+
+
+def test_format_report_flags_dead_rules():
+    profiler = SubstitutionProfiler()
+    profiler.apply('text', SUBSTITUTIONS, '1.md')
+
+    report = profiler.format_report()
+
+    assert report.startswith('Substitution profile of 1 chapters:\n')
+    assert "3 substitution(s) never matched and can be removed:\n" \
+           "  #1 SimpleSubstitution(old='ä', new='ae')\n" in report
+    assert report.endswith("#3 SimpleSubstitution(old='never', new='matched')")
+
+
+def test_save(tmp_path):
+    profiler = SubstitutionProfiler()
+    profiler.apply('ä', SUBSTITUTIONS[:1], '1.md')
+
+    profiler.save(str(tmp_path / 'profile.json'))
+    profile = json.loads((tmp_path / 'profile.json').read_text(encoding='utf8'))
+
+    assert profile['chapters'] == 1
+    assert profile['rules'][0]['matches'] == 1
+    assert profile['rules'][0]['chapters']['1.md']['bytes_changed'] == 2
+
+
+def test_output_profiles_every_chapter_despite_cache(tmp_path):
+    (tmp_path / '1.md').write_text('ä', encoding='utf8')
+    book = Book('title')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+    cache = BuildCache(str(tmp_path / 'cache'))
+    HtmlOutput(str(tmp_path / 'book.html'), cache=cache).make(book, SUBSTITUTIONS)
+    profiler = SubstitutionProfiler()
+
+    HtmlOutput(str(tmp_path / 'book.html'), cache=cache, profiler=profiler).make(
+        book, SUBSTITUTIONS)
+
+    assert len(profiler.get_dead_rules()) == 2
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.project` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,redefined-outer-name
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from publish.project import CompiledProject, compile_project
+
+TEST_PROJECT = """
+title: Concurrent
+authors: Max Mustermann
+language: en
+stylesheet: style.css
+
+chapters:
+  - src: chapters/*.md
+  - src: draft.md
+    publish: false
+
+substitutions:
+  - old: Cows
+    new: Substitutions
+  - pattern: \\+\\+(?P<text>.*?)\\+\\+
+    replace_with: <span class="small-caps">\\g<text></span>
+
+outputs:
+  - path: book.html
+  - path: summary.html
+    stylesheet: summary.css
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / 'chapters').mkdir()
+    for index in range(20):
+        (tmp_path / 'chapters' / f'{index:02}.md').write_text(
+            f'# Chapter {index}\n\nCows say ++moo++ {index} times.\n' * 20, encoding='utf8')
+    (tmp_path / 'draft.md').write_text('# Draft', encoding='utf8')
+    (tmp_path / 'style.css').write_text('body { color: black; }', encoding='utf8')
+    (tmp_path / 'summary.css').write_text('body { color: gray; }', encoding='utf8')
+    monkeypatch.chdir(tmp_path)
+    return compile_project(TEST_PROJECT)
+
+
+def test_compiled_project_is_immutable(project):
+    with pytest.raises(AttributeError):
+        project.substitutions = ()
+    with pytest.raises(AttributeError):
+        del project.chapters
+    with pytest.raises(TypeError):
+        project.metadata['title'] = 'Changed'  # type: ignore
+
+    assert project.metadata['title'] == 'Concurrent'
+    assert project.chapters[-1] == ('draft.md', False)
+    assert len(project.substitutions) == 2
+    assert project.paths == ('book.html', 'summary.html')
+
+
+def test_every_build_gets_its_own_book_and_outputs(project):
+    book, other_book = project.get_book(), project.get_book()
+
+    assert book is not other_book
+    assert book.chapters[0] is not other_book.chapters[0]
+    assert [chapter.src for chapter in book.chapters] == \
+        [src for src, _publish in project.chapters]
+    assert book.authors == 'Max Mustermann'
+    assert project.get_output('book.html') is not project.get_output('./book.html')
+
+    with pytest.raises(ValueError, match='missing.html'):
+        project.get_output('missing.html')
+
+
+def test_stylesheets_are_read_once(project, tmp_path):
+    (tmp_path / 'style.css').unlink()
+
+    html = project.render('book.html').decode('utf-8')
+
+    assert dict(project.stylesheets) == {'style.css': 'body { color: black; }',
+                                         'summary.css': 'body { color: gray; }'}
+    assert 'body { color: black; }' in html
+    assert '<span class="small-caps">moo</span>' in html
+    assert 'Draft' not in html
+
+
+def test_write_to(project):
+    target = io.StringIO()
+
+    project.write_to('summary.html', target)
+
+    assert target.getvalue().encode('utf-8') == project.render('summary.html')
+    assert 'body { color: gray; }' in target.getvalue()
+
+
+def test_make(project, tmp_path):
+    project.make(['summary.html'])
+
+    assert (tmp_path / 'summary.html').read_bytes() == project.render('summary.html')
+    assert not (tmp_path / 'book.html').exists()
+
+
+def test_concurrent_builds_from_one_compiled_project(project):
+    expected = {path: project.render(path) for path in project.paths}
+    paths = list(project.paths) * 16
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        actual = list(executor.map(project.render, paths))
+
+    assert all(html == expected[path] for path, html in zip(paths, actual))
+
+
+def test_constructor_does_not_keep_mutable_project_parts(project):
+    book = project.get_book()
+    outputs = project.get_outputs()
+    compiled = CompiledProject(book, [], outputs)
+
+    book.chapters.clear()
+    book.title = 'Changed'
+    outputs[0].path = 'changed.html'
+
+    assert len(compiled.chapters) == 21
+    assert compiled.metadata['title'] == 'Concurrent'
+    assert compiled.paths == ('book.html', 'summary.html')
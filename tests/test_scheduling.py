@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.scheduling` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,too-few-public-methods
+
+import tarfile
+import threading
+
+import pytest
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.output import HtmlOutput
+from publish.scheduling import CostModel, get_lpt_order, make_outputs, predict_makespan
+from publish.source import TarSource
+
+
+class FakeOutput:
+
+    def __init__(self, path, started, books):
+        self.path = path
+        self.started = started
+        self.books = books
+
+    def make(self, book, substitutions):  # pylint: disable=unused-argument
+        self.started.append(self.path)
+        self.books.append(book)
+
+
+def test_get_lpt_order():
+    assert get_lpt_order([1.0, 5.0, None, 3.0, 5.0]) == [1, 4, 2, 3, 0]
+    assert get_lpt_order([None, None]) == [0, 1]
+
+
+def test_predict_makespan():
+    assert predict_makespan([2.0, 3.0, 5.0, 1.0, 3.0, 2.0], 2) == 8.0
+    assert predict_makespan([2.0, None, 4.0], 1) == 9.0
+    assert predict_makespan([4.0], 8) == 4.0
+    assert predict_makespan([None, None], 2) is None
+
+
+def test_cost_model_is_saved_to_cache(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    cost_model = CostModel(cache)
+    cost_model.record_render('1.md', 2.0)
+    cost_model.record_output('./book.epub', 10.0)
+    cost_model.record_speedup(2, 1.5)
+    cost_model.save()
+
+    cost_model = CostModel(cache)
+    cost_model.record_render('1.md', 4.0)
+
+    assert cost_model.get_render_time('1.md') == 3.0
+    assert cost_model.get_render_time('2.md') is None
+    assert cost_model.get_output_time('book.epub') == 10.0
+    assert cost_model.get_workers(2) == 2
+
+
+def test_cost_model_ignores_invalid_document(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    cache.save('costs', {'renders': {'1.md': 'slow'}, 'speedups': {'two': 1.0}})
+
+    assert CostModel(cache).get_render_time('1.md') is None
+
+
+@pytest.mark.parametrize('speedups, max_workers, expected', [
+    ({}, 3, 3),
+    ({}, 8, 4),
+    ({1: 1.0}, 8, 2),
+    ({1: 1.0, 2: 1.9}, 8, 4),
+    ({1: 1.0, 2: 1.9, 4: 2.0}, 8, 2),
+    ({1: 1.0, 2: 1.2}, 8, 2),
+    ({2: 1.9}, 1, 1)])
+def test_get_workers(monkeypatch, speedups, max_workers, expected):
+    monkeypatch.setattr('publish.scheduling.DEFAULT_WORKERS', 4)
+    cost_model = CostModel()
+    for workers, speedup in speedups.items():
+        cost_model.record_speedup(workers, speedup)
+
+    assert cost_model.get_workers(max_workers) == expected
+
+
+def test_make_outputs_starts_slowest_first():
+    started, books = [], []
+    cost_model = CostModel()
+    cost_model.record_output('a.html', 1.0)
+    cost_model.record_output('b.epub', 9.0)
+    cost_model.record_output('c.pdf', 5.0)
+    outputs = [FakeOutput(path, started, books) for path in ('a.html', 'b.epub', 'c.pdf')]
+    book = Book('title')
+    book.chapters.append(Chapter('1.md'))
+
+    make_outputs(book, [], outputs, cost_model, jobs=2)
+
+    assert sorted(started[:2]) == ['b.epub', 'c.pdf']
+    assert all(made is not book and made.chapters[0].src == '1.md' for made in books)
+    assert 'Schedule of outputs on 2 worker(s): predicted makespan 9.00 s' in \
+        cost_model.format_report()
+
+
+def test_make_outputs_one_at_a_time_keeps_order():
+    started, books = [], []
+    cost_model = CostModel()
+    cost_model.record_output('b.epub', 9.0)
+    outputs = [FakeOutput(path, started, books) for path in ('a.html', 'b.epub')]
+    book = Book('title')
+
+    make_outputs(book, [], outputs, cost_model, jobs=1)
+
+    assert started == ['a.html', 'b.epub']
+    assert books == [book, book]
+    assert cost_model.get_output_time('a.html') is not None
+
+
+def test_make_outputs_records_times_and_speedup(tmp_path, monkeypatch):
+    book = Book('title')
+    for index in range(3):
+        (tmp_path / f'{index}.md').write_text(f'# {index}', encoding='utf8')
+        book.chapters.append(Chapter(str(tmp_path / f'{index}.md')))
+
+    cost_model = CostModel()
+    threads = set()
+    outputs = [HtmlOutput(str(tmp_path / f'{index}.html'), cost_model=cost_model,
+                          render_chapters_separately=True)
+               for index in range(2)]
+    make = HtmlOutput.make
+
+    def record_thread(self, *args):
+        threads.add(threading.current_thread().name)
+        make(self, *args)
+
+    monkeypatch.setattr(HtmlOutput, 'make', record_thread)
+    make_outputs(book, [], outputs, cost_model, jobs=2)
+
+    assert (tmp_path / '0.html').exists() and (tmp_path / '1.html').exists()
+    assert all(name.startswith('publish-output') for name in threads)
+    assert cost_model.get_render_time(str(tmp_path / '2.md')) is not None
+    assert cost_model.get_output_time(str(tmp_path / '1.html')) is not None
+    assert cost_model.get_workers(2) in (1, 2)
+
+
+def test_format_report_without_schedules():
+    assert CostModel().format_report() == 'Nothing was scheduled.'
+
+
+def test_make_outputs_shares_archive_sources_between_threads(tmp_path):
+    (tmp_path / '1.md').write_text('# Archived', encoding='utf8')
+    with tarfile.open(str(tmp_path / 'chapters.tar'), 'w') as tar:
+        tar.add(str(tmp_path / '1.md'), arcname='1.md')
+
+    source = TarSource(str(tmp_path / 'chapters.tar'))
+    book = Book('title')
+    book.sources['archive'] = source
+    book.chapters.append(Chapter('archive!1.md'))
+    outputs = [HtmlOutput(str(tmp_path / f'{index}.html')) for index in range(2)]
+
+    make_outputs(book, [], outputs, CostModel(), jobs=2)
+
+    for index in range(2):
+        assert '<h1>Archived</h1>' in (tmp_path / f'{index}.html').read_text(encoding='utf8')
+    assert book.sources['archive'] is source
+    source.close()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.search` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import json
+from unittest.mock import patch
+
+from publish.book import Book, Chapter
+from publish.cache import BuildCache
+from publish.headings import HeadingIndex, extract_headings
+from publish.output import HtmlOutput
+from publish.search import (SearchIndex, _compress, _decompress, get_search_index_path, search,
+                            tokenize_chapter)
+
+
+def build(*chapters):
+    headings, index = HeadingIndex(), SearchIndex()
+    for src, html in chapters:
+        extract = extract_headings(html)
+        headings.add_chapter(src, extract)
+        index.add_chapter(tokenize_chapter(html, extract))
+    return index.build('Book', headings)
+
+
+def make_book(tmp_path, *texts):
+    book = Book('title')
+    for position, text in enumerate(texts):
+        (tmp_path / f'{position}.md').write_text(text, encoding='utf8')
+        book.chapters.append(Chapter(str(tmp_path / f'{position}.md')))
+    return book
+
+
+def test_tokenize_chapter():
+    html = ('<p>Prologue a &amp; b</p><h1>Über <em>uns</em></h1><p>Das Über-Ich</p>'
+            '<script>hidden()</script><h2>Prologue</h2>')
+
+    assert tokenize_chapter(html, extract_headings(html)) == {
+        'prologue': [0, 2], 'über': [1], 'uns': [1], 'das': [1], 'ich': [1]}
+
+
+def test_compress_round_trip():
+    postings = {'apple': {1, 3, 7}, 'application': {2}, 'banana': {0}}
+
+    entries = _compress(postings)
+
+    assert entries == [[0, 'apple', [1, 2, 4]], [4, 'ication', [2]], [0, 'banana', [0]]]
+    assert _decompress(entries) == {'apple': [1, 3, 7], 'application': [2], 'banana': [0]}
+
+
+def test_build_maps_chapter_sections_to_document_sections():
+    index = build(('1.md', '<p>preface</p><h1>Intro</h1><p>alpha</p>'),
+                  ('2.md', '<p>beta</p><h1>Intro</h1><p>gamma alpha</p>'),
+                  ('3.md', '<p>delta</p>'))
+
+    assert index['sections'] == [['', 'Book'], ['intro', 'Intro'], ['intro-1', 'Intro']]
+    assert search(index, 'preface') == [0]
+    assert search(index, 'beta') == [1]
+    assert search(index, 'delta') == [2]
+    assert search(index, 'alp') == [1, 2]
+    assert search(index, 'alpha gam') == [2]
+    assert search(index, 'missing') == []
+
+
+def test_get_search_index_path():
+    assert get_search_index_path('out/book.html') == 'out/book.search.json'
+
+
+def test_output_writes_search_index(tmp_path):
+    book = make_book(tmp_path, '# Setup\n\nInstall the package.', '# Usage\n\nRun it.')
+    output = HtmlOutput(str(tmp_path / 'book.html'), search_index=True)
+
+    output.make(book)
+
+    html = (tmp_path / 'book.html').read_text(encoding='utf8')
+    index = json.loads((tmp_path / 'book.search.json').read_text(encoding='utf8'))
+    assert '<input type="search" id="search-query"' in html
+    assert '"book.search.json"' in html
+    assert '<h1 id="usage">Usage</h1>' in html
+    assert '<nav class="toc">' not in html
+    assert index['sections'] == [['', 'title'], ['setup', 'Setup'], ['usage', 'Usage']]
+    assert search(index, 'install') == [1]
+
+
+def test_render_has_no_search_field(tmp_path):
+    book = make_book(tmp_path, '# One')
+
+    html = HtmlOutput(str(tmp_path / 'book.html'), search_index=True).render(book)
+
+    assert b'search-query' not in html
+    assert not (tmp_path / 'book.search.json').exists()
+
+
+def test_output_tokenizes_only_changed_chapters(tmp_path):
+    book = make_book(tmp_path, '# One\n\nfirst', '# Two\n\nsecond')
+    output = HtmlOutput(str(tmp_path / 'book.html'), search_index=True,
+                        cache=BuildCache(str(tmp_path / 'cache')), render_chapters_separately=True)
+    output.make(book)
+    book = make_book(tmp_path, '# One\n\nfirst', '# Two\n\nchanged')
+
+    with patch('publish.search.tokenize_chapter', wraps=tokenize_chapter) as mock_tokenize:
+        output.make(book)
+
+    assert mock_tokenize.call_count == 1
+    index = json.loads((tmp_path / 'book.search.json').read_text(encoding='utf8'))
+    assert search(index, 'first') == [1]
+    assert search(index, 'changed') == [2]
+    assert search(index, 'second') == []
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.source` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name,protected-access
+# pylint: disable=redefined-outer-name
+
+import io
+import tarfile
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from publish.source import (FileSource, MappingSource, SourceResolver, TarSource, ZipSource,
+                            is_archive, open_archive)
+
+
+@pytest.fixture
+def zip_path(tmp_path):
+    path = str(tmp_path / 'bundle.zip')
+    with zipfile.ZipFile(path, 'w') as zip_file:
+        zip_file.writestr('chapters/01.md', '# One')
+        zip_file.writestr('chapters/02.md', '# Two')
+    return path
+
+
+@pytest.fixture
+def tar_path(tmp_path):
+    path = str(tmp_path / 'bundle.tar.gz')
+    with tarfile.open(path, 'w:gz') as tar_file:
+        for name, content in (('chapters/01.md', b'# One'), ('chapters/02.md', b'# Two')):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = 1234
+            tar_file.addfile(info, io.BytesIO(content))
+    return path
+
+
+def test_is_archive():
+    assert is_archive('bundle.zip')
+    assert is_archive('bundle.TAR.GZ')
+    assert not is_archive('chapter.md')
+
+
+def test_open_archive_unsupported_type_raises_error():
+    with pytest.raises(ValueError):
+        open_archive('chapter.md')
+
+
+def test_file_source(tmp_path):
+    (tmp_path / '1.md').write_bytes(b'# One')
+    source = FileSource()
+
+    assert source.read(str(tmp_path / '1.md')) == b'# One'
+    assert source.stat(str(tmp_path / '1.md')).size == 5
+    assert source.names() == []
+
+
+def test_zip_source(zip_path):
+    source = ZipSource(zip_path)
+
+    assert source.read('chapters/02.md') == b'# Two'
+    assert source.stat('chapters/01.md').size == 5
+    assert source.names() == ['chapters/01.md', 'chapters/02.md']
+
+    with pytest.raises(FileNotFoundError):
+        source.read('missing.md')
+
+    source.close()
+
+
+def test_tar_source(tar_path):
+    source = TarSource(tar_path)
+
+    assert source.read('chapters/02.md') == b'# Two'
+    assert source.stat('chapters/01.md') == (5, 1234.0)
+    assert sorted(source.names()) == ['chapters/01.md', 'chapters/02.md']
+
+    with pytest.raises(FileNotFoundError):
+        source.read('missing.md')
+
+    source.close()
+
+
+def test_mapping_source():
+    source = MappingSource({'a.md': 'ä', 'b.md': b'b'}, mtime=1.0)
+
+    assert source.read('a.md') == 'ä'.encode('utf-8')
+    assert source.read('b.md') == b'b'
+    assert source.stat('a.md') == (2, 1.0)
+
+    with pytest.raises(FileNotFoundError):
+        source.read('missing.md')
+
+
+def test_resolver_resolves_files_archives_and_named_sources(zip_path):
+    mapping = MappingSource({'01.md': 'memory'})
+
+    with SourceResolver({'memory': mapping}) as resolver:
+        assert isinstance(resolver.resolve('a!b.md')[0], FileSource)
+        assert resolver.resolve('a!b.md')[1] == 'a!b.md'
+        assert resolver.resolve('memory!01.md') == (mapping, '01.md')
+        assert resolver.read(f'{zip_path}!chapters/01.md') == b'# One'
+
+
+def test_resolver_opens_each_archive_once(zip_path):
+    with patch('publish.source.open_archive', wraps=open_archive) as mock_open_archive:
+        with SourceResolver() as resolver:
+            resolver.read(f'{zip_path}!chapters/01.md')
+            resolver.read(f'{zip_path}!chapters/02.md')
+            resolver.stat(f'{zip_path}!chapters/02.md')
+
+    mock_open_archive.assert_called_once_with(zip_path)
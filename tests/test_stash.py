@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# anited. publish - Python package with cli to turn markdown files into ebooks
+# Copyright (c) 2014 Christopher Knörndel
+#
+# Distributed under the MIT License
+# (license terms are at http://opensource.org/licenses/MIT).
+
+"""Tests for `publish.stash` module.
+"""
+
+# pylint: disable=missing-docstring,no-self-use,invalid-name
+
+import threading
+
+import markdown
+
+from publish import distributed
+from publish.book import Book, Chapter
+from publish.distributed import WorkerServer
+from publish.output import HtmlOutput
+from publish.stash import OpaqueStash
+from publish.substitution import RegexSubstitution
+
+PAYLOAD = 'iVBORw0KGgo' + 'A' * 400 + '=='
+CHAPTER = f'# Image\n\n![x](data:image/png;base64,{PAYLOAD})\n\nAn A.'
+RAW = '<div class="raw">\n*not markdown*\n</div>'
+
+
+def make_book(tmp_path, text):
+    (tmp_path / '1.md').write_text(text, encoding='utf8')
+    book = Book('title')
+    book.chapters.append(Chapter(str(tmp_path / '1.md')))
+    return book
+
+
+def test_data_uri_payload_is_stashed_and_restored():
+    stash = OpaqueStash()
+    short = '![y](data:image/gif;base64,R0lGOD==)'
+
+    text, spans = stash.stash(f'{CHAPTER}\n\n{short}')
+
+    assert spans == [PAYLOAD]
+    assert PAYLOAD not in text and short in text
+    assert stash.restore(markdown.markdown(text), spans) == \
+        markdown.markdown(f'{CHAPTER}\n\n{short}')
+
+
+def test_pattern_matches_are_restored_without_paragraph():
+    stash = OpaqueStash(patterns=[r'(?ms)^<div class="raw">.*?^</div>$'])
+
+    text, spans = stash.stash(f'Before\n\n{RAW}\n\nAfter')
+
+    assert spans == [RAW]
+    assert stash.restore(markdown.markdown(text), spans) == \
+        f'<p>Before</p>\n{RAW}\n<p>After</p>'
+
+
+def test_spans_are_escaped_for_preformatted_text():
+    stash = OpaqueStash(patterns=['<b>'])
+
+    text, spans = stash.stash('a <b> c')
+
+    assert stash.restore(f'<pre>{text}</pre>', spans, escape=True) == '<pre>a &lt;b&gt; c</pre>'
+
+
+def test_lost_placeholder_is_logged(caplog):
+    stash = OpaqueStash(patterns=['<b>'])
+
+    _text, spans = stash.stash('a <b> c')
+
+    assert stash.restore('<p>a c</p>', spans) == '<p>a c</p>'
+    assert '1 stashed span(s) could not be put back' in caplog.text
+
+
+def test_substitutions_do_not_see_stashed_spans(tmp_path):
+    book = make_book(tmp_path, CHAPTER)
+    substitutions = [RegexSubstitution('A', 'B')]
+
+    stashed = HtmlOutput(str(tmp_path / 'book.html')).render(book, substitutions)
+    unstashed = HtmlOutput(str(tmp_path / 'book.html'),
+                           stash_data_uris=False).render(book, substitutions)
+
+    assert f'src="data:image/png;base64,{PAYLOAD}"'.encode('utf-8') in stashed
+    assert PAYLOAD.replace('A', 'B').encode('utf-8') in unstashed
+    assert b'<p>Bn B.</p>' in stashed
+
+
+def test_stashed_spans_are_not_sent_to_render_workers(tmp_path, monkeypatch):
+    server = WorkerServer(('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    texts = []
+    render_job = distributed._render_job  # pylint: disable=protected-access
+
+    def record(job, worker, renderer):
+        texts.append(job['text'])
+        return render_job(job, worker, renderer)
+
+    monkeypatch.setattr('publish.distributed._render_job', record)
+    book = make_book(tmp_path, CHAPTER)
+    host, port = server.server_address[:2]
+
+    try:
+        html = HtmlOutput(str(tmp_path / 'book.html'),
+                          render_workers=[f'{host}:{port}']).render(book)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert PAYLOAD not in texts[0]
+    assert f'src="data:image/png;base64,{PAYLOAD}"'.encode('utf-8') in html
@@ -12,11 +12,13 @@
 
 # pylint: disable=missing-docstring,no-self-use,invalid-name
 
+import logging
 from abc import ABCMeta
 
 from publish.substitution import (Substitution,
                                   SimpleSubstitution,
-                                  apply_substitutions, RegexSubstitution)
+                                  apply_substitutions, RegexSubstitution,
+                                  get_fingerprint)
 
 
 class TestSubstitution:
@@ -135,3 +137,20 @@ def test_apply_substitutions():
     actual = apply_substitutions(text, [substitution1, substitution2, substitution3])
 
     assert actual == expected
+
+
+def test_get_fingerprint():
+    substitutions = [SimpleSubstitution(old='foo', new='bar'),
+                     RegexSubstitution(pattern='a+', replace_with='b')]
+
+    assert get_fingerprint(substitutions) == get_fingerprint(list(substitutions))
+    assert get_fingerprint(substitutions) != get_fingerprint(substitutions[::-1])
+    assert get_fingerprint(substitutions) != get_fingerprint(
+        [SimpleSubstitution(old='foo', new='baz'), substitutions[1]])
+
+
+def test_regex_substitution_warns_about_risky_pattern(caplog):
+    with caplog.at_level(logging.WARNING):
+        RegexSubstitution(pattern=r'(a+)+', replace_with='')
+
+    assert "'(a+)+' may take exponential time" in caplog.text
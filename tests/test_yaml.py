@@ -11,15 +11,24 @@
 """
 
 # pylint: disable=missing-docstring,no-self-use,invalid-name,protected-access
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-few-public-methods,redefined-outer-name
+import os
+import zipfile
+from datetime import date
+from unittest.mock import patch
+
 import pytest
 
+from publish.cache import BuildCache
 from publish.output import HtmlOutput, EbookConvertOutput
 from publish.book import Book, Chapter
+from publish.preflight import PreflightError
 # noinspection PyProtectedMember
 from publish.yaml import (load_yaml, _load_book, _load_chapters, _load_ebookconvert_params,
-                          _load_outputs, _load_substitutions, load_project)
+                          _load_outputs, _load_substitutions, load_project, load_project_file,
+                          SNAPSHOT_NAME)
 from publish.substitution import SimpleSubstitution, RegexSubstitution
+from tests import get_attributes
 
 
 def test_load_book():
@@ -37,7 +46,7 @@ language: en
 
     actual = _load_book(load_yaml(yaml))
 
-    assert actual.__dict__ == expected.__dict__
+    assert get_attributes(actual) == get_attributes(expected)
 
 
 def test_load_book_omits_unknown_attribute():
@@ -50,7 +59,7 @@ unknown_attribute: hello
 
     actual = _load_book(load_yaml(yaml))
 
-    assert 'unknown_attribute' not in actual.__dict__
+    assert not hasattr(actual, 'unknown_attribute')
 
 
 def test_load_book_title_is_mandatory():
@@ -79,9 +88,67 @@ chapters:
     actual = list(_load_chapters(load_yaml(yaml)))
 
     assert len(actual) == len(expected)
-    assert actual[0].__dict__ == expected[0].__dict__
-    assert actual[1].__dict__ == expected[1].__dict__
-    assert actual[2].__dict__ == expected[2].__dict__
+    assert get_attributes(actual[0]) == get_attributes(expected[0])
+    assert get_attributes(actual[1]) == get_attributes(expected[1])
+    assert get_attributes(actual[2]) == get_attributes(expected[2])
+
+
+def test_load_chapters_expands_patterns_and_directories(tmp_path, monkeypatch):
+    for path in ('intro.md', 'chapters/1.md', 'chapters/10.md', 'chapters/2.md',
+                 'chapters/draft.md', 'appendix/a.md', 'appendix/b/c.md'):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path, encoding='utf8')
+    monkeypatch.chdir(tmp_path)
+
+    yaml = r"""
+chapters:
+  - src: chapters/1.md
+  - src: chapters/*.md
+    exclude: draft.md
+  - src: appendix/
+    publish: False
+"""
+
+    actual = list(_load_chapters(load_yaml(yaml)))
+
+    assert [chapter.src for chapter in actual] == ['chapters/1.md',
+                                                   'chapters/2.md',
+                                                   'chapters/10.md',
+                                                   'appendix/a.md',
+                                                   'appendix/b/c.md']
+    assert [chapter.publish for chapter in actual] == [True, True, True, False, False]
+
+
+def test_load_chapters_expands_patterns_inside_archives(tmp_path, monkeypatch):
+    with zipfile.ZipFile(str(tmp_path / 'bundle.zip'), 'w') as zip_file:
+        for name in ('chapters/10.md', 'chapters/9.md', 'chapters/draft.md', 'notes.txt'):
+            zip_file.writestr(name, name)
+    monkeypatch.chdir(tmp_path)
+
+    yaml = r"""
+chapters:
+  - src: bundle.zip!chapters/*.md
+    exclude: draft.md
+  - src: bundle.zip!
+"""
+
+    actual = list(_load_chapters(load_yaml(yaml)))
+
+    assert [chapter.src for chapter in actual] == ['bundle.zip!chapters/9.md',
+                                                   'bundle.zip!chapters/10.md',
+                                                   'bundle.zip!chapters/draft.md']
+
+
+def test_load_chapters_raises_for_patterns_inside_empty_archives(tmp_path, monkeypatch):
+    with zipfile.ZipFile(str(tmp_path / 'empty.zip'), 'w'):
+        pass
+    monkeypatch.chdir(tmp_path)
+
+    with pytest.raises(PreflightError) as error:
+        list(_load_chapters(load_yaml('chapters:\n  - src: empty.zip!chapters/\n')))
+
+    assert error.value.problems == [
+        'empty.zip does not list any members to expand chapters/**/*.md against.']
 
 
 def test_load_ebookconvert_params():
@@ -189,6 +256,28 @@ outputs:
     assert actual[0].__dict__ == expected[0].__dict__
 
 
+def test_load_outputs_does_not_change_the_dictionary():
+    dict_ = load_yaml("""
+stylesheet: style.css
+ebookconvert_params:
+  - level1-toc=//h:h1
+outputs:
+  - path: example.html
+  - path: example.epub
+    ebookconvert_params:
+      - no-default-epub-cover""")
+
+    list(_load_outputs(dict_))
+    outputs = list(_load_outputs(dict_))
+
+    assert dict_['outputs'] == [{'path': 'example.html'},
+                                {'path': 'example.epub',
+                                 'ebookconvert_params': ['no-default-epub-cover']}]
+    assert outputs[0].stylesheet == 'style.css'
+    assert outputs[1].ebookconvert_params == ['--level1-toc=//h:h1',
+                                              '--no-default-epub-cover']
+
+
 def test_load_outputs_uses_ebookconvert_output_for_all_other_file_endings():
     yaml = """
 outputs:
@@ -417,8 +506,108 @@ outputs:
     assert actual_book.authors == expected_book.authors
     assert actual_book.language == expected_book.language
     assert len(actual_book.chapters) == len(expected_book.chapters)
-    assert actual_book.chapters[0].__dict__ == expected_book.chapters[0].__dict__
+    assert get_attributes(actual_book.chapters[0]) == \
+        get_attributes(expected_book.chapters[0])
     assert len(list(actual_substitutions)) == len(expected_substitutions)
     assert list(actual_substitutions)[0].__dict__ == expected_substitutions[0].__dict__
     assert len(list(actual_outputs)) == len(expected_outputs)
     assert list(actual_outputs)[0].__dict__ == expected_outputs[0].__dict__
+
+
+SNAPSHOT_PROJECT = r"""
+title: My book
+chapters:
+  - src: chapters/*.md
+substitutions:
+  - pattern: a+
+    replace_with: b
+outputs:
+  - path: example.html
+"""
+
+
+@pytest.fixture
+def project_file(tmp_path, monkeypatch):
+    (tmp_path / 'chapters').mkdir()
+    (tmp_path / 'chapters' / '1.md').write_text('# One', encoding='utf8')
+    (tmp_path / '.publish.yml').write_text(SNAPSHOT_PROJECT, encoding='utf8')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / '.publish.yml'
+
+
+@pytest.mark.usefixtures('project_file')
+def test_load_project_file_reuses_snapshot():
+    cache = BuildCache()
+    load_project_file(cache=cache, snapshot=True)
+
+    with patch('publish.yaml.load_yaml') as mock_load_yaml:
+        book, substitutions, outputs = load_project_file(cache=cache, snapshot=True)
+
+    mock_load_yaml.assert_not_called()
+    assert book.title == 'My book'
+    assert [chapter.src for chapter in book.chapters] == ['chapters/1.md']
+    assert substitutions[0].apply_to('caat') == 'cbt'
+    assert outputs[0].path == 'example.html'
+
+
+def test_load_project_file_reloads_changed_project(project_file):
+    cache = BuildCache()
+    load_project_file(cache=cache, snapshot=True)
+    project_file.write_text(SNAPSHOT_PROJECT.replace('My book', 'Changed'), encoding='utf8')
+
+    book, _substitutions, _outputs = load_project_file(cache=cache, snapshot=True)
+
+    assert book.title == 'Changed'
+
+
+def test_load_project_file_reloads_changed_directory(project_file):
+    cache = BuildCache()
+    load_project_file(cache=cache, snapshot=True)
+    chapters = project_file.parent / 'chapters'
+    (chapters / '2.md').write_text('# Two', encoding='utf8')
+    os.utime(str(chapters), ns=(0, 0))
+
+    book, _substitutions, _outputs = load_project_file(cache=cache, snapshot=True)
+
+    assert [chapter.src for chapter in book.chapters] == ['chapters/1.md', 'chapters/2.md']
+
+
+@pytest.mark.usefixtures('project_file')
+def test_load_project_file_keeps_no_snapshot_by_default():
+    cache = BuildCache()
+    load_project_file(cache=cache)
+
+    assert cache.load(SNAPSHOT_NAME) is None
+
+
+def test_load_project_file_snapshot_is_json_without_defaults(project_file):
+    cache = BuildCache()
+    project_file.write_text(SNAPSHOT_PROJECT + 'series_index: 2\n', encoding='utf8')
+    load_project_file(cache=cache, snapshot=True)
+
+    with patch('publish.book.date') as mock_date:
+        mock_date.today.return_value = date(2031, 2, 3)
+        book, _substitutions, _outputs = load_project_file(cache=cache, snapshot=True)
+
+    assert 'pubdate' not in cache.load(SNAPSHOT_NAME)['project']
+    assert book.pubdate == '2031-02-03'
+    assert book.series_index == 2
+
+
+def test_load_project_file_snapshot_keeps_dates(project_file):
+    cache = BuildCache()
+    project_file.write_text(SNAPSHOT_PROJECT + 'pubdate: 2020-01-02\n', encoding='utf8')
+    load_project_file(cache=cache, snapshot=True)
+
+    with patch('publish.yaml.load_yaml') as mock_load_yaml:
+        book, _substitutions, _outputs = load_project_file(cache=cache, snapshot=True)
+
+    mock_load_yaml.assert_not_called()
+    assert book.pubdate == date(2020, 1, 2)
+
+
+def test_load_project_file_without_cache(project_file):
+    book, _substitutions, _outputs = load_project_file(str(project_file))
+
+    assert book.title == 'My book'
+    assert not os.path.exists('.publish-cache')